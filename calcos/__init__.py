@@ -42,6 +42,7 @@ def localcalcos(input,
                 comp_param="gzip,-0.01",
                 binx=None, biny=None,
                 stimfile=None, livetimefile=None, burstfile=None,
+                jobs=1, threads=None, chunk_size=None, refcache="",
                 print_version=False, print_revision=False):
 
     if print_version:
@@ -67,6 +68,8 @@ def localcalcos(input,
         livetimefile = None
     if not burstfile:
         burstfile = None
+    if not refcache:
+        refcache = None
 
     only_csum = False
 
@@ -84,7 +87,9 @@ def localcalcos(input,
                       save_temp_files=savetmp,
                       stimfile=stimfile,
                       livetimefile=livetimefile,
-                      burstfile=burstfile)
+                      burstfile=burstfile,
+                      jobs=jobs, threads=threads, chunk_size=chunk_size,
+                      refcache=refcache)
         status |= stat
 
     return status
@@ -485,14 +485,12 @@ def doFlatcorr(flt_sci, switches, reffiles, phdr):
 
         cosutil.printRef("FLATFILE", reffiles)
 
-        fd = fits.open(reffiles["flatfile"], mode="copyonwrite")
-        hdu = fd[1]
-        flat = hdu.data
-        fd.close()
+        (flat, flat_hdr) = cosutil.image_store.getImage(reffiles["flatfile"],
+                                                        1)
 
         (ny, nx) = flat.shape
-        x0 = hdu.header.get("origin_x", 0)
-        y0 = hdu.header.get("origin_y", 0)
+        x0 = flat_hdr.get("origin_x", 0)
+        y0 = flat_hdr.get("origin_y", 0)
 
         flt_sci[int(y0):int(y0+ny),int(x0):int(x0+nx)] /= flat
 
@@ -10,17 +10,9 @@ import copy
 import numpy
 import astropy
 from astropy.io import fits
-from . import accum
-from . import average
+from . import ccos
 from . import cosutil
-from . import extract
-from . import fpavg
 from . import getinfo
-from . import shiftfile
-from . import spwcs
-from . import timetag
-from . import trace
-from . import wavecal
 from .calcosparam import *       # parameter definitions
 
 # These values for Observation.exp_type are used in this file only.
@@ -69,9 +61,18 @@ def main(args=sys.argv[1:]):
         --stim filename (append stim locations to filename)
         --live filename (append livetime factors to filename)
         --burst filename (append burst info to filename)
+        --jobs N (calibrate up to N raw files (FUV segments or exposures)
+                in parallel)
+        --threads N (use N threads for the event kernels; 0 means all
+                processors)
+        --chunk N (calibrate events tables N rows at a time)
+        --refcache dir (memory-map reference images from this directory)
+        --queue dir (keep running, and calibrate jobs from this directory)
+        --socket path (keep running, and calibrate jobs sent to this socket)
     Following the command-line options, there should be a list of one
     or more association files or raw files, specified by rootname with
-    "_asn" or "_raw".
+    "_asn" or "_raw", unless --queue or --socket was specified, in which
+    case the file names are sent to the worker (see worker.py).
     """
 
     if len(args) < 1:
@@ -86,7 +87,9 @@ def main(args=sys.argv[1:]):
                             "version",
                             "csum", "raw", "only_csum",
                             "compress=", "binx=", "biny=",
-                            "shift=", "stim=", "live=", "burst="])
+                            "shift=", "stim=", "live=", "burst=",
+                            "jobs=", "threads=", "chunk=", "refcache=",
+                            "queue=", "socket="])
     except Exception as error:
         prtOptions()
         cosutil.printError(str(error))
@@ -118,6 +121,12 @@ def main(args=sys.argv[1:]):
     livetimefile = None
     burstfile = None
     outdir = None
+    jobs = 1
+    threads = None
+    chunk_size = None
+    refcache = None
+    queue_dir = None
+    socket_path = None
 
     for i in range(len(options)):
         if options[i][0] == "--version":
@@ -177,6 +186,42 @@ def main(args=sys.argv[1:]):
             livetimefile = options[i][1]
         elif options[i][0] == "--burst":
             burstfile = options[i][1]
+        elif options[i][0] == "--jobs":
+            try:
+                jobs = int(options[i][1])
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                prtOptions()
+                cosutil.printError("Don't understand '--jobs %s'" %
+                                   options[i][1])
+                sys.exit()
+        elif options[i][0] == "--threads":
+            try:
+                threads = int(options[i][1])
+            except ValueError:
+                threads = -1
+            if threads < 0:
+                prtOptions()
+                cosutil.printError("Don't understand '--threads %s'" %
+                                   options[i][1])
+                sys.exit()
+        elif options[i][0] == "--chunk":
+            try:
+                chunk_size = int(options[i][1])
+            except ValueError:
+                chunk_size = 0
+            if chunk_size < 1:
+                prtOptions()
+                cosutil.printError("Don't understand '--chunk %s'" %
+                                   options[i][1])
+                sys.exit()
+        elif options[i][0] == "--refcache":
+            refcache = options[i][1]
+        elif options[i][0] == "--queue":
+            queue_dir = options[i][1]
+        elif options[i][0] == "--socket":
+            socket_path = options[i][1]
 
     if only_csum:
         create_csum_image = True
@@ -192,22 +237,33 @@ def main(args=sys.argv[1:]):
         else:
             raw_csum_coords = True
 
+    cl_args = {"outdir": outdir, "verbosity": None,
+               "find_target": find_target,
+               "create_csum_image": create_csum_image,
+               "raw_csum_coords": raw_csum_coords,
+               "only_csum": only_csum,
+               "binx": binx, "biny": biny,
+               "compress_csum": compress_csum,
+               "compression_parameters": compression_parameters,
+               "shift_file": shift_file,
+               "save_temp_files": save_temp_files,
+               "stimfile": stimfile, "livetimefile": livetimefile,
+               "burstfile": burstfile, "jobs": jobs, "threads": threads,
+               "chunk_size": chunk_size, "refcache": refcache}
+
+    if queue_dir is not None or socket_path is not None:
+        from . import worker
+        if queue_dir is not None:
+            worker.serveQueue(queue_dir, cl_args)
+        else:
+            worker.serveSocket(socket_path, cl_args)
+        return
+
     infiles = uniqueInput(pargs)        # remove duplicate names from list
 
     status = 0
     for i in range(len(infiles)):
-        stat = calcos(infiles[i], outdir=outdir, verbosity=None,
-                      find_target=find_target,
-                      create_csum_image=create_csum_image,
-                      raw_csum_coords=raw_csum_coords,
-                      only_csum=only_csum,
-                      binx=binx, biny=biny,
-                      compress_csum=compress_csum,
-                      compression_parameters=compression_parameters,
-                      shift_file=shift_file,
-                      save_temp_files=save_temp_files,
-                      stimfile=stimfile, livetimefile=livetimefile,
-                      burstfile=burstfile)
+        stat = calcos(infiles[i], **cl_args)
         status |= stat
     if status != 0:
         sys.exit(status)
@@ -236,6 +292,16 @@ def prtOptions():
     cosutil.printMsg("  --stim filename (append stim locations to filename)")
     cosutil.printMsg("  --live filename (append livetime factors to filename)")
     cosutil.printMsg("  --burst filename (append burst info to filename)")
+    cosutil.printMsg("  --jobs N (calibrate up to N raw files, i.e. FUV "
+                     "segments or exposures,")
+    cosutil.printMsg("        in parallel)")
+    cosutil.printMsg("  --threads N (use N threads for the event kernels;")
+    cosutil.printMsg("        0 means use all processors)")
+    cosutil.printMsg("  --chunk N (calibrate events tables N rows at a time)")
+    cosutil.printMsg("  --refcache dir (memory-map reference images from dir)")
+    cosutil.printMsg("  --queue dir (keep running, and calibrate jobs from dir)")
+    cosutil.printMsg("  --socket path (keep running, and calibrate jobs "
+                     "sent to path)")
     cosutil.printMsg("")
     cosutil.printMsg("Following the options, list one or more association")
     cosutil.printMsg("files (rootname_asn) or raw files (rootname_raw).")
@@ -305,7 +371,8 @@ def calcos(asntable, outdir=None, verbosity=None,
            compress_csum=False, compression_parameters="gzip,-0.01",
            shift_file=None,
            save_temp_files=False,
-           stimfile=None, livetimefile=None, burstfile=None):
+           stimfile=None, livetimefile=None, burstfile=None,
+           jobs=1, threads=None, chunk_size=None, refcache=None):
     """Calibrate COS data.
 
     This is the main module for calibrating COS data.
@@ -385,6 +452,38 @@ def calcos(asntable, outdir=None, verbosity=None,
     burstfile: str, optional
         If specified, burst information will be written to (or appended to)
         a text file with this name.
+
+    jobs: int, optional
+        The maximum number of raw files (FUV segments or exposures) to
+        calibrate at the same time, each in a separate process; segment B
+        of an FUV tagflash exposure with no wavecal signal for segment B
+        is calibrated after segment A, in the same process, because it
+        copies the lampflash file for segment A.  The wavecals are
+        calibrated first, then the science exposures; the
+        concatenation of segments and the averaging of the spectra are
+        done in the main process.  Messages are written to the standard
+        output and trailer files in the same order as with the default,
+        jobs=1.
+
+    threads: int or None, optional
+        The number of threads to use in the C functions that bin events
+        and apply the flat field and event corrections (see
+        ccos.set_threads); 0 means use all processors.  This only has an
+        effect if the ccos module was compiled with OpenMP.  None means
+        use the current setting (by default, 1).
+
+    chunk_size: int or None, optional
+        The maximum number of rows of a TIME-TAG events table to process
+        at a time in the per-event calibration steps, which limits the
+        memory used for temporary arrays.  None means use the default,
+        EVENTS_CHUNK_SIZE.
+
+    refcache: str or None, optional
+        If not None, the name of a directory in which native-endian copies
+        of the flat field, geometric correction and walk images will be
+        kept (created if necessary).  These are memory-mapped read-only,
+        so calcos processes running at the same time share one copy of
+        each image.
     """
 
     t0 = time.time()
@@ -404,6 +503,11 @@ def calcos(asntable, outdir=None, verbosity=None,
 
     if verbosity is not None:
         cosutil.setVerbosity(verbosity)
+    cosutil.setRefcache(refcache)
+    if threads is not None:
+        n_threads = ccos.set_threads(threads)
+        cosutil.printMsg("Using %d threads for the event kernels."
+                         % n_threads, VERY_VERBOSE)
 
     # some of the command-line arguments
     cl_args = {"find_target": find_target,
@@ -418,7 +522,11 @@ def calcos(asntable, outdir=None, verbosity=None,
                "save_temp_files": save_temp_files,
                "stimfile": stimfile,
                "livetimefile": livetimefile,
-               "burstfile": burstfile}
+               "burstfile": burstfile,
+               "jobs": jobs,
+               "threads": threads,
+               "chunk_size": chunk_size,
+               "refcache": refcache}
 
     assoc = Association(asntable, outdir, cl_args)
     if len(assoc.obs) == 0:
@@ -1976,6 +2084,7 @@ class Observation(object):
 
     def __init__(self, input, outdir, memtype, suffix, shift_file, first):
         """Invoked by a subclass."""
+        from . import shiftfile
 
         self.input = input              # name of a raw input file
         self.exp_type = EXP_SCIENCE     # science, wavecal, target acq
@@ -2735,6 +2844,7 @@ class Observation(object):
         int: number of wavecal exposures for this science exposure
 
         """
+        from . import wavecal
         info = self.info
         tmid = 0.5 * (info["expstart"] + info["expend"])
 
@@ -2826,6 +2936,63 @@ class NUVAccumObs(Observation):
 
         self.printSwitchMessages(messages, self.input)
 
+def _calibrateWorker(cal, calibrate, indices, verbosity_level):
+    """Calibrate one file, or a group of files, in a worker process.
+
+    The files (segments A and B of an FUV tagflash exposure, see
+    Calibration.jobGroups) are calibrated one after the other, in the
+    order given, because the calibration of segment B can use the output
+    for segment A (see concurrent.copySegAtoSegB).  If there is an
+    exception, the remaining files are not calibrated.
+
+    Parameters
+    ----------
+    cal: Calibration object
+        A copy of the Calibration object in the main process.
+
+    calibrate: str
+        Name of the Calibration method to call, e.g. "calibrateScience".
+
+    indices: list of int
+        Indices of the files to calibrate in cal.assoc.obs.
+
+    verbosity_level: int
+        The verbosity level in the main process.
+
+    Returns
+    -------
+    list of tuples
+        For each file that was calibrated, the value returned by the
+        'calibrate' method (or None if there was an exception), the info,
+        switches and reffiles dictionaries of the Observation (which may
+        have been updated), the list of messages, and the exception (or
+        None).
+    """
+
+    cosutil.setVerbosity(verbosity_level)
+    cosutil.setRefcache(cal.assoc.cl_args.get("refcache"))
+    # The setting is not inherited if the process was not forked.
+    threads = cal.assoc.cl_args.get("threads")
+    if threads is not None:
+        ccos.set_threads(threads)
+    results = []
+    for i in indices:
+        obs = cal.assoc.obs[i]
+        result = None
+        error = None
+        cosutil.captureMessages()
+        try:
+            result = getattr(cal, calibrate)(obs)
+        except Exception as e:
+            error = e
+        messages = cosutil.releaseMessages()
+        results.append((result, obs.info, obs.switches, obs.reffiles,
+                        messages, error))
+        if error is not None:
+            break
+
+    return results
+
 class Calibration(object):
     """Calibrate COS data.
 
@@ -2879,6 +3046,8 @@ class Calibration(object):
         reffiles: dictionary
             Values of header keywords for reference file names.
         """
+        from . import accum
+        from . import timetag
 
         input = filenames["raw"]
         inpha = filenames["pha"]
@@ -2908,6 +3077,7 @@ class Calibration(object):
 
     def allWavecals(self):
         """Process all the wavecal observations in the association."""
+        from . import extract
 
         status = 0
 
@@ -2918,37 +3088,19 @@ class Calibration(object):
 
         # initial value
         any_x1dcorr = "omit"
-        # First calibrate all the wavecals.
+        wavecal_obs = []
         for obs in self.assoc.obs:
             if obs.exp_type == EXP_WAVECAL:
-                obs.openTrailer()
-                if self.wcp_info is None:
-                    # Read info from wavecal parameters table.
-                    wcp_info = cosutil.getTable(obs.reffiles["wcptab"],
-                               filter={"opt_elem": obs.info["opt_elem"]},
-                               exactly_one=True)
-                    self.wcp_info = wcp_info[0]
-                try:
-                    self.basicCal(obs.filenames,
-                                  obs.info, obs.switches, obs.reffiles)
-                    if obs.switches["x1dcorr"] == "PERFORM":
-                        # Find spectrum in cross-dispersion direction.
-                        # (xd_shifts and xd_locns are ignored.)
-                        (shift2, xd_shifts, xd_locns, lamp_is_on) = \
-                        wavecal.findWavecalSpectrum(obs.filenames["corrtag"],
-                                                    obs.info, obs.reffiles)
-                        # Update shift2[a-c] keywords, and possibly lampused.
-                        self.setSpectrumOffset(obs.filenames,
-                                               obs.info["segment"],
-                                               shift2, lamp_is_on)
-                        self.extractSpectrum(obs.filenames)
-                        any_x1dcorr = "PERFORM"
-                except (BadApertureError, MissingRowError) as e:
-                    cosutil.printError("%s" % e)
-                    status = BAD_APER_MISSING_ROW_EXCEPTION
-                    continue
-                finally:
-                    obs.closeTrailer()
+                wavecal_obs.append(obs)
+
+        # First calibrate all the wavecals.
+        results = self.calibrateAll(wavecal_obs,
+                                    "prepareWavecal", "calibrateWavecal")
+        for (obs_status, obs_x1dcorr) in results:
+            if obs_status:
+                status = obs_status
+            if obs_x1dcorr == "PERFORM":
+                any_x1dcorr = "PERFORM"
 
         w_status = 0
         if any_x1dcorr == "PERFORM":
@@ -3012,55 +3164,28 @@ class Calibration(object):
         any_wavecorr = "omit"
         any_spectroscopic = "omit"
         spwcstab = NOT_APPLICABLE
+        science_obs = []
         for obs in self.assoc.obs:
             if obs.exp_type == EXP_SCIENCE or \
                obs.exp_type == EXP_CALIBRATION or \
                obs.exp_type == EXP_ACQ_IMAGE:
-                obs.openTrailer()
-                # Check for whether this exposure meets the criteria for adding a simulated wavecal
-                # If so, set the obs.info['addsimulatedwavecal'] entry to True
-                if obs.CheckforAddSimulatedWavecal(self.assoc, self.wavecal_info, debug=True):
-                    obs.info['addsimulatedwavecal'] = True
-                    obs.checkwcpinfo()
-                else:
-                    obs.info['addsimulatedwavecal'] = False
-                if not self.assoc.asn_info['exists'] and not obs.info['tagflash'] and \
-                   obs.switches["wavecorr"] == "PERFORM":
-                    nowavecalwarning = "\nCAUTION: You are running CalCOS with a "
-                    nowavecalwarning += "rawtag or corrtag file\nthat does not "
-                    nowavecalwarning += "contain simultaneous lamp data instead "
-                    nowavecalwarning += "of using\nan association (asn) file as "
-                    nowavecalwarning += "an input. No wavelength correction\nwill "
-                    nowavecalwarning += "be applied and your wavelength "
-                    nowavecalwarning += "calibration will be wrong.\nIf you wish "
-                    nowavecalwarning += "to create a custom asn file for use with "
-                    nowavecalwarning += "your data,\nplease refer to Chapter 3 of "
-                    nowavecalwarning += "the COS Data Handbook."
-                    cosutil.printMsg(nowavecalwarning)
-                try:
-                    self.basicCal(obs.filenames,
-                                  obs.info, obs.switches, obs.reffiles)
-                    self.updateShift(obs.filenames, obs.switches["wavecorr"],
-                                     obs.info)
-                    if obs.switches["x1dcorr"] == "PERFORM":
-                        self.extractSpectrum(obs.filenames)
-                        any_x1dcorr = "PERFORM"
-                        any_spectroscopic = "PERFORM"
-                    elif obs.info["obstype"] == "SPECTROSCOPIC":
-                        cosutil.printSwitch("X1DCORR", obs.switches)
-                        any_spectroscopic = "PERFORM"
-                    if obs.info["obstype"] == "SPECTROSCOPIC" and \
-                       obs.reffiles["spwcstab"] != NOT_APPLICABLE:
-                        spwcstab = obs.reffiles["spwcstab_hdr"]
-                    if obs.info["tagflash"] and \
-                       obs.switches["wavecorr"] == "PERFORM":
-                        any_wavecorr = "PERFORM"
-                except (BadApertureError, MissingRowError) as e:
-                    cosutil.printError("%s" % e)
-                    status = BAD_APER_MISSING_ROW_EXCEPTION
-                    continue
-                finally:
-                    obs.closeTrailer()
+                science_obs.append(obs)
+
+        results = self.calibrateAll(science_obs,
+                                    "prepareScience", "calibrateScience")
+
+        for (obs, (obs_status, obs_spwcstab, flags)) in \
+                zip(science_obs, results):
+            if obs_status:
+                status = obs_status
+            if obs_spwcstab != NOT_APPLICABLE:
+                spwcstab = obs_spwcstab
+            if flags["x1dcorr"] == "PERFORM":
+                any_x1dcorr = "PERFORM"
+            if flags["wavecorr"] == "PERFORM":
+                any_wavecorr = "PERFORM"
+            if flags["spectroscopic"] == "PERFORM":
+                any_spectroscopic = "PERFORM"
 
         if any_x1dcorr == "omit" and any_wavecorr == "omit" and \
            any_spectroscopic == "omit":
@@ -3093,6 +3218,339 @@ class Calibration(object):
 
         return status
 
+    def calibrateAll(self, obs_list, prepare, calibrate):
+        """Calibrate a list of exposures, serially or in parallel.
+
+        For each exposure, the method named by 'prepare' is called, and then
+        the method named by 'calibrate'; the trailer file for the exposure
+        is open while these are running.  If the jobs argument is greater
+        than one, the 'calibrate' methods are run in separate processes
+        (see calibrateParallel); this allows different exposures, and the
+        two segments of an FUV exposure, to be calibrated at the same time.
+
+        Parameters
+        ----------
+        obs_list: list of Observation objects
+            The exposures to be calibrated.
+
+        prepare: str
+            Name of a Calibration method that takes an Observation as its
+            argument, for checks that must be done serially.
+
+        calibrate: str
+            Name of a Calibration method that takes an Observation as its
+            argument, for the work that can be done independently for
+            each exposure.
+
+        Returns
+        -------
+        results: list
+            The value returned by 'calibrate' for each exposure.
+        """
+
+        cl_args = self.assoc.cl_args
+        jobs = cl_args.get("jobs", 1)
+        if jobs > 1 and (cl_args["stimfile"] or cl_args["livetimefile"] or
+                         cl_args["burstfile"]):
+            # The worker processes would append to these files at the
+            # same time.
+            cosutil.printWarning("jobs = %d will be ignored because a stim,"
+                                 " livetime or burst log file was specified"
+                                 % jobs)
+            jobs = 1
+        if jobs > 1 and len(self.jobGroups(obs_list)) > 1:
+            return self.calibrateParallel(obs_list, jobs, prepare, calibrate)
+
+        results = []
+        for obs in obs_list:
+            obs.openTrailer()
+            try:
+                getattr(self, prepare)(obs)
+                results.append(getattr(self, calibrate)(obs))
+            finally:
+                obs.closeTrailer()
+
+        return results
+
+    def prepareWavecal(self, obs):
+        """Checks that must be done before calibrating a wavecal.
+
+        Parameters
+        ----------
+        obs: Observation object
+            The wavecal exposure.
+        """
+
+        if self.wcp_info is None:
+            # Read info from wavecal parameters table.
+            wcp_info = cosutil.getTable(obs.reffiles["wcptab"],
+                       filter={"opt_elem": obs.info["opt_elem"]},
+                       exactly_one=True)
+            self.wcp_info = wcp_info[0]
+
+    def calibrateWavecal(self, obs):
+        """Basic calibration and extraction for one wavecal exposure.
+
+        Parameters
+        ----------
+        obs: Observation object
+            The wavecal exposure.
+
+        Returns
+        -------
+        tuple
+            (status, x1dcorr); status is 0 if OK, or
+            BAD_APER_MISSING_ROW_EXCEPTION if the try/except block catches
+            a bad aperture or missing row; x1dcorr is "PERFORM" if a
+            spectrum was extracted, otherwise "omit".
+        """
+        from . import wavecal
+
+        status = 0
+        x1dcorr = "omit"
+        try:
+            self.basicCal(obs.filenames,
+                          obs.info, obs.switches, obs.reffiles)
+            if obs.switches["x1dcorr"] == "PERFORM":
+                # Find spectrum in cross-dispersion direction.
+                # (xd_shifts and xd_locns are ignored.)
+                (shift2, xd_shifts, xd_locns, lamp_is_on) = \
+                wavecal.findWavecalSpectrum(obs.filenames["corrtag"],
+                                            obs.info, obs.reffiles)
+                # Update shift2[a-c] keywords, and possibly lampused.
+                self.setSpectrumOffset(obs.filenames,
+                                       obs.info["segment"],
+                                       shift2, lamp_is_on)
+                self.extractSpectrum(obs.filenames)
+                x1dcorr = "PERFORM"
+        except (BadApertureError, MissingRowError) as e:
+            cosutil.printError("%s" % e)
+            status = BAD_APER_MISSING_ROW_EXCEPTION
+
+        return (status, x1dcorr)
+
+    def prepareScience(self, obs):
+        """Checks that must be done before calibrating a science exposure.
+
+        These are done serially (even if jobs > 1), because the check for
+        a simulated wavecal can modify the info for the other segment.
+
+        Parameters
+        ----------
+        obs: Observation object
+            The science exposure.
+        """
+
+        # Check for whether this exposure meets the criteria for adding a simulated wavecal
+        # If so, set the obs.info['addsimulatedwavecal'] entry to True
+        if obs.CheckforAddSimulatedWavecal(self.assoc, self.wavecal_info, debug=True):
+            obs.info['addsimulatedwavecal'] = True
+            obs.checkwcpinfo()
+        else:
+            obs.info['addsimulatedwavecal'] = False
+        if not self.assoc.asn_info['exists'] and not obs.info['tagflash'] and \
+           obs.switches["wavecorr"] == "PERFORM":
+            nowavecalwarning = "\nCAUTION: You are running CalCOS with a "
+            nowavecalwarning += "rawtag or corrtag file\nthat does not "
+            nowavecalwarning += "contain simultaneous lamp data instead "
+            nowavecalwarning += "of using\nan association (asn) file as "
+            nowavecalwarning += "an input. No wavelength correction\nwill "
+            nowavecalwarning += "be applied and your wavelength "
+            nowavecalwarning += "calibration will be wrong.\nIf you wish "
+            nowavecalwarning += "to create a custom asn file for use with "
+            nowavecalwarning += "your data,\nplease refer to Chapter 3 of "
+            nowavecalwarning += "the COS Data Handbook."
+            cosutil.printMsg(nowavecalwarning)
+
+    def calibrateScience(self, obs):
+        """Basic calibration and extraction for one science exposure.
+
+        Parameters
+        ----------
+        obs: Observation object
+            The science exposure.
+
+        Returns
+        -------
+        tuple
+            (status, spwcstab, flags); status is 0 if OK, or
+            BAD_APER_MISSING_ROW_EXCEPTION if the try/except block catches
+            a bad aperture or missing row; spwcstab is the name of the
+            spwcstab (from the header) or NOT_APPLICABLE; flags is a
+            dictionary with keys "x1dcorr", "wavecorr" and "spectroscopic",
+            each of which is "PERFORM" or "omit", to indicate what still
+            needs to be done for the association as a whole.
+        """
+
+        status = 0
+        spwcstab = NOT_APPLICABLE
+        flags = {"x1dcorr": "omit",
+                 "wavecorr": "omit",
+                 "spectroscopic": "omit"}
+        try:
+            self.basicCal(obs.filenames,
+                          obs.info, obs.switches, obs.reffiles)
+            self.updateShift(obs.filenames, obs.switches["wavecorr"],
+                             obs.info)
+            if obs.switches["x1dcorr"] == "PERFORM":
+                self.extractSpectrum(obs.filenames)
+                flags["x1dcorr"] = "PERFORM"
+                flags["spectroscopic"] = "PERFORM"
+            elif obs.info["obstype"] == "SPECTROSCOPIC":
+                cosutil.printSwitch("X1DCORR", obs.switches)
+                flags["spectroscopic"] = "PERFORM"
+            if obs.info["obstype"] == "SPECTROSCOPIC" and \
+               obs.reffiles["spwcstab"] != NOT_APPLICABLE:
+                spwcstab = obs.reffiles["spwcstab_hdr"]
+            if obs.info["tagflash"] and \
+               obs.switches["wavecorr"] == "PERFORM":
+                flags["wavecorr"] = "PERFORM"
+        except (BadApertureError, MissingRowError) as e:
+            cosutil.printError("%s" % e)
+            status = BAD_APER_MISSING_ROW_EXCEPTION
+
+        return (status, spwcstab, flags)
+
+    def jobGroups(self, obs_list):
+        """Group the files that must be calibrated in the same job.
+
+        Each file is calibrated on its own, except that segment B of a
+        tagflash exposure for which there is no wavecal signal copies the
+        lampflash file for segment A (see concurrent.copySegAtoSegB), so
+        it is calibrated after segment A, in the same job.
+
+        Parameters
+        ----------
+        obs_list: list of Observation objects
+            The exposures to be calibrated.
+
+        Returns
+        -------
+        list of lists of int
+            The indices in obs_list of the files for each job, in order.
+        """
+
+        groups = []
+        segment_a = {}                  # rootname -> group for segment A
+        for (k, obs) in enumerate(obs_list):
+            root = obs.info["root"]
+            if root in segment_a and self.segmentBNeedsA(obs):
+                segment_a[root].append(k)
+            else:
+                groups.append([k])
+                if obs.info.get("segment") == "FUVA":
+                    segment_a[root] = groups[-1]
+
+        return groups
+
+    def segmentBNeedsA(self, obs):
+        """Test whether calibrating a file uses the output for segment A.
+
+        Parameters
+        ----------
+        obs: Observation object
+            One file of an exposure.
+
+        Returns
+        -------
+        boolean
+            True if obs is segment B of a tagflash exposure, and the
+            lampflash file for segment A will be copied because there is
+            no wavecal signal for segment B (or if that can't be
+            determined).
+        """
+
+        if obs.info.get("segment") != "FUVB" or not obs.info.get("tagflash"):
+            return False
+        if obs.switches.get("wavecorr") in ["OMIT", "SKIPPED"]:
+            return False
+        try:
+            return cosutil.checkForNoWavecalData(obs.info["opt_elem"],
+                                                 obs.info["cenwave"], "FUVB",
+                                                 obs.reffiles["lamptab"])
+        except (KeyError, OSError, MissingRowError):
+            # calibrating segment B will report the problem
+            return True
+
+    def calibrateParallel(self, obs_list, jobs, prepare, calibrate):
+        """Calibrate exposures in separate processes.
+
+        The 'prepare' method is called here for each exposure, in order.
+        Then the 'calibrate' method is run for each exposure in a pool of
+        up to 'jobs' processes.  Each file (e.g. each segment of an FUV
+        exposure) is calibrated in its own job, except that the files
+        grouped by jobGroups are calibrated in one job, in their original
+        order, because segment B copies the output for segment A.  The
+        messages from each exposure are saved,
+        and they are copied to the standard output and the trailer file in
+        the original order of the exposures, so the trailer files are the
+        same as for serial processing.  The header info for each
+        Observation is updated from the worker process.
+
+        Parameters
+        ----------
+        obs_list: list of Observation objects
+            The exposures to be calibrated.
+
+        jobs: int
+            The maximum number of worker processes.
+
+        prepare: str
+            Name of the Calibration method for serial checks.
+
+        calibrate: str
+            Name of the Calibration method to run in the worker processes.
+
+        Returns
+        -------
+        results: list
+            The value returned by 'calibrate' for each exposure.
+        """
+
+        intro_messages = []
+        for obs in obs_list:
+            cosutil.captureMessages()
+            try:
+                getattr(self, prepare)(obs)
+            finally:
+                intro_messages.append(cosutil.releaseMessages())
+
+        groups = self.jobGroups(obs_list)
+
+        from concurrent import futures
+
+        jobs = min(jobs, len(groups))
+        cosutil.printMsg("Calibrate %d files using %d processes."
+                         % (len(obs_list), jobs), VERY_VERBOSE)
+        with futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            # For each file, its job and its position in that job.
+            job_for_file = {}
+            for ks in groups:
+                future = executor.submit(_calibrateWorker, self, calibrate,
+                                         [self.assoc.obs.index(obs_list[k])
+                                          for k in ks],
+                                         cosutil.verbosity)
+                for (n, k) in enumerate(ks):
+                    job_for_file[k] = (future, n)
+            results = []
+            for (k, (obs, messages)) in \
+                    enumerate(zip(obs_list, intro_messages)):
+                (future, n) = job_for_file[k]
+                (result, info, switches, reffiles, worker_messages,
+                 error) = future.result()[n]
+                obs.info.update(info)
+                obs.switches.update(switches)
+                obs.reffiles.update(reffiles)
+                obs.openTrailer()
+                for message in messages + worker_messages:
+                    cosutil.printMsg(message)
+                obs.closeTrailer()
+                if error is not None:
+                    raise error
+                results.append(result)
+
+        return results
+
     def extractSpectrum(self, filenames):
         """Extract a 1-D spectrum from corrtag table or from 2-D images.
 
@@ -3103,6 +3561,7 @@ class Calibration(object):
         filenames: dictionary
             Input and output file names.
         """
+        from . import extract
 
         input = filenames["flt"]
         incounts = filenames["counts"]
@@ -3138,6 +3597,7 @@ class Calibration(object):
         updated: boolean
             True if keywords were actually written.
         """
+        from . import spwcs
 
         helcorr = switches["helcorr"]
         spwcstab = reffiles["spwcstab"]
@@ -3182,6 +3642,7 @@ class Calibration(object):
             0 if OK; BAD_APER_MISSING_ROW_EXCEPTION if the try/except block
             catches a bad aperture or missing row.
         """
+        from . import wavecal
 
         cosutil.printSwitch("WAVECORR", {"wavecorr": "PERFORM"})
         status = 0
@@ -3245,6 +3706,7 @@ class Calibration(object):
         info: dictionary
             Header keywords and values for general information.
         """
+        from . import wavecal
 
         if info["obsmode"] == "TIME-TAG":
             return
@@ -3394,6 +3856,7 @@ class Calibration(object):
         filenames: dictionary
             Input and output file names.
         """
+        from . import wavecal
 
         shift_dict = wavecal.returnExactMatch(self.wavecal_info,
                                               filenames["root"])
@@ -3426,6 +3889,7 @@ class Calibration(object):
         filenames: dictionary
             Input and output file names.
         """
+        from . import timetag
 
         if os.access(corrtag, os.R_OK):
             fd = fits.open(corrtag, mode="update")
@@ -3442,6 +3906,7 @@ class Calibration(object):
         copied from flt_a to flt_b and vice versa, and similarly for the
         counts files.
         """
+        from . import extract
 
         # segment_specific_keywords is in calcosparam.py.  The strings in
         # this list use "X" as a character to be replaced by "a" or "b" to
@@ -3489,6 +3954,7 @@ class Calibration(object):
         type: str {"science", "wavecal", "tagflash", "unknown"}
             Type of file to be concatenated, used as a dictionary key.
         """
+        from . import extract
 
         for one_set in self.assoc.concat:
 
@@ -3549,6 +4015,7 @@ class Calibration(object):
 
     def combineFlt(self):
         """Average image mode data."""
+        from . import average
 
         combine = self.assoc.combine
 
@@ -3558,6 +4025,7 @@ class Calibration(object):
 
     def combineAllX1D(self):
         """Average x1d data for all OSM positions."""
+        from . import fpavg
 
         combine = self.assoc.combine
 
@@ -3576,6 +4044,7 @@ class Calibration(object):
         fppos: int {1, 2, 3, 4}
             Value of header keyword FPPOS.
         """
+        from . import fpavg
 
         output = self.x1dProductName(fppos)
 
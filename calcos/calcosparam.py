@@ -127,6 +127,56 @@ STRING_WILDCARD = "ANY"
 NOT_APPLICABLE = "N/A"
 INT_WILDCARD = -1
 
+# This is the maximum total size (bytes) of the reference table data that
+# getTable keeps in memory between calls.  Set to 0 to disable the cache.
+TABLE_CACHE_NBYTES = 256 * 1024 * 1024
+
+# This is the maximum total size (bytes) of the reference images (flat
+# field, geometric correction and walk images) that cosutil.image_store
+# keeps in memory between calls, if no --refcache directory was given.
+# Set to 0 to disable the cache.
+IMAGE_CACHE_NBYTES = 1024 * 1024 * 1024
+
+# Wavelengths and dispersions of events are interpolated in tables
+# sampled at DISP_TABLE_SUBSAMPLE points per pixel, covering the detector
+# plus DISP_TABLE_MARGIN pixels on either side (see
+# dispersion.DispersionTable).  If the interpolation error, relative to
+# the largest value in the table, would be larger than DISP_TABLE_RTOL,
+# the dispersion relation is evaluated directly instead.  At most
+# DISP_TABLE_CACHE_SIZE tables are kept in memory.
+DISP_TABLE_SUBSAMPLE = 8
+DISP_TABLE_MARGIN = 1024
+DISP_TABLE_RTOL = 1.e-9
+DISP_TABLE_CACHE_SIZE = 16
+
+# Flux calibration curves (from the FLUXTAB) and the slopes and
+# intercepts of the time-dependent sensitivity (from the TDSTAB) are kept
+# in memory for this many configurations each (see extract.getFluxCurve
+# and extract.getTdsRow).
+SENSITIVITY_CACHE_SIZE = 64
+
+# The orbital Doppler phase, sin(2 pi t / orbitper), is tabulated at this
+# interval (seconds) and interpolated for each event (see
+# timetag.orbitalPhase).  The interpolation error is less than
+# 1.5e-7 * DOPPLER_TABLE_STEP**2 for a 96-minute orbit.
+DOPPLER_TABLE_STEP = 0.125
+
+# errFrequentist looks up the errors for integer counts from 0 through
+# this value in a table; other values are computed directly.
+FREQUENTIST_TABLE_MAX = 10000
+
+# writeOutputEvents copies the rawtag table to the corrtag file this many
+# rows at a time.
+EVENTS_BLOCK_SIZE = 1000000
+
+# Per-event corrections are applied to the events table this many rows at a
+# time (see cosutil.setChunkSize), so the memory used for temporary arrays
+# does not depend on the number of events.
+EVENTS_CHUNK_SIZE = 10000000
+
+# length (bytes) of a FITS header or data block
+FITS_BLOCK_SIZE = 2880
+
 # These are the data quality flags.
 DQ_OK = 0                       # no anomalous condition noted
 DQ_SOFTERR = 1                  # Reed-Solomon error
@@ -6,10 +6,11 @@ import sys
 import time
 import types
 import copy
+import hashlib
+from collections import OrderedDict
 import numpy as np
 import numpy.linalg as LA
 from astropy.io import fits
-from astropy.stats import poisson_conf_interval
 from . import ccos
 from .calcosparam import *       # parameter definitions
 
@@ -20,6 +21,15 @@ verbosity = VERBOSE
 fd_trl = None
 # if this is False, writing to trailer files will be disabled
 write_to_trailer = True
+# if this is a list, printMsg will append messages to it instead of
+# printing them (see captureMessages)
+captured_messages = None
+
+# number of rows of an events table to process at a time (see eventChunks)
+chunk_size = EVENTS_CHUNK_SIZE
+
+# lower and upper limits for integer counts, used by frequentistInterval
+frequentist_table = None
 
 # Used as a default value in updateDQArray.  The actual value should be
 # gotten via keyword WIDEN in the BPIXTAB table header.
@@ -27,10 +37,16 @@ PIXEL_FRACTION = 0.25
 
 def writeOutputEvents(infile, outfile):
     """
-    This function creates a recarray object with the column definitions
-    appropriate for a corrected time-tag table, reads an input events table
-    into this object, and writes it to the output file.  If the input file
-    contains a GTI table, that will be copied unchanged to output.
+    This function writes a corrected time-tag table, with the column
+    definitions appropriate for a corrtag table, by copying the columns
+    from an input events table.  If the input file contains a GTI table,
+    that will be copied unchanged to output.
+
+    The output file is written directly, without first creating the
+    table in memory.  The headers are written, and then the table data
+    are written EVENTS_BLOCK_SIZE rows at a time, so the memory needed
+    does not depend on the size of the input table.  The caller can then
+    open the output file (memory mapped) for update.
 
     If the input is already a corrtag table (if the table in the first
     extension contains the column XFULL), then the file will be copied
@@ -61,55 +77,52 @@ def writeOutputEvents(infile, outfile):
         return nrows
 
     detector = ifd[0].header.get("detector", "FUV")
-    tagflash = (ifd[0].header.get("tagflash", default="NONE") != "NONE")
-
-    # Create the output events HDU.
-    hdu = createCorrtagHDU(nrows, detector, events_extn)
-
-    if nrows == 0:
-        primary_hdu = fits.PrimaryHDU(header=ifd[0].header)
-        ofd = fits.HDUList(primary_hdu)
-        updateFilename(ofd[0].header, outfile)
-        ofd.append(hdu)
-        if len(ifd) == 3:
-            ofd.append(ifd["GTI"])
-        ofd.writeto(outfile)
-        ifd.close()
-        return nrows
-
-    outdata = hdu.data
-
-    # Copy data from the input table to the output HDU object.
-
-    outdata.field("TIME")[:] = indata.field("TIME")
 
-    outdata.field("RAWX")[:] = indata.field("RAWX")
-    outdata.field("RAWY")[:] = indata.field("RAWY")
-    outdata.field("XCORR")[:] = indata.field("RAWX")
-    outdata.field("YCORR")[:] = indata.field("RAWY")
-
-    outdata.field("XDOPP")[:] = np.zeros(nrows, dtype=np.float32)
-    outdata.field("XFULL")[:] = np.zeros(nrows, dtype=np.float32)
-    outdata.field("YFULL")[:] = np.zeros(nrows, dtype=np.float32)
-    outdata.field("WAVELENGTH")[:] = np.zeros(nrows, dtype=np.float32)
-
-    outdata.field("EPSILON")[:] = np.ones(nrows, dtype=np.float32)
-    outdata.field("DQ")[:] = np.zeros(nrows, dtype=np.int16)
-    if detector == "FUV":
-        outdata.field("PHA")[:] = indata.field("PHA")
-    else:
-        outdata.field("PHA")[:] = 0
+    # Create the output events HDU, but with no rows; this gives the
+    # header and the data type of a row.
+    hdu = createCorrtagHDU(0, detector, events_extn)
+    hdu.header["naxis2"] = nrows
+    row_dtype = hdu.columns.dtype.newbyteorder(">")     # FITS byte order
 
     primary_hdu = fits.PrimaryHDU(header=ifd[0].header)
-    ofd = fits.HDUList(primary_hdu)
-    updateFilename(ofd[0].header, outfile)
-    ofd.append(hdu)
+    updateFilename(primary_hdu.header, outfile)
+    if "extend" not in primary_hdu.header:
+        primary_hdu.header.set("extend", True, after="naxis")
+
+    with open(outfile, "wb") as fd:
+        # The primary HDU has no data.
+        fd.write(primary_hdu.header.tostring().encode("ascii"))
+        fd.write(hdu.header.tostring().encode("ascii"))
+
+        # Copy data from the input table to the output file.
+        for first in range(0, nrows, EVENTS_BLOCK_SIZE):
+            block = indata[first:first+EVENTS_BLOCK_SIZE]
+            outdata = np.zeros(len(block), dtype=row_dtype)
+
+            outdata["TIME"] = block.field("TIME")
+
+            outdata["RAWX"] = block.field("RAWX")
+            outdata["RAWY"] = block.field("RAWY")
+            outdata["XCORR"] = block.field("RAWX")
+            outdata["YCORR"] = block.field("RAWY")
+
+            # XDOPP, XFULL, YFULL, WAVELENGTH and DQ are zero.
+            outdata["EPSILON"] = 1.
+            if detector == "FUV":
+                outdata["PHA"] = block.field("PHA")
+            else:
+                outdata["PHA"] = 0
+            fd.write(outdata.tobytes())
+            del block, outdata
+
+        # Pad the data to a multiple of the FITS block size.
+        nbytes = nrows * row_dtype.itemsize
+        fd.write(bytes(-nbytes % FITS_BLOCK_SIZE))
 
     # GTI table.
     if len(ifd) == 3:
-        ofd.append(ifd["GTI"])
+        fits.append(outfile, ifd["GTI"].data, ifd["GTI"].header)
 
-    ofd.writeto(outfile)
     ifd.close()
 
     return nrows
@@ -423,9 +436,7 @@ def findColumn(table, colname):
     """
 
     if isinstance(table, str):
-        fd = fits.open(table, mode="copyonwrite")
-        fits_rec = fd[1].data
-        fd.close()
+        fits_rec = table_cache.getData(table, 1)
     else:
         fits_rec = table
 
@@ -493,10 +504,8 @@ def getTable(table, filter, extension=1,
         None will be returned.
     """
 
-    fd = fits.open(table, mode="copyonwrite")
-    data = fd[extension].data
+    data = table_cache.getData(table, extension)
     if data is None or len(data) < 1:
-        fd.close()
         return None
 
     # There will be one element of select_arrays for each non-trivial
@@ -531,8 +540,6 @@ def getTable(table, filter, extension=1,
     else:
         newdata = data.copy()
 
-    fd.close()
-
     nselect = len(newdata)
     if nselect < 1:
         newdata = None
@@ -551,6 +558,364 @@ def getTable(table, filter, extension=1,
 
     return newdata
 
+def fileKey(filename):
+    """Return a key that identifies the current contents of a file.
+
+    Parameters
+    ----------
+    filename: str
+        Name of a (reference) file.
+
+    Returns
+    -------
+    tuple or None
+        The absolute path, modification time (ns), size and inode number
+        of the file, so a file that is replaced on disk gets a new key;
+        None if the file can't be found.
+    """
+
+    try:
+        st = os.stat(filename)
+    except (OSError, TypeError):
+        return None
+
+    return (os.path.abspath(filename),
+            st.st_mtime_ns, st.st_size, st.st_ino)
+
+class TableCache(object):
+    """In-memory cache of reference table data, used by getTable.
+
+    The same reference tables (e.g. disptab, xtractab, wcptab) are read
+    many times while processing an association.  This class keeps the
+    decoded data of each table extension, so the file only has to be
+    opened and read once.  An entry is identified by the file name, the
+    extension, and the modification time, size and inode of the file, so
+    a reference file that is replaced on disk will be read again.  When
+    the total size of the cached data exceeds the limit, the least
+    recently used entries are discarded.
+
+    The public methods are:
+        data = table_cache.getData(table, extension)
+        table_cache.setMaxBytes(max_nbytes)
+        table_cache.clear()
+        nbytes = table_cache.nbytes()
+
+    Parameters
+    ----------
+    max_nbytes: int
+        Maximum total size (bytes) of the cached table data.  0 disables
+        the cache.
+    """
+
+    def __init__(self, max_nbytes=TABLE_CACHE_NBYTES):
+
+        self.max_nbytes = max_nbytes
+        self._entries = OrderedDict()   # key -> (data, nbytes)
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def getData(self, table, extension=1):
+        """Return the data portion of a table extension.
+
+        The returned object is shared with the cache and must not be
+        modified; getTable only returns selected copies of it.
+
+        Parameters
+        ----------
+        table: str
+            Name of the table.
+
+        extension: tuple, str, or int
+            Identifier for the extension containing the table.
+
+        Returns
+        -------
+        FITS_rec or None
+            The table data, or None if the extension contains no data.
+        """
+
+        key = self._makeKey(table, extension)
+        if key is not None and key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+        self.misses += 1
+
+        fd = fits.open(table, mode="copyonwrite")
+        data = fd[extension].data
+        if data is not None:
+            # copy to memory, so the data are independent of the file
+            data = data.copy()
+        fd.close()
+
+        if key is not None:
+            self._insert(key, data)
+
+        return data
+
+    def setMaxBytes(self, max_nbytes):
+        """Change the size limit, discarding entries if necessary."""
+
+        self.max_nbytes = max_nbytes
+        self._evict()
+
+    def clear(self):
+        """Discard all cached tables."""
+
+        self._entries.clear()
+        self._nbytes = 0
+
+    def nbytes(self):
+        """Return the total size (bytes) of the cached table data."""
+
+        return self._nbytes
+
+    def _makeKey(self, table, extension):
+        """Return a key for the table, or None if it can't be cached."""
+
+        if self.max_nbytes <= 0 or not isinstance(table, str):
+            return None
+        try:
+            hash(extension)
+        except TypeError:
+            return None
+        file_key = fileKey(table)
+        if file_key is None:
+            return None
+
+        return (file_key, extension)
+
+    def _insert(self, key, data):
+
+        if data is None:
+            nbytes = 0
+        else:
+            nbytes = data.nbytes
+        if nbytes > self.max_nbytes:
+            return
+
+        # Drop any stale entries for the same file and extension.
+        for old_key in [k for k in self._entries
+                        if k[0][0] == key[0][0] and k[1] == key[1]]:
+            self._nbytes -= self._entries.pop(old_key)[1]
+
+        self._entries[key] = (data, nbytes)
+        self._nbytes += nbytes
+        self._evict()
+
+    def _evict(self):
+
+        while self._entries and \
+              (self._nbytes > self.max_nbytes or self.max_nbytes <= 0):
+            (data, nbytes) = self._entries.popitem(last=False)[1]
+            self._nbytes -= nbytes
+
+# The cache used by getTable and findColumn.
+table_cache = TableCache()
+
+class ImageStore(object):
+    """Native-endian, memory-mapped copies of reference images.
+
+    The flat field, geometric correction and walk images are read for
+    every exposure and segment, and each process decodes its own copy of
+    the big-endian FITS data.  If a directory has been specified, the data
+    of each reference image extension are instead written once to that
+    directory as a native-endian .npy file (with the header as a text
+    file next to it), and the .npy file is memory-mapped read-only.  So
+    several calcos processes on one machine share one physical copy of
+    each image.  The files are named by the SHA-256 hash of the reference
+    file contents and the extension, so a reference file that is replaced
+    gets new files, and the directory can be shared by any number of
+    processes; a file is written to a temporary name and then renamed, so
+    a partially written file will never be read.
+
+    If no directory was specified (the default), getImage reads the
+    extension from the FITS file, and keeps a native-endian copy in memory
+    for later calls in the same process (e.g. the next exposure, or the
+    next job of a calcos worker).  An image is identified by the file
+    name, modification time, size and inode of the file and the
+    extension, so a reference file that is replaced on disk will be read
+    again.  When the total size of these images exceeds max_nbytes, the
+    least recently used ones are discarded.
+
+    The public methods are:
+        (data, header) = image_store.getImage(filename, extension)
+        image_store.setDirectory(directory)
+
+    Parameters
+    ----------
+    directory: str or None
+        Name of the directory for the .npy files, or None.
+
+    max_nbytes: int
+        Maximum total size (bytes) of the images kept in memory if there
+        is no directory.  0 disables this cache.
+    """
+
+    def __init__(self, directory=None, max_nbytes=IMAGE_CACHE_NBYTES):
+
+        self.directory = None
+        self.max_nbytes = max_nbytes
+        self._hashes = {}               # file key -> hash of file contents
+        self._images = {}               # (file key, extension) -> image
+        self._memory = OrderedDict()    # (file key, extension) -> image
+        self._nbytes = 0
+        self.setDirectory(directory)
+
+    def setDirectory(self, directory):
+        """Specify the directory for the .npy files (None to disable)."""
+
+        if directory:
+            directory = os.path.abspath(os.path.expandvars(directory))
+        else:
+            directory = None
+        if directory != self.directory:
+            self._images.clear()
+        self.directory = directory
+
+    def getImage(self, filename, extension):
+        """Return the data and header of an image extension.
+
+        The array is read-only, and it may be shared with later calls;
+        if the image could not be cached, it is opened with
+        mode="copyonwrite", so changes are not written to the reference
+        file.
+
+        Parameters
+        ----------
+        filename: str
+            Name of the reference file.
+
+        extension: tuple, str, or int
+            Identifier for the image extension.
+
+        Returns
+        -------
+        tuple
+            (data, header), the image (array or None) and a copy of the
+            extension header.
+        """
+
+        file_key = fileKey(filename)
+        if file_key is None:
+            pass                # fits.open will report the error
+        elif self.directory is not None:
+            try:
+                return self._getStoredImage(filename, file_key, extension)
+            except OSError as error:
+                printWarning("Can't use reference image directory %s:" %
+                             self.directory)
+                printContinuation(str(error))
+        elif self.max_nbytes > 0:
+            return self._getMemoryImage(filename, file_key, extension)
+
+        fd = fits.open(filename, mode="copyonwrite")
+        hdu = fd[extension]
+        data = hdu.data
+        header = hdu.header.copy()
+        fd.close()
+
+        return (data, header)
+
+    def _getMemoryImage(self, filename, file_key, extension):
+
+        key = (file_key, self._extensionName(extension))
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            (data, header, nbytes) = self._memory[key]
+            return (data, header.copy())
+
+        fd = fits.open(filename, mode="copyonwrite")
+        hdu = fd[extension]
+        data = hdu.data
+        header = hdu.header
+        if data is not None:
+            data = np.ascontiguousarray(data,
+                                        dtype=data.dtype.newbyteorder("="))
+            data.flags.writeable = False
+        fd.close()
+
+        nbytes = 0 if data is None else data.nbytes
+        if nbytes <= self.max_nbytes:
+            # Drop any stale entry for the same file and extension.
+            for old_key in [k for k in self._memory
+                            if k[0][0] == key[0][0] and k[1] == key[1]]:
+                self._nbytes -= self._memory.pop(old_key)[2]
+            self._memory[key] = (data, header, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_nbytes:
+                self._nbytes -= self._memory.popitem(last=False)[1][2]
+
+        return (data, header.copy())
+
+    def _getStoredImage(self, filename, file_key, extension):
+
+        key = (file_key, self._extensionName(extension))
+        if key in self._images:
+            return self._images[key]
+
+        if file_key not in self._hashes:
+            self._hashes[file_key] = self._fileHash(filename)
+        root = os.path.join(self.directory,
+                            "%s_%s" % (self._hashes[file_key], key[1]))
+        (data_name, header_name) = (root + ".npy", root + ".hdr")
+
+        if not (os.access(data_name, os.R_OK) and
+                os.access(header_name, os.R_OK)):
+            os.makedirs(self.directory, exist_ok=True)
+            fd = fits.open(filename, mode="copyonwrite")
+            hdu = fd[extension]
+            if hdu.data is None:
+                fd.close()
+                raise OSError("extension %s of %s has no data" %
+                              (repr(extension), filename))
+            dtype = hdu.data.dtype.newbyteorder("=")
+            data = np.ascontiguousarray(hdu.data, dtype=dtype)
+            header_string = hdu.header.tostring()
+            fd.close()
+            temp = "%s.%d.tmp" % (root, os.getpid())
+            with open(temp, "wb") as fd_npy:
+                np.save(fd_npy, data)
+            os.replace(temp, data_name)
+            with open(temp, "w") as fd_hdr:
+                fd_hdr.write(header_string)
+            os.replace(temp, header_name)
+            del data
+
+        data = np.load(data_name, mmap_mode="r")
+        with open(header_name) as fd_hdr:
+            header = fits.Header.fromstring(fd_hdr.read())
+        self._images[key] = (data, header)
+
+        return (data, header.copy())
+
+    def _fileHash(self, filename):
+        """Return the SHA-256 hash (hex digits) of the contents of a file."""
+
+        h = hashlib.sha256()
+        with open(filename, "rb") as fd:
+            while True:
+                block = fd.read(FITS_BLOCK_SIZE * 1024)
+                if not block:
+                    break
+                h.update(block)
+
+        return h.hexdigest()
+
+    def _extensionName(self, extension):
+        """Return a string for the extension that can be part of a name."""
+
+        if isinstance(extension, tuple):
+            name = "_".join([str(x) for x in extension])
+        else:
+            name = str(extension)
+
+        return "".join([c if c.isalnum() else "_" for c in name.lower()])
+
+# The store used for reference images (see setRefcache).
+image_store = ImageStore()
+
 def getColCopy(filename="", column=None, extension=1, data=None):
     """Return the specified column in native format.
 
@@ -715,6 +1080,56 @@ def determineLivetime(countrate, obs_rate, live_factor):
 
     return livetime
 
+def determineLivetimeArray(countrate, obs_rate, live_factor):
+    """Compute livetime factors for an array of observed count rates.
+
+    This gives the same values as calling determineLivetime for each
+    element of countrate.
+
+    Parameters
+    ----------
+    countrate: array_like
+        Observed count rates.
+
+    obs_rate: array_like
+        Observed count rate column from deadtab.
+
+    live_factor: array_like
+        Livetime factor column from deadtab.
+
+    Returns
+    -------
+    array_like
+        The interpolated livetime factors.
+    """
+
+    countrate = np.asarray(countrate, dtype=np.float64)
+    obs_rate = np.asarray(obs_rate)
+    live_factor = np.asarray(live_factor)
+    n = len(obs_rate)
+
+    # Do the arithmetic in the same precision as determineLivetime, where
+    # countrate is a Python float and the other values are table elements.
+    if np.issubdtype(obs_rate.dtype, np.floating):
+        rate = countrate.astype(obs_rate.dtype)
+    else:
+        rate = countrate
+
+    if n == 1:
+        livetime = np.zeros(len(countrate), dtype=live_factor.dtype) + \
+                   live_factor[0]
+    else:
+        i = np.searchsorted(obs_rate, rate, side="right") - 1
+        i = np.clip(i, 0, n-2)
+        p = (rate - obs_rate[i]) / (obs_rate[i+1] - obs_rate[i])
+        q = 1. - p
+        livetime = live_factor[i] * q + live_factor[i+1] * p
+        livetime = np.where(rate >= obs_rate[n-1], live_factor[n-1], livetime)
+        livetime = np.where(rate < obs_rate[0], 1., livetime)
+    livetime = np.where(countrate <= 0., 1., livetime)
+
+    return livetime
+
 def isLampOn(xi, eta, dq, info, xtractab, shift2=0.):
     """Test whether a lamp was on.
 
@@ -971,28 +1386,53 @@ def geometricDistortion(x, y, geofile, segment, igeocorr):
         "PERFORM" if interpolation should be used within the geofile.
     """
 
-    fd = fits.open(geofile, mode="copyonwrite")
-    x_hdu = fd[(segment,1)]
-    y_hdu = fd[(segment,2)]
+    (x_image, y_image, origin_x, origin_y, xbin, ybin) = \
+            getGeoImages(geofile, segment)
+
+    interp_flag = (igeocorr == "PERFORM")
+    ccos.geocorrection(x, y, x_image, y_image, interp_flag,
+                       origin_x, origin_y, xbin, ybin)
+
+def getGeoImages(geofile, segment):
+    """Read the X and Y geometric correction images for a segment.
+
+    Parameters
+    ----------
+    geofile: str
+        Name of geometric correction reference file.
+
+    segment: {"FUVA", "FUVB"}
+        FUV segment name.
+
+    Returns
+    -------
+    tuple
+        (x_image, y_image, origin_x, origin_y, xbin, ybin), where x_image
+        and y_image are the images of X and Y offsets (float32), and the
+        other values are the corresponding header keywords (int).
+    """
+
+    (x_data, x_hdr) = image_store.getImage(geofile, (segment,1))
+    (y_data, y_hdr) = image_store.getImage(geofile, (segment,2))
 
-    origin_x = x_hdu.header.get("origin_x", 0)
-    origin_y = x_hdu.header.get("origin_y", 0)
+    origin_x = x_hdr.get("origin_x", 0)
+    origin_y = x_hdr.get("origin_y", 0)
 
-    if origin_x != y_hdu.header.get("origin_x", 0) or \
-       origin_y != y_hdu.header.get("origin_y", 0):
+    if origin_x != y_hdr.get("origin_x", 0) or \
+       origin_y != y_hdr.get("origin_y", 0):
         raise RuntimeError("Inconsistent ORIGIN_X or _Y keywords in GEOFILE")
 
-    xbin = x_hdu.header.get("xbin", 1)
-    ybin = x_hdu.header.get("ybin", 1)
-    if xbin != y_hdu.header.get("xbin", 1) or \
-       ybin != y_hdu.header.get("ybin", 1):
+    xbin = x_hdr.get("xbin", 1)
+    ybin = x_hdr.get("ybin", 1)
+    if xbin != y_hdr.get("xbin", 1) or \
+       ybin != y_hdr.get("ybin", 1):
         raise RuntimeError("Inconsistent XBIN or YBIN keywords in GEOFILE")
 
-    interp_flag = (igeocorr == "PERFORM")
-    ccos.geocorrection(x, y, x_hdu.data, y_hdu.data, interp_flag,
-                       origin_x, origin_y, xbin, ybin)
+    # Memory-mapped float32 images are used in-place.
+    x_image = np.asarray(x_data, dtype=np.float32)
+    y_image = np.asarray(y_data, dtype=np.float32)
 
-    fd.close()
+    return (x_image, y_image, origin_x, origin_y, xbin, ybin)
 
 def activeArea(segment, brftab):
     """Return the limits of the FUV active area.
@@ -2044,40 +2484,33 @@ def getGeoData(geofile, segment):
     -------
     tuple
         The data from the geofile for X and Y, and the offsets;
-        x_hdu.data:  array to correct distortion in X
-        origin_x:  offset of x_hdu.data within detector coordinates
+        x_data:  array to correct distortion in X
+        origin_x:  offset of x_data within detector coordinates
         xbin:  binning (int) in the X direction
-        y_hdu.data:  array to correct distortion in Y
-        origin_y:  offset of y_hdu.data within detector coordinates
+        y_data:  array to correct distortion in Y
+        origin_y:  offset of y_data within detector coordinates
         ybin:  binning (int) in the Y direction
     """
 
-    fd = fits.open(geofile, mode="copyonwrite")
-    x_hdu = fd[(segment,1)]
-    y_hdu = fd[(segment,2)]
+    (x_data, x_hdr) = image_store.getImage(geofile, (segment,1))
+    (y_data, y_hdr) = image_store.getImage(geofile, (segment,2))
 
     # The images in the geofile will typically be smaller than the full
     # detector.  These offsets give the location of geofile pixel [0,0]
     # on the detector.
-    origin_x = x_hdu.header.get("origin_x", 0)
-    origin_y = x_hdu.header.get("origin_y", 0)
+    origin_x = x_hdr.get("origin_x", 0)
+    origin_y = x_hdr.get("origin_y", 0)
 
-    if origin_x != y_hdu.header.get("origin_x", 0) or \
-       origin_y != y_hdu.header.get("origin_y", 0):
+    if origin_x != y_hdr.get("origin_x", 0) or \
+       origin_y != y_hdr.get("origin_y", 0):
         raise RuntimeError("Inconsistent ORIGIN_X or _Y keywords in GEOFILE")
 
-    xbin = x_hdu.header.get("xbin", 1)
-    ybin = x_hdu.header.get("ybin", 1)
-    if xbin != y_hdu.header.get("xbin", 1) or \
-       ybin != y_hdu.header.get("ybin", 1):
+    xbin = x_hdr.get("xbin", 1)
+    ybin = x_hdr.get("ybin", 1)
+    if xbin != y_hdr.get("xbin", 1) or \
+       ybin != y_hdr.get("ybin", 1):
         raise RuntimeError("Inconsistent XBIN or YBIN keywords in GEOFILE")
 
-    # "touch" the data before closing the file.  Is this necessary?
-    x_data = x_hdu.data
-    y_data = y_hdu.data
-
-    fd.close()
-
     return (x_data, origin_x, xbin, y_data, origin_y, ybin)
 
 def tableHeaderToImage(thdr):
@@ -2779,6 +3212,10 @@ def getPulseHeightRange(hdr, segment):
 
     return "%2d_%2d" % (low, high)
 
+# Values of keyword PHARANGE, used by tempPulseHeightRange; the key
+# includes the modification time and size of the reference file.
+ref_pharange_cache = {}
+
 def tempPulseHeightRange(ref):
     """Get keyword PHARANGE from the primary header of a reference file.
 
@@ -2793,10 +3230,17 @@ def tempPulseHeightRange(ref):
         Value of keyword PHARANGE, or None if the keyword is missing
     """
 
+    key = fileKey(ref)
+    if key in ref_pharange_cache:
+        return ref_pharange_cache[key]
+
     fd = fits.open(ref, "readonly")
     ref_pharange = fd[0].header.get("pharange", None)
     fd.close()
 
+    if key is not None:
+        ref_pharange_cache[key] = ref_pharange
+
     return ref_pharange
 
 def comparePulseHeightRanges(pharange, ref_pharange, refname):
@@ -2886,6 +3330,57 @@ def setVerbosity(verbosity_level):
     global verbosity
     verbosity = verbosity_level
 
+def setChunkSize(n):
+    """Copy the chunk size to a variable that is global for this file.
+
+    Parameters
+    ----------
+    n: int
+        The maximum number of rows of an events table that will be
+        processed at a time by the per-event calibration steps; the
+        default is EVENTS_CHUNK_SIZE, defined in calcosparam.py
+    """
+
+    global chunk_size
+    if n < 1:
+        raise ValueError("chunk size must be at least 1, not %s" % n)
+    chunk_size = int(n)
+
+def setRefcache(directory):
+    """Specify the directory for memory-mapped reference images.
+
+    Parameters
+    ----------
+    directory: str or None
+        Name of the directory in which image_store keeps native-endian
+        copies of the flat field, geometric correction and walk images;
+        None means the images are read from the reference files.
+    """
+
+    image_store.setDirectory(directory)
+
+def eventChunks(stop, start=0):
+    """Divide a range of rows of an events table into chunks.
+
+    Parameters
+    ----------
+    stop: int
+        One more than the index of the last row to include.
+
+    start: int
+        The index of the first row to include.
+
+    Returns
+    -------
+    list of slice objects
+        Consecutive slices, each with at most chunk_size rows, which
+        together cover the rows from start to stop.  The list is empty
+        if stop <= start.
+    """
+
+    return [slice(i, min(i + chunk_size, stop))
+            for i in range(start, stop, chunk_size)]
+
 def checkVerbosity(level):
     """Return True if verbosity is at least as great as level.
 
@@ -2973,12 +3468,47 @@ def printMsg(message, level=QUIET):
     """
 
     if verbosity >= level:
+        if captured_messages is not None:
+            captured_messages.append(message)
+            return
         print(message)
         sys.stdout.flush()
         if fd_trl is not None:
             fd_trl.write(message+"\n")
             fd_trl.flush()
 
+def captureMessages():
+    """Save messages in memory instead of printing them.
+
+    This is used when calibrating an exposure in a worker process, so
+    that the parent process can copy the messages to the standard output
+    and the trailer file in a predictable order.  Messages are selected
+    according to the verbosity level in the usual way.
+    """
+
+    global captured_messages
+
+    captured_messages = []
+
+def releaseMessages():
+    """Stop saving messages, and return the messages that were saved.
+
+    Returns
+    -------
+    messages: list of str
+        The messages that were saved since captureMessages was called.
+        These can be printed by calling printMsg for each one.
+    """
+
+    global captured_messages
+
+    messages = captured_messages
+    captured_messages = None
+    if messages is None:
+        messages = []
+
+    return messages
+
 def printIntro(str):
     """Print introductory message.
 
@@ -3752,11 +4282,60 @@ def errFrequentist(counts):
          the upper error estimate for counts)
     """
 
-    lower, upper = poisson_conf_interval(counts, interval='frequentist-confidence')
+    if np.ndim(counts) == 0:
+        from astropy.stats import poisson_conf_interval
+        lower, upper = poisson_conf_interval(counts,
+                                    interval='frequentist-confidence')
+    else:
+        counts = np.asarray(counts)
+        lower, upper = frequentistInterval(counts)
     err_lower = counts - lower
     err_upper = upper - counts
     return (err_lower.astype(np.float32), err_upper.astype(np.float32))
 
+def frequentistInterval(counts):
+    """Get the 'frequentist-confidence' interval, using a table if possible.
+
+    Counts that are integers from 0 through FREQUENTIST_TABLE_MAX are
+    looked up in a table (created on the first call); the interval for
+    any other value is computed by poisson_conf_interval.
+
+    Parameters
+    ----------
+    counts: array_like
+        Number of counts (not necessarily integer values).
+
+    Returns
+    -------
+    tuple of 2 array_like
+        The lower and upper limits of the confidence interval, float64
+    """
+
+    global frequentist_table
+
+    # astropy.stats is slow to import, so it's only imported when needed
+    from astropy.stats import poisson_conf_interval
+
+    if frequentist_table is None:
+        n = np.arange(FREQUENTIST_TABLE_MAX + 1, dtype=np.float64)
+        frequentist_table = poisson_conf_interval(n,
+                                    interval='frequentist-confidence')
+    (lower_table, upper_table) = frequentist_table
+
+    in_table = np.logical_and(counts >= 0, counts <= FREQUENTIST_TABLE_MAX)
+    index = np.zeros(counts.shape, dtype=np.intp)
+    index[in_table] = counts[in_table]
+    in_table &= (index == counts)
+    if in_table.all():
+        return (lower_table[index], upper_table[index])
+
+    lower = np.where(in_table, lower_table[index], 0.)
+    upper = np.where(in_table, upper_table[index], 0.)
+    not_in_table = np.logical_not(in_table)
+    (lower[not_in_table], upper[not_in_table]) = poisson_conf_interval(
+                counts[not_in_table], interval='frequentist-confidence')
+    return (lower, upper)
+
 def precess(t, target):
     """Precess target to the time of observation.
 
@@ -1,5 +1,11 @@
+from collections import OrderedDict
 import numpy as np
+from . import ccos
 from . import cosutil
+from .calcosparam import *       # parameter definitions
+
+# DispersionTable objects, used by getDispersionTable
+disp_table_cache = OrderedDict()
 
 class Dispersion(object):
     """Dispersion relation.
@@ -218,3 +224,221 @@ class Dispersion(object):
                 done = True
 
         return x
+
+class DispersionTable(object):
+    """Dispersion relation tabulated on a sub-pixel grid.
+
+    The wavelength and dispersion are computed from the dispersion
+    relation at subsample points per pixel, from x_min to x_max, and
+    evalDisp and evalDerivDisp interpolate linearly in these tables, for
+    all the elements of an array in one pass.  This is much faster than
+    evaluating the polynomial for each event in a large events table.
+    For x outside the tables, the dispersion relation is evaluated
+    directly.
+
+    The interpolation error is largest midway between table points, so
+    the tables are checked against the dispersion relation at those
+    points.  If the largest error (relative to the largest value in the
+    table) exceeds rtol, the tables are not used at all.
+
+    The public methods are:
+        wavelength = disptable.evalDisp(x)
+        dwavelength / dx = disptable.evalDerivDisp(x)
+        wavelength / (dwavelength / dx) = disptable.evalDispRatio(x)
+        (wl_error, disp_error, ratio_error) = disptable.maxError()
+        flag = disptable.isAccurate()
+
+    Parameters
+    ----------
+    disp_rel: Dispersion object
+        The dispersion relation.
+
+    x_min, x_max: float
+        The range of pixel coordinates to cover.
+
+    subsample: int
+        The number of table points per pixel.
+
+    x_shift: float
+        This is subtracted from x before evaluating the dispersion
+        relation, e.g. to correct for fpoffset.
+
+    rtol: float
+        The largest acceptable interpolation error, relative to the
+        largest wavelength or dispersion in the table.
+    """
+
+    def __init__(self, disp_rel, x_min, x_max, subsample,
+                 x_shift=0., rtol=DISP_TABLE_RTOL):
+
+        self.disp_rel = disp_rel
+        self.x_shift = x_shift
+        self.x_first = float(x_min)
+        self.subsample = float(subsample)
+
+        npts = int(round((x_max - x_min) * subsample)) + 1
+        x = self.x_first + np.arange(npts, dtype=np.float64) / subsample
+        self.wavelength = disp_rel.evalDisp(x - x_shift)
+        # (evalDerivDisp returns a scalar for a linear dispersion relation)
+        self.dispersion = np.zeros_like(x) + \
+                          disp_rel.evalDerivDisp(x - x_shift)
+        self.ratio = self.wavelength / self.dispersion
+
+        # Compare interpolated and exact values midway between points.
+        x_mid = x[:-1] + 0.5 / subsample
+        wl_error = np.abs(disp_rel.evalDisp(x_mid - x_shift) -
+                          (self.wavelength[:-1] + self.wavelength[1:]) / 2.)
+        disp_error = np.abs(disp_rel.evalDerivDisp(x_mid - x_shift) -
+                            (self.dispersion[:-1] + self.dispersion[1:]) / 2.)
+        ratio_error = np.abs(self._ratio(x_mid - x_shift) -
+                             (self.ratio[:-1] + self.ratio[1:]) / 2.)
+        self.wl_error = wl_error.max()
+        self.disp_error = disp_error.max()
+        self.ratio_error = ratio_error.max()
+        self._accurate = \
+            (self.wl_error <= rtol * np.abs(self.wavelength).max() and
+             self.disp_error <= rtol * np.abs(self.dispersion).max() and
+             self.ratio_error <= rtol * np.abs(self.ratio).max())
+
+    def maxError(self):
+        """Return the largest interpolation errors in the two tables.
+
+        Returns
+        -------
+        tuple of three floats
+            The largest difference between interpolated and exact values
+            of the wavelength, the dispersion, and their ratio.
+        """
+
+        return (self.wl_error, self.disp_error, self.ratio_error)
+
+    def isAccurate(self):
+        """Return True if the tables are used for interpolation."""
+
+        return self._accurate
+
+    def evalDisp(self, x):
+        """Evaluate the dispersion relation at x.
+
+        Parameters
+        ----------
+        x: array_like
+            Pixel coordinates
+
+        Returns
+        -------
+        array_like
+            Wavelengths at x (float64)
+        """
+
+        return self._lookup(x, self.wavelength, self.disp_rel.evalDisp)
+
+    def evalDerivDisp(self, x):
+        """Evaluate the derivative of the dispersion relation at x.
+
+        Parameters
+        ----------
+        x: array_like
+            Pixel coordinates
+
+        Returns
+        -------
+        array_like
+            Slopes at x, in Angstroms per pixel (float64)
+        """
+
+        return self._lookup(x, self.dispersion, self.disp_rel.evalDerivDisp)
+
+    def evalDispRatio(self, x):
+        """Evaluate the wavelength divided by the dispersion at x.
+
+        This is the factor for converting a fractional shift in wavelength
+        (e.g. v / c for a Doppler shift) to a shift in pixels.
+
+        Parameters
+        ----------
+        x: array_like
+            Pixel coordinates
+
+        Returns
+        -------
+        array_like
+            Wavelength divided by slope at x, in pixels (float64)
+        """
+
+        return self._lookup(x, self.ratio, self._ratio)
+
+    def _ratio(self, x):
+        """Evaluate the wavelength divided by the dispersion directly."""
+
+        return self.disp_rel.evalDisp(x) / self.disp_rel.evalDerivDisp(x)
+
+    def _lookup(self, x, table, function):
+        """Interpolate in table, or evaluate function where necessary."""
+
+        x = np.asarray(x)
+        if not self._accurate or x.ndim != 1:
+            return function(np.float64(x) - self.x_shift)
+
+        result = np.empty(len(x), dtype=np.float64)
+        n_outside = ccos.lookup(x, table, self.x_first, self.subsample,
+                                result)
+        if n_outside > 0:
+            outside = np.isnan(result)
+            result[outside] = function(np.float64(x[outside]) - self.x_shift)
+
+        return result
+
+def getDispersionTable(disptab, filter, nx, x_shift=0., use_fpoffset=True):
+    """Get a DispersionTable covering the detector.
+
+    The tables are cached, so the same dispersion relation is only
+    tabulated once.
+
+    Parameters
+    ----------
+    disptab: str
+        Name of table containing dispersion relations.
+
+    filter: dictionary
+        Parameters for selecting a row from the disptab.
+
+    nx: int
+        Length of the detector in the dispersion direction.
+
+    x_shift: float
+        This is subtracted from pixel coordinates before evaluating the
+        dispersion relation.
+
+    use_fpoffset: boolean
+        If True, include fpoffset in the filter; if False, exclude it.
+
+    Returns
+    -------
+    DispersionTable object, or None
+        None if no matching row was found in disptab.
+    """
+
+    file_id = cosutil.fileKey(disptab)
+    if file_id is None:
+        file_id = disptab
+    key = (file_id,
+           tuple(sorted([(k.lower(), filter[k]) for k in filter])),
+           nx, x_shift, use_fpoffset)
+    if key in disp_table_cache:
+        disp_table_cache.move_to_end(key)
+        return disp_table_cache[key]
+
+    disp_rel = Dispersion(disptab, filter, use_fpoffset=use_fpoffset)
+    if not disp_rel.isValid():
+        disp_rel.close()
+        return None
+    disp_table = DispersionTable(disp_rel,
+                                 -DISP_TABLE_MARGIN, nx + DISP_TABLE_MARGIN,
+                                 DISP_TABLE_SUBSAMPLE, x_shift=x_shift)
+
+    disp_table_cache[key] = disp_table
+    while len(disp_table_cache) > DISP_TABLE_CACHE_SIZE:
+        disp_table_cache.popitem(last=False)
+
+    return disp_table
@@ -1,8 +1,8 @@
 import copy
 import os
+from collections import OrderedDict
 import numpy as np
 from astropy.io import fits
-from astropy.stats import poisson_conf_interval
 from . import cosutil
 from . import ccos
 from . import dispersion
@@ -10,6 +10,10 @@ from . import getinfo
 from . import xd_search
 from .calcosparam import *       # parameter definitions
 
+# Flux calibration curves and TDS table rows, used by doFluxCorr
+flux_curve_cache = OrderedDict()
+tds_row_cache = OrderedDict()
+
 def extract1D(input, incounts=None, output=None,
               update_input=True,
               location=None, extrsize=None,
@@ -473,26 +477,8 @@ def doExtract(ifd_e, ifd_c, ofd, nelem,
     is_corrtag = (ifd_c is None)
     if is_corrtag:              # the input is a corrtag table
         (xi, eta, dq, epsilon) = getColumns(ifd_e, info["detector"])
-        if info["detector"] == "FUV":
-            axis_height = FUV_Y
-            axis_length = FUV_EXTENDED_X
-            segment = segments[0]
-        else:
-            axis_height = NUV_Y
-            axis_length = NUV_EXTENDED_X
-            segment = "NUVB"
-        # populate the DQ array
-        # xxx temporary, should be improved
-        shift1 = hdr.get("SHIFT1" + segment[-1], 0.)
-        shift2 = hdr.get("SHIFT2" + segment[-1], 0.)
-        minmax_shift_dict = {}
-        minmax_shift_dict[(0, 1024)] = [shift1, shift1, shift2, shift2] # xxx
-        minmax_doppler = (0., 0.)       # xxx replace with actual values
-        doppler_boundary = 512          # xxx replace with actual value
-        dq_array = np.zeros((axis_height,axis_length), dtype=np.int16)
-        cosutil.updateDQArray(info, reffiles, dq_array,
-                              minmax_shift_dict,
-                              minmax_doppler, doppler_boundary, None)
+        dq_array = getCorrtagDQArray(hdr, info, reffiles, segments[0])
+        axis_length = dq_array.shape[1]
 
     row = 0
     for segment in segments:
@@ -501,45 +487,7 @@ def doExtract(ifd_e, ifd_c, ofd, nelem,
                   "opt_elem": info["opt_elem"],
                   "cenwave": info["cenwave"],
                   "aperture": info["aperture"]}
-        if info["xtrctalg"] == "BOXCAR":
-            xtract_info = cosutil.getTable(reffiles["xtractab"], filter)
-            if xtract_info is None:
-                raise MissingRowError("Missing row in XTRACTAB; filter = %s" %
-                                      str(filter))
-        else:
-            xtract_info = cosutil.getTable(reffiles["twozxtab"], filter)
-            if xtract_info is None:
-                raise MissingRowError("Missing row in TWOZXTAB; filter = %s" %
-                                      str(filter))
-            #
-            # Make sure the table doesn't have a SLOPE column
-            try:
-                slope = xtract_info.field("SLOPE")[0]
-                cosutil.printWarning("TWOZXTAB file has a SLOPE column")
-            except KeyError:
-                slope = 0.0
-
-            #
-            # Check that EE boundaries increase monotonically
-            lower_outer = xtract_info.field('LOWER_OUTER')[0]
-            lower_inner = xtract_info.field('LOWER_INNER')[0]
-            upper_inner = xtract_info.field('UPPER_INNER')[0]
-            upper_outer = xtract_info.field('UPPER_OUTER')[0]
-            if 0 > lower_outer or \
-                    lower_outer > lower_inner or \
-                    lower_inner > upper_inner or \
-                    upper_inner > upper_outer or \
-                    upper_outer > 1.0:
-                cosutil.printWarning("Zone boundaries invalid:")
-                cosutil.printWarning("LOWER_OUTER = %f" % (lower_outer))
-                cosutil.printWarning("LOWER_INNER = %f" % (lower_inner))
-                cosutil.printWarning("UPPER_INNER = %f" % (upper_inner))
-                cosutil.printWarning("UPPER_OUTER = %f" % (upper_outer))
-                raise Exception("Invalid EE boundaries in TWOZXTAB reference file")
-            proftab_info = cosutil.getTable(reffiles["proftab"], filter)
-            if proftab_info is None:
-                raise MissingRowError("Missing row in PROFTAB; filter = %s" %
-                                      str(filter))
+        (xtract_info, proftab_info) = getXtractInfo(info, reffiles, filter)
 
         # Include fpoffset in the filter for disptab.
         filter["fpoffset"] = info["fpoffset"]
@@ -714,6 +662,117 @@ def doExtract(ifd_e, ifd_c, ofd, nelem,
         ofd[1].data = data.copy()
         del data
 
+def getCorrtagDQArray(hdr, info, reffiles, segment):
+    """Create the DQ array for extracting a spectrum from a corrtag table.
+
+    Parameters
+    ----------
+    hdr: ``astropy.io.fits.header.Header`` object
+        Header of the corrtag events table
+
+    info: dictionary
+        Header keywords and values
+
+    reffiles: dictionary
+        Reference file names
+
+    segment: str
+        FUVA or FUVB, or any NUV stripe name
+
+    Returns
+    -------
+    2-D array
+        DQ array (the full detector, including the extra pixels in the
+        dispersion direction), with the flags from the bad pixel table
+    """
+
+    if info["detector"] == "FUV":
+        axis_height = FUV_Y
+        axis_length = FUV_EXTENDED_X
+    else:
+        axis_height = NUV_Y
+        axis_length = NUV_EXTENDED_X
+        segment = "NUVB"
+    # populate the DQ array
+    # xxx temporary, should be improved
+    shift1 = hdr.get("SHIFT1" + segment[-1], 0.)
+    shift2 = hdr.get("SHIFT2" + segment[-1], 0.)
+    minmax_shift_dict = {}
+    minmax_shift_dict[(0, 1024)] = [shift1, shift1, shift2, shift2] # xxx
+    minmax_doppler = (0., 0.)       # xxx replace with actual values
+    doppler_boundary = 512          # xxx replace with actual value
+    dq_array = np.zeros((axis_height,axis_length), dtype=np.int16)
+    cosutil.updateDQArray(info, reffiles, dq_array,
+                          minmax_shift_dict,
+                          minmax_doppler, doppler_boundary, None)
+
+    return dq_array
+
+def getXtractInfo(info, reffiles, filter):
+    """Get the row of the extraction table for one segment or stripe.
+
+    Parameters
+    ----------
+    info: dictionary
+        Header keywords and values
+
+    reffiles: dictionary
+        Reference file names
+
+    filter: dictionary
+        For selecting a row (segment, opt_elem, cenwave, aperture)
+
+    Returns
+    -------
+    tuple
+        The matching row of the XTRACTAB (BOXCAR algorithm) or TWOZXTAB
+        (TWOZONE algorithm), and the matching row of the PROFTAB (or None
+        for the BOXCAR algorithm)
+    """
+
+    proftab_info = None
+    if info["xtrctalg"] == "BOXCAR":
+        xtract_info = cosutil.getTable(reffiles["xtractab"], filter)
+        if xtract_info is None:
+            raise MissingRowError("Missing row in XTRACTAB; filter = %s" %
+                                  str(filter))
+    else:
+        xtract_info = cosutil.getTable(reffiles["twozxtab"], filter)
+        if xtract_info is None:
+            raise MissingRowError("Missing row in TWOZXTAB; filter = %s" %
+                                  str(filter))
+        #
+        # Make sure the table doesn't have a SLOPE column
+        try:
+            slope = xtract_info.field("SLOPE")[0]
+            cosutil.printWarning("TWOZXTAB file has a SLOPE column")
+        except KeyError:
+            slope = 0.0
+
+        #
+        # Check that EE boundaries increase monotonically
+        lower_outer = xtract_info.field('LOWER_OUTER')[0]
+        lower_inner = xtract_info.field('LOWER_INNER')[0]
+        upper_inner = xtract_info.field('UPPER_INNER')[0]
+        upper_outer = xtract_info.field('UPPER_OUTER')[0]
+        if 0 > lower_outer or \
+                lower_outer > lower_inner or \
+                lower_inner > upper_inner or \
+                upper_inner > upper_outer or \
+                upper_outer > 1.0:
+            cosutil.printWarning("Zone boundaries invalid:")
+            cosutil.printWarning("LOWER_OUTER = %f" % (lower_outer))
+            cosutil.printWarning("LOWER_INNER = %f" % (lower_inner))
+            cosutil.printWarning("UPPER_INNER = %f" % (upper_inner))
+            cosutil.printWarning("UPPER_OUTER = %f" % (upper_outer))
+            raise Exception("Invalid EE boundaries in TWOZXTAB reference file")
+        proftab_info = cosutil.getTable(reffiles["proftab"], filter)
+        if proftab_info is None:
+            raise MissingRowError("Missing row in PROFTAB; filter = %s" %
+                                  str(filter))
+
+    return (xtract_info, proftab_info)
+
 def postargOffset(phdr, dispaxis):
     """Get the offset to shift2 if postarg is non-zero.
 
@@ -1500,71 +1559,87 @@ def extractSegmentTwozone(e_data, c_data, e_dq_data, ofd_header, segment,
     DQ_ALL_i = np.zeros(ncols, dtype=np.int16)
     DQ_WGT_i = np.ones(ncols, dtype=np.float32)
     extr_height_i = np.ones(ncols, dtype=np.float32)
-    bad_i = np.zeros(ncols, dtype=np.int32)
-    lowerbad_i = np.zeros(ncols, dtype=np.int32)
-    upperbad_i = np.zeros(ncols, dtype=np.int32)
 
     #
-    # Loop over columns
-    for column in range(ncols):
-        if UPPER_OUTER_INDEX_i[column] > LOWER_OUTER_INDEX_i[column]:
-            lowerstart = LOWER_OUTER_INDEX_i[column]
-            lowerstop = LOWER_INNER_INDEX_i[column]
-            lower_ecounts = e_data_sub[int(lowerstart):int(lowerstop),
-                                       column].sum(dtype=np.float64)
-            lower_ccounts = c_data[int(lowerstart):int(lowerstop),
-                                   column].sum(dtype=np.float64)
-            lowerdq = e_dq_data[int(lowerstart):int(lowerstop), column]
-            upperstart = UPPER_INNER_INDEX_i[column] + 1
-            upperstop = UPPER_OUTER_INDEX_i[column] + 1
-            upper_ecounts = e_data_sub[int(upperstart):int(upperstop),
-                                       column].sum(dtype=np.float64)
-            upper_ccounts = c_data[int(upperstart):int(upperstop),
-                                   column].sum(dtype=np.float64)
-            upperdq = e_dq_data[int(upperstart):int(upperstop), column]
-            innerstart = lowerstop
-            innerstop = upperstart
-            inner_ecounts = e_data_sub[int(innerstart):int(innerstop),
-                                       column].sum(dtype=np.float64)
-            inner_ccounts = c_data[int(innerstart):int(innerstop),
-                                   column].sum(dtype=np.float64)
-            innerdq = e_dq_data[int(innerstart):int(innerstop), column]
-            outerstart = lowerstart
-            outerstop = upperstop
-            outerdq = e_dq_data[int(outerstart):int(outerstop), column]
-            bad_i[column] = np.where(np.bitwise_and(innerdq, sdqflags), 1,
-                                     0).sum()
-            DQ_WGT_i[column] = 1.0
-            if bad_i[column] > 0.0:
-                DQ_WGT_i[column] = 0.0
-            sdqlower = np.bitwise_and(lowerdq, sdqouter)
-            lowerbad_i[column] = np.where(sdqlower, 1, 0).sum()
-            if lowerbad_i[column] > 0.0:
-                DQ_WGT_i[column] = 0.0
-            sdqupper = np.bitwise_and(upperdq, sdqouter)
-            upperbad_i[column] = np.where(sdqupper, 1, 0).sum()
-            if upperbad_i[column] > 0.0:
-                DQ_WGT_i[column] = 0.0
-            DQ_i[column] = bitwise_or_vector(innerdq) | \
-                bitwise_or_vector(sdqlower) | \
-                bitwise_or_vector(sdqupper)
-            DQ_ALL_i[column] = bitwise_or_vector(outerdq)
-            total_ecounts[column] = lower_ecounts + upper_ecounts + \
-                inner_ecounts
-            total_ccounts[column] = lower_ccounts + upper_ccounts + \
-                inner_ccounts
-            extr_height_i[column] = UPPER_OUTER_INDEX_i[column] - \
-                LOWER_OUTER_INDEX_i[column] + 1
-            if ENCLOSED_FRACTION_i[column] != 0.0:
-                total_ecounts[column] = total_ecounts[column] / \
-                    ENCLOSED_FRACTION_i[column]
-            else:
-                if total_ecounts[column] != 0.0:
-                    total_ecounts[column] = 0.0
-        else:
-            DQ_i[column] = DQ_PIXEL_OUT_OF_BOUNDS
-            DQ_ALL_i[column] = DQ_PIXEL_OUT_OF_BOUNDS
-            DQ_WGT_i[column] = 0.0
+    # Get the zone boundaries (slice limits) for all columns.  The lower
+    # zone is lowerstart:lowerstop, the inner zone is lowerstop:upperstart,
+    # and the upper zone is upperstart:upperstop.
+    in_bounds = UPPER_OUTER_INDEX_i > LOWER_OUTER_INDEX_i
+    columns = np.where(in_bounds)[0]
+    (lowerstart, lowerstop) = sliceLimits(
+                        LOWER_OUTER_INDEX_i[columns].astype(np.intp),
+                        LOWER_INNER_INDEX_i[columns].astype(np.intp), nrows)
+    (upperstart, upperstop) = sliceLimits(
+                        UPPER_INNER_INDEX_i[columns].astype(np.intp) + 1,
+                        UPPER_OUTER_INDEX_i[columns].astype(np.intp) + 1,
+                        nrows)
+    (innerstart, innerstop) = sliceLimits(
+                        LOWER_INNER_INDEX_i[columns].astype(np.intp),
+                        UPPER_INNER_INDEX_i[columns].astype(np.intp) + 1,
+                        nrows)
+    (outerstart, outerstop) = sliceLimits(
+                        LOWER_OUTER_INDEX_i[columns].astype(np.intp),
+                        UPPER_OUTER_INDEX_i[columns].astype(np.intp) + 1,
+                        nrows)
+    if len(columns) > 0:
+        #
+        # Only the band of rows that includes all the zones is needed.
+        row_limits = np.concatenate((lowerstart, lowerstop, upperstart,
+                                     upperstop, innerstart, innerstop))
+        band = slice(int(row_limits.min()), int(row_limits.max()))
+        first_row = band.start
+        e_band = e_data_sub[band, columns]
+        c_band = c_data[band, columns]
+        dq_band = e_dq_data[band, columns]
+        limits = {}
+        for (name, start, stop) in [("lower", lowerstart, lowerstop),
+                                    ("upper", upperstart, upperstop),
+                                    ("inner", innerstart, innerstop),
+                                    ("outer", outerstart, outerstop)]:
+            limits[name] = (start - first_row, stop - first_row)
+        #
+        # Sums over the zones, from cumulative sums along the columns
+        e_cumsum = columnCumsum(e_band)
+        c_cumsum = columnCumsum(c_band)
+        lower_ecounts = zoneSums(e_cumsum, *limits["lower"])
+        lower_ccounts = zoneSums(c_cumsum, *limits["lower"])
+        upper_ecounts = zoneSums(e_cumsum, *limits["upper"])
+        upper_ccounts = zoneSums(c_cumsum, *limits["upper"])
+        inner_ecounts = zoneSums(e_cumsum, *limits["inner"])
+        inner_ccounts = zoneSums(c_cumsum, *limits["inner"])
+        #
+        # Count the pixels flagged as bad in each zone
+        bad_i = zoneSums(columnCumsum(
+                            np.bitwise_and(dq_band, sdqflags) != 0),
+                         *limits["inner"])
+        sdqouter_cumsum = columnCumsum(np.bitwise_and(dq_band, sdqouter) != 0)
+        lowerbad_i = zoneSums(sdqouter_cumsum, *limits["lower"])
+        upperbad_i = zoneSums(sdqouter_cumsum, *limits["upper"])
+        DQ_WGT_i[columns] = np.where(np.logical_or.reduce(
+                                    (bad_i > 0, lowerbad_i > 0,
+                                     upperbad_i > 0)), 0.0, 1.0)
+        sdqouter_band = np.bitwise_and(dq_band, sdqouter)
+        DQ_i[columns] = zoneBitwiseOr(dq_band, *limits["inner"]) | \
+            zoneBitwiseOr(sdqouter_band, *limits["lower"]) | \
+            zoneBitwiseOr(sdqouter_band, *limits["upper"])
+        DQ_ALL_i[columns] = zoneBitwiseOr(dq_band, *limits["outer"])
+        total_ecounts[columns] = lower_ecounts + upper_ecounts + \
+            inner_ecounts
+        total_ccounts[columns] = lower_ccounts + upper_ccounts + \
+            inner_ccounts
+        extr_height_i[columns] = UPPER_OUTER_INDEX_i[columns] - \
+            LOWER_OUTER_INDEX_i[columns] + 1
+        enclosed = ENCLOSED_FRACTION_i[columns]
+        nonzero = (enclosed != 0.0)
+        total_e = total_ecounts[columns]
+        total_ecounts[columns] = np.where(nonzero,
+                                          total_e / np.where(nonzero,
+                                                             enclosed, 1.0),
+                                          np.where(total_e != 0.0,
+                                                   0.0, total_e))
+    DQ_i[~in_bounds] = DQ_PIXEL_OUT_OF_BOUNDS
+    DQ_ALL_i[~in_bounds] = DQ_PIXEL_OUT_OF_BOUNDS
+    DQ_WGT_i[~in_bounds] = 0.0
     N_i = total_ecounts
     goodcolumns = np.where(nrows_c_bkg_i > 0)
     DQ_WGT_i = np.where(nrows_c_bkg_i > 0, DQ_WGT_i, 0.0)
@@ -1755,76 +1830,110 @@ def getPercentileVectors(cumulative_profile, p1, p2, p3, p4):
     upper_inner_value = np.zeros(ncols)
     upper_outer_value = np.zeros(ncols)
     enclosed_fraction = np.zeros(ncols)
-    for column in range(ncols):
-        if cumulative_profile[-1, column] > 0:
-            if p1 == 0.0:
-                lower_outer_index[column] = 0
-                lower_outer_value[column] = 0.0
-            else:
-                lessthanp1 =  np.where(cumulative_profile[:, column] < p1)[0]
-                if len(lessthanp1) > 0:
-                    #
-                    # Last row where profile < p1
-                    # First row of the lower outer region
-                    row = lessthanp1[-1]
-                else:
-                    row = 0
-                lower_outer_index[column] = row
-                lower_outer_value[column] = cumulative_profile[row, column]
-            if p2 == 0.0:
-                lower_inner_index[column] = 0
-                lower_inner_value[column] = 0.0
-            else:
-                lessthanp2 =  np.where(cumulative_profile[:, column] < p2)[0]
-                if len(lessthanp2) > 0:
-                    #
-                    # Last row where profile < p2
-                    # First row of the inner region
-                    row = lessthanp2[-1]
-                else:
-                    row = 0
-                lower_inner_index[column] = row
-                lower_inner_value[column] = cumulative_profile[row, column]
-            if p3 == 1.0:
-                #
-                # The index of the last row is (nrows-1)
-                upper_inner_index[column] = nrows - 1
-                upper_inner_value[column] = 1.0
-            else:
-                morethanp3 =  np.where(cumulative_profile[:, column] > p3)[0]
-                if len(morethanp3) > 0:
-                    #
-                    # First row where profile > p3
-                    # Last row of the inner region, so we'll need to add
-                    # 1 to the slice index
-                    row = morethanp3[0]
-                else:
-                    row = nrows
-                upper_inner_index[column] = row
-                upper_inner_value[column] = cumulative_profile[row, column]
-            if p4 == 1.0:
-                #
-                # The index of the last row is (nrows-1)
-                upper_outer_index[column] = nrows - 1
-                upper_outer_value[column] = 1.0
-            else:
-                morethanp4 =  np.where(cumulative_profile[:, column] > p4)[0]
-                if len(morethanp4) > 0:
-                    #
-                    # First row where profile > p4
-                    # Last row of the upper outer region, so we'll add 1 to
-                    # the index in the slice
-                    row = morethanp4[0]
-                else:
-                    row = nrows
-                upper_outer_index[column] = row
-                upper_outer_value[column] =  cumulative_profile[row, column]
-            enclosed_fraction[column] = upper_outer_value[column] - \
-                lower_outer_value[column]
+    columns = np.where(cumulative_profile[-1] > 0)[0]
+    profile = cumulative_profile[:, columns]
+    for (p, index, value) in [(p1, lower_outer_index, lower_outer_value),
+                              (p2, lower_inner_index, lower_inner_value)]:
+        if p == 0.0:
+            continue
+        #
+        # Last row where profile < p (or 0 if there is none)
+        # First row of the lower outer region or of the inner region
+        lessthanp = profile < p
+        row = np.where(lessthanp.any(axis=0),
+                       nrows - 1 - np.argmax(lessthanp[::-1], axis=0), 0)
+        index[columns] = row
+        value[columns] = profile[row, np.arange(len(columns))]
+    for (p, index, value) in [(p3, upper_inner_index, upper_inner_value),
+                              (p4, upper_outer_index, upper_outer_value)]:
+        if p == 1.0:
+            #
+            # The index of the last row is (nrows-1)
+            index[columns] = nrows - 1
+            value[columns] = 1.0
+            continue
+        #
+        # First row where profile > p (or nrows if there is none)
+        # Last row of the inner region or of the upper outer region, so
+        # we'll need to add 1 to the slice index
+        morethanp = profile > p
+        row = np.where(morethanp.any(axis=0),
+                       np.argmax(morethanp, axis=0), nrows)
+        index[columns] = row
+        value[columns] = profile[row, np.arange(len(columns))]
+    enclosed_fraction[columns] = upper_outer_value[columns] - \
+        lower_outer_value[columns]
     return (lower_outer_index, lower_inner_index, upper_inner_index,
             upper_outer_index, enclosed_fraction, lower_outer_value,
             lower_inner_value, upper_inner_value, upper_outer_value)
 
+def sliceLimits(start, stop, length):
+    """Normalize the limits of slices start:stop of an axis.
+
+    The limits are adjusted the way Python interprets a slice, i.e. with
+    negative values counting from the end and the limits clipped to the
+    range 0 to length; stop is no smaller than start.
+
+    Parameters
+    ----------
+    start: array_like
+        Integer start of each slice
+
+    stop: array_like
+        Integer stop of each slice
+
+    length: int
+        The length of the axis being sliced
+
+    Returns
+    -------
+    tuple of two arrays
+        The start and stop of each slice, from 0 to length inclusive
+    """
+    start = np.where(start < 0, start + length, start).clip(0, length)
+    stop = np.where(stop < 0, stop + length, stop).clip(0, length)
+    return (start, np.maximum(stop, start))
+
+def columnCumsum(data_ij):
+    """Cumulative sums along the columns, with a leading row of zeros.
+
+    Row i of the result is the sum of data_ij[0:i] along axis 0, computed
+    in double precision.
+    """
+    nrows, ncols = data_ij.shape
+    cumsum_ij = np.zeros((nrows + 1, ncols), dtype=np.float64)
+    np.cumsum(data_ij, axis=0, dtype=np.float64, out=cumsum_ij[1:])
+    return cumsum_ij
+
+def zoneSums(cumsum_ij, start, stop):
+    """Sum of each column over the rows start:stop.
+
+    Parameters
+    ----------
+    cumsum_ij: array_like
+        Cumulative sums along the columns, from columnCumsum
+
+    start: array_like
+        First row of the zone in each column
+
+    stop: array_like
+        One more than the last row of the zone in each column
+
+    Returns
+    -------
+    array_like
+        The sum over the zone for each column
+    """
+    columns = np.arange(cumsum_ij.shape[1])
+    return cumsum_ij[stop, columns] - cumsum_ij[start, columns]
+
+def zoneBitwiseOr(dq_ij, start, stop):
+    """Bitwise OR of each column of dq_ij over the rows start:stop."""
+    rows = np.arange(dq_ij.shape[0])[:, np.newaxis]
+    in_zone = np.logical_and(rows >= start, rows < stop)
+    return np.bitwise_or.reduce(np.where(in_zone, dq_ij, 0).astype(np.int16),
+                                axis=0)
+
 def bitwise_or_vector(vector):
     length = len(vector)
     if length == 0: return 0
@@ -2158,6 +2267,10 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
     been specified, the flux and error will be corrected to the time of
     observation.
 
+    The sensitivity curves are gotten once for each segment (and cached
+    between calls, see getFluxCurve and getTdsFactors), and all the rows
+    for a segment are corrected together.
+
     Parameters
     ----------
     ofd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
@@ -2176,7 +2289,6 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
     """
 
     outdata = ofd[1].data
-    nrows = outdata.shape[0]
     segment = outdata.field("SEGMENT")
     wavelength = outdata.field("WAVELENGTH")
     net = outdata.field("NET")
@@ -2185,6 +2297,11 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
     error_lower = outdata.field("ERROR_LOWER")
     fluxtab = reffiles["fluxtab"]
 
+    # The rows for each segment, in order of first appearance.
+    segment_rows = OrderedDict()
+    for (row, seg) in enumerate(segment):
+        segment_rows.setdefault(seg, []).append(row)
+
     # segment will be added to filter in the loop
     filter = {"opt_elem": info["opt_elem"],
               "cenwave": info["cenwave"],
@@ -2193,22 +2310,19 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
     if cosutil.findColumn(fluxtab, "fpoffset"):
         filter["fpoffset"] = info["fpoffset"]
 
-    for row in range(nrows):
-        pharange = cosutil.getPulseHeightRange(ofd[1].header, segment[row])
+    for (seg, rows) in segment_rows.items():
+        pharange = cosutil.getPulseHeightRange(ofd[1].header, seg)
         # xxx this is temporary; eventually select the row based on pharange
         ref_pharange = cosutil.tempPulseHeightRange(fluxtab)
         cosutil.comparePulseHeightRanges(pharange, ref_pharange, fluxtab)
-        factor = np.zeros(len(flux[row]), dtype=np.float32)
-        filter["segment"] = segment[row]
-        flux_info = cosutil.getTable(fluxtab, filter, exactly_one=True)
+        filter["segment"] = seg
+        (wl_phot, sens_phot) = getFluxCurve(fluxtab, filter)
         # Interpolate sensitivity at each wavelength.
-        wl_phot = flux_info.field("wavelength")[0]
-        sens_phot = flux_info.field("sensitivity")[0]
-        ccos.interp1d(wl_phot, sens_phot, wavelength[row], factor)
+        factor = interpolateRows(wl_phot, sens_phot, wavelength[rows])
         factor = np.where(factor <= 0., 1., factor)
-        flux[row][:] = net[row] / factor
-        error[row][:] = error[row] / factor
-        error_lower[row][:] = error_lower[row] / factor
+        flux[rows] = net[rows] / factor
+        error[rows] = error[rows] / factor
+        error_lower[rows] = error_lower[rows] / factor
     ofd[0].header["fluxcorr"] = "COMPLETE"
 
     # Compute an array of time-dependent correction factors (a potentially
@@ -2224,19 +2338,15 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
         # First check for dummy rows in the TDS table.  If there is no
         # pedigree column, assume all rows are good (i.e. not dummy).
         dummy = False           # initial value
-        for row in range(nrows):
-            pharange = cosutil.getPulseHeightRange(ofd[1].header, segment[row])
+        for seg in segment_rows:
+            pharange = cosutil.getPulseHeightRange(ofd[1].header, seg)
             # xxx this is temporary
             ref_pharange = cosutil.tempPulseHeightRange(tdstab)
             cosutil.comparePulseHeightRanges(pharange, ref_pharange, tdstab)
-            filter["segment"] = segment[row]
-            tds_info = cosutil.getTable(tdstab, filter, exactly_one=True)
-            names = []
-            for name in tds_info.names:
-                names.append(name.lower())
-            if "pedigree" not in names:
+            filter["segment"] = seg
+            pedigree = getTdsRow(tdstab, filter)["pedigree"]
+            if pedigree is None:
                 break
-            pedigree = tds_info.field("pedigree")[0]
             if pedigree == "DUMMY":
                 dummy = True
                 cosutil.printWarning("Current row in TDSTAB %s is dummy" % \
@@ -2250,28 +2360,115 @@ def doFluxCorr(ofd, info, reffiles, tdscorr):
             ofd[0].header["tdscorr"] = "SKIPPED"
         else:
             printed = False             # used below
-            for row in range(nrows):
-                filter["segment"] = segment[row]
+            for (seg, rows) in segment_rows.items():
+                filter["segment"] = seg
                 # Get an array of factors vs. wavelength at the time of the obs.
                 tds_results = getTdsFactors(tdstab, filter, t_obs)
                 (wl_tds, factor_tds, extrapolate) = tds_results
-                factor = np.zeros(len(flux[row]), dtype=np.float32)
                 # Interpolate factor_tds at each wavelength.
-                ccos.interp1d(wl_tds, factor_tds, wavelength[row], factor)
-                flux[row][:] /= factor
-                error[row][:] /= factor
-                error_lower[row][:] /= factor
+                factor = interpolateRows(wl_tds, factor_tds, wavelength[rows])
+                flux[rows] /= factor
+                error[rows] /= factor
+                error_lower[rows] /= factor
                 if extrapolate and not printed:
                     cosutil.printWarning("TDS correction was extrapolated.")
                     printed = True
             ofd[0].header["tdscorr"] = "COMPLETE"
 
-def getTdsFactors(tdstab, filter, t_obs):
-    """Get arrays of wavelengths and corresponding TDS factors.
+def interpolateRows(x, y, wavelength):
+    """Interpolate a curve at the wavelengths of several rows.
 
-    If the time of observation is outside the range of times in the TDS
-    table, the correction factor will be extrapolated using the slope at
-    the first or last time in the table respectively.
+    Parameters
+    ----------
+    x, y: array_like
+        Independent and dependent variables of the curve (1-D)
+
+    wavelength: array_like
+        Wavelengths (2-D, one row for each spectrum)
+
+    Returns
+    -------
+    array_like
+        float32 array with the same shape as wavelength, the values of y
+        interpolated at each wavelength (see ccos.interp1d)
+    """
+
+    factor = np.zeros(wavelength.size, dtype=np.float32)
+    ccos.interp1d(x, y, np.ravel(wavelength), factor)
+
+    return factor.reshape(wavelength.shape)
+
+def sensitivityKey(table, filter, *args):
+    """Return a key for caching values derived from a reference table.
+
+    Parameters
+    ----------
+    table: str
+        Name of the reference table
+
+    filter: dictionary
+        For selecting a row from the table
+
+    args:
+        Any other values that the cached result depends on
+
+    Returns
+    -------
+    tuple
+        The key includes the modification time and size of the file, so
+        a reference table that is replaced on disk will be read again.
+    """
+
+    file_id = cosutil.fileKey(table)
+    if file_id is None:
+        file_id = table
+
+    return (file_id,
+            tuple(sorted([(k.lower(), filter[k]) for k in filter]))) + args
+
+def cacheResult(cache, key, result):
+    """Save a result in a cache, discarding the oldest entries if needed."""
+
+    cache[key] = result
+    while len(cache) > SENSITIVITY_CACHE_SIZE:
+        cache.popitem(last=False)
+
+    return result
+
+def getFluxCurve(fluxtab, filter):
+    """Get arrays of wavelengths and corresponding sensitivities.
+
+    Parameters
+    ----------
+    fluxtab: str
+        Name of the flux calibration (sensitivity) reference table
+
+    filter: dictionary
+        For selecting a row from fluxtab
+
+    Returns
+    -------
+    tuple
+        (wl_phot, sens_phot), the wavelengths and sensitivities from the
+        matching row of fluxtab; these are shared with the cache and must
+        not be modified.
+    """
+
+    key = sensitivityKey(fluxtab, filter)
+    if key in flux_curve_cache:
+        flux_curve_cache.move_to_end(key)
+        return flux_curve_cache[key]
+
+    flux_info = cosutil.getTable(fluxtab, filter, exactly_one=True)
+    wl_phot = flux_info.field("wavelength")[0].astype(np.float64)
+    sens_phot = flux_info.field("sensitivity")[0].astype(np.float64)
+    wl_phot.setflags(write=False)
+    sens_phot.setflags(write=False)
+
+    return cacheResult(flux_curve_cache, key, (wl_phot, sens_phot))
+
+def getTdsRow(tdstab, filter):
+    """Get the values from the TDS table for one configuration.
 
     Parameters
     ----------
@@ -2281,35 +2478,30 @@ def getTdsFactors(tdstab, filter, t_obs):
     filter: dictionary
         For selecting a row from tdstab
 
-    t_obs: float
-        Time of the observation (MJD)
-
     Returns
     -------
-    tuple or None
-        (wl_tds, factor_tds, extrapolate), where wl_tds is the array
-        of wavelengths from the TDS table, and factor_tds is the
-        corresponding array of time-dependent sensitivity factors,
-        evaluated at the time of observation from the slope and
-        intercept from the TDS table, and extrapolate will be True if
-        the time of observation was outside the range of times in the
-        TDS table.
+    dictionary
+        The PEDIGREE (or None if there is no such column), the
+        reference time REF_TIME, the NT times, the NWL wavelengths, and
+        the slopes (converted to fraction per year) and intercepts, with
+        shape (NT, NWL); the arrays are shared with the cache and must
+        not be modified.
     """
 
+    key = sensitivityKey(tdstab, filter)
+    if key in tds_row_cache:
+        tds_row_cache.move_to_end(key)
+        return tds_row_cache[key]
+
     # Slope and intercept are specified for each of the nt entries in
     # the TIME column and for each of the nwl values in the WAVELENGTH
     # column.  nt and nwl should be at least 1.
 
     tds_info = cosutil.getTable(tdstab, filter, exactly_one=True)
-
-    fd = fits.open(tdstab, mode="readonly")
-    try:
-        ref_time = fd[1].header["ref_time"]         # MJD
-    except KeyError:
-        cosutil.printWarning("REF_TIME keyword missing from TDSTAB data extension header")
-        cosutil.printMsg("Setting to 0, will probably make fluxes negative")
-        ref_time = 0.0
-    fd.close()
+    if cosutil.findColumn(tds_info, "pedigree"):
+        pedigree = tds_info.field("pedigree")[0]
+    else:
+        pedigree = None
 
     nwl = tds_info.field("nwl")[0]
     nt = tds_info.field("nt")[0]
@@ -2325,32 +2517,92 @@ def getTdsFactors(tdstab, filter, t_obs):
     slope = np.reshape(slope, (maxt, maxwl))
     intercept = np.reshape(intercept, (maxt, maxwl))
 
+    # Take the slice [0:nwl] to avoid using elements that may not be valid,
+    # and because the array of factors should be the same length as the
+    # set of wavelengths that have been specified.  The slope in the
+    # tdstab is in percent per year; convert it to fraction per year.
+    tds_row = {"pedigree": pedigree,
+               "ref_time": getTdsRefTime(tdstab),
+               "time": time[0:nt].astype(np.float64),
+               "wavelength": wl_tds[0:nwl].astype(np.float64),
+               "slope": slope[0:nt, 0:nwl] / 100.,
+               "intercept": intercept[0:nt, 0:nwl].copy()}
+    for name in ["time", "wavelength", "slope", "intercept"]:
+        tds_row[name].setflags(write=False)
+
+    return cacheResult(tds_row_cache, key, tds_row)
+
+def getTdsFactors(tdstab, filter, t_obs):
+    """Get arrays of wavelengths and corresponding TDS factors.
+
+    If the time of observation is outside the range of times in the TDS
+    table, the correction factor will be extrapolated using the slope at
+    the first or last time in the table respectively.
+
+    Parameters
+    ----------
+    tdstab: str
+        Name of the time-dependent sensitivity reference table
+
+    filter: dictionary
+        For selecting a row from tdstab
+
+    t_obs: float
+        Time of the observation (MJD)
+
+    Returns
+    -------
+    tuple or None
+        (wl_tds, factor_tds, extrapolate), where wl_tds is the array
+        of wavelengths from the TDS table, and factor_tds is the
+        corresponding array of time-dependent sensitivity factors,
+        evaluated at the time of observation from the slope and
+        intercept from the TDS table, and extrapolate will be True if
+        the time of observation was outside the range of times in the
+        TDS table.
+    """
+
+    tds_row = getTdsRow(tdstab, filter)
+    time = tds_row["time"]
+    nt = len(time)
+
     extrapolate = (t_obs < time[0] or t_obs >= time[nt-1])
 
-    # Find the time interval that includes the time of observation.
-    # The variable i is set here, and it's used below.
-    if nt == 1 or t_obs >= time[nt-1]:
-        i = nt - 1
-    else:
-        for i in range(nt-1):
-            if t_obs < time[i+1]:
-                break
+    # Find the time interval that includes the time of observation, i.e.
+    # the last i such that time[i] <= t_obs, or 0 if t_obs is before the
+    # first time.  If the time of observation is before the first time in
+    # the table or after the last time, the extrapolation will be done
+    # using the slope at the first time or the last time respectively.
+    i = np.searchsorted(time[1:], t_obs, side="right")
 
-    # The slope in the tdstab is in percent per year.  Convert the time
-    # interval to years, and convert the slope to fraction per year.
-    # If the time of observation is before the first time in the table or
-    # after the last time, the extrapolation will be done using the slope
-    # at the first time or the last time respectively.
-    delta_t = (t_obs - ref_time) / DAYS_PER_YEAR
-    slope[:,:] /= 100.
+    # Convert the time interval to years.
+    delta_t = (t_obs - tds_row["ref_time"]) / DAYS_PER_YEAR
+    factor_tds = delta_t * tds_row["slope"][i] + tds_row["intercept"][i]
 
-    # Take the slice [0:nwl] to avoid using elements that may not be valid,
-    # and because the array of factors should be the same length as the
-    # set of wavelengths that have been specified.
-    wl_tds = wl_tds[0:nwl]
-    factor_tds = delta_t * slope[i][0:nwl] + intercept[i][0:nwl]
+    return (tds_row["wavelength"], factor_tds, extrapolate)
+
+def getTdsRefTime(tdstab):
+    """Get keyword REF_TIME from the TDS table header.
+
+    Parameters
+    ----------
+    tdstab: str
+        Name of the time-dependent sensitivity reference table
+
+    Returns
+    -------
+    float
+        The reference time (MJD) for the slopes in the TDS table
+    """
+
+    try:
+        ref_time = fits.getval(tdstab, "ref_time", ext=1)  # MJD
+    except KeyError:
+        cosutil.printWarning("REF_TIME keyword missing from TDSTAB data extension header")
+        cosutil.printMsg("Setting to 0, will probably make fluxes negative")
+        ref_time = 0.0
 
-    return (wl_tds, factor_tds, extrapolate)
+    return ref_time
 
 def updateExtractionKeywords(hdr, segment, slope, height,
                              xd_nominal, xd_locn, found_locn_sigma, xd_offset,
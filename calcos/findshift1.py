@@ -22,6 +22,60 @@ NUV_X = 1024
 # finding the scatter of the shift for these values of npts.
 NPTS_RANGE = [3, 4, 6, 7, 5]
 
+# scanLags uses an FFT to compute the cross correlation if there are at
+# least this many lags; otherwise the products are summed directly.
+FFT_MIN_LAGS = 64
+
+def firstNonzero(spectrum, template, lags, t0, t1):
+    """Find the first element that is non-zero in both spectrum and template.
+
+    For each lag, this is the smallest index j from t0 to t1 - 1 for which
+    both spectrum[j + lag] and template[j] are non-zero.
+
+    Parameters
+    ----------
+    spectrum: array_like
+        The 1-D extracted wavecal spectrum
+
+    template: array_like
+        Template spectrum, the same length as spectrum
+
+    lags: array_like
+        Integer shifts of the spectrum relative to the template
+
+    t0, t1: array_like
+        The overlap region (indices in template) for each lag
+
+    Returns
+    -------
+    array_like
+        The index j for each lag, or t1 if there is no such element.
+    """
+
+    len_spec = len(spectrum)
+    # next_s[i] is the index of the first non-zero element of spectrum
+    # at or after i, or len_spec if there is none; similarly for next_t.
+    index = np.arange(len_spec + 1, dtype=np.intp)
+    (next_s, next_t) = [np.minimum.accumulate(
+                            np.where(np.append(a != 0., True),
+                                     index, len_spec)[::-1])[::-1]
+                        for a in (spectrum, template)]
+    # Alternately skip zeros in the template and in the spectrum, until
+    # neither is zero.  This converges after one or two iterations unless
+    # the spectrum or template has a lot of zeros.
+    j = np.minimum(t0, t1)
+    active = np.flatnonzero(j < t1)
+    while len(active) > 0:
+        j_a = j[active]
+        lag_a = lags[active]
+        j_new = np.maximum(next_t[j_a], next_s[j_a + lag_a] - lag_a)
+        j_new = np.minimum(j_new, t1[active])
+        j[active] = j_new
+        moved = np.logical_and(j_new > j_a, j_new < t1[active])
+        active = active[moved]
+
+    return j
+
 class Shift1(object):
     """Find the shift in the dispersion direction.
 
@@ -546,31 +600,24 @@ class Shift1(object):
         # We expect to find a minimum rms.
         # These arrays all have length self.lenxc, and we can
         # use the same index(e.g. imin) in all of these arrays.
-        rms = np.zeros(lenxc, dtype=np.float32)
-        chisq = np.zeros(lenxc, dtype=np.float32)
-        factor = np.zeros(lenxc, dtype=np.float32)
-        baseline = np.zeros(lenxc, dtype=np.float32)
-        flag = np.zeros(lenxc, dtype=np.int32)
         maxlag = lenxc // 2
-        i = 0
-        # Assign reduced chi square to chisq.
-        for shift in range(-maxlag, maxlag+1):
-            shift_x = shift + self.initial_offset
-            # compute self.rms and other values
-            self.computeNormalization(spectrum, template, shift_x)
-            if self.factor is not None:
-                (chisq_i, ndf, spec, tmpl) = \
-                        self.computeChiSquare(spectrum, template)
-                chisq[i] = chisq_i / float(max(ndf, 1))
-            if self.factor is None:
-                flag[i] = BAD_VALUE
-            else:
-                flag[i] = GOOD_VALUE
-                rms[i] = self.rms
-            i += 1
-        # Where factor was None, set chisq to a large value.
-        max_xc = chisq.max()
-        chisq = np.where(flag == GOOD_VALUE, chisq, 2.*max_xc)
+        # Compute the rms and flag for all lags at once.
+        (rms, good) = self.scanLags(spectrum, template)
+        flag = np.where(good, GOOD_VALUE, BAD_VALUE).astype(np.int32)
+        # Reduced chi square is only needed at a few lags (near local
+        # minima of rms that have no bad values nearby), so it's computed
+        # as needed by getChisq.  Values that haven't been computed are
+        # never used.
+        chisq = np.zeros(lenxc, dtype=np.float32)
+        have_chisq = np.zeros(lenxc, dtype=np.bool_)
+
+        def getChisq(i1, i2):
+            for i in range(i1, i2):
+                if not have_chisq[i]:
+                    chisq[i] = self.reducedChiSquare(spectrum, template,
+                                        i - maxlag + self.initial_offset)
+                    have_chisq[i] = True
+            return chisq[i1:i2]
 
         good_values = np.where(flag == GOOD_VALUE)
         # Find all the local minima in the array of RMS values.
@@ -586,36 +633,22 @@ class Shift1(object):
 
         # Check each local minimum to make sure none of the nearby values
         # is flagged as bad.
-        # real_minima, rms_list, and chisq_list will all have the same
-        # number of elements.
+        # real_minima and rms_list will have the same number of elements.
         real_minima = []        # list of indices (imin) of minima of rms
-        chisq_list = []         # chi square at each imin in real_minima
         rms_list = []           # value of rms at each imin in real_minima
         npts = max(NPTS_RANGE)
-        for imin in local_minima:
-            i1 = imin - npts//2
-            i1 = max(i1, 0)
-            i2 = i1 + npts
-            i2 = min(i2, lenxc)
-            i1 = i2 - npts
-            bad = (flag[i1:i2] == BAD_VALUE)
-            if np.any(bad):
-                continue
+        i1 = np.maximum(local_minima - npts//2, 0)
+        i2 = np.minimum(i1 + npts, lenxc)
+        i1 = i2 - npts
+        # number of bad values in flag[0:i], for each i
+        n_bad = np.concatenate(([0], np.cumsum(flag == BAD_VALUE)))
+        for imin in local_minima[n_bad[i2] == n_bad[i1]]:
             real_minima.append(imin)
             rms_list.append(rms[imin])
-            chisq_list.append(chisq[imin])
         if len(real_minima) <= 0:
             return (0., 0., 0., False)
 
-        # Pick the location with the smallest RMS.  index_of_min is the
-        # index in rms_list that gives the smallest RMS.
-        min_rms = None
-        index_of_min = 0                # initial values
-        for (i, rms_i) in enumerate(rms_list):
-            chisq_i = chisq_list[i]
-
-        # The values in rms_index and chisq_index are indices in real_minima,
-        # rms_list, and chisq_list.
+        # The values in rms_index are indices in real_minima and rms_list.
         # index_of_min (below) will also be an index in real_minima, etc.
         # Example:
         # k = rms_index[0]         the point with the minimum RMS
@@ -623,8 +656,6 @@ class Shift1(object):
         # rms[imin] and rms_list[k] will be the same
         rms_array = np.array(rms_list)
         rms_index = np.argsort(rms_array)
-        chisq_array = np.array(chisq_list)
-        chisq_index = np.argsort(chisq_array)
 
         # Of the PICK_N points with the smallest RMS, skip ones that don't have
         # positive curvature, then select the one with smallest chi square.
@@ -632,7 +663,7 @@ class Shift1(object):
         x = np.arange(5, dtype=np.float64)      # for fitting a quadratic
         index_of_min = None                     # initial value
         for i in range(PICK_N):
-            # k is an index in real_minima, rms_list, and chisq_list, while
+            # k is an index in real_minima and rms_list, while
             # real_minima[k] is an index in rms.
             k = rms_index[i]
             imin = real_minima[k]
@@ -646,14 +677,20 @@ class Shift1(object):
             (coeff, var) = cosutil.fitQuadratic(x, rms[j1:j2])
             if coeff is None or coeff[2] <= 0.: # coeff[2] is the curvature
                 continue
-            if index_of_min is None or chisq_list[k] < min_chisq:
-                min_chisq = chisq_list[k]
+            chisq_k = getChisq(imin, imin+1)[0]
+            if index_of_min is None or chisq_k < min_chisq:
+                min_chisq = chisq_k
                 index_of_min = k
         if index_of_min is None:
             return (0., 0., 0., False)
 
         # Fit a quadratic to points near the minimum of chisq.
         imin = real_minima[index_of_min]
+        # findMinimum uses at most npts points centered on imin, and these
+        # were all checked above for bad values.
+        i1 = max(imin - npts//2, 0)
+        i2 = min(i1 + npts, lenxc)
+        getChisq(i2 - npts, i2)
         (shift, orig_shift1, scatter) = self.findMinimum(imin, maxlag, chisq)
 
         return (shift, orig_shift1, scatter, True)
@@ -712,6 +749,170 @@ class Shift1(object):
 
         return (shift, orig_shift1, scatter)
 
+    def scanLags(self, spectrum, template):
+        """Compute the rms of the fit of template to spectrum for all lags.
+
+        For each lag (shift - maxlag + self.initial_offset, for shift from
+        0 to self.lenxc - 1), this gives the same overlap region, factor,
+        baseline and rms as computeNormalization, but the sums over the
+        overlap region are computed for all lags at once, from cumulative
+        sums of the spectrum and template and the cross correlation of
+        the spectrum with the template.  The sum of the squared residuals
+        is computed from these sums rather than from the residuals.
+
+        Parameters
+        ----------
+        spectrum: array_like
+            The 1-D extracted wavecal spectrum
+
+        template: array_like
+            Template spectrum
+
+        Returns
+        -------
+        tuple of two arrays
+            The rms (float32) and a flag that is True for lags where the
+            normalization was found (i.e. where computeNormalization would
+            not set self.factor to None); rms is zero where the flag is
+            False.
+        """
+
+        lenxc = self.lenxc
+        maxlag = lenxc // 2
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        template = np.asarray(template, dtype=np.float64)
+        len_spec = len(spectrum)
+
+        # This is the rounding done by computeNormalization.
+        lags = np.round(np.arange(-maxlag, maxlag+1, dtype=np.float64) +
+                        self.initial_offset).astype(np.intp)
+        rms = np.zeros(lenxc, dtype=np.float32)
+        good = np.abs(lags) < len_spec
+        if not np.any(good):
+            return (rms, good)
+        # Limit the lags to the length of the spectrum, so that indexing
+        # is well defined.
+        pad = int(np.abs(lags[good]).max())
+        lags_c = np.clip(lags, -pad, pad)
+
+        # For each lag, find the first and last elements (template index)
+        # of the overlap region for which neither the spectrum nor the
+        # template is zero.
+        t0 = np.maximum(-lags_c, 0)
+        t1 = np.minimum(len_spec - lags_c, len_spec)
+        first = firstNonzero(spectrum, template, lags_c, t0, t1)
+        last = len_spec - 1 - firstNonzero(spectrum[::-1], template[::-1],
+                                           -lags_c, len_spec - t1,
+                                           len_spec - t0)
+        good &= (first < t1)
+        # computeNormalization gives up if the only such element is the
+        # last one in the overlap region, unless it's also the first.
+        good &= np.logical_or(first == t0, first < t1 - 1)
+        t0 = np.where(good, first, 0)
+        t1 = np.where(good, last + 1, 0)
+        (s0, s1) = (t0 + lags_c, t1 + lags_c)
+        n = (t1 - t0).astype(np.float64)
+
+        cumsum_s = np.concatenate(([0.], np.cumsum(spectrum)))
+        cumsum_s2 = np.concatenate(([0.], np.cumsum(spectrum**2)))
+        cumsum_t = np.concatenate(([0.], np.cumsum(template)))
+        cumsum_t2 = np.concatenate(([0.], np.cumsum(template**2)))
+        sum_s = cumsum_s[s1] - cumsum_s[s0]
+        sum_s2 = cumsum_s2[s1] - cumsum_s2[s0]
+        sum_t = cumsum_t[t1] - cumsum_t[t0]
+        sum_t2 = cumsum_t2[t1] - cumsum_t2[t0]
+        # Products outside [t0:t1] are zero, so the sum over the entire
+        # overlap region is the same as the sum over the trimmed region.
+        sum_st = self.crossCorrelate(spectrum, template, lags_c, pad)
+
+        # Fit the template to the spectrum:
+        # spec = baseline + factor * tmpl + noise
+        # In terms of the sums about the mean, factor = var_st / var_t2,
+        # and the sum of the squared residuals is var_s2 - factor * var_st.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var_s2 = sum_s2 - sum_s**2 / n
+            var_st = sum_st - sum_s * sum_t / n
+            var_t2 = sum_t2 - sum_t**2 / n
+            # A single element gives a zero denominator, but the
+            # difference of cumulative sums might not be exactly zero.
+            good &= np.logical_and(n > 1., var_t2 > 0.)
+            factor = var_st / var_t2
+            good &= (factor > 0.)
+            sum_diff2 = np.maximum(var_s2 - factor * var_st, 0.)
+            rms[good] = np.sqrt(sum_diff2[good] / (n[good] - 1.))
+
+        return (rms, good)
+
+    def crossCorrelate(self, spectrum, template, lags, pad):
+        """Sum of spectrum[j + lag] * template[j] over j, for each lag.
+
+        Parameters
+        ----------
+        spectrum: array_like
+            The 1-D extracted wavecal spectrum (float64)
+
+        template: array_like
+            Template spectrum (float64)
+
+        lags: array_like
+            Integer shifts of the spectrum relative to the template
+
+        pad: int
+            The maximum absolute value of lags, which must be less than
+            the length of spectrum.
+
+        Returns
+        -------
+        array_like
+            The cross correlation at each lag.
+        """
+
+        len_spec = len(spectrum)
+        index = lags + pad
+        padded = np.zeros(len_spec + 2*pad, dtype=np.float64)
+        padded[pad:pad+len_spec] = spectrum
+        if len(lags) >= FFT_MIN_LAGS:
+            # Zero padding the template to the length of padded avoids
+            # wrap-around for lags from -pad to pad.
+            nfft = len(padded)
+            xc = np.fft.irfft(np.fft.rfft(padded) *
+                              np.conj(np.fft.rfft(template, nfft)), nfft)
+            sum_st = xc[index]
+        else:
+            window = np.lib.stride_tricks.sliding_window_view(padded,
+                                                              len_spec)
+            sum_st = np.dot(window[index], template)
+
+        return sum_st
+
+    def reducedChiSquare(self, spectrum, template, shift):
+        """Compute reduced chi square for one shift.
+
+        Parameters
+        ----------
+        spectrum: array_like
+            The 1-D extracted wavecal spectrum
+
+        template: array_like
+            Template spectrum
+
+        shift: float
+            The pixel shift in the dispersion direction
+
+        Returns
+        -------
+        float
+            Chi square divided by the number of degrees of freedom (or 1
+            if that's zero), or zero if the normalization was not found.
+        """
+
+        self.computeNormalization(spectrum, template, shift)
+        if self.factor is None:
+            return 0.
+        (chisq, ndf, spec, tmpl) = self.computeChiSquare(spectrum, template)
+
+        return chisq / float(max(ndf, 1))
+
     def computeNormalization(self, spectrum, template, shift):
         """Compute a normalization factor between spectrum and template.
 
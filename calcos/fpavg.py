@@ -2,7 +2,6 @@ import copy
 import math
 import numpy as np
 from astropy.io import fits
-from astropy.stats import poisson_conf_interval
 from . import cosutil
 from .calcosparam import *       # parameter definitions
 
@@ -0,0 +1,380 @@
+import numpy as np
+
+from . import cosutil
+
+def searchSorted(time, values, side="left"):
+    """Find the indices in a sorted array at which values would be inserted.
+
+    This gives the same result as np.searchsorted(time, values, side),
+    with time and values compared in their common data type, but time is
+    searched one chunk (cosutil.eventChunks) at a time.  A column of a
+    memory-mapped table may be big-endian, in which case np.searchsorted
+    would make a copy of the entire column; this way only one chunk at a
+    time is copied.  For sorted time, the index of a value is the sum of
+    its indices within the chunks.
+
+    Parameters
+    ----------
+    time: array_like
+        The array of times of events (sorted).
+
+    values: array_like
+        The times to locate in the time array.
+
+    side: {"left", "right"}
+        As for np.searchsorted.
+
+    Returns
+    -------
+    array of int
+        The indices in time, with the shape of values.
+    """
+
+    time = np.asarray(time)
+    values = np.asarray(values)
+    dtype = np.result_type(time.dtype, values.dtype).newbyteorder("=")
+    values = values.astype(dtype)
+    indices = np.zeros(values.shape, dtype=np.intp)
+    for c in cosutil.eventChunks(len(time)):
+        indices += np.searchsorted(time[c].astype(dtype), values, side=side)
+
+    return indices
+
+def rangeIndices(time, t0, t1):
+    """Find the range of events for each of a set of time intervals.
+
+    This gives the same indices as calling ccos.range(time, t0[i], t1[i])
+    for each interval i, but for all intervals at once.
+
+    Parameters
+    ----------
+    time: array_like
+        The array of times of events (sorted).
+
+    t0: array_like
+        The array of times at the start of each interval.
+
+    t1: array_like
+        The array of times at the end of each interval.
+
+    Returns
+    -------
+    tuple of three arrays
+        i0 and i1 are the indices in time of the first event in the
+        interval and one more than the last event in the interval;
+        no_overlap is True for intervals that do not overlap the time
+        array at all (for which ccos.range would raise an exception).
+    """
+
+    n_events = len(time)
+    first_time = np.float64(time[0])
+    last_time = np.float64(time[n_events-1])
+    # The interval limits are truncated to single precision, as in
+    # ccos.range.
+    t0 = np.asarray(t0, dtype=np.float32)
+    t1 = np.asarray(t1, dtype=np.float32)
+    i0 = searchSorted(time, t0.astype(np.float64), side="left")
+    i1 = searchSorted(time, t1.astype(np.float64), side="left")
+    # ccos.range returns the length of the array if t >= the last time.
+    i0[t0 >= last_time] = n_events
+    i1[t1 >= last_time] = n_events
+    no_overlap = np.logical_or(t1 < first_time, t0 > last_time)
+
+    return (i0, i1, no_overlap)
+
+def inRanges(n_events, i0, i1):
+    """Find the events that are within any of a set of index ranges.
+
+    Parameters
+    ----------
+    n_events: int
+        The number of events.
+
+    i0: array_like
+        Index of the first event in each range.
+
+    i1: array_like
+        One more than the index of the last event in each range.
+
+    Returns
+    -------
+    array of bool
+        True for each event that is in at least one range.
+    """
+
+    # +1 where a range begins, -1 just after it ends
+    edges = np.zeros(n_events + 1, dtype=np.int32)
+    np.add.at(edges, i0, 1)
+    np.add.at(edges, i1, -1)
+
+    return np.cumsum(edges[:-1]) > 0
+
+def isSorted(time):
+    """Return True if the times are in increasing order."""
+
+    return len(time) < 2 or bool(np.all(time[1:] >= time[:-1]))
+
+class TimeIntervals(object):
+    """[start, stop] time intervals of several types.
+
+    The intervals of each type (e.g. "badt" for the bad time intervals
+    from the badttab, "burst" for bursts, "gti" for good time intervals)
+    are kept as contiguous arrays of start and stop times, so they can
+    also be passed to C functions.  The data type of the times is kept
+    (bursts are single precision), so sums of interval lengths agree with
+    the values computed by looping over the lists.  Events are located by
+    searching the sorted TIME column with searchSorted, so flagging or
+    counting events takes time proportional to the number of events plus
+    the number of intervals, rather than to their product.
+
+    The public methods are add, getIntervals, merged, flagEvents,
+    countEvents and subtractFrom.
+    """
+
+    def __init__(self):
+        """Constructor."""
+
+        # key is the type of interval, value is (start, stop)
+        self.intervals = {}
+
+    def add(self, kind, intervals):
+        """Append intervals of a given type.
+
+        Parameters
+        ----------
+        kind: str
+            The type of interval, e.g. "badt", "burst" or "gti".
+
+        intervals: list of two-element lists, or None
+            List of [start, stop] intervals (seconds since expstart).
+        """
+
+        if intervals is None or len(intervals) == 0:
+            return
+        intervals = np.asarray(intervals).reshape(-1, 2)
+        if intervals.dtype.kind != "f":
+            intervals = intervals.astype(np.float64)
+        (start, stop) = (intervals[:, 0].copy(), intervals[:, 1].copy())
+        if kind in self.intervals:
+            start = np.concatenate((self.intervals[kind][0], start))
+            stop = np.concatenate((self.intervals[kind][1], stop))
+        self.intervals[kind] = (start, stop)
+
+    def getIntervals(self, kind):
+        """Return the intervals of a given type, in the order they were added.
+
+        Parameters
+        ----------
+        kind: str
+            The type of interval.
+
+        Returns
+        -------
+        tuple of two arrays
+            The start and stop times of the intervals.
+        """
+
+        empty = np.zeros(0, dtype=np.float64)
+        return self.intervals.get(kind, (empty, empty))
+
+    def merged(self, kinds):
+        """Return the union of the intervals of the specified types.
+
+        Parameters
+        ----------
+        kinds: str or list of str
+            The type or types of interval to include.
+
+        Returns
+        -------
+        tuple of two arrays
+            The start and stop times of the merged intervals, sorted and
+            not overlapping (intervals that just touch are merged).
+        """
+
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        start = np.concatenate([self.getIntervals(kind)[0] for kind in kinds])
+        stop = np.concatenate([self.getIntervals(kind)[1] for kind in kinds])
+        if len(start) == 0:
+            return (start, stop)
+
+        index = np.argsort(start, kind="stable")
+        start = start[index]
+        stop = np.maximum.accumulate(stop[index])
+        # A new merged interval begins where the start of an interval is
+        # later than the stop of every interval before it.
+        new = np.ones(len(start), dtype=np.bool_)
+        new[1:] = start[1:] > stop[:-1]
+        first = np.nonzero(new)[0]
+        last = np.append(first[1:], len(start)) - 1
+
+        return (start[first], stop[last])
+
+    def flagEvents(self, time, dq, flag, kinds):
+        """Flag events within any of the intervals of the specified types.
+
+        An event is within an interval if start <= time <= stop.
+
+        Parameters
+        ----------
+        time: array_like
+            The time column in the events table.
+
+        dq: array_like
+            The data quality column in the events table (updated in-place).
+
+        flag: int
+            The data quality flag to set.
+
+        kinds: str or list of str
+            The type or types of interval to use.
+
+        Returns
+        -------
+        int
+            The number of events that are within the intervals.
+        """
+
+        (start, stop) = self.merged(kinds)
+        if len(start) == 0 or len(time) == 0:
+            return 0
+        if not isSorted(time):
+            time = np.asarray(time, dtype=np.float64)
+            inside = np.zeros(len(time), dtype=np.bool_)
+            for i in range(len(start)):
+                inside |= np.logical_and(time >= start[i], time <= stop[i])
+        else:
+            i0 = searchSorted(time, start.astype(np.float64), side="left")
+            i1 = searchSorted(time, stop.astype(np.float64), side="right")
+            inside = inRanges(len(time), i0, i1)
+        dq[inside] |= flag
+
+        return int(np.count_nonzero(inside))
+
+    def countEvents(self, time, kind, t_min=None, t_max=None):
+        """Count events and exposure time within intervals of a given type.
+
+        Each interval is counted separately, so events or time in more
+        than one interval are counted more than once.  The events in an
+        interval are found as with ccos.range, i.e. start <= time < stop.
+
+        Parameters
+        ----------
+        time: array_like
+            The time column in the events table (sorted).
+
+        kind: str
+            The type of interval.
+
+        t_min: float or None
+            If not None, intervals are clipped at this time, and intervals
+            that end at or before it are ignored.
+
+        t_max: float or None
+            If not None, intervals are clipped at this time, and intervals
+            that begin at or after it are ignored.
+
+        Returns
+        -------
+        tuple of int and float
+            The number of events and the exposure time (seconds) within
+            the intervals; the latter has the data type of the intervals.
+        """
+
+        (start, stop) = self.getIntervals(kind)
+        if t_min is not None:
+            keep = stop > t_min
+            (start, stop) = (np.maximum(start[keep], t_min), stop[keep])
+        if t_max is not None:
+            keep = start < t_max
+            (start, stop) = (start[keep], np.minimum(stop[keep], t_max))
+        if len(start) == 0 or len(time) == 0:
+            return (0, 0.)
+
+        (i0, i1, no_overlap) = rangeIndices(time, start, stop)
+        n_events = int(np.sum(np.where(no_overlap, 0, i1 - i0)))
+        # cumsum adds the lengths in order, as a loop over intervals would
+        exptime = np.cumsum(stop - start)[-1]
+
+        return (n_events, exptime)
+
+    def subtractFrom(self, gti, kinds):
+        """Remove the intervals of the specified types from a list of GTIs.
+
+        Parameters
+        ----------
+        gti: list of two-element lists
+            List of [start, stop] good time intervals.
+
+        kinds: str or list of str
+            The type or types of interval to remove from gti.
+
+        Returns
+        -------
+        tuple containing a flag and a list of two-element lists
+            modified is a flag indicating whether there was actually any
+            change to the list of [start, stop] intervals.
+            gti is the updated list of [start, stop] good time intervals.
+        """
+
+        if isinstance(kinds, str):
+            kinds = [kinds]
+        modified = False
+        for kind in kinds:
+            if not modified:
+                modified = self._splitsAny(gti, kind)
+            (bad_start, bad_stop) = self.merged(kind)
+            new_gti = []
+            for (start, stop) in gti:
+                # the bad intervals that overlap [start, stop]
+                k0 = np.searchsorted(bad_stop, start, side="right")
+                k1 = np.searchsorted(bad_start, stop, side="left")
+                if k0 >= k1:
+                    new_gti.append([start, stop])
+                    continue
+                if bad_start[k0] > start:
+                    new_gti.append([start, bad_start[k0]])
+                for k in range(k0, k1 - 1):
+                    new_gti.append([bad_stop[k], bad_start[k+1]])
+                if bad_stop[k1-1] < stop:
+                    new_gti.append([bad_stop[k1-1], stop])
+            gti = new_gti
+
+        return (modified, gti)
+
+    def _splitsAny(self, gti, kind):
+        """Test whether removing intervals of one type shortens any GTI.
+
+        The intervals are taken in the order in which they were added.
+        A GTI that lies entirely within the first interval that overlaps
+        it is dropped, and that alone does not count as a change to the
+        list of GTIs; any other overlap leaves part of the GTI, which
+        does count.  This is the flag that was computed when each bad
+        interval was subtracted in turn from the list of GTIs.
+
+        Parameters
+        ----------
+        gti: list of two-element lists
+            List of [start, stop] good time intervals.
+
+        kind: str
+            The type of interval to remove from gti.
+
+        Returns
+        -------
+        bool
+            True if any GTI would be split or shortened.
+        """
+
+        (bad_start, bad_stop) = self.getIntervals(kind)
+        if len(bad_start) == 0:
+            return False
+        for (start, stop) in gti:
+            overlap = np.nonzero((bad_start < stop) & (bad_stop > start))[0]
+            if len(overlap) > 0:
+                k = overlap[0]
+                if bad_start[k] > start or bad_stop[k] < stop:
+                    return True
+
+        return False
@@ -0,0 +1,569 @@
+"""Light curves in wavelength bands, computed from a corrtag table.
+
+lightCurve reads the events table once and accumulates, for every time
+bin and every wavelength band, the number of events in the source and
+background extraction regions and their sums of epsilon and epsilon
+squared.  All of these go into one histogram, indexed by time bin,
+wavelength interval and region, so the cost is one pass over the events
+whatever the number of bands.  The wavelength intervals are the pieces
+between adjacent band limits; summing them over a band is then a small
+matrix product, so bands may overlap.
+
+Events are assigned to the source or background regions using the same
+boxes (XTRACTAB) as extract.extractCorrtag.  Events outside the good time
+intervals or flagged with any of SERIOUS_DQ_FLAGS (burst, bad time, pulse
+height out of bounds) are not included.
+
+All times are in seconds, and the zero point is EXPSTART.  Wavelengths
+of source events are taken from the WAVELENGTH column, so they include
+the heliocentric correction if that was done for the corrtag table.  A
+background box can extend beyond the region for which timetag assigned
+wavelengths (e.g. past the midpoint between the PSA and WCA), so the
+wavelengths of background events are computed from XFULL with the PSA
+dispersion relation for the segment or stripe, in the same way as in
+timetag.computeWavelengths.
+"""
+
+import numpy as np
+from astropy.io import fits
+
+from . import cosutil
+from . import dispersion
+from . import extract
+from . import getinfo
+from . import splittag
+from .calcosparam import *       # parameter definitions
+
+# Values in the region code for an event.
+SOURCE = 0
+BACKGROUND = 1
+N_REGIONS = 2
+
+def lightCurve(input, binwidth, bands=None, output=None,
+               starttime=None, endtime=None, verbosity=None):
+    """Compute light curves in one or more wavelength bands.
+
+    Parameters
+    ----------
+    input: str
+        Name of the corrtag file.
+
+    binwidth: float
+        Length of each time bin (seconds).  The last bin is shorter if
+        (endtime - starttime) is not a multiple of binwidth.
+
+    bands: list of (float, float) tuples, or None
+        Lower and upper wavelength limits (Angstroms) of each band; an
+        event with lower <= wavelength < upper is in the band.  Bands
+        may overlap.  None means one band including all wavelengths.
+
+    output: str or None
+        Name of the output file, or None if the light curves should just
+        be returned, not written.
+
+    starttime: float or None
+        Time at the beginning of the first bin; None means the start of
+        the first good time interval.
+
+    endtime: float or None
+        Time at the end of the last bin; None means the end of the last
+        good time interval.
+
+    verbosity: int {0, 1, 2} or None
+        Indicates how much should be printed; None means don't change
+        the current value.
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The primary header is copied from the input file.  The LIGHTCURVE
+        table has one row for each time bin, with columns START, STOP and
+        EXPTIME (the good time within the bin), and array columns with
+        one element per band:  COUNTS and BKG_COUNTS, the number of events
+        in the source and background regions; GROSS, the epsilon-weighted
+        source count rate; BACKGROUND, the epsilon-weighted background
+        count rate scaled to the height of the source region; NET, GROSS
+        minus BACKGROUND; and ERROR, the error estimate for NET.  The
+        rates are zero for bins with no good time.  The BANDS table gives
+        the wavelength limits of each band.
+    """
+
+    if verbosity is not None:
+        cosutil.setVerbosity(verbosity)
+
+    cosutil.printIntro("Light curve")
+    names = [("Input", input), ("Output", output)]
+    cosutil.printFilenames(names)
+
+    if binwidth <= 0.:
+        raise ValueError("binwidth must be positive")
+    if bands is None:
+        bands = [(0., np.inf)]
+    bands = np.array(bands, dtype=np.float64).reshape(-1, 2)
+
+    ifd = fits.open(input, mode="copyonwrite", memmap=True)
+    try:
+        ofd = lightCurveFromCorrtag(ifd, input, binwidth, bands,
+                                    starttime, endtime)
+    finally:
+        ifd.close()
+
+    if output is not None:
+        cosutil.updateFilename(ofd[0].header, output)
+        ofd.writeto(output, output_verify="silentfix")
+        cosutil.printMsg("%s written" % output, VERBOSE)
+
+    return ofd
+
+def lightCurveFromCorrtag(ifd, input, binwidth, bands, starttime, endtime):
+    """Compute the light curves from an open corrtag file.
+
+    Parameters
+    ----------
+    ifd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The corrtag file
+
+    input: str
+        Name of the corrtag file (for messages)
+
+    binwidth: float
+        Length of each time bin
+
+    bands: array_like, shape (nbands, 2)
+        Lower and upper wavelength limits of each band
+
+    starttime, endtime: float or None
+        Limits of the time bins; see lightCurve
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The light curves; see lightCurve
+    """
+
+    phdr = ifd[0].header
+    try:
+        events_hdu = ifd[("events")]
+    except KeyError:
+        raise RuntimeError("%s is not a corrtag file" % input)
+    hdr = events_hdu.header
+    events = events_hdu.data
+    info = getinfo.getGeneralInfo(phdr, hdr)
+    switches = getinfo.getSwitchValues(phdr)
+    reffiles = getinfo.getRefFileNames(phdr)
+    if events is None or len(events) == 0:
+        raise RuntimeError("%s contains no events" % input)
+    if not cosutil.findColumn(events, "wavelength"):
+        raise RuntimeError("%s has no WAVELENGTH column" % input)
+    if switches["wavecorr"] != "COMPLETE":
+        cosutil.printWarning("WAVECORR was not done for " + input)
+
+    (gti_start, gti_stop) = getGTIArrays(ifd, events.field("time"))
+    if starttime is None:
+        starttime = gti_start[0]
+    if endtime is None:
+        endtime = gti_stop[-1]
+    if endtime <= starttime:
+        raise RuntimeError("endtime (%g) must be greater than starttime (%g)"
+                           % (endtime, starttime))
+    nbins = int(np.ceil((endtime - starttime) / binwidth))
+    bin_start = starttime + binwidth * np.arange(nbins, dtype=np.float64)
+    bin_stop = np.minimum(bin_start + binwidth, endtime)
+    exptime = binExptime(bin_start, bin_stop, gti_start, gti_stop)
+
+    # The wavelength intervals between adjacent band limits, and which
+    # of those intervals are within each band.
+    wl_edges = np.unique(bands)
+    membership = (wl_edges[:-1, np.newaxis] >= bands[:, 0]) & \
+                 (wl_edges[1:, np.newaxis] <= bands[:, 1])
+    nwl = len(wl_edges) - 1
+
+    regions = regionSetup(info, switches, reffiles)
+    disp_rel = dispersionSetup(info, reffiles)
+    if switches["helcorr"] == "COMPLETE":
+        v_helio = hdr.get("v_helio", 0.)
+    else:
+        v_helio = 0.
+
+    (xi, eta, dq, epsilon) = extract.getColumns(ifd, info["detector"])
+    time = events.field("time")
+    wavelength = events.field("wavelength")
+
+    # For each time bin, wavelength interval and region:  the number of
+    # events, and the sums of their weights and squared weights.
+    shape = (nbins, nwl, N_REGIONS)
+    size = nbins * nwl * N_REGIONS
+    counts = np.zeros(size, dtype=np.int64)
+    sum_w = np.zeros(size, dtype=np.float64)
+    sum_w2 = np.zeros(size, dtype=np.float64)
+    for c in cosutil.eventChunks(len(events)):
+        (index, weight) = histogramIndex(
+                time[c], wavelength[c], xi[c], eta[c], dq[c], epsilon[c],
+                regions, disp_rel, v_helio, starttime, binwidth, nbins,
+                endtime, gti_start, gti_stop, wl_edges)
+        counts += np.bincount(index, minlength=size)
+        sum_w += np.bincount(index, weights=weight, minlength=size)
+        sum_w2 += np.bincount(index, weights=weight * weight, minlength=size)
+
+    # Sum over the wavelength intervals within each band.
+    counts = np.einsum("twr,wb->rtb", counts.reshape(shape),
+                       membership.astype(np.int64))
+    sum_w = np.einsum("twr,wb->rtb", sum_w.reshape(shape),
+                      membership.astype(np.float64))
+    sum_w2 = np.einsum("twr,wb->rtb", sum_w2.reshape(shape),
+                       membership.astype(np.float64))
+
+    good = exptime > 0.
+    exptime_div = np.where(good, exptime, 1.)[:, np.newaxis]
+    gross = np.where(good[:, np.newaxis], sum_w[SOURCE] / exptime_div, 0.)
+    background = np.where(good[:, np.newaxis],
+                          sum_w[BACKGROUND] / exptime_div, 0.)
+    error = np.where(good[:, np.newaxis],
+                     np.sqrt(sum_w2[SOURCE] + sum_w2[BACKGROUND]) /
+                     exptime_div, 0.)
+
+    cosutil.printMsg("%d time bins and %d wavelength bands from %s" %
+                     (nbins, len(bands), input), VERBOSE)
+
+    return makeOutput(phdr, hdr, bands, binwidth, bin_start, bin_stop,
+                      exptime, counts, gross, background, error)
+
+def getGTIArrays(ifd, time):
+    """Get the good time intervals.
+
+    Parameters
+    ----------
+    ifd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The corrtag file
+
+    time: array_like
+        The TIME column, used if there is no GTI table
+
+    Returns
+    -------
+    tuple of two arrays
+        The start and stop times of the good time intervals, in
+        increasing order
+    """
+
+    gti_hdu = splittag.getGTI(ifd)
+    if gti_hdu is None or gti_hdu.data is None or len(gti_hdu.data) == 0:
+        cosutil.printWarning("No GTI table found; using the range of "
+                             "event times.", VERBOSE)
+        return (np.array([time[0]], dtype=np.float64),
+                np.array([time[-1]], dtype=np.float64))
+
+    gti_start = gti_hdu.data.field("start").astype(np.float64)
+    gti_stop = gti_hdu.data.field("stop").astype(np.float64)
+    order = np.argsort(gti_start)
+
+    return (gti_start[order], gti_stop[order])
+
+def binExptime(bin_start, bin_stop, gti_start, gti_stop):
+    """Compute the good time within each time bin.
+
+    Parameters
+    ----------
+    bin_start, bin_stop: array_like
+        Beginning and end of each time bin
+
+    gti_start, gti_stop: array_like
+        Beginning and end of each good time interval
+
+    Returns
+    -------
+    array_like
+        The total overlap of each time bin with the good time intervals
+    """
+
+    overlap = np.minimum(bin_stop[:, np.newaxis], gti_stop) - \
+              np.maximum(bin_start[:, np.newaxis], gti_start)
+
+    return np.clip(overlap, 0., None).sum(axis=1)
+
+def regionSetup(info, switches, reffiles):
+    """Get the source and background regions for each segment or stripe.
+
+    Parameters
+    ----------
+    info: dictionary
+        Header keywords and values
+
+    switches: dictionary
+        Calibration switch values
+
+    reffiles: dictionary
+        Reference file names
+
+    Returns
+    -------
+    dictionary
+        The key is the segment or stripe name, and the value is a list of
+        (region, slope, intercept, height, weight) tuples, one for the
+        source region and one for each background region.  intercept is
+        the location of the middle of the region at xi = 0, and weight is
+        the factor for scaling epsilon for that region.
+    """
+
+    if info["detector"] == "FUV":
+        segments = [info["segment"]]
+    else:
+        segments = ["NUVA", "NUVB", "NUVC"]
+
+    # The XFULL and YFULL coordinates have already been corrected for the
+    # wavecal shifts, so only the life adjustment offset is needed if
+    # there was no wavecal correction (see extract.doExtract).
+    if switches["wavecorr"] == "COMPLETE":
+        shift2 = 0.
+    else:
+        shift2 = info["life_adj_offset"]
+
+    regions = {}
+    for segment in segments:
+        filter = {"segment": segment,
+                  "opt_elem": info["opt_elem"],
+                  "cenwave": info["cenwave"],
+                  "aperture": info["aperture"]}
+        (xtract_info, proftab_info) = \
+            extract.getXtractInfo(info, reffiles, filter)
+        try:
+            slope = xtract_info.field("slope")[0]
+        except KeyError:
+            slope = 0.0
+        height = xtract_info.field("height")[0]
+        if cosutil.findColumn(xtract_info, "b_hgt1"):
+            bkg_height1 = xtract_info.field("b_hgt1")[0]
+            bkg_height2 = xtract_info.field("b_hgt2")[0]
+        else:
+            bkg_height1 = xtract_info.field("bheight")[0]
+            bkg_height2 = bkg_height1
+        # scale the sum over both background regions to the height of
+        # the source region, as in extract.extractCorrtag
+        bkg_norm = float(height) / float(bkg_height1 + bkg_height2)
+        regions[segment] = [
+            (SOURCE, slope, xtract_info.field("b_spec")[0] + shift2,
+             height, 1.),
+            (BACKGROUND, slope, xtract_info.field("b_bkg1")[0] + shift2,
+             bkg_height1, bkg_norm),
+            (BACKGROUND, slope, xtract_info.field("b_bkg2")[0] + shift2,
+             bkg_height2, bkg_norm)]
+
+    return regions
+
+def dispersionSetup(info, reffiles):
+    """Get the PSA dispersion relation for each segment or stripe.
+
+    Parameters
+    ----------
+    info: dictionary
+        Header keywords and values
+
+    reffiles: dictionary
+        Reference file names
+
+    Returns
+    -------
+    dictionary
+        The key is the segment or stripe name, and the value is a
+        dispersion.DispersionTable object
+    """
+
+    if info["detector"] == "FUV":
+        segments = [info["segment"]]
+        nx = FUV_X
+    else:
+        segments = ["NUVA", "NUVB", "NUVC"]
+        nx = NUV_X
+
+    disp_rel = {}
+    for segment in segments:
+        filter = {"segment": segment,
+                  "opt_elem": info["opt_elem"],
+                  "cenwave": info["cenwave"],
+                  "aperture": "PSA",
+                  "fpoffset": info["fpoffset"]}
+        disp_rel[segment] = dispersion.getDispersionTable(
+                                reffiles["disptab"], filter, nx)
+        if disp_rel[segment] is None:
+            raise MissingRowError("Missing row in DISPTAB; filter = %s" %
+                                  str(filter))
+
+    return disp_rel
+
+def inRegion(xi, eta, slope, intercept, height):
+    """Find the events within an extraction box.
+
+    This uses the same test as ccos.xy_extract.
+
+    Parameters
+    ----------
+    xi, eta: array_like
+        Pixel coordinates in the dispersion and cross-dispersion
+        directions
+
+    slope, intercept: float
+        The middle of the box is at eta = intercept + slope * xi
+
+    height: int
+        Height of the box (pixels)
+
+    Returns
+    -------
+    array_like, boolean
+        True for events within the box
+    """
+
+    y = eta - (intercept - height // 2 + slope * xi)
+    j = np.floor(y + 0.5)
+
+    return (j >= 0) & (j < height)
+
+def histogramIndex(time, wavelength, xi, eta, dq, epsilon,
+                   regions, disp_rel, v_helio, starttime, binwidth, nbins,
+                   endtime, gti_start, gti_stop, wl_edges):
+    """Compute the histogram bin and weight for a chunk of events.
+
+    Parameters
+    ----------
+    time, wavelength, xi, eta, dq, epsilon: array_like
+        Columns from the events table (one chunk)
+
+    regions: dictionary
+        Source and background regions; see regionSetup
+
+    disp_rel: dictionary
+        Dispersion relations for the background events; see
+        dispersionSetup
+
+    v_helio: float
+        Heliocentric velocity (km/s) for correcting the wavelengths of
+        background events, or 0 if the corrtag wavelengths were not
+        corrected
+
+    starttime, binwidth, nbins, endtime:
+        The time bins
+
+    gti_start, gti_stop: array_like
+        Good time intervals
+
+    wl_edges: array_like
+        Limits of the wavelength intervals, in increasing order
+
+    Returns
+    -------
+    tuple of two arrays
+        The index into the flattened (time bin, wavelength interval,
+        region) histogram and the weight (epsilon, scaled for background
+        events) of each event that is included
+    """
+
+    time = time.astype(np.float64)
+    nwl = len(wl_edges) - 1
+
+    # Only the time, wavelength and region determine whether an event is
+    # included, and all three are computed before doing any selection.
+    k = np.searchsorted(gti_start, time, side="right") - 1
+    good = (k >= 0) & (time < gti_stop[np.maximum(k, 0)])
+    good &= (time >= starttime) & (time < endtime)
+    good &= np.bitwise_and(dq, SERIOUS_DQ_FLAGS) == 0
+    t_bin = np.floor((time - starttime) / binwidth).astype(np.int64)
+    np.clip(t_bin, 0, nbins - 1, out=t_bin)
+
+    region = np.full(len(time), -1, dtype=np.int64)
+    weight = np.zeros(len(time), dtype=np.float64)
+    # (a copy, with the same data type as the WAVELENGTH column)
+    wavelength = wavelength.copy()
+    for segment in regions:
+        # The source region takes precedence, so it is assigned last.
+        for (code, slope, intercept, height, factor) in \
+                reversed(regions[segment]):
+            in_box = inRegion(xi, eta, slope, intercept, height)
+            region[in_box] = code
+            weight[in_box] = factor
+            if code == BACKGROUND:
+                bkg_wavelength = disp_rel[segment].evalDisp(xi[in_box])
+                if v_helio != 0.:
+                    bkg_wavelength += (bkg_wavelength *
+                                       (-v_helio) / SPEED_OF_LIGHT)
+                wavelength[in_box] = bkg_wavelength
+    good &= region >= 0
+
+    wl_bin = np.searchsorted(wl_edges, wavelength, side="right") - 1
+    good &= (wavelength > 0.) & (wl_bin >= 0) & (wl_bin < nwl)
+
+    index = (t_bin * nwl + wl_bin) * N_REGIONS + region
+    weight *= epsilon
+
+    return (index[good], weight[good])
+
+def makeOutput(phdr, hdr, bands, binwidth, bin_start, bin_stop,
+               exptime, counts, gross, background, error):
+    """Create the light curve and band tables.
+
+    Parameters
+    ----------
+    phdr, hdr: ``astropy.io.fits.header.Header`` objects
+        Primary and events headers of the corrtag file
+
+    bands: array_like, shape (nbands, 2)
+        Wavelength limits of the bands
+
+    binwidth: float
+        Length of each time bin
+
+    bin_start, bin_stop, exptime: array_like
+        Beginning, end and good time of each time bin
+
+    counts: array_like, shape (N_REGIONS, nbins, nbands)
+        Number of events in the source and background regions
+
+    gross, background, error: array_like, shape (nbins, nbands)
+        Count rates
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        Primary header, LIGHTCURVE table and BANDS table
+    """
+
+    rpt = str(len(bands))
+    col = []
+    col.append(fits.Column(name="START", format="1D", disp="F10.3",
+                           unit="s", array=bin_start))
+    col.append(fits.Column(name="STOP", format="1D", disp="F10.3",
+                           unit="s", array=bin_stop))
+    col.append(fits.Column(name="EXPTIME", format="1D", disp="F8.3",
+                           unit="s", array=exptime))
+    col.append(fits.Column(name="COUNTS", format=rpt+"J", unit="count",
+                           array=counts[SOURCE].astype(np.int32)))
+    col.append(fits.Column(name="BKG_COUNTS", format=rpt+"J", unit="count",
+                           array=counts[BACKGROUND].astype(np.int32)))
+    col.append(fits.Column(name="GROSS", format=rpt+"E", unit="count /s",
+                           array=gross))
+    col.append(fits.Column(name="BACKGROUND", format=rpt+"E",
+                           unit="count /s", array=background))
+    col.append(fits.Column(name="NET", format=rpt+"E", unit="count /s",
+                           array=gross - background))
+    col.append(fits.Column(name="ERROR", format=rpt+"E", unit="count /s",
+                           array=error))
+    lc_hdu = fits.BinTableHDU.from_columns(fits.ColDefs(col))
+    lc_hdu.name = "LIGHTCURVE"
+    for keyword in ["expstart", "expend", "exptime"]:
+        if keyword in hdr:
+            lc_hdu.header[keyword] = hdr[keyword]
+    lc_hdu.header["binwidth"] = (binwidth, "length of time bins (s)")
+    lc_hdu.header["nbands"] = (len(bands), "number of wavelength bands")
+
+    col = []
+    col.append(fits.Column(name="WAVE_MIN", format="1D", unit="angstrom",
+                           array=bands[:, 0]))
+    col.append(fits.Column(name="WAVE_MAX", format="1D", unit="angstrom",
+                           array=bands[:, 1]))
+    bands_hdu = fits.BinTableHDU.from_columns(fits.ColDefs(col))
+    bands_hdu.name = "BANDS"
+
+    ofd = fits.HDUList([fits.PrimaryHDU(header=phdr.copy()),
+                        lc_hdu, bands_hdu])
+    ofd[0].header["nextend"] = 2
+
+    return ofd
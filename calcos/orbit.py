@@ -96,19 +96,21 @@ class HSTOrbit(object):
 
         Parameters
         ----------
-        mjd: float
+        mjd: float or array_like
             The time (MJD) at which to compute the position and velocity.
+            This may be an array of times, in which case the positions and
+            velocities for all of them are computed in one call.
 
         Returns
         -------
         tuple of two array_like
             The first array is the position vector (km), the second array
-            is the velocity vector (km/s).
+            is the velocity vector (km/s).  If mjd is a scalar, each array
+            has shape (3,); if mjd is an array of length n, each array has
+            shape (3, n).
         """
 
-        # These will be returned, after assigning the actual values.
-        x_hst = np.zeros(3, dtype=np.float64)
-        v_hst = np.zeros(3, dtype=np.float64)
+        mjd = np.asarray(mjd, dtype=np.float64)
 
         argperig = self.argperig
         cirveloc = self.cirveloc
@@ -140,14 +142,14 @@ class HSTOrbit(object):
         temp3 = 0.5 * sdmeanan * deltim*deltim
         m = meananom + TWOPI * (temp2 + temp3)
 
-        sin_m = math.sin(m)
-        cos_m = math.cos(m)
+        sin_m = np.sin(m)
+        cos_m = np.cos(m)
 
         # true anomaly (equation of the center)
         v = m + sin_m * (eccentx2 + ecbdx3 * cos_m * cos_m -
                 ecbdx4d3 * sin_m * sin_m + esqdx5d2 * cos_m)
-        sin_v = math.sin(v)
-        cos_v = math.cos(v)
+        sin_v = np.sin(v)
+        cos_v = np.cos(v)
 
         # distance
         r = semilrec / (1.0 + eccentry * cos_v)
@@ -157,15 +159,19 @@ class HSTOrbit(object):
 
         # longitude of the ascending node
         wbig = TWOPI * (rascascn + rcascnrv * deltim)
-        sin_wbig = math.sin(wbig)
-        cos_wbig = math.cos(wbig)
+        sin_wbig = np.sin(wbig)
+        cos_wbig = np.cos(wbig)
 
         # calculate the rectangular coordinates
         #  (see Smart, Spherical Astronomy, section 75, page 122-124)
 
         f = wsmall + v
-        sin_f = math.sin(f)
-        cos_f = math.cos(f)
+        sin_f = np.sin(f)
+        cos_f = np.cos(f)
+
+        # These will be returned, after assigning the actual values.
+        x_hst = np.zeros((3,) + mjd.shape, dtype=np.float64)
+        v_hst = np.zeros((3,) + mjd.shape, dtype=np.float64)
 
         x_hst[0] = r * (cos_wbig * cos_f - cosincli * sin_wbig * sin_f)
         x_hst[1] = r * (sin_wbig * cos_f + cosincli * cos_wbig * sin_f)
@@ -1,6 +1,7 @@
 import glob
 import math
 import os
+from collections import deque
 import numpy as np
 from astropy.io import fits
 from . import cosutil
@@ -8,9 +9,16 @@ from . import ccos
 
 NOT_APPLICABLE = "N/A"
 SEC_PER_DAY = 86400.            # seconds in a day
+# Default number of threads writing output files.  Formatting the headers
+# holds the GIL, so on a local disk one writer (overlapping the I/O with
+# setting up the next file) is fastest; more can help on a network file
+# system, where each write waits longer.
+MAX_WRITERS = 1
+FITS_BLOCK_SIZE = 2880          # FITS files are written in blocks this size
 
 def splittag(infiles, outroot, starttime=None, increment=None, endtime=None,
-             time_list=None, verbosity=1):
+             time_list=None, verbosity=1, max_writers=None,
+             max_open_files=None, dry_run=False):
     """Split TIME-TAG files into multiple files.
 
     All times are in seconds, and the zero point is EXPSTART.
@@ -42,19 +50,47 @@ def splittag(infiles, outroot, starttime=None, increment=None, endtime=None,
     verbosity: int {0, 1, 2}
         0 --> print almost nothing, 1 --> print some info,
         2 --> print more info
+
+    max_writers: int or None
+        Number of threads for writing output files (default MAX_WRITERS).
+
+    max_open_files: int or None
+        Maximum number of output files that may be set up or being
+        written at any one time (default twice max_writers).
+
+    dry_run: bool
+        If True, print the output file names and time intervals, but
+        don't write any files.
+
+    Returns
+    -------
+    list of tuples
+        One (filename, t0, t1, i, j) tuple for each output file; see
+        splitOneTag.
     """
 
     infiles = os.path.expandvars(infiles)
     outroot = os.path.expandvars(outroot)
     inlist = glob.glob(infiles)
+    plan = []
     for input in inlist:
-        splitOneTag(input, outroot, starttime, increment, endtime,
-                    time_list, verbosity)
+        plan.extend(splitOneTag(input, outroot, starttime, increment, endtime,
+                                time_list, verbosity, max_writers,
+                                max_open_files, dry_run))
+
+    return plan
 
 def splitOneTag(input, outroot, starttime=None, increment=None, endtime=None,
-                time_list=None, verbosity=1):
+                time_list=None, verbosity=1, max_writers=None,
+                max_open_files=None, dry_run=False):
     """Split a TIME-TAG file into multiple files.
 
+    The row ranges of all the time intervals are found with a single
+    search of the TIME column (see sliceIndices).  The EVENTS table in
+    each output file is a view of the (memory mapped) input table, so no
+    rows are copied until the file is written, and the output files are
+    written by a pool of threads while the next ones are being set up.
+
     Parameters
     ----------
     input: str
@@ -78,6 +114,26 @@ def splitOneTag(input, outroot, starttime=None, increment=None, endtime=None,
 
     verbosity: int {0, 1, 2}
         Indicates how much should be printed
+
+    max_writers: int or None
+        Number of threads for writing output files; the default is
+        MAX_WRITERS
+
+    max_open_files: int or None
+        Maximum number of output files that may be set up or being
+        written at any one time; the default is twice the number of
+        writer threads
+
+    dry_run: bool
+        If True, find the output file names and time intervals, but don't
+        write anything
+
+    Returns
+    -------
+    list of tuples
+        One (filename, t0, t1, i, j) tuple for each output file, giving
+        the file name, the start and end times of the interval, and the
+        slice [i:j] of rows copied from the input EVENTS table
     """
 
     cosutil.setVerbosity(verbosity)
@@ -87,7 +143,7 @@ def splitOneTag(input, outroot, starttime=None, increment=None, endtime=None,
 
     (inroot, suffix) = splitName(input)
 
-    ifd = fits.open(input, mode="copyonwrite")
+    ifd = fits.open(input, mode="copyonwrite", memmap=True)
     phdr = ifd[0].header
     try:
         hdr = ifd[("events")].header
@@ -106,42 +162,217 @@ def splitOneTag(input, outroot, starttime=None, increment=None, endtime=None,
                                 starttime, increment, endtime, time_list)
     cosutil.printMsg("time_list = %s" % repr(time_list), 2)
 
-    # define output columns based on input table
-    cd = ifd[("events")].columns
-
+    (first, last) = sliceIndices(time_col, time_list)
+    plan = []
     file_index = 1              # one indexing for output file names
-    for (t0, t1) in time_list:
-
-        (i, j) = determineSlice(time_col, t0, t1)
-        nrows = j - i
-        if nrows <= 0:
+    for (k, (t0, t1)) in enumerate(time_list):
+        (i, j) = (int(first[k]), int(last[k]))
+        if j - i <= 0:
             cosutil.printWarning("no rows in increment %.2f to %.2f" %
                                  (t0, t1))
             continue
-
         filename = constructOutputName(outroot, file_index, suffix)
-        ofd = fits.HDUList(fits.PrimaryHDU(header=phdr))
-        hdu = fits.BinTableHDU.from_columns(cd, header=hdr, nrows=nrows)
-        ofd.append(hdu)
+        plan.append((filename, t0, t1, i, j))
+        file_index += 1
+
+    try:
+        if dry_run:
+            for (filename, t0, t1, i, j) in plan:
+                cosutil.printMsg("%s:  %.3f to %.3f, %d events" %
+                                 (filename, t0, t1, j - i))
+        else:
+            writeSlices(ifd, info, gti_hdu, timeline_hdu, plan,
+                        max_writers, max_open_files)
+    finally:
+        ifd.close()
+
+    return plan
+
+def sliceIndices(time_col, time_list):
+    """Find the row ranges for all the time intervals at once.
+
+    This gives the same indices as calling determineSlice for each
+    interval, but it does one search of time_col for all the interval
+    boundaries.
+
+    Parameters
+    ----------
+    time_col: array_like
+        A copy of the TIME column from the input table (float64)
+
+    time_list: list of two-element tuples
+        The start and end times of each interval, as returned by
+        convertToSlices
+
+    Returns
+    -------
+    tuple of two arrays of int
+        For interval k, [first[k]:last[k]] is the slice of time_col
+        with times >= t0 and < t1
+    """
+
+    nelem = len(time_list)
+    if nelem == 0:
+        return (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+
+    # Like ccos.range, search for the boundaries after rounding them to
+    # single precision, and take [i:len(time_col)] if the boundary is at
+    # or after the last event.
+    bounds = np.sort(np.array(time_list, dtype=np.float64), axis=1)
+    bounds = bounds.astype(np.float32).astype(np.float64).ravel()
+    indices = np.searchsorted(time_col, bounds, side="left")
+    indices[bounds >= time_col[-1]] = len(time_col)
+    indices = indices.reshape(nelem, 2)
+
+    return (indices[:, 0], indices[:, 1])
+
+def writeSlices(ifd, info, gti_hdu, timeline_hdu, plan,
+                max_writers=None, max_open_files=None):
+    """Write the output files, using a pool of threads.
+
+    Creating a new HDUList for every output file takes much longer than
+    writing it, so the output files are written directly:  the headers
+    are copied from templates (see TableSlicer), and the rows are written
+    from the input file (or a table of GTIs computed for the slice),
+    without creating any HDU objects.
+
+    Parameters
+    ----------
+    ifd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The fits file handle for the input file; this must remain open
+        until this function returns
+
+    info: dictionary
+        Keywords and values from the input header
+
+    gti_hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
+        The GTI table from the input file
 
-        copyRows(data, ofd, i, j)
-        nevents = j - i
+    timeline_hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
+        The TIMELINE table from the input file
+
+    plan: list of tuples
+        (filename, t0, t1, i, j) for each output file
 
-        out_gti_hdu = createNewGTI(gti_hdu, t0, t1)
-        if out_gti_hdu is not None:
-            ofd.append(out_gti_hdu)
+    max_writers: int or None
+        Number of threads for writing output files
 
-        out_timeline_hdu = createNewTimeline(timeline_hdu, t0, t1)
-        if out_timeline_hdu is not None:
-            ofd.append(out_timeline_hdu)
+    max_open_files: int or None
+        Maximum number of output files that may be set up or being
+        written at any one time
+    """
 
-        updateKeywords(info, out_gti_hdu, t0, t1, nevents, ofd)
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if max_writers is None:
+        max_writers = MAX_WRITERS
+    if max_open_files is None:
+        max_open_files = 2 * max_writers
+    if max_writers < 1 or max_open_files < 1:
+        raise RuntimeError("max_writers and max_open_files must be "
+                           "at least 1")
+
+    events_hdu = ifd[("events")]
+    if events_hdu.header.get("pcount", 0) > 0:
+        raise RuntimeError("The EVENTS table in %s has variable-length "
+                           "arrays; that's not supported." % info["input"])
+    primary_template = fits.PrimaryHDU(header=ifd[0].header).header
+    primary_template.set("extend", True, after="naxis")
+    events = TableSlicer(events_hdu)
+    gti = TableSlicer(gti_hdu, defaultGTI())
+    if timeline_hdu is None:
+        timeline = None
+    else:
+        timeline = TableSlicer(timeline_hdu)
+        timeline_time = timeline_hdu.data.field("time").astype(np.float64)
+
+    pending = set()
+    written = deque()           # in the order of the slices
+    with ThreadPoolExecutor(max_workers=max_writers) as executor:
+        try:
+            for (filename, t0, t1, i, j) in plan:
+                if len(pending) >= max_open_files:
+                    (done, pending) = wait(pending,
+                                           return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                    printWritten(written)
+
+                phdr = primary_template.copy()
+                tables = [events.slice(i, j)]
+                gti_rows = newGTI(gti, t0, t1)
+                tables.append((gti.header(len(gti_rows)), gti_rows))
+                if timeline is not None:
+                    tables.append(newTimeline(timeline, timeline_time,
+                                              t0, t1))
+
+                exptime = gtiExptime(gti_rows[gti.name("start")],
+                                     gti_rows[gti.name("stop")])
+                updateKeywords(info, exptime, t0, t1, j - i,
+                               phdr, tables[0][0])
+
+                # Format the headers here, so the writer threads only do
+                # I/O and don't compete for the GIL.
+                blocks = [phdr.tostring().encode("ascii")]
+                for (hdr, rows) in tables:
+                    blocks.append(hdr.tostring().encode("ascii"))
+                    blocks.append(rows)
+                future = executor.submit(writeOneSlice, filename, blocks)
+                pending.add(future)
+                written.append(future)
+        finally:
+            # Wait for every file that was started, even after an error.
+            wait(pending)
+        printWritten(written)
+
+def printWritten(written):
+    """Print the names of the output files that have been written.
+
+    This is called in the main thread (cosutil.printMsg is not thread
+    safe), and the names are printed in the order of the slices, so the
+    messages are the same regardless of which writer finishes first.
+
+    Parameters
+    ----------
+    written: deque
+        Futures for the files being written, in the order of the slices;
+        those at the beginning that are done are removed.  If one of them
+        raised an exception, it is raised here.
+    """
 
-        ofd.writeto(filename)
-        ofd.close()
-        del ofd
+    while written and written[0].done():
+        filename = written.popleft().result()
         cosutil.printMsg("%s written" % filename)
-        file_index += 1
+
+def writeOneSlice(filename, blocks):
+    """Write one output file (called in a writer thread).
+
+    Parameters
+    ----------
+    filename: str
+        Name of the output file; this must not already exist
+
+    blocks: list
+        The primary header, then the header and rows of each table
+        extension; the headers are bytes (already padded), and the rows
+        are arrays of records in FITS (big-endian) format, possibly
+        views of the memory mapped input file
+
+    Returns
+    -------
+    str
+        The name of the output file
+    """
+
+    with open(filename, "xb") as fd:
+        for block in blocks:
+            if isinstance(block, bytes):
+                fd.write(block)
+            elif block.nbytes > 0:
+                fd.write(memoryview(block).cast("B"))
+                fd.write(b"\0" * (-block.nbytes % FITS_BLOCK_SIZE))
+
+    return filename
 
 def splitName(input):
     """Split the input name into rootname and suffix.
@@ -470,26 +701,45 @@ def constructOutputName(outroot, file_index, suffix):
 
     return filename
 
-def copyRows(data, ofd, i, j):
-    """Copy rows from the input file to an output file.
+class TableSlicer(object):
+    """The header and rows of an input table, for copying slices of it.
+
+    The rows are the records as stored in the input file (a view of the
+    memory mapped file, not a copy), and the header is a template for
+    the output tables, in the form astropy would write it.
 
     Parameters
     ----------
-    data: ``astropy.io.fits.fitsrec.FITS_rec`` record array
-        The data block of the EVENTS table extension
+    hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
+        A table from the input file
 
-    ofd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
-        The data block of the EVENTS table extension
+    default: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
+        A table to use instead, if hdu is None or has no data
+    """
 
-    i: int
-        Number (zero indexed) of the first row to copy
+    def __init__(self, hdu, default=None):
 
-    j: int
-        One more than the number (zero indexed) of the last row to copy;
-        that is, [i:j] is a slice
-    """
+        if hdu is None or hdu.data is None:
+            hdu = default
+        data = hdu.data
+        self.template = fits.BinTableHDU(data=data[0:0],
+                                         header=hdu.header).header
+        self.rows = data.view(np.ndarray)
+        self.names = {name.lower(): name for name in self.rows.dtype.names}
 
-    ofd[1].data = data[i:j]
+    def name(self, column):
+        """The name of a column in the raw rows (case insensitive)."""
+        return self.names[column.lower()]
+
+    def header(self, nrows):
+        """A header for an output table with nrows rows."""
+        hdr = self.template.copy()
+        hdr["naxis2"] = nrows
+        return hdr
+
+    def slice(self, i, j):
+        """The header and rows for rows [i:j] of the input table."""
+        return (self.header(j - i), self.rows[i:j])
 
 def getGTI(ifd):
     """Find the most up-to-date GTI table in the input file.
@@ -523,13 +773,30 @@ def getGTI(ifd):
         gti_hdu = ifd[hdunum]
     return gti_hdu
 
-def createNewGTI(gti_hdu, t0, t1):
-    """Create a GTI table for the output table.
+def defaultGTI():
+    """Create an empty GTI table, for an input file that doesn't have one.
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.table.BinTableHDU`` object
+        A GTI table with START and STOP columns and no rows
+    """
+
+    col = []
+    col.append(fits.Column(name="START", format="1D", unit="s"))
+    col.append(fits.Column(name="STOP", format="1D", unit="s"))
+    hdu = fits.BinTableHDU.from_columns(fits.ColDefs(col), nrows=0)
+    hdu.header["extname"] = "GTI"
+
+    return hdu
+
+def newGTI(gti, t0, t1):
+    """Create the rows of the GTI table for the output table.
 
     Parameters
     ----------
-    gti_hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
-        The GTI table from the input file (may be None)
+    gti: TableSlicer
+        The GTI table from the input file (see defaultGTI)
 
     t0: float
         Time at the start of the interval
@@ -539,62 +806,33 @@ def createNewGTI(gti_hdu, t0, t1):
 
     Returns
     -------
-    ``astropy.io.fits.hdu.table.BinTableHDU`` object
-        A GTI table to append to the output file
+    array of records
+        The GTI table rows for the output file, the parts of the input
+        good time intervals that overlap t0 to t1; one row (0, 0) if
+        there is no overlap, or one row (t0, t1) if the input GTI table
+        is empty (meaning the entire exposure is good)
     """
 
-    if gti_hdu is None or gti_hdu.data is None or len(gti_hdu.data) == 0:
-        # No GTI table means the entire exposure is good.
-        if gti_hdu is None or gti_hdu.data is None:
-            col = []
-            col.append(fits.Column(name="START", format="1D", unit="s"))
-            col.append(fits.Column(name="STOP", format="1D", unit="s"))
-            cd = fits.ColDefs(col)
-        else:
-            cd = gti_hdu.columns
-        out_gti_hdu = fits.BinTableHDU.from_columns(cd, header=gti_hdu.header,
-                                                    nrows=1)
-        out_start_col = out_gti_hdu.data.field("start")
-        out_stop_col = out_gti_hdu.data.field("stop")
-        out_start_col[0] = t0
-        out_stop_col[0] = t1
-        return out_gti_hdu
-
-    cd = gti_hdu.columns
-
-    data = gti_hdu.data
-    in_nrows = len(data)
-
-    # columns in the GTI table from the input file
-    start_col = data.field("start")
-    stop_col = data.field("stop")
-
-    gti = []                    # list of good (start, stop) intervals
-    for i in range(in_nrows):
-        start = start_col[i]
-        stop = stop_col[i]
-        if start >= t1 or stop <= t0:
-            continue
-        start = max(start, t0)
-        stop = min(stop, t1)
-        if (stop - start) <= 0.:
-            continue
-        gti.append((start, stop))
+    start_name = gti.name("start")
+    stop_name = gti.name("stop")
+
+    if len(gti.rows) == 0:
+        out_rows = np.zeros(1, dtype=gti.rows.dtype)
+        out_rows[start_name] = t0
+        out_rows[stop_name] = t1
+        return out_rows
 
-    if not gti:
-        gti.append((0., 0.))
-    out_nrows = len(gti)
+    start = np.maximum(gti.rows[start_name], t0)
+    stop = np.minimum(gti.rows[stop_name], t1)
+    good = (stop - start) > 0.
+    out_nrows = max(np.count_nonzero(good), 1)
 
-    out_gti_hdu = fits.BinTableHDU.from_columns(cd, header=gti_hdu.header,
-                                                nrows=out_nrows)
-    out_start_col = out_gti_hdu.data.field("start")
-    out_stop_col = out_gti_hdu.data.field("stop")
-    for i in range(out_nrows):
-        (start, stop) = gti[i]
-        out_start_col[i] = start
-        out_stop_col[i] = stop
+    out_rows = np.zeros(out_nrows, dtype=gti.rows.dtype)
+    if good.any():
+        out_rows[start_name] = start[good]
+        out_rows[stop_name] = stop[good]
 
-    return out_gti_hdu
+    return out_rows
 
 def getTimeline(ifd):
     """Get the TIMELINE extension (if there is one) from the input file.
@@ -629,13 +867,16 @@ def getTimeline(ifd):
 
     return timeline_hdu
 
-def createNewTimeline(timeline_hdu, t0, t1):
+def newTimeline(timeline, time_col, t0, t1):
     """Create a TIMELINE table for the output table.
 
     Parameters
     ----------
-    timeline_hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
-        The TIMELINE table from the input file (may be None).
+    timeline: TableSlicer
+        The TIMELINE table from the input file.
+
+    time_col: array_like
+        The TIME column of the TIMELINE table, as float64.
 
     t0: float
         Time at the start of the interval.
@@ -645,50 +886,48 @@ def createNewTimeline(timeline_hdu, t0, t1):
 
     Returns
     -------
-    ``astropy.io.fits.hdu.table.BinTableHDU`` object, or None
-        A TIMELINE table to append to the output file, or None.  If
-        there is no TIMELINE extension in the input file (indicated by
-        timeline_hdu being None) or if the time increment is zero or
-        negative, None will be returned.  Otherwise, the returned value
-        will have the same columns as the input timeline_hdu, but the rows
-        will be a subset of timeline_hdu.
+    tuple
+        The header and rows for the output TIMELINE table, which are the
+        rows of the input table that cover t0 to t1 (or no rows, if the
+        input table is empty).
     """
 
-    if timeline_hdu is None:
-        return None
+    if len(timeline.rows) == 0:
+        return timeline.slice(0, 0)
 
-    cd = timeline_hdu.columns
+    # "ceil(t1) + 0.1" here is to ensure that the time range
+    # (specifically i_end) actually includes all the relevant rows
+    # of the input TIMELINE table.
+    # This implicitly assumes that the time increment is one second.
+    (i_start, i_end) = ccos.range(time_col, t0, math.ceil(t1) + 0.1)
 
-    in_data = timeline_hdu.data
-    if in_data is None:
-        in_nrows = 0
-    else:
-        in_nrows = len(in_data)
-
-    if in_nrows > 0:
-        time_col = in_data.field("time").astype(np.float64)
-        # "ceil(t1) + 0.1" here is to ensure that the time range
-        # (specifically i_end) actually includes all the relevant rows
-        # of the input TIMELINE table.
-        # This implicitly assumes that the time increment is one second.
-        (i_start, i_end)= ccos.range(time_col, t0, math.ceil(t1) + 0.1)
-        out_nrows = i_end - i_start
-    else:
-        out_nrows = 0
+    return timeline.slice(i_start, i_end)
+
+def gtiExptime(start_col, stop_col):
+    """Add up the lengths of the good time intervals.
 
-    out_timeline_hdu = fits.BinTableHDU.from_columns(cd,
-                                                     header=timeline_hdu.header,
-                                                     nrows=out_nrows)
-    if in_nrows > 0:
-        out_data = out_timeline_hdu.data
-        i = i_start
-        for j in range(out_nrows):
-            out_data[j] = in_data[i]
-            i += 1
+    Parameters
+    ----------
+    start_col: array_like
+        Start times of the good time intervals
+
+    stop_col: array_like
+        Stop times of the good time intervals
+
+    Returns
+    -------
+    float
+        The exposure time
+    """
 
-    return out_timeline_hdu
+    exptime = 0.
+    n = len(start_col)
+    for i in range(n):
+        exptime += (stop_col[i] - start_col[i])
 
-def updateKeywords(info, out_gti_hdu, t0, t1, nevents, ofd):
+    return exptime
+
+def updateKeywords(info, exptime, t0, t1, nevents, phdr, hdr):
     """Update keywords in an output file.
 
     This function adds two HISTORY records to the output primary header and
@@ -700,8 +939,9 @@ def updateKeywords(info, out_gti_hdu, t0, t1, nevents, ofd):
     info: dictionary
         Keywords and values from the input header
 
-    out_gti_hdu: ``astropy.io.fits.hdu.table.BinTableHDU`` object
-        Header/data unit for the GTI table for the output file
+    exptime: float
+        Exposure time (the total of the good time intervals) for the
+        output file
 
     t0: float
         Time at the start of the interval
@@ -712,27 +952,17 @@ def updateKeywords(info, out_gti_hdu, t0, t1, nevents, ofd):
     nevents: int
         Number of events in the output EVENTS table
 
-    ofd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
-        The fits file handle for the output file
-    """
+    phdr: ``astropy.io.fits.header.Header`` object
+        The primary header of the output file (modified in-place)
 
-    phdr = ofd[0].header
-    hdr = ofd[1].header
+    hdr: ``astropy.io.fits.header.Header`` object
+        The EVENTS extension header of the output file (modified in-place)
+    """
 
     filename = os.path.basename(info["input"])          # just the file name
     phdr.add_history("Copied from %s" % filename)
     phdr.add_history("Time slice from input was %.3f to %.3f" % (t0, t1))
 
-    if out_gti_hdu is None:
-        exptime = t1 - t0
-    else:
-        start_col = out_gti_hdu.data.field("start")
-        stop_col = out_gti_hdu.data.field("stop")
-        exptime = 0.
-        n = len(start_col)
-        for i in range(n):
-            exptime += (stop_col[i] - start_col[i])
-
     # Modified 2011 May 13 to update exptimea or exptimeb, depending on
     # segment.  Also update nevents and either neventsa or neventsb.
     hdr["exptime"] = exptime
@@ -4,8 +4,8 @@ import numpy as np
 from astropy.io import fits
 from . import cosutil
 from . import dispersion
+from . import intervals
 from . import orbit
-from . import ccos
 from .calcosparam import *       # parameter definitions
 
 DIST_SUN  = 149597870.691       # 1 AU in km
@@ -110,6 +110,10 @@ def createTimeline(input, fd, info, reffiles,
             dt = tl_time[1] - tl_time[0]
         else:
             dt = 1.
+        # e.g. ACCUM data
+        accum_like = (np.float64(time[-1]) - np.float64(time[0]) < 1.)
+        if not accum_like:
+            (jt0, jt1, no_overlap) = timelineBinIndices(time, tl_time, dt)
         for key in ["ly_alpha", "oi_1304", "oi_1356", "dark"]:
             wl_airglow = AIRGLOW_WAVELENGTHS[key]
             region = findPixelRegion(info, reffiles["disptab"],
@@ -122,38 +126,34 @@ def createTimeline(input, fd, info, reffiles,
                 cosutil.printMsg("Airglow region for %s is "
                                  "X: %d to %d, Y: %d to %d" %
                                  (key.upper(), x0, x1+1, y0, y1+1), VERBOSE)
-            # A value of 1 (True) in region_flags means the corresponding
-            # event is within the area that includes the airglow line.
-            region_flags = np.ones(len(xfull), dtype=np.bool_)
-            region_flags = np.where(xfull > x1, False, region_flags)
-            region_flags = np.where(xfull < x0,  False, region_flags)
             if isinstance(y0, (list, tuple)):
                 # for the dark, there are two y regions
-                region_flags = np.where(yfull > y1[1], False, region_flags)
-                region_flags = np.where(yfull < y0[0],  False, region_flags)
-                between = np.logical_and(yfull > y1[0], yfull < y0[1])
-                region_flags = np.where(between,  False, region_flags)
                 npixels = (x1 - x0) * (y1[0] - y0[0] + y1[1] - y0[1])
             else:
-                region_flags = np.where(yfull > y1, False, region_flags)
-                region_flags = np.where(yfull < y0,  False, region_flags)
                 npixels = 1.
-            region_flags = region_flags.astype(np.bool_)
+            # The events are counted one chunk at a time.
+            n_region = 0
+            counts = np.zeros(len(tl_time), dtype=np.int64)
+            for c in cosutil.eventChunks(len(xfull)):
+                region_flags = airglowRegionFlags(xfull[c], yfull[c], region)
+                if accum_like:
+                    n_region += int(region_flags.sum(dtype=np.int32))
+                    continue
+                # cum_flags[j] is the number of flagged events in the chunk
+                # before index j, so the number in the slice jt0:jt1 is a
+                # difference of two elements (clipped to the chunk).
+                n_chunk = len(region_flags)
+                cum_flags = np.zeros(n_chunk + 1, dtype=np.int64)
+                np.cumsum(region_flags, out=cum_flags[1:])
+                counts += cum_flags[np.clip(jt1 - c.start, 0, n_chunk)] - \
+                          cum_flags[np.clip(jt0 - c.start, 0, n_chunk)]
             # scratch array for counts per second within each time bin
             temp = np.zeros(len(tl_time), dtype=np.float32)
-            if time[-1] - time[0] < 1.:         # e.g. ACCUM data
-                temp[:] = float(region_flags.sum(dtype=np.int32)) / exptime
+            if accum_like:
+                temp[:] = float(n_region) / exptime
             else:
-                for i in range(len(tl_time)):
-                    # jt0 and jt1 are indices in the TIME column, and therefore
-                    # also in region_flags.
-                    try:
-                        (jt0, jt1) = ccos.range(time,
-                                                tl_time[i], tl_time[i]+dt)
-                        temp[i] = float(
-                        (region_flags[jt0:jt1]).sum(dtype=np.int32)) / dt
-                    except RuntimeError:
-                        temp[i] = 0.
+                temp[:] = counts.astype(np.float32) / dt
+                temp[no_overlap] = 0.
             if key == "ly_alpha":
                 ly_alpha_col[:] = temp
             elif key == "oi_1304":
@@ -187,26 +187,89 @@ def createTimeline(input, fd, info, reffiles,
         target_alt_col = tl_data.field("target_alt")
         rv_col = tl_data.field("radial_vel")
 
-    for i in range(len(tl_time)):
-        mjd = np.float64(tl_time[i]) / SEC_PER_DAY + info["expstart"]
-        (rect_hst, vel_hst) = orb.getPos(mjd)
-        (r, ra_hst, dec_hst) = rectToSph(rect_hst)
-        # Assume that we want geocentric latitude.  The difference from
-        # astronomical latitude can be up to about 8.6 arcmin.
-        lat_hst = dec_hst
-        # Subtract the sidereal time at Greenwich to convert to longitude.
-        long_hst = ra_hst - 2. * math.pi * gmst(mjd)
-        if long_hst < 0.:
-            long_hst += (2. * math.pi)
-        long_col[i] = long_hst / DEGtoRAD
-        lat_col[i] = lat_hst / DEGtoRAD
-        rect_sun = eqSun(mjd)                   # equatorial coords of the Sun
-        sun_alt_col[i] = computeAlt(rect_sun, rect_hst, parallax=True)
-        sun_zd_col[i] = computeZD(rect_sun, rect_hst)
-        if external_target:
-            rv_col[i] = -dotProduct(rect_targ, vel_hst)
-            target_alt_col[i] = computeAlt(rect_targ, rect_hst,
-                                           parallax=False)
+    # Compute the orbital and solar positions for all rows at once.
+    mjd = tl_time.astype(np.float64) / SEC_PER_DAY + info["expstart"]
+    (rect_hst, vel_hst) = orb.getPos(mjd)
+    (r, ra_hst, dec_hst) = rectToSph(rect_hst)
+    # Assume that we want geocentric latitude.  The difference from
+    # astronomical latitude can be up to about 8.6 arcmin.
+    lat_hst = dec_hst
+    # Subtract the sidereal time at Greenwich to convert to longitude.
+    long_hst = ra_hst - 2. * math.pi * gmst(mjd)
+    long_hst = np.where(long_hst < 0., long_hst + 2. * math.pi, long_hst)
+    long_col[:] = long_hst / DEGtoRAD
+    lat_col[:] = lat_hst / DEGtoRAD
+    rect_sun = eqSun(mjd)                       # equatorial coords of the Sun
+    sun_alt_col[:] = computeAlt(rect_sun, rect_hst, parallax=True)
+    sun_zd_col[:] = computeZD(rect_sun, rect_hst)
+    if external_target:
+        rv_col[:] = -dotProduct(rect_targ, vel_hst)
+        target_alt_col[:] = computeAlt(rect_targ, rect_hst, parallax=False)
+
+def airglowRegionFlags(xfull, yfull, region):
+    """Find the events within the region that includes an airglow line.
+
+    Parameters
+    ----------
+    xfull: array_like
+        Fully corrected X positions of events.
+
+    yfull: array_like
+        Fully corrected Y positions of events.
+
+    region: tuple
+        (y0, y1, x0, x1), as returned by findPixelRegion; for the dark,
+        y0 and y1 are two-element lists, because there are two Y regions.
+
+    Returns
+    -------
+    array of bool
+        True for each event that is within the region.
+    """
+
+    (y0, y1, x0, x1) = region
+    if isinstance(y0, (list, tuple)):
+        region_flags = ~((xfull > x1) | (xfull < x0) |
+                         (yfull > y1[1]) | (yfull < y0[0]) |
+                         ((yfull > y1[0]) & (yfull < y0[1])))
+    else:
+        region_flags = ~((xfull > x1) | (xfull < x0) |
+                         (yfull > y1) | (yfull < y0))
+
+    return region_flags
+
+def timelineBinIndices(time, tl_time, dt):
+    """Find the range of events in each timeline bin.
+
+    This gives the same indices as calling ccos.range(time, tl_time[i],
+    tl_time[i]+dt) for each row i of the timeline table, but for all
+    rows at once.
+
+    Parameters
+    ----------
+    time: array_like
+        The array of times of events in the corrtag table (sorted).
+
+    tl_time: array_like
+        The array of times at the start of each timeline bin.
+
+    dt: float
+        The width of each timeline bin, in seconds.
+
+    Returns
+    -------
+    tuple of three arrays
+        jt0 and jt1 are the indices in time of the first event in the
+        bin and one more than the last event in the bin; no_overlap is
+        True for bins that do not overlap the time array at all (for
+        which ccos.range would raise an exception).
+    """
+
+    # The bin limits are truncated to single precision, as in ccos.range.
+    t0 = np.asarray(tl_time, dtype=np.float32)
+    t1 = (t0 + dt).astype(np.float32)
+
+    return intervals.rangeIndices(time, t0, t1)
 
 def makeSptFileName(input):
     """Construct the spt file name from the corrtag file name.
@@ -259,33 +322,40 @@ def rectToSph(rect):
     Parameters
     ----------
     rect: array_like
-        Vector in rectangular coordinates.
+        Vector in rectangular coordinates.  This may have shape (3, n)
+        for an array of n vectors.
 
     Returns
     --------
     array_like
-        Distance, longitude, latitude (angles in radians).
+        Distance, longitude, latitude (angles in radians), with the same
+        shape as rect.
     """
 
     # radius, longitude, latitude
-    sph = np.zeros(3, dtype=np.float64)
+    rect = np.asarray(rect, dtype=np.float64)
+    sph = np.zeros(rect.shape, dtype=np.float64)
 
     r2xy = rect[0] * rect[0] + rect[1] * rect[1]
-    sph[0] = math.sqrt(r2xy + rect[2] * rect[2])
-    rxy = math.sqrt(r2xy)
-    sph[2] = math.atan2(rect[2], rxy)
-    if r2xy > 0.:
-        sph[1] = math.atan2(rect[1], rect[0])
-        if sph[1] < 0.:
-            sph[1] += (2. * math.pi)
-    else:
-        sph[1] = 0.
+    sph[0] = np.sqrt(r2xy + rect[2] * rect[2])
+    rxy = np.sqrt(r2xy)
+    sph[2] = np.arctan2(rect[2], rxy)
+    longitude = np.arctan2(rect[1], rect[0])
+    longitude = np.where(longitude < 0., longitude + 2. * math.pi, longitude)
+    sph[1] = np.where(r2xy > 0., longitude, 0.)
 
     return sph
 
 def dotProduct(v1, v2):
+    """Dot product of two vectors (or of two arrays of vectors).
+
+    Either argument may have shape (3,) or (3, n); the result is a float
+    if both are single vectors, otherwise an array of length n.
+    """
     product = v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]
-    return product.item()
+    if np.ndim(product) == 0:
+        return product.item()
+    return product
 
 def gmst(mjd):
     """Greenwich mean sidereal time at mjd.
@@ -294,17 +364,17 @@ def gmst(mjd):
 
     Parameters
     ----------
-    mjd: float
+    mjd: float or array_like
         The Modified Julian Date.
 
     Returns
     -------
-    float
+    float or array_like
         The sidereal time at Greenwich, unit is fraction of a day.
     """
 
     d = mjd - MREF                      # days since MREF
-    du = math.floor(mjd) - MREF
+    du = np.floor(mjd) - MREF
     Tu = du / 36525.
     # Greenwich mean sidereal time at 0h UT1, in seconds.
     GMST0 = 24110.54841 + 8640184.812866 * Tu \
@@ -389,7 +459,9 @@ def computeAlt(rect, rect_hst, parallax=False):
         toward the object.
 
     rect_hst: array like
-        Rectangular, geocentric coordinates of HST, in km.
+        Rectangular, geocentric coordinates of HST, in km.  This may
+        have shape (3, n) for n different times, in which case rect may
+        also have shape (3, n).
 
     parallax: boolean
         True if the object is close enough that we should correct for
@@ -399,7 +471,7 @@ def computeAlt(rect, rect_hst, parallax=False):
 
     Returns
     -------
-    float
+    float or array_like
         Altitude of the object above the horizon, as seen by HST, in
         degrees.
     """
@@ -408,20 +480,20 @@ def computeAlt(rect, rect_hst, parallax=False):
         target = rect - rect_hst        # shift origin to HST
     else:
         target = rect
-    rtarget = math.sqrt(dotProduct(target, target))
+    rtarget = np.sqrt(dotProduct(target, target))
     # unit vector pointing from HST toward the object
     utarget = target / rtarget
 
-    rhst = math.sqrt(dotProduct(rect_hst, rect_hst))
+    rhst = np.sqrt(dotProduct(rect_hst, rect_hst))
     # unit vector pointing from the center of the Earth toward HST
     uhst = rect_hst / rhst
 
     cz = dotProduct(uhst, utarget)      # cosine zenith distance
-    zenith_dist = math.acos(cz)
+    zenith_dist = np.arccos(cz)
 
     # The horizon is more than 90 degrees from the zenith; add this extra
     # angle.
-    horizon_corr = math.acos(RADIUS_EARTH / rhst)
+    horizon_corr = np.arccos(RADIUS_EARTH / rhst)
     altitude = math.pi / 2 + horizon_corr - zenith_dist
 
     return altitude / DEGtoRAD
@@ -438,25 +510,26 @@ def computeZD(rect_sun, rect_hst):
 
     rect_hst: array like
         Rectangular, geocentric coordinates of HST.  The units are
-        arbitrary because the vector will be normalized to 1.
+        arbitrary because the vector will be normalized to 1.  Either
+        argument may have shape (3, n) for n different times.
 
     Returns
     -------
-    float
+    float or array_like
         The angle between HST and the Sun, as seen from the center of
         the Earth, in degrees.
     """
 
-    rsun = math.sqrt(dotProduct(rect_sun, rect_sun))
+    rsun = np.sqrt(dotProduct(rect_sun, rect_sun))
     usun = rect_sun / rsun
 
-    rhst = math.sqrt(dotProduct(rect_hst, rect_hst))
+    rhst = np.sqrt(dotProduct(rect_hst, rect_hst))
     uhst = rect_hst / rhst
 
     # zenith_dist is not quite the zenith distance, because parallax
     # is not accounted for.
     cz = dotProduct(uhst, usun)
-    zenith_dist = math.acos(cz)
+    zenith_dist = np.arccos(cz)
 
     return zenith_dist / DEGtoRAD
 
@@ -583,14 +656,15 @@ def eqSun(mjd):
 
     Parameters
     ----------
-    mjd: float
+    mjd: float or array_like
         The Modified Julian Date.
 
     Returns
     -------
     rect_sun: array_like
         Three-element vector containing the equatorial rectangular
-        coordinates of the Sun, in km.
+        coordinates of the Sun, in km; shape (3, n) if mjd is an array
+        of length n.
     """
 
     ecl_sun = eclSun(mjd)               # ecliptic coordinates of the Sun
@@ -608,17 +682,18 @@ def eclSun(mjd):
 
     Parameters
     ----------
-    mjd: float
+    mjd: float or array_like
         The Modified Julian Date.
 
     Returns
     -------
     eclcoord: array_like
         Three-element vector containing the ecliptic rectangular
-        coordinates of the Sun at mjd, in astronomical units.
+        coordinates of the Sun at mjd, in astronomical units; shape
+        (3, n) if mjd is an array of length n.
     """
 
-    eclcoord = np.zeros(3, dtype=np.float64)
+    eclcoord = np.zeros((3,) + np.shape(mjd), dtype=np.float64)
 
     tJcent = (mjd - MREF) / 36525. + 1.         # Julian centuries
 
@@ -629,26 +704,26 @@ def eclSun(mjd):
     gm4 = gmars(mjd)
     gj5 = gjupiter(mjd)
 
-    sings = math.sin(gs)
-    cosgs = math.cos(gs)
+    sings = np.sin(gs)
+    cosgs = np.cos(gs)
     sin2gs = 2. * sings * cosgs
     cos2gs = cosgs * cosgs - sings * sings
 
     ecllong = ls + (6910. * sings + 72. * sin2gs - 17. * tJcent * sings \
-                     - 7. * math.cos(gs - gj5) \
-                     + 6. * math.sin(lm - ls) \
-                     + 5. * math.sin(4.*gs - 8.*gm4 + 3.*gj5) \
-                     - 5. * math.cos(2.*gs - 2.*gv2) \
-                     - 4. * math.sin(gs - gv2) \
-                     + 4. * math.cos(4.*gs - 8.*gm4 + 3.*gj5) \
-                     + 3. * math.sin(2.*gs - 2.*gv2) \
-                     - 3. * math.sin(gj5) \
-                     - 3. * math.sin(2.*gs - 2.*gj5)) * ASECtoRAD
+                     - 7. * np.cos(gs - gj5) \
+                     + 6. * np.sin(lm - ls) \
+                     + 5. * np.sin(4.*gs - 8.*gm4 + 3.*gj5) \
+                     - 5. * np.cos(2.*gs - 2.*gv2) \
+                     - 4. * np.sin(gs - gv2) \
+                     + 4. * np.cos(4.*gs - 8.*gm4 + 3.*gj5) \
+                     + 3. * np.sin(2.*gs - 2.*gv2) \
+                     - 3. * np.sin(gj5) \
+                     - 3. * np.sin(2.*gs - 2.*gj5)) * ASECtoRAD
 
     dist = 1.00014 - 0.01675 * cosgs - 0.00014 * cos2gs
 
-    eclcoord[0] = dist * math.cos(ecllong)
-    eclcoord[1] = dist * math.sin(ecllong)
+    eclcoord[0] = dist * np.cos(ecllong)
+    eclcoord[1] = dist * np.sin(ecllong)
     eclcoord[2] = 0.
 
     return eclcoord
@@ -659,9 +734,10 @@ def eclToEq(eclcoord, mjd):
     Parameters
     ----------
     eclcoord: array_like
-        Three-element vector containing ecliptic rectangular coordinates.
+        Three-element vector containing ecliptic rectangular coordinates,
+        or an array of shape (3, n).
 
-    mjd: float
+    mjd: float or array_like
         The Modified Julian Date.
 
     Returns
@@ -671,15 +747,15 @@ def eclToEq(eclcoord, mjd):
         coordinates corresponding to eclcoord at mjd.
     """
 
-    eqcoord = np.zeros(3, dtype=np.float64)
+    eqcoord = np.zeros(np.shape(eclcoord), dtype=np.float64)
 
     tJcent = (mjd - MREF) / 36525. + 1.         # Julian centuries
 
     omega = momega(mjd)         # longitude of the ascending node of the moon
 
-    eps = (84428. - 47. * tJcent + 9. * math.cos(omega)) * ASECtoRAD
-    coseps = math.cos(eps)
-    sineps = math.sin(eps)
+    eps = (84428. - 47. * tJcent + 9. * np.cos(omega)) * ASECtoRAD
+    coseps = np.cos(eps)
+    sineps = np.sin(eps)
 
     # Rotate around x-axis by the obliquity of the ecliptic.
     eqcoord[0] = eclcoord[0]
@@ -0,0 +1,402 @@
+"""Time-resolved spectra, extracted directly from a corrtag table.
+
+The usual way to make a series of spectra covering successive time
+intervals of one exposure is to run splittag, then x1d.extractSpec on
+each of the output corrtag files.  That writes a corrtag, flt and counts
+file for each interval, and it reads the reference tables and recomputes
+the wavelengths and the DQ array every time.  extractTimeResolved does
+the setup once, then extracts the spectrum for each interval from the
+corresponding slice of the events table (extract.extractCorrtag), and it
+returns all the spectra in one table, one row per interval and segment
+(or stripe).
+
+The time intervals are specified the same way as for splittag; all times
+are in seconds, and the zero point is EXPSTART.
+"""
+
+import numpy as np
+from astropy.io import fits
+
+from . import cosutil
+from . import dispersion
+from . import extract
+from . import getinfo
+from . import splittag
+from .calcosparam import *       # parameter definitions
+
+def extractTimeResolved(input, output=None,
+                        starttime=None, increment=None, endtime=None,
+                        time_list=None, location=None, extrsize=None,
+                        verbosity=None):
+    """Extract a 1-D spectrum for each of a set of time intervals.
+
+    Parameters
+    ----------
+    input: str
+        Name of the corrtag file.
+
+    output: str or None
+        Name of the output file, or None if the spectra should just be
+        returned, not written.
+
+    starttime: float or None
+        Time at beginning of first interval, or None if time_list was
+        specified.
+
+    increment: float or None
+        Length of each time interval, or None if time_list was specified.
+
+    endtime: float or None
+        Time at end of last interval, or None if time_list is specified.
+
+    time_list: str or list
+        Times of the beginning of each interval and the end of the last
+        interval, or a list of (start, end) tuples; see
+        splittag.convertToSlices.
+
+    location: int or float, or list of integers or floats, or None
+        The location of the spectrum in the cross-dispersion direction;
+        see extract.extract1D.
+
+    extrsize: int, or list of int, or None
+        The height of the extraction box; see extract.extract1D.
+
+    verbosity: int {0, 1, 2} or None
+        Indicates how much should be printed; None means don't change
+        the current value.
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The primary header is copied from the input file.  The SCI table
+        has one row for each time interval (intervals with no events or
+        no good time are skipped) and each segment or stripe, with the
+        same columns as an x1d table, plus START and STOP, the times
+        (seconds since EXPSTART) of the beginning and end of the
+        interval.  The rows for one interval are consecutive; see
+        getCube.
+    """
+
+    if verbosity is not None:
+        cosutil.setVerbosity(verbosity)
+
+    cosutil.printIntro("Time-resolved Spectral Extraction")
+    names = [("Input", input), ("Output", output)]
+    cosutil.printFilenames(names)
+
+    ifd = fits.open(input, mode="copyonwrite", memmap=True)
+    try:
+        ofd = extractFromCorrtag(ifd, input, starttime, increment, endtime,
+                                 time_list, location, extrsize)
+    finally:
+        ifd.close()
+
+    if output is not None:
+        cosutil.updateFilename(ofd[0].header, output)
+        ofd.writeto(output, output_verify="silentfix")
+        cosutil.printMsg("%s written" % output, VERBOSE)
+
+    return ofd
+
+def extractFromCorrtag(ifd, input, starttime, increment, endtime,
+                       time_list, location, extrsize):
+    """Extract the spectra from an open corrtag file.
+
+    Parameters
+    ----------
+    ifd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The corrtag file
+
+    input: str
+        Name of the corrtag file (for messages)
+
+    starttime, increment, endtime, time_list:
+        Specify the time intervals; see splittag.convertToSlices
+
+    location, extrsize:
+        User-specified location and height of the extraction box, or None
+
+    Returns
+    -------
+    ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        The spectra; see extractTimeResolved
+    """
+
+    phdr = ifd[0].header
+    try:
+        events_hdu = ifd[("events")]
+    except KeyError:
+        raise RuntimeError("%s is not a corrtag file" % input)
+    hdr = events_hdu.header
+    info = getinfo.getGeneralInfo(phdr, hdr)
+    switches = getinfo.getSwitchValues(phdr)
+    reffiles = getinfo.getRefFileNames(phdr)
+    is_wavecal = info["exptype"].find("WAVE") >= 0
+    if is_wavecal:
+        location = None
+        extrsize = None
+    elif switches["wavecorr"] != "COMPLETE":
+        cosutil.printWarning("WAVECORR was not done for " + input)
+    if info["npix"] == (0,) or len(events_hdu.data) == 0:
+        raise RuntimeError("%s contains no events" % input)
+    find_target = {"flag": False, "cutoff": None}
+    (location, extrsize) = \
+        extract.checkLocation(info, location, extrsize, find_target)
+
+    if info["detector"] == "FUV":
+        segments = [info["segment"]]
+    elif info["obstype"] == "IMAGING":
+        segments = ["NUVA"]
+    else:
+        segments = ["NUVA", "NUVB", "NUVC"]
+
+    # Convert the columns to native byte order once, rather than for
+    # every slice.
+    columns = extract.getColumns(ifd, info["detector"])
+    (xi, eta, dq, epsilon) = [column.astype(column.dtype.newbyteorder("="))
+                              for column in columns]
+    time = events_hdu.data.field("time").astype(np.float64)
+
+    time_list = splittag.convertToSlices(time, starttime, increment,
+                                         endtime, time_list)
+    (first, last) = splittag.sliceIndices(time, time_list)
+    gti = splittag.TableSlicer(splittag.getGTI(ifd), splittag.defaultGTI())
+
+    dq_array = extract.getCorrtagDQArray(hdr, info, reffiles, segments[0])
+    axis_length = dq_array.shape[1]
+    setup = [segmentSetup(hdr, info, switches, reffiles, is_wavecal,
+                          segment, axis_length, location, extrsize)
+             for segment in segments]
+    nelem = axis_length
+
+    # These are the columns that extractCorrtag computes, in the order
+    # it returns them (the others are not used for corrtag extraction).
+    rows = {"START": [], "STOP": [], "SEGMENT": [], "EXPTIME": []}
+    names = ["NET", "ERROR", "ERROR_LOWER", "VARIANCE_FLAT",
+             "VARIANCE_COUNTS", "VARIANCE_BKG", "GROSS", "GCOUNTS",
+             "BACKGROUND", "DQ", "DQ_WGT"]
+    for name in names:
+        rows[name] = []
+
+    first_interval = True
+    for (k, (t0, t1)) in enumerate(time_list):
+        (i, j) = (first[k], last[k])
+        gti_rows = splittag.newGTI(gti, t0, t1)
+        exptime = splittag.gtiExptime(gti_rows[gti.name("start")],
+                                      gti_rows[gti.name("stop")])
+        if j <= i or exptime <= 0.:
+            cosutil.printWarning("no events or no good time in interval "
+                                 "%.2f to %.2f" % (t0, t1), VERBOSE)
+            continue
+        # Only update the extraction keywords for the first interval.
+        if first_interval:
+            ofd_header = hdr
+        else:
+            ofd_header = None
+        first_interval = False
+        for seg in setup:
+            results = extract.extractCorrtag(
+                        xi[i:j], eta[i:j], dq[i:j], epsilon[i:j], dq_array,
+                        ofd_header, seg["segment"], axis_length,
+                        seg["x_offset"], hdr["sdqflags"], seg["snr_ff"],
+                        exptime, switches["backcorr"], seg["axis"],
+                        seg["xtract_info"], seg["shift1"], seg["shift2"],
+                        seg["user_xdisp_locn"], seg["user_xdisp_size"],
+                        find_target)
+            rows["START"].append(t0)
+            rows["STOP"].append(t1)
+            rows["SEGMENT"].append(seg["segment"])
+            rows["EXPTIME"].append(exptime)
+            for (name, value) in zip(names, results):
+                rows[name].append(value)
+        cosutil.printMsg("interval %.3f to %.3f:  %d events" %
+                         (t0, t1, j - i), VERY_VERBOSE)
+
+    nrows = len(rows["SEGMENT"])
+    if nrows == 0:
+        raise RuntimeError("None of the time intervals contain events.")
+    cosutil.printMsg("%d spectra extracted from %s" % (nrows, input),
+                     VERBOSE)
+
+    # The wavelengths are the same for every interval.
+    wavelength = np.array([seg["wavelength"] for seg in setup] *
+                          (nrows // len(setup)))
+
+    rpt = str(nelem)
+    flux_unit = "erg /s /cm**2 /angstrom"
+    col = []
+    col.append(fits.Column(name="SEGMENT", format="4A",
+                           array=np.array(rows["SEGMENT"])))
+    col.append(fits.Column(name="START", format="1D", disp="F10.3",
+                           unit="s", array=np.array(rows["START"])))
+    col.append(fits.Column(name="STOP", format="1D", disp="F10.3",
+                           unit="s", array=np.array(rows["STOP"])))
+    col.append(fits.Column(name="EXPTIME", format="1D", disp="F8.3",
+                           unit="s", array=np.array(rows["EXPTIME"])))
+    col.append(fits.Column(name="NELEM", format="1J", disp="I6",
+                           array=np.full(nrows, nelem, dtype=np.int32)))
+    col.append(fits.Column(name="WAVELENGTH", format=rpt+"D",
+                           unit="angstrom", array=wavelength))
+    col.append(fits.Column(name="FLUX", format=rpt+"E", unit=flux_unit,
+                           array=np.zeros((nrows, nelem), dtype=np.float32)))
+    units = {"ERROR": flux_unit, "ERROR_LOWER": flux_unit,
+             "GROSS": "count /s", "GCOUNTS": "count", "NET": "count /s",
+             "BACKGROUND": "count /s"}
+    for name in names:
+        if name == "DQ":
+            format = rpt + "I"
+        else:
+            format = rpt + "E"
+        col.append(fits.Column(name=name, format=format,
+                               unit=units.get(name),
+                               array=np.array(rows[name])))
+        rows[name] = None               # free memory as we go
+
+    out_phdr = phdr.copy()
+    ofd = fits.HDUList(fits.PrimaryHDU(header=out_phdr))
+    hdu = fits.BinTableHDU.from_columns(fits.ColDefs(col), header=hdr)
+    hdu.name = "SCI"
+    ofd.append(hdu)
+    ofd[1].header = cosutil.delCorrtagWCS(ofd[1].header)
+
+    if switches["fluxcorr"] == "PERFORM":
+        extract.doFluxCorr(ofd, info, reffiles, switches["tdscorr"])
+
+    # Apply heliocentric Doppler correction to the wavelength array.
+    if switches["helcorr"] == "PERFORM" or switches["helcorr"] == "COMPLETE":
+        wavelength = ofd[1].data.field("WAVELENGTH")
+        wavelength += (wavelength * (-hdr["v_helio"]) / SPEED_OF_LIGHT)
+        ofd[0].header["helcorr"] = "COMPLETE"
+
+    ofd[0].header["nextend"] = 1
+    ofd[0].header["x1dcorr"] = "COMPLETE"
+    if switches["backcorr"] == "PERFORM":
+        ofd[0].header["backcorr"] = "COMPLETE"
+
+    return ofd
+
+def segmentSetup(hdr, info, switches, reffiles, is_wavecal,
+                 segment, axis_length, location, extrsize):
+    """Get the values that are the same for every interval.
+
+    This follows the setup in extract.doExtract for a corrtag table.
+
+    Parameters
+    ----------
+    hdr: ``astropy.io.fits.header.Header`` object
+        Header of the corrtag events table
+
+    info: dictionary
+        Header keywords and values
+
+    switches: dictionary
+        Calibration switch values
+
+    reffiles: dictionary
+        Reference file names
+
+    is_wavecal: boolean
+        True if the observation is a wavecal, based on exptype
+
+    segment: str
+        Segment or stripe name
+
+    axis_length: int
+        Length of the dispersion axis
+
+    location: dictionary with segment or stripe as key, or None
+        User-specified locations of the spectrum
+
+    extrsize: dictionary with segment or stripe as key, or None
+        User-specified heights of the extraction box
+
+    Returns
+    -------
+    dictionary
+        The segment name, xtract_info, wavelength array, and the other
+        arguments for extract.extractCorrtag
+    """
+
+    filter = {"segment": segment,
+              "opt_elem": info["opt_elem"],
+              "cenwave": info["cenwave"],
+              "aperture": info["aperture"]}
+    (xtract_info, proftab_info) = \
+        extract.getXtractInfo(info, reffiles, filter)
+
+    filter["fpoffset"] = info["fpoffset"]
+    disp_rel = dispersion.Dispersion(reffiles["disptab"], filter, True)
+    if not disp_rel.isValid():
+        raise MissingRowError("Missing row in DISPTAB; filter = %s" %
+                              str(disp_rel.getFilter()))
+
+    if is_wavecal:
+        dpixel1 = 0.
+        shift2 = hdr.get("shift2" + segment[-1], 0.)
+    elif switches["wavecorr"] != "COMPLETE":
+        dpixel1 = 0.
+        shift2 = info["life_adj_offset"]
+    else:
+        dpixel1 = hdr.get("dpixel1" + segment[-1], 0.)
+        shift2 = 0.
+
+    x_offset = hdr.get("x_offset", 0)
+    pixel = np.arange(axis_length, dtype=np.float64)
+    pixel -= x_offset
+    pixel += dpixel1
+    wavelength = disp_rel.evalDisp(pixel)
+    disp_rel.close()
+
+    if location is None:
+        user_xdisp_locn = None
+    else:
+        user_xdisp_locn = location[segment]
+    if extrsize is None:
+        user_xdisp_size = None
+    else:
+        user_xdisp_size = extrsize[segment]
+
+    return {"segment": segment,
+            "xtract_info": xtract_info,
+            "wavelength": wavelength,
+            "x_offset": x_offset,
+            "snr_ff": extract.getSnrFf(switches, reffiles, segment),
+            "axis": 2 - max(info["dispaxis"], 1),
+            "shift1": hdr.get("shift1" + segment[-1], 0.),
+            "shift2": shift2,
+            "user_xdisp_locn": user_xdisp_locn,
+            "user_xdisp_size": user_xdisp_size}
+
+def getCube(ofd, column="FLUX"):
+    """Get one column of time-resolved spectra as a 3-D array.
+
+    Parameters
+    ----------
+    ofd: ``astropy.io.fits.hdu.hdulist.HDUList`` object
+        Time-resolved spectra, as returned by extractTimeResolved
+
+    column: str
+        Name of an array column, e.g. "FLUX", "NET" or "GCOUNTS"
+
+    Returns
+    -------
+    tuple
+        (start, stop, segments, cube), where start and stop are arrays of
+        the beginning and end times of the intervals, segments is the
+        list of segment (or stripe) names, and cube is an array with
+        shape (number of intervals, number of segments, nelem)
+    """
+
+    data = ofd[1].data
+    segment = data.field("SEGMENT")
+    nsegments = 1
+    while nsegments < len(segment) and segment[nsegments] != segment[0]:
+        nsegments += 1
+    ntimes = len(segment) // nsegments
+
+    values = data.field(column)
+    cube = values.reshape((ntimes, nsegments) + values.shape[1:])
+    start = data.field("START")[::nsegments]
+    stop = data.field("STOP")[::nsegments]
+
+    return (start, stop, list(segment[0:nsegments]), cube)
@@ -10,6 +10,7 @@ from . import burst
 from . import ccos
 from . import concurrent
 from . import dispersion
+from . import intervals
 from . import phot
 from . import shiftfile
 from . import timeline
@@ -94,6 +95,8 @@ def timetagBasicCalibration(input, inpha, outtag,
         1 means there were no rows in the input table
     """
     input_path = os.path.dirname(input)
+    if cl_args.get("chunk_size") is not None:
+        cosutil.setChunkSize(cl_args["chunk_size"])
     if info["obsmode"] == "TIME-TAG":
         cosutil.printIntro("TIME-TAG calibration")
         names = [("Input", input),
@@ -111,10 +114,11 @@ def timetagBasicCalibration(input, inpha, outtag,
         cosutil.printMode(info)
 
     # Copy data from the input file to the output.  Then open the output
-    # file read/write.
+    # file read/write; the table is memory mapped, so the events are
+    # calibrated in the output file rather than in a copy in memory.
     if info["obsmode"] == "TIME-TAG":
         nrows = cosutil.writeOutputEvents(input, outtag)
-    ofd = fits.open(outtag, mode="update")
+    ofd = fits.open(outtag, mode="update", memmap=True)
     if ofd["EVENTS"].data is None:
         nrows = 0
     else:
@@ -126,10 +130,11 @@ def timetagBasicCalibration(input, inpha, outtag,
 
     if nrows > 0 and info["obsmode"] == "TIME-TAG":
         # Change orig_exptime to be the range of times in the TIME column.
-        time64 = events_hdu.data.field("TIME").astype(np.float64)
-        if time64[-1] > time64[0]:
-            info["orig_exptime"] = time64[-1] - time64[0]
-        del time64
+        time = events_hdu.data.field("TIME")
+        (first_time, last_time) = (np.float64(time[0]), np.float64(time[-1]))
+        if last_time > first_time:
+            info["orig_exptime"] = last_time - first_time
+        del time
 
     # Get a copy of the primary header.  This copy will be modified and
     # written to the output image files.
@@ -180,23 +185,9 @@ def timetagBasicCalibration(input, inpha, outtag,
             input, info, switches, reffiles, headers[1],
             cl_args["stimfile"])
     
-    doTempcorr(stim_param, events, info, switches, reffiles, phdr)
-
-    doGeocorr(events, info, switches, reffiles, phdr)
-
-    doDgeocorr(events, info, switches, reffiles, phdr)
-
-    # Set active_area based on (xcorr, ycorr) coordinates.
-    setActiveArea(events, info, reffiles["brftab"])
-
-    #
-    # The X and Y walk correction need to be independent, and applied to the
-    # same xcorr/pha values
-    if doWalkCorr(switches):
-
-        xcorrection = doXWalkcorr(events, info, switches, reffiles, phdr)
-        ycorrection = doYWalkcorr(events, info, switches, reffiles, phdr)
-        applyWalkCorrection(events, xcorrection, ycorrection)
+    # Apply tempcorr, geocorr, dgeocorr and the walk correction, and set
+    # active_area based on the (xcorr, ycorr) coordinates.
+    doEventCorrections(stim_param, events, info, switches, reffiles, phdr)
 
     updateGlobrate(info, headers[1])
 
@@ -338,7 +329,7 @@ def timetagBasicCalibration(input, inpha, outtag,
     # Create or update a TIMELINE extension.
     timeline.createTimeline(input, ofd, info, reffiles,
                             tl_time, shift1_vs_time,
-                            events.field("TIME").astype(np.float64),
+                            events.field("TIME"),
                             events.field(xfull), events.field(yfull))
 
     ofd.close()
@@ -731,22 +722,16 @@ def filterByTime(time, dq, badttab, expstart, segment):
 
     badt = []
     if badt_info is not None:
-        nrows = badt_info.shape[0]
-
-        start = badt_info.field("start")
-        stop  = badt_info.field("stop")
-
         # Convert from MJD to seconds after expstart.
-        for i in range(nrows):
-            start[i] = (start[i] - expstart) * SEC_PER_DAY
-            stop[i] = (stop[i] - expstart) * SEC_PER_DAY
-            badt.append([start[i], stop[i]])
+        start = (badt_info.field("start") - expstart) * SEC_PER_DAY
+        stop = (badt_info.field("stop") - expstart) * SEC_PER_DAY
+        badt = [[start[i], stop[i]] for i in range(len(start))]
 
-        # For each time interval in the badttab, flag every event for which
-        # the time falls within that interval.
-        for i in range(nrows):
-            dq |= np.where(np.logical_and(time >= start[i], time <= stop[i]),
-                           DQ_BAD_TIME, 0)
+        # Flag every event for which the time falls within any of the
+        # intervals in the badttab.
+        bad_intervals = intervals.TimeIntervals()
+        bad_intervals.add("badt", badt)
+        bad_intervals.flagEvents(time, dq, DQ_BAD_TIME, "badt")
 
     return badt
 
@@ -773,23 +758,19 @@ def countBadEvents(events, bursts, badt, info, hdr):
         The events extension header (keywords will be updated).
     """
 
-    t = events.field("time").astype(np.float64)
-    expstart = t[0]             # seconds since exposure start
-    expend = t[-1]
+    t = events.field("time")
+    expstart = np.float64(t[0])         # seconds since exposure start
+    expend = np.float64(t[-1])
+
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("burst", bursts)
+    bad_intervals.add("badt", badt)
 
-    t_burst = 0.
-    n_burst = 0
-    t_badt = 0.
-    n_badt = 0
     n_outside_active_area = 0
     n_bad_pha = 0
 
     if info["detector"] == "FUV":
-        if bursts is not None:
-            for burst in bursts:
-                t_burst += (burst[1] - burst[0])
-                r = ccos.range(t, burst[0], burst[1])
-                n_burst += (r[1] - r[0])
+        (n_burst, t_burst) = bad_intervals.countEvents(t, "burst")
         t_key = "tbrst_" + info["segment"][-1]
         n_key = "nbrst_" + info["segment"][-1]
         hdr[t_key] = t_burst
@@ -800,20 +781,13 @@ def countBadEvents(events, bursts, badt, info, hdr):
         n_outside_active_area = len(t) - np.sum(active_area.astype(np.int32))
         n_key = "nout_" + info["segment"][-1]
         hdr[n_key] = n_outside_active_area
+    else:
+        n_burst = 0
 
-    for (bad_start, bad_stop) in badt:
-        if badt is not None:
-            # badt includes all time intervals in the badttab, and many of
-            # those intervals may lie outside the time range of the exposure.
-            if bad_stop <= expstart:
-                continue
-            if bad_start >= expend:
-                continue
-            bad_start = max(bad_start, expstart)
-            bad_stop = min(bad_stop, expend)
-            t_badt += (bad_stop - bad_start)
-            r = ccos.range(t, bad_start, bad_stop)
-            n_badt += (r[1] - r[0])
+    # badt includes all time intervals in the badttab, and many of those
+    # intervals may lie outside the time range of the exposure.
+    (n_badt, t_badt) = bad_intervals.countEvents(t, "badt",
+                                                 t_min=expstart, t_max=expend)
     if info["detector"] == "FUV":
         t_key = "tbadt_" + info["segment"][-1]
         n_key = "nbadt_" + info["segment"][-1]
@@ -880,9 +854,11 @@ def recomputeExptime(input, bursts, badt, events, hdr, info):
         gti = [[time[0], time[-1]]]
         modified_0 = True
 
-    (modified_1, gti) = recomputeGTI(gti, bursts)
-    (modified_2, gti) = recomputeGTI(gti, badt)
-    modified = modified_0 or modified_1 or modified_2
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("burst", bursts)
+    bad_intervals.add("badt", badt)
+    (modified_1, gti) = bad_intervals.subtractFrom(gti, ["burst", "badt"])
+    modified = modified_0 or modified_1
 
     exptime = 0.
     for (start, stop) in gti:
@@ -925,25 +901,10 @@ def recomputeGTI(gti, badt):
         badttab.
     """
 
-    modified = False                    # initial value
-    if not badt:
-        return (modified, gti)
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("badt", badt)
 
-    for (bad_start, bad_stop) in badt:
-        new_gti = []
-        for (start, stop) in gti:
-            if bad_start >= stop or bad_stop <= start:
-                new_gti.append([start, stop])
-            else:
-                if bad_start > start:
-                    new_gti.append([start, bad_start])
-                    modified = True
-                if bad_stop < stop:
-                    new_gti.append([bad_stop, stop])
-                    modified = True
-        gti = new_gti
-
-    return (modified, gti)
+    return bad_intervals.subtractFrom(gti, "badt")
 
 def saveNewGTI(ofd, gti):
     """Append new GTI information as a BINTABLE extension.
@@ -1367,7 +1328,7 @@ def initTempcorr(events, input, info, switches, reffiles, hdr, stimfile):
     if info["detector"] == "FUV" and \
        (switches["tempcorr"] == "PERFORM" or switches["deadcorr"] == "PERFORM"):
         # Compute the parameters (to be used later).
-        time = events.field("TIME").astype(np.float64)
+        time = events.field("TIME")
         (stim_param, avg_s1, avg_s2, rms_s1, rms_s2, s1_ref, s2_ref,
          stim_countrate, stim_livetime) = \
          computeThermalParam(time,
@@ -1491,7 +1452,7 @@ def computeThermalParam(time, x, y, dq,
             % dt_thermal, VERY_VERBOSE)
     else:
         # For ACCUM data we want just one time interval.
-        dt_thermal = time[-1] - time[0] + 1.
+        dt_thermal = np.float64(time[-1]) - np.float64(time[0]) + 1.
 
     sx1 = brf_info.field("sx1")[0]
     sy1 = brf_info.field("sy1")[0]
@@ -1515,37 +1476,31 @@ def computeThermalParam(time, x, y, dq,
     if fd is not None:
         fd.write("# t0 t1 stim_locations\n")
 
-    t0 = time[0]
-    t1 = t0 + dt_thermal
+    # Find both stims in every time interval.
+    (edges, indices) = timeIntervals(time, dt_thermal, include_last=True)
+    stims1 = findStims(x, y, indices, s1_ref, xwidth, ywidth)
+    stims2 = findStims(x, y, indices, s2_ref, xwidth, ywidth)
+
     sumstim = (0, 0., 0., 0., 0., 0, 0., 0., 0., 0.)
     last_s1 = s1_ref            # initial default values
     last_s2 = s2_ref
-    while t0 <= time[nevents-1]:
+    for k in range(len(edges) - 1):
 
         # time[i:j] matches t0 to t1.
-        try:
-            (i, j) = ccos.range(time, t0, t1)
-        except:
-            t0 = t1
-            t1 = t0 + dt_thermal
-            continue
+        (i, j) = (indices[k], indices[k+1])
         if i >= j:              # i and j can be equal due to roundoff
-            t0 = t1
-            t1 = t0 + dt_thermal
             continue
+        (t0, t1) = (edges[k], edges[k+1])
 
-        (s1, sumsq1, counts1, found_s1) = \
-                findStim(x[i:j], y[i:j], s1_ref, xwidth, ywidth)
-
-        (s2, sumsq2, counts2, found_s2) = \
-                findStim(x[i:j], y[i:j], s2_ref, xwidth, ywidth)
+        (s1, sumsq1, counts1, found_s1) = stimInInterval(stims1, k)
+        (s2, sumsq2, counts2, found_s2) = stimInInterval(stims2, k)
 
         # Increment sums for averaging the stim positions.
         sumstim = updateStimSum(sumstim, counts1, s1, sumsq1, found_s1,
                                 counts2, s2, sumsq2, found_s2)
 
         if fd is not None:
-            fd.write("%.0f %.0f" % (t0, min(time[nevents-1], t1)))
+            fd.write("%.0f %.0f" % (t0, min(np.float64(time[nevents-1]), t1)))
             if found_s1:
                 fd.write("  %.1f %.1f" % (s1[1], s1[0]))
             else:
@@ -1573,21 +1528,20 @@ def computeThermalParam(time, x, y, dq,
                 msg += " (stim2 not found)"
             if not (found_s1 and found_s2):
                 cosutil.printWarning(msg)
-                if time[j-1] - time[i] < dt_thermal and obsmode == "TIME-TAG":
+                dt = np.float64(time[j-1]) - np.float64(time[i])
+                if dt < dt_thermal and obsmode == "TIME-TAG":
                     cosutil.printContinuation(
-                "Note that the time interval is %g s" % (time[j-1] - time[i]))
+                "Note that the time interval is %g s" % dt)
             else:
                 cosutil.printMsg(msg)
 
         (x0_n, xslope_n, y0_n, yslope_n) = thermalParam(s1, s2, s1_ref, s2_ref)
-        i0.append(i)
-        i1.append(j)
+        i0.append(int(i))
+        i1.append(int(j))
         x0.append(x0_n)
         xslope.append(xslope_n)
         y0.append(y0_n)
         yslope.append(yslope_n)
-        t0 = t1
-        t1 = t0 + dt_thermal
 
     # Compute the average of the stim positions.
     avg_s1 = [-1., -1.]
@@ -1637,6 +1591,134 @@ def computeThermalParam(time, x, y, dq,
     return (stim_param, avg_s1, avg_s2, rms_s1, rms_s2, s1_ref, s2_ref,
             stim_countrate, stim_livetime)
 
+def findStims(x, y, indices, stim_ref, xwidth, ywidth):
+    """Find one stim in each of a set of time intervals.
+
+    This gives the same results as calling findStim for each interval,
+    but the events within the search region are selected just once, and
+    the sums for all the intervals are then computed from those events
+    with np.add.reduceat.  The sums are accumulated in double precision,
+    so they can differ from those in findStim by the rounding error of
+    the single precision sums there; the data types of the results are
+    the same as for findStim.
+
+    Parameters
+    ----------
+    x: array like
+        Array of detector X coordinates.
+
+    y: array like
+        Array of detector Y coordinates.
+
+    indices: array like
+        Boundaries of the time intervals; the events in interval k are
+        x[indices[k]:indices[k+1]], y[indices[k]:indices[k+1]].
+
+    stim_ref: tuple
+        Reference position (y, x) for the stim.
+
+    xwidth: int
+        Half width of the search region in X.
+
+    ywidth: int
+        Half width of the search region in Y.
+
+    Returns
+    -------
+    tuple of lists, (sy, sx, sumysq, sumxsq, n)
+        Each list has one element per time interval.  (sy, sx) is the
+        stim location, (sumysq, sumxsq) is the sum of squared deviations
+        from the mean location, and n is the number of events for this
+        stim within the time interval.  If n is 0, the stim was not found,
+        and the other values are None.
+    """
+
+    # This is the search region for finding the stim.
+    sxlow  = stim_ref[1] - xwidth
+    sxhigh = stim_ref[1] + xwidth
+    sylow  = stim_ref[0] - ywidth
+    syhigh = stim_ref[0] + ywidth
+
+    # Truncate at the lower and upper borders, excluding the first
+    # and last lines.
+    sylow = max(sylow, 1)
+    syhigh = min(syhigh, 1022)
+
+    # Select the events within the search region (in their original
+    # order), and find where each interval begins in the selected events.
+    indices = np.asarray(indices)
+    i0 = indices[0]
+    i1 = indices[-1]
+    xi = x[i0:i1]
+    yi = y[i0:i1]
+    outside = (xi > sxhigh)
+    outside |= (xi < sxlow)
+    outside |= (yi > syhigh)
+    outside |= (yi < sylow)
+    selected = np.flatnonzero(~outside)
+    xs = xi[selected]
+    ys = yi[selected]
+    first = np.searchsorted(selected, indices - i0)
+    counts = np.diff(first)
+    # the same data type as the sum of the mask in findStim
+    n_all = counts.astype(np.float32)
+
+    # Sums for the intervals that contain at least one event; the
+    # intervals with no events begin where the next interval does, so
+    # each of these sums ends at the beginning of the next one.
+    found = counts > 0
+    starts = first[:-1][found]
+    if len(starts) > 0:
+        n_found = n_all[found]
+        # The stim reference position is subtracted before taking the sum
+        # and then added back to the average in order to reduce the
+        # possibility of numerical roundoff errors.
+        dx = xs - stim_ref[1]
+        dy = ys - stim_ref[0]
+        sumx = np.add.reduceat(dx, starts, dtype=np.float64).astype(dx.dtype)
+        sumy = np.add.reduceat(dy, starts, dtype=np.float64).astype(dy.dtype)
+        sx_found = sumx / n_found + stim_ref[1]
+        sy_found = sumy / n_found + stim_ref[0]
+        # sum of squared deviations, for computing RMS
+        devx = (xs - np.repeat(sx_found, counts[found]))**2
+        devy = (ys - np.repeat(sy_found, counts[found]))**2
+        sumxsq_found = np.add.reduceat(devx, starts,
+                                       dtype=np.float64).astype(devx.dtype)
+        sumysq_found = np.add.reduceat(devy, starts,
+                                       dtype=np.float64).astype(devy.dtype)
+
+    nintervals = len(counts)
+    (sy, sx, sumysq, sumxsq) = ([None] * nintervals, [None] * nintervals,
+                                [None] * nintervals, [None] * nintervals)
+    for (m, k) in enumerate(np.flatnonzero(found)):
+        sy[k] = sy_found[m]
+        sx[k] = sx_found[m]
+        sumysq[k] = sumysq_found[m]
+        sumxsq[k] = sumxsq_found[m]
+    n = [n_all[k] for k in range(nintervals)]
+
+    return (sy, sx, sumysq, sumxsq, n)
+
+def stimInInterval(stims, k):
+    """Extract the results for one interval from the output of findStims.
+
+    Parameters
+    ----------
+    stims: tuple of lists
+        The value returned by findStims.
+
+    k: int
+        Index of the time interval.
+
+    Returns
+    -------
+    tuple, ((sy, sx), (sumysq, sumxsq), n, found_stim)
+        The same as the value returned by findStim.
+    """
+
+    (sy, sx, sumysq, sumxsq, n) = stims
+    return ((sy[k], sx[k]), (sumysq[k], sumxsq[k]), n[k], bool(n[k] > 0.))
+
 def findStim(x, y, stim_ref, xwidth, ywidth):
     """Find one stim in time-tag data.
 
@@ -1881,6 +1963,218 @@ def thermalParam(s1, s2, s1_ref, s2_ref):
 
     return (xintercept, xslope, yintercept, yslope)
 
+def doEventCorrections(stim_param, events, info, switches, reffiles, phdr):
+    """Apply tempcorr, geocorr, dgeocorr and the walk correction.
+
+    For FUV data these are all applied in a single pass over the events
+    table by ccos.eventcorrection, which also assigns active_area (from
+    the coordinates after geocorr and dgeocorr, as the walk correction
+    is only applied within the active area).  If the thermal correction
+    parameters can't be handled that way (or for NUV), the steps are
+    done one at a time, in the same order, by doTempcorr, doGeocorr,
+    doDgeocorr, setActiveArea and applyWalkCorrection.  The results are
+    the same either way.
+
+    Parameters
+    ----------
+    stim_param: dictionary of lists
+        The dictionary has keys i0, i1, x0, xslope, y0, yslope.
+
+    events: astropy.io.fits record array
+        The data unit containing the events table.
+
+    info: dictionary
+        Header keywords and values.
+
+    switches: dictionary
+        Calibration switches.
+
+    reffiles: dictionary
+        Reference file names.
+
+    phdr: astropy.io.fits Header object
+        The input primary header.
+    """
+
+    global active_area
+
+    tempcorr_args = None
+    if info["detector"] == "FUV" and switches["tempcorr"] == "PERFORM":
+        tempcorr_args = thermalDistortionArgs(events.field(xcorr),
+                                              events.field(ycorr),
+                                              stim_param)
+
+    if info["detector"] != "FUV" or \
+       (switches["tempcorr"] == "PERFORM" and tempcorr_args is None):
+        doTempcorr(stim_param, events, info, switches, reffiles, phdr)
+        doGeocorr(events, info, switches, reffiles, phdr)
+        doDgeocorr(events, info, switches, reffiles, phdr)
+        # Set active_area based on (xcorr, ycorr) coordinates.
+        setActiveArea(events, info, reffiles["brftab"])
+        #
+        # The X and Y walk correction need to be independent, and applied
+        # to the same xcorr/pha values
+        if doWalkCorr(switches):
+            xcorrection = doXWalkcorr(events, info, switches, reffiles, phdr)
+            ycorrection = doYWalkcorr(events, info, switches, reffiles, phdr)
+            applyWalkCorrection(events, xcorrection, ycorrection)
+        return
+
+    # Print the same messages as the separate steps, and read the
+    # reference images.
+    cosutil.printSwitch("TEMPCORR", switches)
+    if switches["tempcorr"] == "PERFORM":
+        cosutil.printRef("BRFTAB", reffiles)
+        # The thermal correction is actually applied only if at least
+        # one interval has parameters that are not the identity.
+        tempcorr_done = (tempcorr_args[3] >= 0).any()
+        if not tempcorr_done:
+            cosutil.printWarning("TEMPCORR was skipped")
+            tempcorr_args = None
+
+    geo_args = {}
+    for (key, refkey) in [("geocorr", "geofile"), ("dgeocorr", "dgeofile")]:
+        cosutil.printSwitch(key.upper(), switches)
+        if switches[key] == "PERFORM":
+            cosutil.printRef(refkey.upper(), reffiles)
+            cosutil.printSwitch("IGEOCORR", switches)
+            (x_image, y_image, origin_x, origin_y, xbin, ybin) = \
+                    cosutil.getGeoImages(reffiles[refkey], info["segment"])
+            interp_flag = (switches["igeocorr"] == "PERFORM")
+            geo_args[key] = (x_image, y_image, int(interp_flag),
+                             origin_x, origin_y, xbin, ybin)
+        else:
+            geo_args[key] = None
+
+    xwalk = None
+    ywalk = None
+    if doWalkCorr(switches):
+        cosutil.printSwitch("XWLKCORR", switches)
+        if switches["xwlkcorr"] == "PERFORM":
+            cosutil.printRef("XWLKFILE", reffiles)
+            xwalk = getWalkImage(reffiles["xwlkfile"], info["segment"])
+        cosutil.printSwitch("YWLKCORR", switches)
+        if switches["ywlkcorr"] == "PERFORM":
+            cosutil.printRef("YWLKFILE", reffiles)
+            ywalk = getWalkImage(reffiles["ywlkfile"], info["segment"])
+            correct_size = (32, 1024)
+            if ywalk.shape != correct_size:
+                cosutil.printWarning("You are running CALCOS with a YWLKFILE that is of different")
+                cosutil.printContinuation("dimensions than expected by the YWLKCORR routine in this")
+                cosutil.printContinuation("build of CalCOS. Data may be calibrated with an incorrect")
+                cosutil.printContinuation("Y walk correction, potentially resulting in incorrect")
+                cosutil.printContinuation("spectral extraction.")
+        if xwalk is not None:
+            xwalk = xwalk.astype(np.float64)
+        if ywalk is not None:
+            ywalk = ywalk.astype(np.float64)
+
+    area = cosutil.activeArea(info["segment"], reffiles["brftab"])
+    (b_low, b_high, b_left, b_right) = [float(a) for a in area]
+    active_area = np.ones(len(events), dtype=np.bool_)
+
+    # The events are corrected one chunk at a time, so the copies that
+    # ccos makes of the (big-endian) columns are no larger than a chunk.
+    # The tempcorr intervals are given by event index, so they are
+    # shifted to the start of each chunk.
+    (x, y, pha) = (events.field(xcorr), events.field(ycorr),
+                   events.field("pha"))
+    for c in cosutil.eventChunks(len(events)):
+        if tempcorr_args is None:
+            chunk_tempcorr = None
+        else:
+            (i0, i1, param, mode) = tempcorr_args
+            n_chunk = c.stop - c.start
+            i0 = np.clip(i0 - c.start, 0, n_chunk).astype(np.int32)
+            i1 = np.clip(i1 - c.start, 0, n_chunk).astype(np.int32)
+            chunk_tempcorr = (i0, i1, param, mode)
+        ccos.eventcorrection(x[c], y[c], pha[c], active_area[c],
+                             (b_low, b_high, b_left, b_right),
+                             chunk_tempcorr,
+                             geo_args["geocorr"], geo_args["dgeocorr"],
+                             xwalk, ywalk)
+
+    if switches["tempcorr"] == "PERFORM":
+        if tempcorr_args is not None:
+            phdr["tempcorr"] = "COMPLETE"
+        else:
+            phdr["tempcorr"] = "SKIPPED"
+    for key in ["geocorr", "dgeocorr"]:
+        if switches[key] == "PERFORM":
+            phdr[key] = "COMPLETE"
+            if switches["igeocorr"] == "PERFORM":
+                phdr["igeocorr"] = "COMPLETE"
+    if xwalk is not None:
+        phdr["xwlkcorr"] = "COMPLETE"
+    if ywalk is not None:
+        phdr["ywlkcorr"] = "COMPLETE"
+
+def thermalDistortionArgs(x, y, stim_param):
+    """Get the thermal distortion parameters in the form used by ccos.
+
+    Parameters
+    ----------
+    x: array like
+        Array of detector X coordinates.
+
+    y: array like
+        Array of detector Y coordinates.
+
+    stim_param: dictionary of lists
+        The dictionary has keys i0, i1, x0, xslope, y0, yslope.
+
+    Returns
+    -------
+    tuple or None
+        (i0, i1, param, mode), the tempcorr argument for
+        ccos.eventcorrection; param has one row (x0, xslope, y0, yslope)
+        per interval, and mode gives the precision of the arithmetic
+        that thermalDistortion would use for x and y in each interval
+        (-1 if that interval would not be corrected).  None will be
+        returned if the intervals are out of order or overlap, in which
+        case thermalDistortion should be used instead.
+    """
+
+    x0 = stim_param["x0"]
+    xslope = stim_param["xslope"]
+    y0 = stim_param["y0"]
+    yslope = stim_param["yslope"]
+
+    if "i0" in stim_param:
+        i0 = np.array(stim_param["i0"], dtype=np.int64)
+        i1 = np.array(stim_param["i1"], dtype=np.int64)
+    else:
+        i0 = np.array([0], dtype=np.int64)
+        i1 = np.array([len(x)], dtype=np.int64)
+    i0 = np.clip(i0, 0, len(x))
+    i1 = np.clip(i1, 0, len(x))
+    if np.any(i1 < i0) or np.any(i0[1:] < i1[:-1]):
+        return None
+
+    def precision(coord, intercept, slope):
+        product = np.result_type(coord.dtype, slope)
+        total = np.result_type(product, intercept)
+        if total.itemsize == 4:
+            return 0
+        elif product.itemsize == 4:
+            return 1
+        else:
+            return 2
+
+    n_intervals = len(i0)
+    param = np.zeros((n_intervals, 4), dtype=np.float64)
+    mode = np.zeros((n_intervals, 2), dtype=np.int32)
+    for n in range(n_intervals):
+        if x0[n] != 0. or xslope[n] != 1. or \
+           y0[n] != 0. or yslope[n] != 1.:
+            param[n] = (x0[n], xslope[n], y0[n], yslope[n])
+            mode[n, 0] = precision(x, x0[n], xslope[n])
+            mode[n, 1] = precision(y, y0[n], yslope[n])
+        else:
+            mode[n] = -1
+
+    return (i0.astype(np.int32), i1.astype(np.int32), param, mode)
+
 def doTempcorr(stim_param, events, info, switches, reffiles, phdr):
     """Apply thermal distortion correction.
 
@@ -2159,18 +2453,38 @@ def walkCorrection(fastCoordinate, slowCoordinate, reference_file, segment):
         The array of lookups in the reference array
 
     """
-    nevents = len(fastCoordinate)
-    fd = fits.open(reference_file)
-    for extension in fd[1:]:
-        if extension.header['SEGMENT'] == segment:
-            reference_array = extension.data
-            break
-    delta = np.zeros(len(fastCoordinate))
+    reference_array = getWalkImage(reference_file, segment)
     delta = bilinear_interpolation(fastCoordinate, slowCoordinate,
                            reference_array)
-    fd.close()
     return delta
 
+def getWalkImage(reference_file, segment):
+    """Read the walk correction image for a segment.
+
+    Parameters
+    ----------
+    reference_file: string
+        Name of reference file (XWLKFILE or YWLKFILE)
+
+    segment: string
+        FUV segment ("FUVA" or "FUVB")
+
+    Returns
+    -------
+    reference_array: numpy ndarray
+        The 2-D image of walk corrections
+    """
+    fd = fits.open(reference_file)
+    extensions = [i for i in range(1, len(fd))
+                  if fd[i].header.get('SEGMENT') == segment]
+    fd.close()
+    if not extensions:
+        raise RuntimeError("Segment %s not found in walk correction file %s"
+                           % (segment, reference_file))
+    (reference_array, hdr) = cosutil.image_store.getImage(reference_file,
+                                                          extensions[0])
+    return reference_array
+
 def bilinear_interpolation(fastCoordinate, slowCoordinate,
                                reference_array):
     nrows, ncols = reference_array.shape
@@ -2708,27 +3022,36 @@ def doDoppcorr(events, info, switches, reffiles, phdr):
             cosutil.printRef("BRFTAB", reffiles)
 
         xtractab = reffiles["xtractab"]
+        time = events.field("time")
         if info["detector"] == "FUV":
-            # This array of flags indicates which events should be corrected.
-            region_flags = fuvDopplerRegions(eta, info, xtractab)
-            # Apply the orbital Doppler correction to the flagged events.
-            dopp[:] = np.where(region_flags,
-                               dopplerCorrection(events.field("time"),
-                                                 xi, info, reffiles),
-                               xi)
+            stripes = [None]
         else:
-            region_flags_dict = nuvPsaRegions(eta, info, xtractab)
-            dopp[:] = xi
-            for stripe in ["NUVA", "NUVB", "NUVC"]:
-                dopp[:] = np.where(region_flags_dict[stripe],
-                                   dopplerCorrection(events.field("time"),
-                                                     xi, info, reffiles,
-                                                     stripe=stripe),
-                                   dopp)
-
-        # Copy to xfull if wavecal processing will not be done.
-        if switches["wavecorr"] == "OMIT" and not info["corrtag_input"]:
-            xi_full[:] = dopp.copy()
+            stripes = ["NUVA", "NUVB", "NUVC"]
+        disp_rel = {}
+        for stripe in stripes:
+            disp_rel[stripe] = dopplerDispersion(info, reffiles, stripe)
+        copy_to_full = (switches["wavecorr"] == "OMIT" and
+                        not info["corrtag_input"])
+
+        for c in cosutil.eventChunks(len(events)):
+            (time_c, xi_c, dopp_c) = (time[c], xi[c], dopp[c])
+            dopp_c[:] = xi_c
+            if info["detector"] == "FUV":
+                # These flags indicate which events should be corrected.
+                region_flags_dict = {None: fuvDopplerRegions(eta[c], info,
+                                     xtractab, active=active_area[c])}
+            else:
+                region_flags_dict = nuvPsaRegions(eta[c], info, xtractab)
+            # Apply the orbital Doppler correction to the flagged events.
+            for stripe in stripes:
+                region_flags = region_flags_dict[stripe]
+                dopp_c[region_flags] = dopplerCorrection(
+                                time_c[region_flags], xi_c[region_flags],
+                                info, reffiles, stripe=stripe,
+                                disp_rel=disp_rel[stripe])
+            # Copy to xfull if wavecal processing will not be done.
+            if copy_to_full:
+                xi_full[c] = dopp_c
 
         phdr["doppcorr"] = "COMPLETE"
 
@@ -2788,7 +3111,7 @@ def psaWcaBoundary(info, xtractab):
 
     return boundary
 
-def fuvDopplerRegions(eta, info, xtractab):
+def fuvDopplerRegions(eta, info, xtractab, active=None):
     """Determine the region over which Doppler shift should be applied.
 
     This version is for FUV data.
@@ -2804,15 +3127,21 @@ def fuvDopplerRegions(eta, info, xtractab):
     xtractab: str
         Name of spectral extraction parameters reference table.
 
+    active: array like, boolean, or None
+        Flags for the events in eta that are within the active area;
+        None means use active_area (all the events in the table).
+
     Returns
     -------
     array like, boolean
         True for events that are within the region for which it would be
         appropriate to apply Doppler correction.  There is one element for
-        each event in the table.
+        each element of eta.
     """
 
-    region_flags = active_area.copy()
+    if active is None:
+        active = active_area
+    region_flags = active.copy()
 
     boundary = psaWcaBoundary(info, xtractab)
 
@@ -2820,7 +3149,7 @@ def fuvDopplerRegions(eta, info, xtractab):
 
     return region_flags
 
-def dopplerCorrection(time, xi, info, reffiles, stripe=None):
+def dopplerCorrection(time, xi, info, reffiles, stripe=None, disp_rel=None):
     """Apply orbital and heliocentric Doppler correction.
 
     Parameters
@@ -2840,12 +3169,49 @@ def dopplerCorrection(time, xi, info, reffiles, stripe=None):
     stripe: str
         Name of NUV stripe ("NUVA", "NUVB", "NUVC"), or None for FUV.
 
+    disp_rel: DispersionTable object, or None
+        The dispersion relation returned by dopplerDispersion; if None,
+        dopplerDispersion will be called.
+
     Returns
     -------
     array like
         Array of Doppler-corrected X pixel coordinates.
     """
 
+    if disp_rel is None:
+        disp_rel = dopplerDispersion(info, reffiles, stripe)
+
+    # Compute wavelength / dispersion at each element of xi.
+    factor = disp_rel.evalDispRatio(xi)
+
+    # Apply the Doppler correction to the pixel coordinates.
+    xd = orbitalDoppler(time, xi, factor, info["expstart"],
+                        info["doppmagv"], info["doppzero"], info["orbitper"])
+
+    return xd
+
+def dopplerDispersion(info, reffiles, stripe=None):
+    """Get the dispersion relation for the Doppler correction.
+
+    Parameters
+    ----------
+    info: dictionary
+        Keywords and values.
+
+    reffiles: dictionary
+        Dictionary of reference file names.
+
+    stripe: str
+        Name of NUV stripe ("NUVA", "NUVB", "NUVC"), or None for FUV.
+
+    Returns
+    -------
+    DispersionTable object
+        The dispersion relation for the current setup, which gives the
+        wavelength and dispersion at each pixel.
+    """
+
     disptab = reffiles["disptab"]
 
     # Compute the wavelength and dispersion at each pixel.
@@ -2863,17 +3229,9 @@ def dopplerCorrection(time, xi, info, reffiles, stripe=None):
         filter["segment"] = info["segment"]
     else:
         filter["segment"] = stripe
-    disp_rel = dispersion.Dispersion(disptab, filter, use_fpoffset=True)
-    if not disp_rel.isValid():
-        disp_rel.close()
-        raise MissingRowError("missing row in disptab")
-
-    xi = xi.astype(np.float64)
     fpoffset_present = cosutil.findColumn(disptab, "fpoffset")
     if fpoffset_present:
-        # Compute wavelength and dispersion at each element of xi.
-        wavelength = disp_rel.evalDisp(xi)
-        disp = disp_rel.evalDerivDisp(xi)
+        x_shift = 0.
     else:
         # Correct for fpoffset when computing wavelength and dispersion
         # (a feature will be at larger pixel number if fpoffset is larger,
@@ -2882,20 +3240,20 @@ def dopplerCorrection(time, xi, info, reffiles, stripe=None):
                                     filter={"opt_elem": info["opt_elem"]},
                                     exactly_one=True)
         stepsize = wcp_info.field("stepsize")[0]
-        wavelength = disp_rel.evalDisp(xi)
-        xi_temp = xi - info["fpoffset"] * stepsize
-        wavelength = disp_rel.evalDisp(xi_temp)
-        disp = disp_rel.evalDerivDisp(xi_temp)
-        del xi_temp, wcp_info
-    disp_rel.close()
-
-    # Apply the Doppler correction to the pixel coordinates.
-    xd = orbitalDoppler(time, xi, wavelength, disp, info["expstart"],
-                        info["doppmagv"], info["doppzero"], info["orbitper"])
+        x_shift = info["fpoffset"] * stepsize
+        del wcp_info
+    if info["detector"] == "FUV":
+        nx = FUV_X
+    else:
+        nx = NUV_X
+    disp_rel = dispersion.getDispersionTable(disptab, filter, nx,
+                                             x_shift=x_shift)
+    if disp_rel is None:
+        raise MissingRowError("missing row in disptab")
 
-    return xd
+    return disp_rel
 
-def orbitalDoppler(time, xi, wavelength, dispersion, expstart,
+def orbitalDoppler(time, xi, factor, expstart,
                    doppmag_v, doppzero, orbitper):
     """Apply Doppler correction for HST orbital motion.
 
@@ -2907,11 +3265,8 @@ def orbitalDoppler(time, xi, wavelength, dispersion, expstart,
     xi: array like
         Pixel coordinates of events, in dispersion direction.
 
-    wavelength: array like
-        Wavelengths corresponding to xi (Angstroms).
-
-    dispersion: array like
-        Dispersion at each element of xi (Angstroms/pixel).
+    factor: array like
+        Wavelength divided by dispersion at each element of xi (pixels).
 
     expstart: float
         Exposure start time (MJD).
@@ -2931,13 +3286,58 @@ def orbitalDoppler(time, xi, wavelength, dispersion, expstart,
         Doppler-corrected xi array.
     """
 
-    # t is the time of each event in seconds since doppzero.
-    t = (expstart - doppzero) * SEC_PER_DAY + time.astype(np.float64)
+    shift = orbitalPhase(time, expstart, doppzero, orbitper)
+    shift *= factor
+    shift *= doppmag_v / SPEED_OF_LIGHT
+
+    return xi.astype(np.float64) - shift
+
+def orbitalPhase(time, expstart, doppzero, orbitper):
+    """Compute sin(2 * pi * t / orbitper) for each event.
+
+    t is the time in seconds since doppzero.  The function changes slowly
+    compared with the time resolution of the events, so it is computed
+    once on a grid with spacing DOPPLER_TABLE_STEP seconds, covering the
+    range of times in the time array, and interpolated for each event.
+
+    Parameters
+    ----------
+    time: array like
+        Times of events (seconds since expstart).
+
+    expstart: float
+        Exposure start time (MJD).
 
-    shift = doppmag_v / SPEED_OF_LIGHT * wavelength / dispersion * \
-            np.sin(2. * np.pi * t / orbitper)
+    doppzero: float
+        Time when orbital Doppler shift is zero and increasing (MJD).
+
+    orbitper: float
+        Orbital period of HST (seconds).
+
+    Returns
+    -------
+    array like
+        The sine of the orbital phase at each element of time (float64).
+    """
 
-    return xi - shift
+    t_offset = (expstart - doppzero) * SEC_PER_DAY
+    phase = np.zeros(len(time), dtype=np.float64)
+    if len(time) < 1:
+        return phase
+
+    t_first = math.floor(time.min())
+    nsteps = int(math.ceil((time.max() - t_first) / DOPPLER_TABLE_STEP)) + 1
+    t_grid = t_first + np.arange(nsteps + 1, dtype=np.float64) * \
+             DOPPLER_TABLE_STEP
+    table = np.sin(2. * np.pi * (t_offset + t_grid) / orbitper)
+    n_outside = ccos.lookup(time, table, t_first,
+                            1. / DOPPLER_TABLE_STEP, phase)
+    if n_outside > 0:
+        outside = np.isnan(phase)
+        t = t_offset + time[outside].astype(np.float64)
+        phase[outside] = np.sin(2. * np.pi * t / orbitper)
+
+    return phase
 
 def initHelcorr(events, info, hdr):
     """Compute the radial velocity and update the V_HELIO keyword.
@@ -3107,36 +3507,37 @@ def doFlatcorr(events, info, switches, reffiles, phdr, hdr):
 
         cosutil.printRef("FLATFILE", reffiles)
 
-        fd = fits.open(reffiles["flatfile"], mode="copyonwrite")
-
         if info["detector"] == "NUV":
-            hdu = fd[1]
+            extension = 1
         else:
             pharange = cosutil.getPulseHeightRange(hdr, info["segment"])
             # xxx this is temporary; eventually select image based on pharange
             ref_pharange = cosutil.tempPulseHeightRange(reffiles["flatfile"])
             cosutil.comparePulseHeightRanges(pharange, ref_pharange,
                                              reffiles["flatfile"])
-            hdu = fd[(info["segment"],1)]
-        flat = hdu.data
+            extension = (info["segment"],1)
+        (flat, flat_hdr) = cosutil.image_store.getImage(reffiles["flatfile"],
+                                                        extension)
 
-        origin_x = hdu.header.get("origin_x", 0)
-        origin_y = hdu.header.get("origin_y", 0)
+        origin_x = flat_hdr.get("origin_x", 0)
+        origin_y = flat_hdr.get("origin_y", 0)
 
         if info["obsmode"] == "ACCUM":
             if info["obstype"] == "SPECTROSCOPIC":
                 cosutil.printSwitch("DOPPCORR", switches)
             if switches["doppcorr"] == "PERFORM" or \
                switches["doppcorr"] == "COMPLETE":
+                # the flat may be read-only, and it's modified in-place
+                flat = flat.copy()
                 convolveFlat(flat, info["dispaxis"], \
                      info["expstart"], info["orig_exptime"],
                      info["dopmagt"], info["dopzerot"], info["orbtpert"])
                 phdr["doppcorr"] = "COMPLETE"
 
-        ccos.applyflat(events.field(xcorr), events.field(ycorr),
-                       events.field("epsilon"), flat, origin_x, origin_y)
-
-        fd.close()
+        (x, y, epsilon) = (events.field(xcorr), events.field(ycorr),
+                           events.field("epsilon"))
+        for c in cosutil.eventChunks(len(events)):
+            ccos.applyflat(x[c], y[c], epsilon[c], flat, origin_x, origin_y)
 
         phdr["flatcorr"] = "COMPLETE"
 
@@ -3420,9 +3821,11 @@ def deadtimeCorrection(events, deadtab, info,
     segment = info["segment"]
     dec_countrate = info["countrate"]
 
-    time = events.field("TIME").astype(np.float64)
+    time = events.field("TIME")
     epsilon = events.field("epsilon")
     nevents = len(time)
+    first_time = np.float64(time[0])
+    last_time = np.float64(time[nevents-1])
 
     live_info = cosutil.getTable(deadtab, filter={"segment": segment},
                                  at_least_one=True)
@@ -3431,8 +3834,8 @@ def deadtimeCorrection(events, deadtab, info,
     live_factor = live_info.field("livetime")
 
     # This livetime value is based on count rate over the entire exposure.
-    if time[nevents-1] > time[0]:
-        actual_countrate = float(nevents) / (time[nevents-1] - time[0])
+    if last_time > first_time:
+        actual_countrate = float(nevents) / (last_time - first_time)
     else:
         actual_countrate = 0.
     actual_rate_livetime = cosutil.determineLivetime(actual_countrate,
@@ -3490,66 +3893,41 @@ def deadtimeCorrection(events, deadtab, info,
         cosutil.printMsg("Compute livetime factor; timestep is %.6g s:" \
                       % dt_deadtime, VERY_VERBOSE)
 
-        t0 = time[0]
-        t1 = t0 + dt_deadtime
-        last_time = time[nevents-1]
         cosutil.printMsg("  time range    rate   livetime", VERY_VERBOSE)
-        last_livetime = 1.      # use this for saving previous value
-        sum_livetime = 0.       # for computing average livetime factor
-        wgt_livetime = 0.
-        countrate = 0.
-        first = True
-        while t0 < last_time:
-
-            # time[i:j] matches t0 to t1.
-            try:
-                (i, j) = ccos.range(time, t0, t1)
-            except:
-                t0 = t1
-                t1 = t0 + dt_deadtime
-                continue
-            t1_for_printing = t1        # may be changed below
-            if i >= j:          # i and j can be equal due to roundoff
-                t0 = t1
-                t1 = t0 + dt_deadtime
-                continue
-
-            if t1 < last_time:
-                countrate = (j - i) / dt_deadtime
-                livetime = cosutil.determineLivetime(countrate,
-                                                     obs_rate, live_factor)
-                sum_livetime += livetime * (t1 - t0)
-                wgt_livetime += (t1 - t0)
-            elif t0 < last_time:
-                t1_for_printing = last_time
-                if (last_time - t0) < 0.5 * dt_deadtime and not first:
-                    livetime = last_livetime
-                    cosutil.printMsg("Last time interval is short (%.6g s),"
-                                     " so previous livetime will be used." %
-                                     (last_time - t0,))
-                else:
-                    countrate = (j - i) / (last_time - t0)
-                    livetime = cosutil.determineLivetime(countrate,
-                                                         obs_rate, live_factor)
-                sum_livetime += livetime * (last_time - t0)
-                wgt_livetime += (last_time - t0)
-            else:
-                countrate = 0.
-                livetime = 1.
-            if livetime > 0.:
-                epsilon[i:j] = epsilon[i:j] / livetime
-                last_livetime = livetime
-            first = False
+        (i, j, t0, t1, countrate, livetime, weight, short_last) = \
+                livetimeIntervals(time, dt_deadtime, obs_rate, live_factor)
+
+        # Divide epsilon by the livetime factor for the interval that
+        # contains each event.  The intervals are contiguous, so j gives
+        # the interval for each event.
+        if len(i) > 0:
+            factor = np.where(livetime > 0., livetime, 1.)
+            for c in cosutil.eventChunks(j[-1], start=i[0]):
+                k = np.searchsorted(j, np.arange(c.start, c.stop),
+                                    side="right")
+                epsilon[c] = epsilon[c] / factor[k]
+            # add.accumulate sums in order, like a running sum
+            sum_livetime = np.add.accumulate(livetime * weight)[-1]
+            wgt_livetime = np.add.accumulate(weight)[-1]
+        else:
+            sum_livetime = 0.
+            wgt_livetime = 0.
 
+        if fd is not None or cosutil.checkVerbosity(VERY_VERBOSE):
+            nprint = len(i)
+        else:
+            nprint = 0
+        for k in range(nprint):
+            if short_last and k == nprint - 1:
+                printShortInterval(t1[k] - t0[k])
             if fd is not None:
                 fd.write("%.0f %.0f %.6g %.6g\n" %
-                         (t0, t1_for_printing, countrate, livetime))
+                         (t0[k], t1[k], countrate[k], livetime[k]))
             cosutil.printMsg("%6.1f %6.1f   %.6g %.6g" %
-                             (t0, t1_for_printing, countrate, livetime),
+                             (t0[k], t1[k], countrate[k], livetime[k]),
                              VERY_VERBOSE)
-
-            t0 = t1
-            t1 = t0 + dt_deadtime
+        if short_last and nprint == 0:
+            printShortInterval(t1[-1] - t0[-1])
 
         if wgt_livetime > 0.:
             avg_livetime = sum_livetime / wgt_livetime
@@ -3564,6 +3942,154 @@ def deadtimeCorrection(events, deadtab, info,
 
     return (dead_rate, dead_method, avg_livetime)
 
+def timeIntervals(time, dt, include_last=False):
+    """Divide the exposure into consecutive intervals of length dt.
+
+    The first interval begins at the time of the first event.  Each
+    subsequent interval begins where the previous one ended; the
+    boundaries are computed by repeated addition of dt (add.accumulate
+    adds in order, so the values are the same as from a running sum).
+    The last interval is the one that contains the time of the last event.
+
+    The range of events within each interval is found in the same way as
+    by ccos.range, i.e. the interval boundaries are rounded to single
+    precision, and a boundary at or beyond the last event gives the number
+    of events.
+
+    Parameters
+    ----------
+    time: array_like
+        Times of the events, sorted in increasing order.
+
+    dt: float
+        Length of each time interval (seconds).
+
+    include_last: boolean
+        If True, an interval that begins exactly at the time of the last
+        event will be included.
+
+    Returns
+    -------
+    tuple of two arrays, (edges, indices)
+        edges gives the start time of each interval, followed by the end
+        time of the last interval; indices (the same length as edges) gives
+        the corresponding indices in time, so the events in interval k are
+        time[indices[k]:indices[k+1]].  Intervals may be empty.
+    """
+
+    nevents = len(time)
+    first_time = np.float64(time[0])
+    last_time = np.float64(time[nevents-1])
+
+    nbins = int((last_time - first_time) / dt) + 2
+    while True:
+        steps = np.empty(nbins + 1, dtype=np.float64)
+        steps[0] = first_time
+        steps[1:] = dt
+        edges = np.add.accumulate(steps)
+        if edges[-1] > last_time:
+            break
+        nbins *= 2
+    if include_last:
+        side = "right"
+    else:
+        side = "left"
+    # m is the number of intervals that begin before the last event (or
+    # at the last event, if include_last is True).
+    m = np.searchsorted(edges, last_time, side=side)
+    edges = edges[0:m+1]
+
+    edges32 = edges.astype(np.float32).astype(np.float64)
+    indices = intervals.searchSorted(time, edges32, side="left")
+    indices[edges32 >= last_time] = nevents
+
+    return (edges, indices)
+
+def printShortInterval(dt):
+    """Print a message about the last (short) interval for deadcorr."""
+
+    cosutil.printMsg("Last time interval is short (%.6g s),"
+                     " so previous livetime will be used." % (dt,))
+
+def livetimeIntervals(time, dt_deadtime, obs_rate, live_factor):
+    """Compute livetime factors in consecutive time intervals.
+
+    The exposure is divided into intervals of length dt_deadtime,
+    starting at the time of the first event.  The count rate in each
+    interval gives the livetime factor for that interval.  If the last
+    interval (which ends at the time of the last event) is shorter than
+    half of dt_deadtime, the count rate and livetime factor from the
+    previous interval will be used instead.  Intervals that contain no
+    events are omitted from the output arrays.
+
+    Parameters
+    ----------
+    time: array_like
+        Times of the events, sorted in increasing order.
+
+    dt_deadtime: float
+        Length of each time interval (seconds).
+
+    obs_rate: array_like
+        Observed count rate column from deadtab.
+
+    live_factor: array_like
+        Livetime factor column from deadtab.
+
+    Returns
+    -------
+    tuple
+        (i, j, t0, t1, countrate, livetime, weight, short_last).  Each of
+        these except short_last is an array with one element per
+        non-empty interval.  The slice time[i:j] contains the events in an
+        interval, which begins at t0 and ends at t1 (but not later than
+        the last event); countrate and livetime are the count rate and
+        livetime factor for that interval, and weight is the length of the
+        interval to use for averaging the livetime factor.  short_last is
+        True if the livetime factor for the last interval was copied from
+        the previous interval.
+    """
+
+    nevents = len(time)
+    last_time = np.float64(time[nevents-1])
+
+    (edges, indices) = timeIntervals(time, dt_deadtime)
+    m = len(edges) - 1
+
+    # Omit intervals that contain no events.
+    nonempty = np.where(indices[1:] > indices[:-1])[0]
+    i = indices[nonempty]
+    j = indices[nonempty+1]
+    t0 = edges[nonempty]
+    t1 = edges[nonempty+1]
+    weight = t1 - t0
+    countrate = (j - i) / dt_deadtime
+    livetime = cosutil.determineLivetimeArray(countrate,
+                                              obs_rate, live_factor)
+    livetime = livetime.astype(np.float64)
+
+    # The last interval is truncated at the time of the last event.
+    short_last = False
+    n = len(i)
+    if n > 0 and nonempty[-1] == m - 1:
+        t1[-1] = last_time
+        weight[-1] = last_time - t0[-1]
+        if weight[-1] < 0.5 * dt_deadtime and n > 1:
+            short_last = True
+            countrate[-1] = countrate[-2]
+            # previous livetime factor that was actually applied
+            good = np.where(livetime[:-1] > 0.)[0]
+            if len(good) > 0:
+                livetime[-1] = livetime[good[-1]]
+            else:
+                livetime[-1] = 1.
+        else:
+            countrate[-1] = (j[-1] - i[-1]) / (last_time - t0[-1])
+            livetime[-1] = cosutil.determineLivetime(countrate[-1],
+                                                     obs_rate, live_factor)
+
+    return (i, j, t0, t1, countrate, livetime, weight, short_last)
+
 def deadtimeCorrectionAccum(events, deadtab, info,
                             stim_countrate, stim_livetime,
                             input, livetimefile):
@@ -3977,7 +4503,14 @@ def writeImages(x, y, epsilon, dq,
             makeImage(output, phdr, headers, C_counts, C_counts, dq_array)
         return
 
-    ccos.binevents(x, y, C_counts, x_offset, dq, SERIOUS_DQ_FLAGS)
+    if output is None:
+        ccos.binevents(x, y, C_counts, x_offset, dq, SERIOUS_DQ_FLAGS)
+    else:
+        # Also make an image array where event number i has weight
+        # epsilon[i]; both images are filled in one pass over the events.
+        E_counts = np.zeros(npix, dtype=np.float32)
+        ccos.binevents2(x, y, C_counts, E_counts, x_offset,
+                        dq, SERIOUS_DQ_FLAGS, epsilon)
 
     # Use the Frequentist variance function.
     err_lower, err_upper = cosutil.errFrequentist(C_counts)
@@ -3993,10 +4526,6 @@ def writeImages(x, y, epsilon, dq,
 
     cosutil.printMsg("writing file %s ..." % output, VERY_VERBOSE)
 
-    # Make an image array where event number i has weight epsilon[i].
-    E_counts = np.zeros(npix, dtype=np.float32)
-    ccos.binevents(x, y, E_counts, x_offset, dq, SERIOUS_DQ_FLAGS, epsilon)
-
     E_rate = E_counts / exptime
 
     reciprocal_flat = np.where(E_counts == 0., 1., E_counts) / \
@@ -4332,11 +4861,17 @@ def flag_gti(time, dq, gti):
       (time[0] >= gti[0][0] and time[-1] <= gti[0][1]):
         return
 
-    dq[:] |= DQ_BAD_TIME
-
-    for (t_start, t_stop) in gti:
-        (i0, i1) = ccos.range(time, t_start, t_stop+SMALL_INCR)
-        dq[i0:i1] &= ~DQ_BAD_TIME
+    t_start = np.array([interval[0] for interval in gti])
+    t_stop = np.array([interval[1] for interval in gti])
+    (i0, i1, no_overlap) = intervals.rangeIndices(time, t_start,
+                                                  t_stop + SMALL_INCR)
+    if no_overlap.any():
+        # as ccos.range does for an interval with no events
+        k = np.nonzero(no_overlap)[0][0]
+        raise RuntimeError("(%.6g, %.6g) does not overlap the time array"
+                           % (t_start[k], t_stop[k] + SMALL_INCR))
+    good = intervals.inRanges(len(time), i0[~no_overlap], i1[~no_overlap])
+    dq[:] = np.where(good, dq & ~DQ_BAD_TIME, dq | DQ_BAD_TIME)
 
 def noWavecal(input, shift_file, info, switches, reffiles):
     """Assign a default value for the wavecal shift, from fp_pixel_shift.
@@ -4517,14 +5052,15 @@ def updateFromWavecal(events, wavecal_info, wavecorr,
         segment_list = [info["segment"]]
     else:
         segment_list = ["NUVA", "NUVB", "NUVC"]
-        psa_region_flags_dict = nuvPsaRegions(eta, info, reffiles["xtractab"])
-        wca_region_flags_dict = nuvWcaRegions(eta, info, reffiles["xtractab"])
 
     t0 = time[0]
     t_mid = (t0 + time[-1]) / 2.
 
-    xi_full[:] = xi.copy()
-
+    # Find the shift1 zero point and slope for each segment or stripe,
+    # up to the first one that has no wavecal.  The events will be
+    # shifted below, one chunk at a time.
+    shift1_params = {}
+    missing_wavecal = False
     for segment in segment_list:
 
         key = "shift1" + segment[-1].lower()
@@ -4538,69 +5074,117 @@ def updateFromWavecal(events, wavecal_info, wavecorr,
                 otherkey = "shift1" + othersegment[-1].lower()
                 if not (otherkey in shift_dict and otherkey in slope_dict):
                     cosutil.printError("No matching wavecal for segment {} either".format(othersegment))
-                    return (tl_time, None)
+                    missing_wavecal = True
+                    break
                 cosutil.printMsg("Using shift info for segment {}".format(othersegment))
                 shift1_zero = shift_dict[otherkey]
                 shift1_slope = slope_dict[otherkey]
                 goodshift1key = otherkey
             else:
-                return (tl_time, None)
+                missing_wavecal = True
+                break
         else:
             shift1_zero = shift_dict[key]
             shift1_slope = slope_dict[key]
+        shift1_params[segment] = (shift1_zero, shift1_slope)
+    if info["detector"] == "FUV" and not missing_wavecal and \
+       info['addsimulatedwavecal']:
+        simulated_wavecal_info = getSimulatedWavecalInfo(info, key, wavecal_info, wcp_info, input_path)
+        transition_time, early_slope, early_intercept, late_slope, late_intercept = simulated_wavecal_info
+
+    if not missing_wavecal:
+        if info["detector"] == "FUV":
+            segment = segment_list[0]
+        else:
+            segment = "NUVB"
+
+        key = "shift2" + segment[-1].lower()
+        if (key in shift_dict and key in slope_dict):
+            shift2_zero = shift_dict[key]
+            shift2_slope = slope_dict[key]
+        else:
+            otherkey = "shift2" + othersegment[-1].lower()
+            shift2_zero = shift_dict[otherkey]
+            shift2_slope = slope_dict[otherkey]
+
+    # Sums for the average shift1 of the events in the active area (for a
+    # simulated wavecal), and for DPIXEL1[A-C].
+    shift1_sum = 0.
+    n_shift1 = 0
+    xi_diff_sum = {segment: 0. for segment in segment_list}
+    n_xi_diff = {segment: 0 for segment in segment_list}
+    for c in cosutil.eventChunks(len(events)):
+        (time_c, xi_c, xi_full_c) = (time[c], xi[c], xi_full[c])
+        xi_full_c[:] = xi_c
         if info["detector"] == "FUV":
+            if missing_wavecal:
+                continue
+            active_c = active_area[c]
+            (shift1_zero, shift1_slope) = shift1_params[segment_list[0]]
             if info['addsimulatedwavecal']:
-                simulated_wavecal_info = getSimulatedWavecalInfo(info, key, wavecal_info, wcp_info, input_path)
-                transition_time, early_slope, early_intercept, late_slope, late_intercept = simulated_wavecal_info
-                early_times = np.where(time < transition_time)
-                late_times = np.where(time >= transition_time)
-                shift1 = np.zeros(xi_full.shape)
-                shift1[early_times] = ((time[early_times] - t0) * early_slope + early_intercept)
-                shift1[late_times] = ((time[late_times] - t0) * late_slope + late_intercept)
-                xi_full[early_times] = xi[early_times] - shift1[early_times]
-                xi_full[late_times] = xi[late_times] - shift1[late_times]
-                xi_full[:] = np.where(active_area, xi_full, xi)
+                early_times = np.where(time_c < transition_time)
+                late_times = np.where(time_c >= transition_time)
+                shift1 = np.zeros(xi_c.shape)
+                shift1[early_times] = ((time_c[early_times] - t0) * early_slope + early_intercept)
+                shift1[late_times] = ((time_c[late_times] - t0) * late_slope + late_intercept)
+                xi_full_c[active_c] = xi_c[active_c] - shift1[active_c]
+                shift1_sum += shift1[active_c].sum(dtype=np.float64)
+                n_shift1 += np.count_nonzero(active_c)
             else:
-                xi_full[:] = np.where(active_area,
-                               xi - ((time - t0) * shift1_slope + shift1_zero),
-                               xi_full)
+                xi_full_c[active_c] = xi_c[active_c] - \
+                        ((time_c[active_c] - t0) * shift1_slope + shift1_zero)
+            eta_full[c] = np.where(active_c,
+                            eta[c] - ((time_c - t0) * shift2_slope + shift2_zero),
+                            eta[c])
+            xi_active = xi_full_c[active_c]
+            xi_diff_sum[segment_list[0]] += \
+                    (xi_active - np.around(xi_active)).sum(dtype=np.float64)
+            n_xi_diff[segment_list[0]] += len(xi_active)
         else:
-            xi_full[:] = np.where(psa_region_flags_dict[segment],
-                           xi - ((time - t0) * shift1_slope + shift1_zero),
-                           xi_full)
-            xi_full[:] = np.where(wca_region_flags_dict[segment],
-                           xi - ((time - t0) * shift1_slope + shift1_zero),
-                           xi_full)
+            eta_c = eta[c]
+            psa_region_flags_dict = nuvPsaRegions(eta_c, info,
+                                                  reffiles["xtractab"])
+            wca_region_flags_dict = nuvWcaRegions(eta_c, info,
+                                                  reffiles["xtractab"])
+            for segment in shift1_params:
+                (shift1_zero, shift1_slope) = shift1_params[segment]
+                for region_flags in [psa_region_flags_dict[segment],
+                                     wca_region_flags_dict[segment]]:
+                    xi_full_c[region_flags] = xi_c[region_flags] - \
+                        ((time_c[region_flags] - t0) * shift1_slope +
+                         shift1_zero)
+            if missing_wavecal:
+                continue
+            # Use the same shift2 for every stripe.
+            eta_full[c] = eta_c - ((time_c - t0) * shift2_slope + shift2_zero)
+            for segment in segment_list:
+                xi_psa = xi_full_c[psa_region_flags_dict[segment]]
+                xi_diff_sum[segment] += \
+                        (xi_psa - np.around(xi_psa)).sum(dtype=np.float64)
+                n_xi_diff[segment] += len(xi_psa)
+
+    for segment in shift1_params:
+        (shift1_zero, shift1_slope) = shift1_params[segment]
         # Calculate the average shift for the simulated wavecal as the
         # average shift of the events in the active Area
         if info['addsimulatedwavecal']:
-            avg_shift1 = np.mean(shift1[np.where(active_area)], dtype=np.float64)
+            if n_shift1 > 0:
+                avg_shift1 = shift1_sum / n_shift1
+            else:
+                avg_shift1 = np.nan
         else:
             avg_shift1 = shift1_slope * t_mid + shift1_zero
         key = "SHIFT1" + segment[-1]
         hdr[key] = round(avg_shift1, 4)
 
+    if missing_wavecal:
+        return (tl_time, None)
+
     if info["detector"] == "FUV":
         segment = segment_list[0]
     else:
         segment = "NUVB"
 
-    key = "shift2" + segment[-1].lower()
-    if (key in shift_dict and key in slope_dict):
-        shift2_zero = shift_dict[key]
-        shift2_slope = slope_dict[key]
-    else:
-        otherkey = "shift2" + othersegment[-1].lower()
-        shift2_zero = shift_dict[otherkey]
-        shift2_slope = slope_dict[otherkey]
-    if info["detector"] == "FUV":
-        eta_full[:] = np.where(active_area,
-                        eta - ((time - t0) * shift2_slope + shift2_zero),
-                        eta)
-    else:
-        # Use the same shift2 for every stripe.
-        eta_full[:] = eta - ((time - t0) * shift2_slope + shift2_zero)
-
     # stripe B for NUV
     key = "shift1" + segment[-1].lower()
     if (key not in shift_dict and key not in slope_dict):
@@ -4631,14 +5215,8 @@ def updateFromWavecal(events, wavecal_info, wavecorr,
     for segment in segment_list:
         key = "SHIFT2" + segment[-1]
         hdr[key] = round(avg_dy, 4)
-        if info["detector"] == "FUV":
-            xi_active = xi_full[active_area]
-            xi_diff = xi_active - np.around(xi_active)
-        else:
-            xi_psa = xi_full[psa_region_flags_dict[segment]]
-            xi_diff = xi_psa - np.around(xi_psa)
-        if len(xi_diff) > 0:
-            dpixel1 = xi_diff.mean(dtype=np.float64)
+        if n_xi_diff[segment] > 0:
+            dpixel1 = xi_diff_sum[segment] / n_xi_diff[segment]
         else:
             dpixel1 = 0.
         key = "DPIXEL1" + segment[-1]
@@ -4844,8 +5422,10 @@ def computeWavelengths(events, info, reffiles, helcorr="OMIT", hdr=None):
     cenwave = info["cenwave"]
     if detector == "FUV":
         segment_list = [info["segment"]]
+        nx = FUV_X
     else:
         segment_list = ["NUVA", "NUVB", "NUVC"]
+        nx = NUV_X
     shift1_dict = {}
     shift2_dict = {}
     if use_shift_keywords:
@@ -4862,81 +5442,79 @@ def computeWavelengths(events, info, reffiles, helcorr="OMIT", hdr=None):
               "cenwave": cenwave,
               "fpoffset": info["fpoffset"]}
 
-    wavelength = events.field("WAVELENGTH")
-
-    # The YFULL position is used to determine which stripe a given
-    # event corresponds to.
-    if use_shift_keywords:
-        xi = events.field(xfull).copy()         # because we need to modify it
-        if detector == "FUV":
-            shift2b = shift2_dict[segment_list[0]]
-        else:
-            shift2b = shift2_dict["NUVB"]
-        eta = events.field(yfull).copy() - shift2b
-    else:
-        xi = events.field(xfull)
-        eta = events.field(yfull)
-
-    if detector == "FUV":
-        setActiveArea(events, info, reffiles["brftab"])
-        (psa_region_flags, wca_region_flags) = \
-                        fuvPsaWcaRegions(eta, info, xtractab)
-    else:
-        psa_region_flags_dict = nuvPsaRegions(eta, info, xtractab)
-        wca_region_flags_dict = nuvWcaRegions(eta, info, xtractab)
-
+    # Get the PSA and WCA dispersion relations for each segment or stripe.
+    disp_rel = {}
     for segment in segment_list:
-        # Compute the wavelengths for the output table.
         filter["segment"] = segment
         filter["aperture"] = "PSA"
-        psa_disp_rel = dispersion.Dispersion(disptab, filter)
+        psa_disp_rel = dispersion.getDispersionTable(disptab, filter, nx)
         filter["aperture"] = "WCA"
-        wca_disp_rel = dispersion.Dispersion(disptab, filter)
-        if not (psa_disp_rel.isValid() and wca_disp_rel.isValid()):
+        wca_disp_rel = dispersion.getDispersionTable(disptab, filter, nx)
+        if psa_disp_rel is None or wca_disp_rel is None:
             cosutil.printError("Matching row in disptab %s was not found" \
                                % disptab)
             cosutil.printContinuation(
                 "can't compute wavelengths for corrtag file.")
             continue
+        disp_rel[segment] = (psa_disp_rel, wca_disp_rel)
+
+    if detector == "FUV":
+        setActiveArea(events, info, reffiles["brftab"])
+        shift2b = shift2_dict.get(segment_list[0], 0.)
+    else:
+        shift2b = shift2_dict.get("NUVB", 0.)
+
+    wavelength = events.field("WAVELENGTH")
+    for c in cosutil.eventChunks(len(events)):
+        # The YFULL position is used to determine which stripe a given
+        # event corresponds to.
+        if use_shift_keywords:
+            xi = events.field(xfull)[c].copy()  # because we need to modify it
+            eta = events.field(yfull)[c].copy() - shift2b
+        else:
+            xi = events.field(xfull)[c]
+            eta = events.field(yfull)[c]
+
         if detector == "FUV":
-            if use_shift_keywords:
-                xi -= shift1_dict[segment]
-            psa_wavelength = psa_disp_rel.evalDisp(xi)
-            # "hdr is None" means the current exposure is not a wavecal
-            if hdr is None and (helcorr == "PERFORM" or helcorr == "COMPLETE"):
-                psa_wavelength += (psa_wavelength *
-                                   (-info["v_helio"]) / SPEED_OF_LIGHT)
-            wavelength[:] = np.where(psa_region_flags,
-                                     psa_wavelength, wavelength)
-            del psa_wavelength
-            wca_wavelength = wca_disp_rel.evalDisp(xi)
-            wavelength[:] = np.where(wca_region_flags,
-                                     wca_wavelength, wavelength)
-            del wca_wavelength
+            (psa_region_flags, wca_region_flags) = \
+                    fuvPsaWcaRegions(eta, info, xtractab,
+                                     active=active_area[c])
         else:
-            if use_shift_keywords:
-                xi_full = xi - shift1_dict[segment]
-            else:
+            psa_region_flags_dict = nuvPsaRegions(eta, info, xtractab)
+            wca_region_flags_dict = nuvWcaRegions(eta, info, xtractab)
+
+        wavelength_c = wavelength[c]
+        for segment in segment_list:
+            if segment not in disp_rel:
+                continue
+            (psa_disp_rel, wca_disp_rel) = disp_rel[segment]
+            if detector == "FUV":
+                if use_shift_keywords:
+                    xi -= shift1_dict[segment]
                 xi_full = xi
+            else:
+                if use_shift_keywords:
+                    xi_full = xi - shift1_dict[segment]
+                else:
+                    xi_full = xi
+                psa_region_flags = psa_region_flags_dict[segment]
+                wca_region_flags = wca_region_flags_dict[segment]
             # Update the wavelength array for those events that are within
-            # the PSA and WCA regions for the current stripe.
-            psa_wavelength = psa_disp_rel.evalDisp(xi_full)
-            if hdr is None and (helcorr == "PERFORM" or helcorr == "COMPLETE"):
+            # the PSA and WCA regions for the current segment or stripe.
+            psa_wavelength = psa_disp_rel.evalDisp(xi_full[psa_region_flags])
+            # "hdr is None" means the current exposure is not a wavecal
+            if hdr is None and (helcorr == "PERFORM" or
+                                helcorr == "COMPLETE"):
                 psa_wavelength += (psa_wavelength *
                                    (-info["v_helio"]) / SPEED_OF_LIGHT)
-            wavelength[:] = np.where(psa_region_flags_dict[segment],
-                                     psa_wavelength, wavelength)
+            wavelength_c[psa_region_flags] = psa_wavelength
             del psa_wavelength
-            wca_wavelength = wca_disp_rel.evalDisp(xi_full)
-            wavelength[:] = np.where(wca_region_flags_dict[segment],
-                                     wca_wavelength, wavelength)
-            del wca_wavelength
-        psa_disp_rel.close()
-        wca_disp_rel.close()
+            wavelength_c[wca_region_flags] = \
+                    wca_disp_rel.evalDisp(xi_full[wca_region_flags])
 
     return
 
-def fuvPsaWcaRegions(eta, info, xtractab):
+def fuvPsaWcaRegions(eta, info, xtractab, active=None):
     """Determine the sets of events within the PSA and WCA.
 
     This version is for FUV data.
@@ -4952,6 +5530,10 @@ def fuvPsaWcaRegions(eta, info, xtractab):
     xtractab: str
         Name of spectral extraction parameters reference table.
 
+    active: array like, boolean, or None
+        Flags for the events in eta that are within the active area;
+        None means use active_area (all the events in the table).
+
     Returns
     -------
     tuple of two boolean arrays
@@ -4962,8 +5544,10 @@ def fuvPsaWcaRegions(eta, info, xtractab):
         region.
     """
 
-    psa_region_flags = active_area.copy()
-    wca_region_flags = active_area.copy()
+    if active is None:
+        active = active_area
+    psa_region_flags = active.copy()
+    wca_region_flags = active.copy()
 
     filter = {"opt_elem": info["opt_elem"], "cenwave": info["cenwave"],
               "segment": info["segment"]}       # aperture added below
@@ -5349,6 +5933,7 @@ def copyColumns(events):
     xi_full  = events.field(xfull)
     eta_full = events.field(yfull)
 
-    xi_dopp[:] = xi.copy()
-    xi_full[:] = xi.copy()
-    eta_full[:] = eta.copy()
+    for c in cosutil.eventChunks(len(events)):
+        xi_dopp[c] = xi[c]
+        xi_full[c] = xi[c]
+        eta_full[c] = eta[c]
@@ -121,8 +121,9 @@ def doProfileAlignment(events, input, info, switches, reffiles, phdr, hdr,
             slope = 0.0
     #
     # Rebin the data.  Output is the flatfielded image, with events binned
-    # in (XFULL, YFULL) space
-    rebinned_data = rebinData(events, info)
+    # in (XFULL, YFULL) space; the counts image (for the error on the
+    # centroid) is made in the same pass over the events
+    (rebinned_counts, rebinned_data) = rebinEvents(events, info)
     nrows, ncols = rebinned_data.shape
     #
     # Mask airglow lines in the DQ image
@@ -156,7 +157,8 @@ def doProfileAlignment(events, input, info, switches, reffiles, phdr, hdr,
     #
     # Calculate the error on the centroid using the counts data which
     # will be calculated from the event list
-    error = getCentroidError(events, info, goodcolumns, regions)
+    error = getCentroidError(events, info, goodcolumns, regions,
+                             counts_ij=rebinned_counts)
     if error is not None:
         cosutil.printMsg("Error on centroid = %f" % (error))
     else:
@@ -214,6 +216,23 @@ def rebinData(events, info):
                    events.field('epsilon'))
     return rebinned
 
+def rebinEvents(events, info):
+    """Bin events to a counts image and a flatfielded image in one pass.
+
+    This gives the same images as rebinCounts and rebinData.
+    """
+    rebinnedCounts = np.zeros(info['npix'], dtype=np.float32)
+    rebinned = np.zeros(info['npix'], dtype=np.float32)
+    ccos.binevents2(events.field('xfull'),
+                    events.field('yfull'),
+                    rebinnedCounts,
+                    rebinned,
+                    info['x_offset'],
+                    events.field('dq'),
+                    SERIOUS_DQ_FLAGS,
+                    events.field('epsilon'))
+    return (rebinnedCounts, rebinned)
+
 def rebinCounts(events, info):
     rebinnedCounts = np.zeros(info['npix'], dtype=np.float32)
     ccos.binevents(events.field('xfull'),
@@ -483,7 +502,7 @@ def getCentroid(data_array, goodcolumns, rowstart, rowstop, background=None):
     else:
         return None
 
-def getCentroidError(events, info, goodcolumns, regions):
+def getCentroidError(events, info, goodcolumns, regions, counts_ij=None):
     #
     # Calculate the error on the centroid.
     # Use counts data, not flatfielded data.
@@ -497,8 +516,9 @@ def getCentroidError(events, info, goodcolumns, regions):
     if len(goodcolumns[0]) == 0:
         cosutil.printMsg("No good columns, cannot calculate centroid error")
         return None
-    # First need to rebin evens to counts
-    counts_ij = rebinCounts(events, info)
+    # First need to rebin evens to counts (unless that was already done)
+    if counts_ij is None:
+        counts_ij = rebinCounts(events, info)
     #
     # Now need to calculate the background
     background = getBackground(counts_ij, goodcolumns, regions)
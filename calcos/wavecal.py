@@ -1,8 +1,6 @@
 import math
 import os
 import numpy as np
-from scipy.signal import windows as scipysignal
-from scipy import ndimage
 from astropy.io import fits
 from .calcosparam import *
 from . import ccos
@@ -972,7 +970,9 @@ def ttFindSpec(xdisp, xtract_info, life_adj_offset, xd_range, box):
         y0 = max(y0, 0)
         y1 = min(y1, len(xdisp) - 1)
 
-    boxcar_kernel = scipysignal.boxcar(box) / box
+    from scipy import ndimage           # slow to import, so not global
+
+    boxcar_kernel = np.ones(box) / box
     xdisp_sm = ndimage.convolve(xdisp, boxcar_kernel, mode="nearest")
     len_xdisp_sm = len(xdisp_sm)
 
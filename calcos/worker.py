@@ -0,0 +1,210 @@
+"""Long-running calcos worker, for calibrating many small jobs.
+
+Starting calcos (importing numpy, astropy and scipy, and reading the
+reference tables and images) can take longer than calibrating a small
+association, e.g. ACQ/IMAGE or ACQ/PEAKD.  A worker started with
+calcos --queue or --socket stays running and calibrates one job after
+another in the same process, so the modules are only imported once, and
+the reference data cached by cosutil.getTable, cosutil.image_store and
+dispersion.getDispersionTable are reused from one job to the next.
+
+A job is one or more association or raw file names, separated by commas
+and/or blanks, calibrated with the options that were given when the
+worker was started.  The products and trailer files are the same as for
+a normal run of calcos.
+
+There are two ways to submit jobs:
+
+    Queue directory (serveQueue)
+        Write the file names to a file 'name.job' in the queue directory
+        (write to a different name, then rename it, so the worker never
+        sees a partial file).  The worker renames it to 'name.run', calls
+        calcos, then writes the status to 'name.done' and deletes
+        'name.run'.  Jobs are run in order of modification time.  Several
+        workers may share one queue directory.  Create a file named
+        'STOP' in the directory to make the workers exit.
+
+    Unix-domain socket (serveSocket)
+        Connect to the socket, send one line with the file names, and
+        read one line in reply, the status.  Send 'STOP' to make the
+        worker exit.
+
+The status is the value returned by calcos (0 for success), or
+WORKER_ERROR followed by the error message if calcos raised an exception.
+"""
+
+import glob
+import os
+import socket
+import time
+
+from . import cosutil
+from .calcos import calcos, closeTrailerForRawInput
+from .calcosparam import *       # parameter definitions
+
+# the status that a worker returns if calcos raised an exception
+WORKER_ERROR = 1
+
+# name of the request or file that tells a worker to exit
+STOP_REQUEST = "STOP"
+
+def serveQueue(queue_dir, cl_args, poll_interval=1., wait=True):
+    """Calibrate jobs from a queue directory.
+
+    Parameters
+    ----------
+    queue_dir: str
+        Name of the directory containing the job files.
+
+    cl_args: dictionary
+        Keyword arguments for calcos.calcos (e.g. outdir, verbosity).
+
+    poll_interval: float
+        Time (seconds) to wait before looking for new jobs, if the queue
+        is empty.
+
+    wait: boolean
+        If False, return when the queue is empty, rather than waiting for
+        more jobs.
+
+    Returns
+    -------
+    int
+        The number of jobs that were run.
+    """
+
+    queue_dir = os.path.abspath(os.path.expandvars(queue_dir))
+    stop_file = os.path.join(queue_dir, STOP_REQUEST)
+    cosutil.printMsg("calcos worker waiting for jobs in %s" % queue_dir,
+                     VERY_VERBOSE)
+
+    njobs = 0
+    while not os.access(stop_file, os.F_OK):
+        job = claimJob(queue_dir)
+        if job is None:
+            if not wait:
+                break
+            time.sleep(poll_interval)
+            continue
+        with open(job) as fd:
+            request = fd.read()
+        reply = runJob(request, cl_args)
+        root = os.path.splitext(job)[0]
+        temp = "%s.%d.tmp" % (root, os.getpid())
+        with open(temp, "w") as fd:
+            fd.write(reply + "\n")
+        os.replace(temp, root + ".done")
+        os.remove(job)
+        njobs += 1
+
+    return njobs
+
+def claimJob(queue_dir):
+    """Find the oldest job in the queue, and rename it so no one else runs it.
+
+    Parameters
+    ----------
+    queue_dir: str
+        Name of the directory containing the job files.
+
+    Returns
+    -------
+    str or None
+        The name of the job file after renaming it ('name.run'), or None
+        if there are no jobs in the queue.
+    """
+
+    jobs = []
+    for name in glob.glob(os.path.join(queue_dir, "*.job")):
+        try:
+            jobs.append((os.stat(name).st_mtime_ns, name))
+        except OSError:                 # claimed by another worker
+            continue
+    for (mtime, name) in sorted(jobs):
+        running = os.path.splitext(name)[0] + ".run"
+        try:
+            os.rename(name, running)
+        except OSError:
+            continue
+        return running
+
+    return None
+
+def serveSocket(socket_path, cl_args):
+    """Calibrate jobs sent to a Unix-domain socket.
+
+    Parameters
+    ----------
+    socket_path: str
+        Name of the socket file, which will be created (or replaced).
+
+    cl_args: dictionary
+        Keyword arguments for calcos.calcos (e.g. outdir, verbosity).
+
+    Returns
+    -------
+    int
+        The number of jobs that were run.
+    """
+
+    socket_path = os.path.abspath(os.path.expandvars(socket_path))
+    if os.path.lexists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    cosutil.printMsg("calcos worker listening on %s" % socket_path,
+                     VERY_VERBOSE)
+
+    njobs = 0
+    try:
+        while True:
+            (connection, address) = server.accept()
+            with connection, connection.makefile("rw") as fd:
+                request = fd.readline()
+                if request.strip() == STOP_REQUEST:
+                    fd.write("0\n")
+                    break
+                fd.write(runJob(request, cl_args) + "\n")
+            njobs += 1
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+    return njobs
+
+def runJob(request, cl_args):
+    """Calibrate the files in one request.
+
+    Parameters
+    ----------
+    request: str
+        One or more association or raw file names, separated by commas
+        and/or blanks (or newlines).
+
+    cl_args: dictionary
+        Keyword arguments for calcos.calcos.
+
+    Returns
+    -------
+    str
+        The status, as a string; if calcos raised an exception, this is
+        WORKER_ERROR followed by the message.
+    """
+
+    verbosity = cosutil.verbosity
+    names = request.replace(",", " ").split()
+    status = 0
+    try:
+        for name in names:
+            status |= calcos(name, **cl_args)
+        reply = "%d" % status
+    except Exception as error:
+        cosutil.printError("%s: %s" % (" ".join(names), str(error)))
+        reply = "%d %s" % (WORKER_ERROR, str(error).replace("\n", " "))
+    finally:
+        # calcos may return early without closing the trailer
+        closeTrailerForRawInput()
+        cosutil.setVerbosity(verbosity)
+
+    return reply
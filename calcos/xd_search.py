@@ -1,6 +1,4 @@
 import numpy as np
-from scipy.signal.windows import boxcar
-from scipy import ndimage
 from . import cosutil
 from .calcosparam import *       # parameter definitions
 from . import ccos
@@ -246,7 +244,9 @@ def findPeak(e_j, box):
         profile
     """
 
-    boxcar_kernel = boxcar(box) / box
+    from scipy import ndimage           # slow to import, so not global
+
+    boxcar_kernel = np.ones(box) / box
     e_j_sm = ndimage.convolve(e_j, boxcar_kernel, mode="nearest")
 
     index = np.argsort(e_j_sm)
@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 
+import os
+import tempfile
+
 from setuptools import setup, Extension
+from setuptools.command.build_ext import build_ext
 from numpy import get_include as numpy_includes
 from pathlib import Path
 
@@ -20,6 +24,43 @@ def c_includes(parent: str, depth: int = 1):
     ]
 
 
+def openmp_flag(compiler) -> str | None:
+    """Return the compiler flag for OpenMP, or None if it isn't supported.
+
+    Set the environment variable CALCOS_NO_OPENMP to build without OpenMP.
+    """
+    if os.environ.get("CALCOS_NO_OPENMP"):
+        return None
+    flag = "/openmp" if compiler.compiler_type == "msvc" else "-fopenmp"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, "test_openmp.c")
+        with open(source, "w") as fd:
+            fd.write("#include <omp.h>\n"
+                     "int main(void) { return omp_get_max_threads() < 1; }\n")
+        try:
+            objects = compiler.compile([source], output_dir=tmpdir,
+                                       extra_postargs=[flag])
+            compiler.link_executable(objects, "test_openmp",
+                                     output_dir=tmpdir,
+                                     extra_postargs=[flag])
+        except Exception:
+            return None
+    return flag
+
+
+class BuildExt(build_ext):
+    """Build the C extension with OpenMP if the compiler supports it."""
+
+    def build_extensions(self):
+        flag = openmp_flag(self.compiler)
+        if flag is not None:
+            for ext in self.extensions:
+                ext.extra_compile_args.append(flag)
+                if self.compiler.compiler_type != "msvc":
+                    ext.extra_link_args.append(flag)
+        super().build_extensions()
+
+
 PACKAGENAME = "calcos"
 SOURCES = c_sources("src")
 INCLUDES = c_includes("src") + [numpy_includes()]
@@ -33,4 +74,5 @@ setup(
             include_dirs=INCLUDES,
         ),
     ],
+    cmdclass={"build_ext": BuildExt},
 )
@@ -1,6 +1,7 @@
 /* This module contains the following functions:
 
 binevents bins a list of (x,y) coordinates into a 2-D array.
+binevents2 bins (x,y) into a counts array and a weighted array in one pass.
 bindq updates a 2-D array of data quality flags from DQI table info.
 applydq assigns data quality flags from a DQI table into a column.
 dq_or collapses (bitwise OR) a column of a 2-D data quality array to 1-D.
@@ -25,6 +26,10 @@ xy_collapse collapses events along the dispersion direction.
 csum_3d bins a list of (x,y,pha) coordinates into a 3-D array.
 csum_2d bins a list of (x,y) coordinates into a 2-D array.
 bin2d bins a 2-D image to a smaller 2-D image (block sum).
+eventcorrection applies tempcorr, geocorr, dgeocorr and walk in one pass.
+lookup interpolates in a table of function values at uniformly spaced points.
+set_threads sets the number of threads used by the event kernels.
+get_threads returns the number of threads used by the event kernels.
 
 2001 Nov 19
 2001 Dec 7	In totalcounts, round float data to int.  In unbinaccum,
@@ -106,6 +111,30 @@ bin2d bins a 2-D image to a smaller 2-D image (block sum).
 2015 May 6      Add initialization code for Python 3
 2015 May 20     Convert PyString function to PyUnicode
 2017 Jan 30     Add bilinear_interpolation function for walk correction
+2026 Oct 16     Add eventcorrection, which applies the thermal, geometric,
+		delta geometric and walk corrections to each event in a
+		single pass; move the body of the geoInterp2D loop into
+		geoCorrectEvent so both functions share it.
+2026 Oct 16     Release the GIL in binevents, bindq, applyflat,
+		geocorrection, walkcorrection, eventcorrection, xy_extract,
+		csum_3d and csum_2d, and split the work among threads (if
+		compiled with OpenMP); add set_threads and get_threads.
+		Kernels that accumulate into an output array give each
+		thread a band of rows of that array, so the order in which
+		values are summed into any one pixel is unchanged and the
+		results don't depend on the number of threads.
+2026 Oct 16     Add lookup, for interpolating wavelengths and dispersions
+		in tables sampled on a sub-pixel grid.
+2026 Oct 16     Add binevents2, which fills both the counts and the
+		epsilon-weighted image from one pass over the events;
+		add a counts argument to binEventsToImage and binEventsRows.
+2026 Oct 16     In binevents, binevents2, xy_extract, csum_3d and csum_2d,
+		sort the events by band of rows once (bandOrder), so each
+		thread reads only the events in its own band, instead of
+		every thread reading all of the events; replace
+		binEventsRows and extrFromEventsRows with binEventPixel and
+		extrEventPixel.  The events in each pixel are still summed
+		in their original order.
 */
 
 # define PY_SSIZE_T_CLEAN
@@ -121,6 +150,10 @@ bin2d bins a 2-D image to a smaller 2-D image (block sum).
 # include <numpy/arrayobject.h>
 # include <numpy/npy_3kcompat.h>
 
+# ifdef _OPENMP
+# include <omp.h>
+# endif
+
 # define SZ_ERRMESS 1024
 
 /* This is the multiplier for the pseudo-random number generator.
@@ -135,9 +168,16 @@ bin2d bins a 2-D image to a smaller 2-D image (block sum).
 /* nearest integer function */
 # define NINT(x)  ((int)(floor(x + 0.5)))
 
+/* Arrays shorter than this are not split among threads. */
+# define MIN_PARALLEL_SIZE 100000
+
+/* number of threads to use for the event kernels; see set_threads */
+static int n_threads = 1;
+
 static char *DocString(void);
 
 static PyObject *ccos_binevents(PyObject *, PyObject *);
+static PyObject *ccos_binevents2(PyObject *, PyObject *);
 static PyObject *ccos_bindq(PyObject *, PyObject *);
 static PyObject *ccos_applydq(PyObject *, PyObject *);
 static PyObject *ccos_dq_or(PyObject *, PyObject *);
@@ -162,9 +202,30 @@ static PyObject *ccos_xy_collapse(PyObject *, PyObject *);
 static PyObject *ccos_csum_3d(PyObject *, PyObject *);
 static PyObject *ccos_csum_2d(PyObject *, PyObject *);
 static PyObject *ccos_walkcorrection(PyObject *, PyObject *);
+static PyObject *ccos_eventcorrection(PyObject *, PyObject *);
+static PyObject *ccos_lookup(PyObject *, PyObject *);
+static PyObject *ccos_set_threads(PyObject *, PyObject *);
+static PyObject *ccos_get_threads(PyObject *, PyObject *);
+
+static int threadsFor(npy_intp);
+static void threadBand(int, int *, int *);
+static void partLimits(npy_intp, int, int, npy_intp *, npy_intp *);
+static int bandOrder(const npy_intp [], npy_intp, int, int, int,
+	npy_intp **, npy_intp **);
+static void addEventsByBand(float [], float [], const float [],
+	const npy_intp [], const npy_intp [], const npy_intp [], int);
+static npy_intp binEventPixel(PyArrayObject *, PyArrayObject *, int, int,
+	int, PyArrayObject *, short, npy_intp);
+static void binDQRows(int [], int [], int [], int [],
+	int [], int, PyArrayObject *, int, int, int);
+static void applyFlatEvents(PyArrayObject *, PyArrayObject *,
+	PyArrayObject *, PyArrayObject *, int, int, int, int);
+static npy_intp extrEventPixel(PyArrayObject *, PyArrayObject *,
+	int, int, int, double, double, PyArrayObject *, short, npy_intp);
 
 static int binEventsToImage(PyArrayObject *, PyArrayObject *,
-	PyArrayObject *, int, PyArrayObject *, short, PyArrayObject *);
+	PyArrayObject *, PyArrayObject *, int, PyArrayObject *, short,
+	PyArrayObject *);
 static int binDQToImage(
 	int [], int [], int [], int [],
 	int [], int, PyArrayObject *, int);
@@ -190,6 +251,20 @@ static int binarySearch(double, double [], int);
 static void addLSF(double, float, double, float [], int);
 static int geoInterp2D(float [], float [], int,
 	PyArrayObject *, PyArrayObject *, int, float, float, float, float);
+static void geoCorrectEvent(float *, float *,
+	PyArrayObject *, PyArrayObject *, int, int,
+	int, float, float, float, float);
+static double walkDelta(float, double, double [], int, int);
+static int geoArgs(PyObject *, PyArrayObject **, PyArrayObject **,
+	int *, float [4]);
+static void eventCorrection(float [], float [], short [], npy_bool [],
+	int, int, double [4],
+	int, int [], int [], double [], int [],
+	PyArrayObject *, PyArrayObject *, int, float [4],
+	PyArrayObject *, PyArrayObject *, int, float [4],
+	PyArrayObject *, PyArrayObject *);
+static int lookupEvents(PyArrayObject *, double [], int,
+		double, double, double [], int, int);
 static int phaCheck(int, short,
 	float [], float [], short [], short [],
 	PyArrayObject *, PyArrayObject *, int *, int *);
@@ -226,10 +301,10 @@ static int collapseFromEvents(PyArrayObject *, PyArrayObject *,
 static void bin3DtoCsum(float [], int, int, int,
 		int, int,
 		float [], float [],
-		float [], short [], int);
+		float [], short [], int, int);
 static void bin2DtoCsum(float [], int, int,
 		int, int,
-		float [], float [], float [], int);
+		float [], float [], float [], int, int);
 static void bin2DArray(float [], int, int,
 		float [], int, int);
 
@@ -243,6 +318,7 @@ static char *DocString(void) {
 "This module contains the following functions:\n\n\
     binevents(x, y, array, x_offset,\n\
               <optional:  dq, sdqflags, epsilon>)\n\
+    binevents2(x, y, counts, array, x_offset, dq, sdqflags, epsilon)\n\
     bindq(lx, ly, ux, uy, flag, dq_array, x_offset)\n\
     applydq(lx, ly, dx, dy, flag, x, y, dq)\n\
     dq_or(dq_2d, dq_1d)\n\
@@ -282,6 +358,11 @@ static char *DocString(void) {
     csum_2d(array, x, y, epsilon,\n\
             <optional:  binx, biny>)\n\
     bin2d(array, binned_array)\n\
+    eventcorrection(x, y, pha, active, area,\n\
+                    tempcorr, geo, dgeo, xwalk, ywalk)\n\
+    n_outside = lookup(x, table, x_first, subsample, out)\n\
+    n = set_threads(n)\n\
+    n = get_threads()\n\
 "
         /* string split because it is too long for windows compiler */
 "\
@@ -291,6 +372,7 @@ epsilon is an array of weights for the events (float32).\n\
 pha is an array of pulse height amplitudes (int16).\n\
 dq is an array of data quality flags (0 is good; int16).\n\
 array is the 2-D array modified in-place by binevents (float32).\n\
+counts is the 2-D array of unweighted counts from binevents2 (float32).\n\
 lx and ly are arrays of lower left corners of DQ regions (int32).\n\
 dx and dy are arrays of DQ region widths (int32).\n\
 flag is an array of data quality flags to assign to DQ regions (int16).\n\
@@ -311,7 +393,202 @@ axis (0 or 1) is the axis along which the convolution will be done (int).\n\
 indata and outdata for extractband can be int16 or float32.\n\
 pixel_zero is an offset to add to xi.\n\
 For binevents, dq and epsilon are optional arguments.\n\
-For bindq, axis, mindopp and maxdopp are optional arguments.\n");
+For bindq, axis, mindopp and maxdopp are optional arguments.\n\
+n is the number of threads used by binevents, binevents2, bindq, applyflat,\n\
+    geocorrection, walkcorrection, eventcorrection, lookup, xy_extract,\n\
+    csum_3d and csum_2d (int); set_threads(0) uses all processors.  These\n\
+    functions release the GIL while they run.\n");
+}
+
+/* calling sequence for set_threads:
+
+   n = set_threads(n)
+
+    n          i: the number of threads to use (int); 0 or negative means
+                  use the number of processors
+    n          o: the number of threads that will actually be used, which
+                  is 1 if this module was not compiled with OpenMP
+
+   The threads are only used for arrays of at least MIN_PARALLEL_SIZE
+   elements.
+*/
+
+static PyObject *ccos_set_threads(PyObject *self, PyObject *args) {
+
+	int n;
+
+	if (!PyArg_ParseTuple(args, "i", &n)) {
+	    PyErr_SetString(PyExc_RuntimeError, "can't read arguments");
+	    return NULL;
+	}
+
+# ifdef _OPENMP
+	if (n < 1)
+	    n = omp_get_num_procs();
+# else
+	n = 1;
+# endif
+	n_threads = n;
+
+	return Py_BuildValue("i", n_threads);
+}
+
+static PyObject *ccos_get_threads(PyObject *self, PyObject *args) {
+
+	return Py_BuildValue("i", n_threads);
+}
+
+/* This returns the number of threads to use for an array of size n. */
+
+static int threadsFor(npy_intp n) {
+
+	if (n < MIN_PARALLEL_SIZE)
+	    return 1;
+	return n_threads;
+}
+
+/* Within a parallel region, this assigns lo and hi such that the
+   current thread should handle elements lo to hi-1 (of n).
+*/
+
+static void threadBand(int n, int *lo, int *hi) {
+
+	int t = 0, nt = 1;
+
+# ifdef _OPENMP
+	t = omp_get_thread_num();
+	nt = omp_get_num_threads();
+# endif
+	*lo = (int)(((long long)n * t) / nt);
+	*hi = (int)(((long long)n * (t + 1)) / nt);
+}
+
+/* This assigns lo and hi such that part t of nt parts of an array of
+   length n consists of elements lo to hi-1; the bands of rows used by
+   bandOrder are given by partLimits(ny, b, nt, ...).
+*/
+
+static void partLimits(npy_intp n, int t, int nt, npy_intp *lo, npy_intp *hi) {
+
+	*lo = (npy_intp)(((long long)n * t) / nt);
+	*hi = (npy_intp)(((long long)n * (t + 1)) / nt);
+}
+
+/* This sorts the events by band of rows of an output array, for the
+   kernels that add each event into one pixel of that array.
+
+   pixel[k] is the index in the output array (of shape (nz,ny,nx) or
+   (ny,nx)) of the pixel to which event k is added, or -1 if event k is
+   not used, so the row is (pixel[k] / nx) % ny.  The rows are divided
+   into nt bands.  On return, the events in band b are
+   order[band_start[b]] to order[band_start[b+1]-1], and they are in
+   their original order, so if each band is handled by one thread, the
+   values added into any one pixel are summed in the same order as by
+   a single loop over the events.  Each thread reads only one part of
+   pixel, rather than every thread reading all of the events.
+
+   The function value is 0 if OK, or 1 if memory could not be allocated,
+   in which case the caller should use one thread.  This is called
+   without the GIL, so the PyMem_Raw functions are used for memory.
+*/
+
+static int bandOrder(const npy_intp pixel[], npy_intp n_events,
+		int nx, int ny, int nt,
+		npy_intp **order, npy_intp **band_start) {
+
+	int *band_of_row;	/* the band that contains each row */
+	npy_intp *place;	/* [part][band], count, then place in order */
+	npy_intp next;
+	npy_intp lo, hi, j;
+	int b, t;
+
+	*order = PyMem_RawMalloc((n_events + 1) * sizeof(npy_intp));
+	*band_start = PyMem_RawMalloc((nt + 1) * sizeof(npy_intp));
+	band_of_row = PyMem_RawMalloc(ny * sizeof(int));
+	place = PyMem_RawCalloc(nt * nt, sizeof(npy_intp));
+	if (*order == NULL || *band_start == NULL ||
+	    band_of_row == NULL || place == NULL) {
+	    PyMem_RawFree(*order);
+	    PyMem_RawFree(*band_start);
+	    PyMem_RawFree(band_of_row);
+	    PyMem_RawFree(place);
+	    *order = NULL;
+	    *band_start = NULL;
+	    return 1;
+	}
+
+	for (b = 0;  b < nt;  b++) {
+	    partLimits(ny, b, nt, &lo, &hi);
+	    for (j = lo;  j < hi;  j++)
+		band_of_row[j] = b;
+	}
+
+	/* Count the events in each band, for each part of the events. */
+# pragma omp parallel for num_threads(nt) schedule(static)
+	for (t = 0;  t < nt;  t++) {
+	    npy_intp k, k_lo, k_hi;
+	    partLimits(n_events, t, nt, &k_lo, &k_hi);
+	    for (k = k_lo;  k < k_hi;  k++) {
+		if (pixel[k] >= 0)
+		    place[t * nt + band_of_row[(pixel[k] / nx) % ny]]++;
+	    }
+	}
+
+	/* Within a band, the events from part 0 come first, then those
+	   from part 1, etc., so they remain in their original order.
+	*/
+	next = 0;
+	for (b = 0;  b < nt;  b++) {
+	    (*band_start)[b] = next;
+	    for (t = 0;  t < nt;  t++) {
+		npy_intp count = place[t * nt + b];
+		place[t * nt + b] = next;
+		next += count;
+	    }
+	}
+	(*band_start)[nt] = next;
+
+# pragma omp parallel for num_threads(nt) schedule(static)
+	for (t = 0;  t < nt;  t++) {
+	    npy_intp k, k_lo, k_hi;
+	    npy_intp *p;
+	    partLimits(n_events, t, nt, &k_lo, &k_hi);
+	    for (k = k_lo;  k < k_hi;  k++) {
+		if (pixel[k] >= 0) {
+		    p = &place[t * nt + band_of_row[(pixel[k] / nx) % ny]];
+		    (*order)[(*p)++] = k;
+		}
+	    }
+	}
+
+	PyMem_RawFree(band_of_row);
+	PyMem_RawFree(place);
+
+	return 0;
+}
+
+/* This adds the events (sorted by bandOrder) into array, with each of
+   the nt bands handled by one thread.  weight may be NULL, meaning a
+   weight of one for each event; counts may be NULL, and if not, it is
+   incremented by one for each event.
+*/
+
+static void addEventsByBand(float array[], float counts[],
+		const float weight[], const npy_intp pixel[],
+		const npy_intp order[], const npy_intp band_start[], int nt) {
+
+	int b;
+
+# pragma omp parallel for num_threads(nt) schedule(static)
+	for (b = 0;  b < nt;  b++) {
+	    npy_intp n, k;
+	    for (n = band_start[b];  n < band_start[b+1];  n++) {
+		k = order[n];
+		array[pixel[k]] += (weight == NULL) ? 1.f : weight[k];
+		if (counts != NULL)
+		    counts[pixel[k]] += 1.;
+	    }
+	}
 }
 
 /* calling sequence for binevents:
@@ -396,8 +673,10 @@ static PyObject *ccos_binevents(PyObject *self, PyObject *args) {
 		return NULL;
 	}
 
-	status = binEventsToImage(x, y, array, x_offset,
+	Py_BEGIN_ALLOW_THREADS
+	status = binEventsToImage(x, y, NULL, array, x_offset,
 			dq, sdqflags, epsilon);
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(x);
 	Py_DECREF(y);
@@ -414,37 +693,128 @@ static PyObject *ccos_binevents(PyObject *self, PyObject *args) {
 	}
 }
 
-/* This is called by ccos_binevents. */
+/* calling sequence for binevents2:
+
+   binevents2(x, y, counts, array, x_offset, dq, sdqflags, epsilon)
+
+    x, y       i: arrays of pixel coordinates of the events
+                  (int16, or default is float32)
+    counts    io: the output 2-D array of counts (float32)
+    array     io: the output 2-D array of weighted counts (float32)
+    x_offset   i: the offset (it's zero or positive) to add to
+                  the x pixel coordinate to get image pixel (int)
+    dq         i: array of data quality flags (int16; 0 is good)
+    sdqflags   i: bit mask for the "serious" dq flags (short)
+    epsilon    i: array of weights for the events (float32)
+
+   This gives the same results as two calls to binevents, one without
+   and one with epsilon, but the events are only read once.  counts and
+   array must have the same shape.
+*/
+
+static PyObject *ccos_binevents2(PyObject *self, PyObject *args) {
+
+	PyObject *ox, *oy, *ocounts, *oarray, *odq, *oepsilon;
+	PyArrayObject *x, *y, *counts, *array, *dq, *epsilon;
+	int x_offset;
+	short sdqflags;
+	int status;
+
+	if (!PyArg_ParseTuple(args, "OOOOiOhO",
+			&ox, &oy, &ocounts, &oarray, &x_offset,
+			&odq, &sdqflags, &oepsilon)) {
+	    PyErr_SetString(PyExc_RuntimeError, "can't read arguments");
+	    return NULL;
+	}
+	if (PyArray_TYPE((PyArrayObject*) ox) == NPY_INT16) {
+	    x = (PyArrayObject *)PyArray_FROM_OTF(ox, NPY_INT16,
+		NPY_ARRAY_IN_ARRAY);
+	} else {
+	    x = (PyArrayObject *)PyArray_FROM_OTF(ox, NPY_FLOAT32,
+		NPY_ARRAY_IN_ARRAY);
+	}
+	if (PyArray_TYPE((PyArrayObject*) oy) == NPY_INT16) {
+	    y = (PyArrayObject *)PyArray_FROM_OTF(oy, NPY_INT16,
+		NPY_ARRAY_IN_ARRAY);
+	} else {
+	    y = (PyArrayObject *)PyArray_FROM_OTF(oy, NPY_FLOAT32,
+		NPY_ARRAY_IN_ARRAY);
+	}
+	dq = (PyArrayObject *)PyArray_FROM_OTF(odq, NPY_INT16,
+			NPY_ARRAY_IN_ARRAY);
+	epsilon = (PyArrayObject *)PyArray_FROM_OTF(oepsilon, NPY_FLOAT32,
+			NPY_ARRAY_IN_ARRAY);
+	if (x == NULL || y == NULL || dq == NULL || epsilon == NULL)
+	    return NULL;
+
+	counts = (PyArrayObject *)PyArray_FROM_OTF(ocounts, NPY_FLOAT32,
+			NPY_ARRAY_INOUT_ARRAY2);
+	array = (PyArrayObject *)PyArray_FROM_OTF(oarray, NPY_FLOAT32,
+			NPY_ARRAY_INOUT_ARRAY2);
+	if (counts == NULL || array == NULL)
+	    return NULL;
+	if (PyArray_DIM(counts, 0) != PyArray_DIM(array, 0) ||
+	    PyArray_DIM(counts, 1) != PyArray_DIM(array, 1)) {
+	    PyErr_SetString(PyExc_ValueError,
+		"counts and array must have the same shape");
+	    PyArray_DiscardWritebackIfCopy(counts);
+	    PyArray_DiscardWritebackIfCopy(array);
+	    Py_DECREF(x);
+	    Py_DECREF(y);
+	    Py_DECREF(counts);
+	    Py_DECREF(array);
+	    Py_DECREF(dq);
+	    Py_DECREF(epsilon);
+	    return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	status = binEventsToImage(x, y, counts, array, x_offset,
+			dq, sdqflags, epsilon);
+	Py_END_ALLOW_THREADS
+
+	Py_DECREF(x);
+	Py_DECREF(y);
+	PyArray_ResolveWritebackIfCopy(counts);
+	Py_DECREF(counts);
+	PyArray_ResolveWritebackIfCopy(array);
+	Py_DECREF(array);
+	Py_DECREF(dq);
+	Py_DECREF(epsilon);
+
+	if (status) {
+	    return NULL;
+	} else {
+	    Py_INCREF(Py_None);
+	    return Py_None;
+	}
+}
+
+/* This is called by ccos_binevents and ccos_binevents2.  counts may be
+   NULL; if not, it is incremented by one for each event that is added
+   to array.
+*/
 
 static int binEventsToImage(PyArrayObject *x, PyArrayObject *y,
-	PyArrayObject *array, int x_offset,
+	PyArrayObject *counts, PyArrayObject *array, int x_offset,
 	PyArrayObject *dq, short sdqflags, PyArrayObject *epsilon) {
 
-	float f_x_offset;	/* same as x_offset */
-	int x_type, y_type;	/* data type codes */
 	int n_events;		/* size of input arrays (number of events) */
 	int nx, ny;		/* size of array */
-	int k;			/* loop index for events */
 	int i, j;		/* indices in 2-D array */
-	/* individual values */
-	float c_x;
-	float c_y;
-	short c_dq;
-	float c_eps;
-
-	/* The NINT macro should work the same way for both positive and
-	   negative values.  To avoid any possibility of a discontinuity
-	   at zero, however, for floating point data, f_x_offset will be
-	   added to the x pixel coordinate (c_x) before rounding to an int.
-	*/
-	f_x_offset = (float)x_offset;
-
-	x_type = PyArray_DESCR(x)->type_num;
-	y_type = PyArray_DESCR(y)->type_num;
+	int nt;			/* number of threads */
+	int t;
+	npy_intp k, m;		/* event index, pixel index */
+	npy_intp *pixel = NULL;	/* pixel index for each event */
+	npy_intp *order = NULL, *band_start = NULL;	/* see bandOrder */
+	float *c_array, *c_counts, *c_epsilon;
 
 	n_events = PyArray_DIM(x, 0);
 	nx = PyArray_DIM(array, 1);	/* shape (ny,nx) */
 	ny = PyArray_DIM(array, 0);
+	c_array = (float *)PyArray_DATA(array);
+	c_counts = (counts == NULL) ? NULL : (float *)PyArray_DATA(counts);
+	c_epsilon = (epsilon == NULL) ? NULL : (float *)PyArray_DATA(epsilon);
 
 	/* Initialize array to zero, because we're going to increment
 	   a pixel value for each event in the list.
@@ -452,46 +822,97 @@ static int binEventsToImage(PyArrayObject *x, PyArrayObject *y,
 	for (i = 0;  i < nx;  i++)
 	    for (j = 0;  j < ny;  j++)
 		*(float *)PyArray_GETPTR2(array, j, i) = 0.;
+	if (counts != NULL) {
+	    for (i = 0;  i < nx;  i++)
+		for (j = 0;  j < ny;  j++)
+		    *(float *)PyArray_GETPTR2(counts, j, i) = 0.;
+	}
 
-	for (k = 0;  k < n_events;  k++) {
-
-	    /* get the coordinates of the current event */
-	    if (x_type == NPY_INT16) {
-		i = *(short *)PyArray_GETPTR1(x, k);
-		i += x_offset;
-	    } else {
-		c_x = *(float *)PyArray_GETPTR1(x, k);
-		c_x += f_x_offset;
-		i = NINT(c_x);		/* the more rapidly varying index */
+	/* Each thread adds the events in a band of rows of the array
+	   (see bandOrder).
+	*/
+	nt = threadsFor(n_events);
+	if (nt > 1)
+	    pixel = PyMem_RawMalloc(n_events * sizeof(npy_intp));
+	if (pixel != NULL) {
+# pragma omp parallel for num_threads(nt) schedule(static)
+	    for (t = 0;  t < nt;  t++) {
+		npy_intp k, k_lo, k_hi;
+		partLimits(n_events, t, nt, &k_lo, &k_hi);
+		for (k = k_lo;  k < k_hi;  k++)
+		    pixel[k] = binEventPixel(x, y, nx, ny, x_offset,
+				dq, sdqflags, k);
 	    }
-	    if (y_type == NPY_INT16) {
-		j = *(short *)PyArray_GETPTR1(y, k);
-	    } else {
-		c_y = *(float *)PyArray_GETPTR1(y, k);
-		j = NINT(c_y);
+	    bandOrder(pixel, n_events, nx, ny, nt, &order, &band_start);
+	}
+	if (order != NULL) {
+	    addEventsByBand(c_array, c_counts, c_epsilon,
+			pixel, order, band_start, nt);
+	} else {
+	    for (k = 0;  k < n_events;  k++) {
+		m = binEventPixel(x, y, nx, ny, x_offset, dq, sdqflags, k);
+		if (m < 0)
+		    continue;
+		c_array[m] += (c_epsilon == NULL) ? 1.f : c_epsilon[k];
+		if (c_counts != NULL)
+		    c_counts[m] += 1.;
 	    }
+	}
+	PyMem_RawFree(pixel);
+	PyMem_RawFree(order);
+	PyMem_RawFree(band_start);
 
-	    if (dq == NULL)
-		c_dq = 0;
-	    else
-		c_dq = *(short *)PyArray_GETPTR1(dq, k);
+	return 0;
+}
 
-	    if ((c_dq & sdqflags) == 0) {
+/* This is called by binEventsToImage.  The function value is the index
+   in the (ny,nx) array of the pixel to which event k should be added,
+   or -1 if the event is outside the array or flagged as bad.
+*/
 
-		if (epsilon == NULL)
-		    c_eps = 1.;
-		else
-		    c_eps = *(float *)PyArray_GETPTR1(epsilon, k);
+static npy_intp binEventPixel(PyArrayObject *x, PyArrayObject *y,
+	int nx, int ny, int x_offset,
+	PyArrayObject *dq, short sdqflags, npy_intp k) {
 
-		/* truncate at borders of image */
-		if (i < 0 || i >= nx || j < 0 || j >= ny)
-		    continue;
+	int i, j;		/* indices in 2-D array */
+	float c_x, c_y;		/* individual values */
+	short c_dq;
 
-		*(float *)PyArray_GETPTR2(array, j, i) += c_eps;
-	    }
+	/* get the coordinates of the current event */
+	if (PyArray_DESCR(y)->type_num == NPY_INT16) {
+	    j = *(short *)PyArray_GETPTR1(y, k);
+	} else {
+	    c_y = *(float *)PyArray_GETPTR1(y, k);
+	    j = NINT(c_y);
+	}
+	/* truncate at borders of image */
+	if (j < 0 || j >= ny)
+	    return -1;
+	/* The NINT macro should work the same way for both positive and
+	   negative values.  To avoid any possibility of a discontinuity
+	   at zero, however, for floating point data, x_offset is added
+	   to the x pixel coordinate (c_x) before rounding to an int.
+	*/
+	if (PyArray_DESCR(x)->type_num == NPY_INT16) {
+	    i = *(short *)PyArray_GETPTR1(x, k);
+	    i += x_offset;
+	} else {
+	    c_x = *(float *)PyArray_GETPTR1(x, k);
+	    c_x += (float)x_offset;
+	    i = NINT(c_x);		/* the more rapidly varying index */
 	}
 
-	return 0;
+	if (dq == NULL)
+	    c_dq = 0;
+	else
+	    c_dq = *(short *)PyArray_GETPTR1(dq, k);
+	if ((c_dq & sdqflags) != 0)
+	    return -1;
+
+	if (i < 0 || i >= nx)
+	    return -1;
+
+	return (npy_intp)j * nx + i;
 }
 
 /* calling sequence for bindq:
@@ -555,11 +976,13 @@ static PyObject *ccos_bindq(PyObject *self, PyObject *args) {
 	    return NULL;
 
 	nrows = PyArray_DIM(lx, 0);
+	Py_BEGIN_ALLOW_THREADS
 	status = binDQToImage(
 		(int *)PyArray_DATA(lx), (int *)PyArray_DATA(ly),
 		(int *)PyArray_DATA(ux), (int *)PyArray_DATA(uy),
 		(int *)PyArray_DATA(flag), nrows,
 		dq_array, x_offset);
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(lx);
 	Py_DECREF(ly);
@@ -583,7 +1006,34 @@ static int binDQToImage(
 	int lx[], int ly[], int ux[], int uy[],
 	int flag[], int nrows, PyArrayObject *dq_array, int x_offset) {
 
-	int nx, ny;		/* size of array */
+	int ny;			/* number of rows in dq_array */
+	int nt;			/* number of threads */
+
+	ny = PyArray_DIM(dq_array, 0);
+
+	/* Each thread updates a band of rows of dq_array. */
+	nt = threadsFor(PyArray_SIZE(dq_array));
+# pragma omp parallel num_threads(nt) if (nt > 1)
+	{
+	    int j_lo, j_hi;
+	    threadBand(ny, &j_lo, &j_hi);
+	    binDQRows(lx, ly, ux, uy, flag, nrows, dq_array, x_offset,
+			j_lo, j_hi);
+	}
+
+	return 0;
+}
+
+/* This is called by binDQToImage.  Only rows j_lo to j_hi-1 of dq_array
+   are updated.
+*/
+
+static void binDQRows(
+	int lx[], int ly[], int ux[], int uy[],
+	int flag[], int nrows, PyArrayObject *dq_array, int x_offset,
+	int j_lo, int j_hi) {
+
+	int nx;			/* size of array in X */
 	int k;			/* loop index for events */
 	int i, j;		/* indices in 2-D array */
 	/* individual values */
@@ -592,7 +1042,6 @@ static int binDQToImage(
 	int temp_flag;
 
 	nx = PyArray_DIM(dq_array, 1);		/* shape (ny,nx) */
-	ny = PyArray_DIM(dq_array, 0);
 
 	for (k = 0;  k < nrows;  k++) {
 
@@ -602,14 +1051,14 @@ static int binDQToImage(
 	    c_uy = uy[k];
 
 	    /* ignore regions that are entirely out of bounds */
-	    if (c_ux < 0 || c_lx >= nx || c_uy < 0 || c_ly >= ny)
+	    if (c_ux < 0 || c_lx >= nx || c_uy < j_lo || c_ly >= j_hi)
 		continue;
 
-	    /* truncate at the array boundaries */
+	    /* truncate at the array (or band) boundaries */
 	    c_lx = (c_lx < 0) ? 0 : c_lx;
-	    c_ly = (c_ly < 0) ? 0 : c_ly;
+	    c_ly = (c_ly < j_lo) ? j_lo : c_ly;
 	    c_ux = (c_ux >= nx) ? nx-1 : c_ux;
-	    c_uy = (c_uy >= ny) ? ny-1 : c_uy;
+	    c_uy = (c_uy >= j_hi) ? j_hi-1 : c_uy;
 
 	    for (j = c_ly;  j <= c_uy;  j++) {
 		for (i = c_lx;  i <= c_ux;  i++) {
@@ -620,8 +1069,6 @@ static int binDQToImage(
 		}
 	    }
 	}
-
-	return 0;
 }
 
 /* calling sequence for applydq:
@@ -919,7 +1366,9 @@ static PyObject *ccos_applyflat(PyObject *self, PyObject *args) {
 	if (x == NULL || y == NULL || epsilon == NULL || flat == NULL)
 	    return NULL;
 
+	Py_BEGIN_ALLOW_THREADS
 	applyFlatField(x, y, epsilon, flat, origin_x, origin_y);
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(x);
 	Py_DECREF(y);
@@ -937,10 +1386,31 @@ static void applyFlatField(PyArrayObject *x, PyArrayObject *y,
 	PyArrayObject *epsilon, PyArrayObject *flat,
 	int origin_x, int origin_y) {
 
+	int n_events;		/* number of rows in events table */
+	int nt;			/* number of threads */
+
+	n_events = PyArray_DIM(x, 0);	/* rows in events table */
+
+	/* Each thread handles a contiguous subset of the events. */
+	nt = threadsFor(n_events);
+# pragma omp parallel num_threads(nt) if (nt > 1)
+	{
+	    int k_lo, k_hi;
+	    threadBand(n_events, &k_lo, &k_hi);
+	    applyFlatEvents(x, y, epsilon, flat, origin_x, origin_y,
+			k_lo, k_hi);
+	}
+}
+
+/* This is called by applyFlatField, for events k_lo to k_hi-1. */
+
+static void applyFlatEvents(PyArrayObject *x, PyArrayObject *y,
+	PyArrayObject *epsilon, PyArrayObject *flat,
+	int origin_x, int origin_y, int k_lo, int k_hi) {
+
 	int x_type, y_type;	/* data type codes for x and y */
 	int nx, ny;		/* size of flat */
 	int k;			/* loop index for events */
-	int n_events;		/* number of rows in events table */
 	int i, j;		/* indices in 2-D array */
 	/* individual values */
 	float c_x, c_y, c_flat;
@@ -948,14 +1418,13 @@ static void applyFlatField(PyArrayObject *x, PyArrayObject *y,
 	x_type = PyArray_DESCR(x)->type_num;
 	y_type = PyArray_DESCR(y)->type_num;
 
-	n_events = PyArray_DIM(x, 0);	/* rows in events table */
 	nx = PyArray_DIM(flat, 1);	/* shape (ny,nx) */
 	ny = PyArray_DIM(flat, 0);
 
 	/* For each event, find the location in the flat field, and
 	   divide the current value of epsilon by the flat field value.
 	*/
-	for (k = 0;  k < n_events;  k++) {
+	for (k = k_lo;  k < k_hi;  k++) {
 
 	    /* get the coordinates of the current event */
 	    if (x_type == NPY_INT16) {
@@ -2165,6 +2634,7 @@ static PyObject *ccos_geocorrection(PyObject *self, PyObject *args) {
 	int xbin, ybin;
 	PyArrayObject *x, *y, *x_image, *y_image;
 	int status;
+	int nt;			/* number of threads */
 	int n_events;		/* number of rows in events table */
 
 	origin_x = 0;
@@ -2191,10 +2661,27 @@ static PyObject *ccos_geocorrection(PyObject *self, PyObject *args) {
 	    return NULL;
 
 	n_events = PyArray_DIM(x, 0);	/* rows in events table */
-	status = geoInterp2D(
-		(float *)PyArray_DATA(x), (float *)PyArray_DATA(y), n_events,
-		x_image, y_image, interp_flag,
-		(float)origin_x, (float)origin_y, (float)xbin, (float)ybin);
+	if (PyArray_DIM(x_image, 1) != PyArray_DIM(y_image, 1) ||
+	    PyArray_DIM(x_image, 0) != PyArray_DIM(y_image, 0)) {
+	    PyErr_SetString(PyExc_RuntimeError,
+		"x_image and y_image are not the same shape");
+	    status = 1;
+	} else {
+	    status = 0;
+	    nt = threadsFor(n_events);
+	    Py_BEGIN_ALLOW_THREADS
+# pragma omp parallel num_threads(nt) if (nt > 1)
+	    {
+		int k_lo, k_hi;
+		threadBand(n_events, &k_lo, &k_hi);
+		geoInterp2D(
+		    (float *)PyArray_DATA(x) + k_lo,
+		    (float *)PyArray_DATA(y) + k_lo, k_hi - k_lo,
+		    x_image, y_image, interp_flag,
+		    (float)origin_x, (float)origin_y, (float)xbin, (float)ybin);
+	    }
+	    Py_END_ALLOW_THREADS
+	}
 
 	PyArray_ResolveWritebackIfCopy(x);
 	PyArray_ResolveWritebackIfCopy(y);
@@ -2218,52 +2705,63 @@ static int geoInterp2D(float x[], float y[], int n_events,
 	PyArrayObject *x_image, PyArrayObject *y_image, int interp_flag,
 	float origin_x, float origin_y, float xbin, float ybin) {
 
-	/* dx and dy are the values interplated from x_image and y_image;
-	   they will be subtracted from the x and y columns to correct
-	   the geometric distortion.
-	*/
-	float dx, dy;
 	int nx, ny;		/* size of images */
 	int k;			/* loop index for events */
-	int i, j;		/* indices in 2-D array */
-	float ix, jy;		/* pixel coordinates in x_image and y_image */
 
+	/* The caller has checked that x_image and y_image are the same
+	   shape.  This may be called with the GIL released.
+	*/
 	nx = PyArray_DIM(x_image, 1);	/* shape (ny,nx) */
 	ny = PyArray_DIM(x_image, 0);
-	if (nx != PyArray_DIM(y_image, 1) || ny != PyArray_DIM(y_image, 0)) {
-	    PyErr_SetString(PyExc_RuntimeError,
-		"x_image and y_image are not the same shape");
-	    return 1;
-	}
 
 	for (k = 0;  k < n_events;  k++) {
+	    geoCorrectEvent(&x[k], &y[k], x_image, y_image, nx, ny,
+			interp_flag, origin_x, origin_y, xbin, ybin);
+	}
 
-	    /* Adjust for offset and scale of geo images. */
-	    ix = (x[k] - origin_x) / xbin;
-	    jy = (y[k] - origin_y) / ybin;
+	return 0;
+}
 
-	    if (interp_flag) {
+/* This applies the geometric correction to one event.  It's called by
+   geoInterp2D and by eventCorrection.
+*/
 
-		if (ix <= -0.5 || ix >= nx-0.5 || jy <= -0.5 || jy >= ny-0.5)
-		    continue;
-		bilinearInterp(ix, jy, x_image, y_image, nx, ny, &dx, &dy);
+static void geoCorrectEvent(float *x, float *y,
+	PyArrayObject *x_image, PyArrayObject *y_image, int nx, int ny,
+	int interp_flag,
+	float origin_x, float origin_y, float xbin, float ybin) {
 
-	    } else {
+	/* dx and dy are the values interplated from x_image and y_image;
+	   they will be subtracted from x and y to correct the geometric
+	   distortion.
+	*/
+	float dx, dy;
+	int i, j;		/* indices in 2-D array */
+	float ix, jy;		/* pixel coordinates in x_image and y_image */
 
-		i = NINT(ix);
-		j = NINT(jy);
-		if (i < 0 || i >= nx || j < 0 || j >= ny)
-		    continue;
-		dx = *(float *)PyArray_GETPTR2(x_image, j, i);
-		dy = *(float *)PyArray_GETPTR2(y_image, j, i);
-	    }
+	/* Adjust for offset and scale of geo images. */
+	ix = (*x - origin_x) / xbin;
+	jy = (*y - origin_y) / ybin;
+
+	if (interp_flag) {
+
+	    if (ix <= -0.5 || ix >= nx-0.5 || jy <= -0.5 || jy >= ny-0.5)
+		return;
+	    bilinearInterp(ix, jy, x_image, y_image, nx, ny, &dx, &dy);
 
-	    /* Update x and y in-place. */
-	    x[k] -= dx;
-	    y[k] -= dy;
+	} else {
+
+	    i = NINT(ix);
+	    j = NINT(jy);
+	    if (i < 0 || i >= nx || j < 0 || j >= ny)
+		return;
+	    dx = *(float *)PyArray_GETPTR2(x_image, j, i);
+	    dy = *(float *)PyArray_GETPTR2(y_image, j, i);
 	}
 
-	return 0;
+	/* Update x and y in-place. */
+	*x -= dx;
+	*y -= dy;
 }
 
 /* calling sequence for walkcorrection:
@@ -2282,6 +2780,7 @@ static PyObject *ccos_walkcorrection(PyObject *self, PyObject *args) {
         PyObject *ox, *oy, *o_image, *o_delta;
 	PyArrayObject *x, *y, *image, *delta;
 	int status;
+	int nt;			/* number of threads */
 	int n_events;		/* number of rows in events table */
 
 	if (!PyArg_ParseTuple(args, "OOOO",
@@ -2302,9 +2801,19 @@ static PyObject *ccos_walkcorrection(PyObject *self, PyObject *args) {
 	    return NULL;
 
 	n_events = PyArray_DIM(x, 0);	/* rows in events table */
-	status = bilinearinterpolation(
-		(float *)PyArray_DATA(x), (float *)PyArray_DATA(y), n_events,
-		image, (float *)PyArray_DATA(delta));
+	status = 0;
+	nt = threadsFor(n_events);
+	Py_BEGIN_ALLOW_THREADS
+# pragma omp parallel num_threads(nt) if (nt > 1)
+	{
+	    int k_lo, k_hi;
+	    threadBand(n_events, &k_lo, &k_hi);
+	    bilinearinterpolation(
+		(float *)PyArray_DATA(x) + k_lo,
+		(float *)PyArray_DATA(y) + k_lo, k_hi - k_lo,
+		image, (float *)PyArray_DATA(delta) + k_lo);
+	}
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(x);
 	Py_DECREF(y);
@@ -2373,6 +2882,482 @@ static int bilinearinterpolation(float x[], float y[], int n_events,
 	return 0;
 }
 
+/* calling sequence for eventcorrection:
+
+   eventcorrection(x, y, pha, active, area,
+                   tempcorr, geo, dgeo, xwalk, ywalk)
+
+    x, y       io: arrays of pixel coordinates of the events (float32)
+    pha         i: array of pulse heights (int16)
+    active      o: array of flags, true if the corrected (x, y) is within
+                   the active area (bool)
+    area        i: (low, high, left, right) limits of the active area,
+                   inclusive (tuple of floats)
+    tempcorr    i: None, or (i0, i1, param, mode) for the thermal
+                   correction:  i0 and i1 are the limits of slices of the
+                   event list (int32, in increasing order, not overlapping);
+                   param has shape (n_intervals, 4) giving x0, xslope, y0,
+                   yslope for each slice (float64); mode has shape
+                   (n_intervals, 2) giving the precision used for x and y
+                   (int32; -1 = skip, 0 = float, 1 = float multiply and
+                   double add, 2 = double)
+    geo, dgeo   i: None, or (x_image, y_image, interp_flag,
+                   origin_x, origin_y, xbin, ybin), the same as the
+                   arguments to geocorrection
+    xwalk       i: None, or the 2-D image for the X walk correction (float64)
+    ywalk       i: None, or the 2-D image for the Y walk correction (float64)
+
+   ccos_eventcorrection calls eventCorrection, which applies (in order) the
+   thermal distortion correction, the geometric and delta geometric
+   corrections, and the X and Y walk corrections to each event in turn,
+   rather than making a separate pass over the event list for each step.
+   The arithmetic for each step is the same as for the corresponding
+   separate step, so the results are identical.  The walk corrections
+   are only applied to events within the active area.
+*/
+
+static PyObject *ccos_eventcorrection(PyObject *self, PyObject *args) {
+
+	PyObject *ox, *oy, *opha, *oactive, *oarea;
+	PyObject *otempcorr, *ogeo, *odgeo, *oxwalk, *oywalk;
+	PyObject *oi0, *oi1, *oparam, *omode;
+	PyArrayObject *x = NULL, *y = NULL, *pha = NULL, *active = NULL;
+	PyArrayObject *i0 = NULL, *i1 = NULL, *param = NULL, *mode = NULL;
+	PyArrayObject *geo_x = NULL, *geo_y = NULL;
+	PyArrayObject *dgeo_x = NULL, *dgeo_y = NULL;
+	PyArrayObject *xwalk = NULL, *ywalk = NULL;
+	double area[4];		/* low, high, left, right */
+	int geo_interp = 0, dgeo_interp = 0;
+	float geo_param[4], dgeo_param[4];	/* origin_x, origin_y, xbin, ybin */
+	int n_events;		/* number of rows in events table */
+	int n_intervals = 0;	/* number of slices for tempcorr */
+	int nt;			/* number of threads */
+	int status = 1;
+
+	if (!PyArg_ParseTuple(args, "OOOOOOOOOO",
+			&ox, &oy, &opha, &oactive, &oarea,
+			&otempcorr, &ogeo, &odgeo, &oxwalk, &oywalk)) {
+	    PyErr_SetString(PyExc_RuntimeError, "can't read arguments");
+	    return NULL;
+	}
+
+	if (!PyArg_ParseTuple(oarea, "dddd",
+			&area[0], &area[1], &area[2], &area[3])) {
+	    PyErr_SetString(PyExc_RuntimeError, "can't read area limits");
+	    return NULL;
+	}
+
+	x = (PyArrayObject *)PyArray_FROM_OTF(ox, NPY_FLOAT32,
+			NPY_ARRAY_INOUT_ARRAY2);
+	y = (PyArrayObject *)PyArray_FROM_OTF(oy, NPY_FLOAT32,
+			NPY_ARRAY_INOUT_ARRAY2);
+	pha = (PyArrayObject *)PyArray_FROM_OTF(opha, NPY_INT16,
+			NPY_ARRAY_IN_ARRAY);
+	active = (PyArrayObject *)PyArray_FROM_OTF(oactive, NPY_BOOL,
+			NPY_ARRAY_INOUT_ARRAY2);
+	if (x == NULL || y == NULL || pha == NULL || active == NULL)
+	    goto cleanup;
+
+	n_events = PyArray_DIM(x, 0);
+	if (PyArray_DIM(y, 0) != n_events || PyArray_DIM(pha, 0) != n_events ||
+	    PyArray_DIM(active, 0) != n_events) {
+	    PyErr_SetString(PyExc_RuntimeError,
+		"x, y, pha and active must all be the same length");
+	    goto cleanup;
+	}
+
+	if (otempcorr != Py_None) {
+	    if (!PyArg_ParseTuple(otempcorr, "OOOO",
+			&oi0, &oi1, &oparam, &omode)) {
+		PyErr_SetString(PyExc_RuntimeError,
+			"can't read tempcorr parameters");
+		goto cleanup;
+	    }
+	    i0 = (PyArrayObject *)PyArray_FROM_OTF(oi0, NPY_INT32,
+			NPY_ARRAY_IN_ARRAY);
+	    i1 = (PyArrayObject *)PyArray_FROM_OTF(oi1, NPY_INT32,
+			NPY_ARRAY_IN_ARRAY);
+	    param = (PyArrayObject *)PyArray_FROM_OTF(oparam, NPY_FLOAT64,
+			NPY_ARRAY_IN_ARRAY);
+	    mode = (PyArrayObject *)PyArray_FROM_OTF(omode, NPY_INT32,
+			NPY_ARRAY_IN_ARRAY);
+	    if (i0 == NULL || i1 == NULL || param == NULL || mode == NULL)
+		goto cleanup;
+	    n_intervals = PyArray_DIM(i0, 0);
+	    if (PyArray_DIM(i1, 0) != n_intervals ||
+		PyArray_SIZE(param) != 4 * n_intervals ||
+		PyArray_SIZE(mode) != 2 * n_intervals) {
+		PyErr_SetString(PyExc_RuntimeError,
+			"inconsistent sizes of tempcorr parameters");
+		goto cleanup;
+	    }
+	}
+
+	if (ogeo != Py_None) {
+	    if (geoArgs(ogeo, &geo_x, &geo_y, &geo_interp, geo_param))
+		goto cleanup;
+	}
+	if (odgeo != Py_None) {
+	    if (geoArgs(odgeo, &dgeo_x, &dgeo_y, &dgeo_interp, dgeo_param))
+		goto cleanup;
+	}
+
+	if (oxwalk != Py_None) {
+	    xwalk = (PyArrayObject *)PyArray_FROM_OTF(oxwalk, NPY_FLOAT64,
+			NPY_ARRAY_IN_ARRAY);
+	    if (xwalk == NULL)
+		goto cleanup;
+	}
+	if (oywalk != Py_None) {
+	    ywalk = (PyArrayObject *)PyArray_FROM_OTF(oywalk, NPY_FLOAT64,
+			NPY_ARRAY_IN_ARRAY);
+	    if (ywalk == NULL)
+		goto cleanup;
+	}
+	if ((xwalk != NULL && PyArray_NDIM(xwalk) != 2) ||
+	    (ywalk != NULL && PyArray_NDIM(ywalk) != 2)) {
+	    PyErr_SetString(PyExc_RuntimeError,
+		"walk correction images must be 2-D");
+	    goto cleanup;
+	}
+
+	nt = threadsFor(n_events);
+	Py_BEGIN_ALLOW_THREADS
+# pragma omp parallel num_threads(nt) if (nt > 1)
+	{
+	    int k_lo, k_hi;
+	    threadBand(n_events, &k_lo, &k_hi);
+	    eventCorrection(
+		(float *)PyArray_DATA(x) + k_lo, (float *)PyArray_DATA(y) + k_lo,
+		(short *)PyArray_DATA(pha) + k_lo,
+		(npy_bool *)PyArray_DATA(active) + k_lo,
+		k_hi - k_lo, k_lo, area,
+		n_intervals,
+		i0 == NULL ? NULL : (int *)PyArray_DATA(i0),
+		i1 == NULL ? NULL : (int *)PyArray_DATA(i1),
+		param == NULL ? NULL : (double *)PyArray_DATA(param),
+		mode == NULL ? NULL : (int *)PyArray_DATA(mode),
+		geo_x, geo_y, geo_interp, geo_param,
+		dgeo_x, dgeo_y, dgeo_interp, dgeo_param,
+		xwalk, ywalk);
+	}
+	Py_END_ALLOW_THREADS
+	status = 0;
+
+cleanup:
+	if (x != NULL)
+	    PyArray_ResolveWritebackIfCopy(x);
+	if (y != NULL)
+	    PyArray_ResolveWritebackIfCopy(y);
+	if (active != NULL)
+	    PyArray_ResolveWritebackIfCopy(active);
+	Py_XDECREF(x);
+	Py_XDECREF(y);
+	Py_XDECREF(pha);
+	Py_XDECREF(active);
+	Py_XDECREF(i0);
+	Py_XDECREF(i1);
+	Py_XDECREF(param);
+	Py_XDECREF(mode);
+	Py_XDECREF(geo_x);
+	Py_XDECREF(geo_y);
+	Py_XDECREF(dgeo_x);
+	Py_XDECREF(dgeo_y);
+	Py_XDECREF(xwalk);
+	Py_XDECREF(ywalk);
+
+	if (status) {
+	    return NULL;
+	} else {
+	    Py_INCREF(Py_None);
+	    return Py_None;
+	}
+}
+
+/* This is called by ccos_eventcorrection to read the (geo or dgeo)
+   tuple of images and parameters; geo_param is assigned origin_x,
+   origin_y, xbin, ybin.  The function value is 1 if there was an error.
+*/
+
+static int geoArgs(PyObject *ogeo, PyArrayObject **x_image,
+	PyArrayObject **y_image, int *interp_flag, float geo_param[4]) {
+
+	PyObject *ox_image, *oy_image;
+	int origin_x, origin_y, xbin, ybin;
+
+	if (!PyArg_ParseTuple(ogeo, "OOiiiii",
+			&ox_image, &oy_image, interp_flag,
+			&origin_x, &origin_y, &xbin, &ybin)) {
+	    PyErr_SetString(PyExc_RuntimeError,
+		"can't read geometric correction parameters");
+	    return 1;
+	}
+	*x_image = (PyArrayObject *)PyArray_FROM_OTF(ox_image, NPY_FLOAT32,
+			NPY_ARRAY_IN_ARRAY);
+	*y_image = (PyArrayObject *)PyArray_FROM_OTF(oy_image, NPY_FLOAT32,
+			NPY_ARRAY_IN_ARRAY);
+	if (*x_image == NULL || *y_image == NULL)
+	    return 1;
+	if (PyArray_NDIM(*x_image) != 2 || PyArray_NDIM(*y_image) != 2 ||
+	    PyArray_DIM(*x_image, 0) != PyArray_DIM(*y_image, 0) ||
+	    PyArray_DIM(*x_image, 1) != PyArray_DIM(*y_image, 1)) {
+	    PyErr_SetString(PyExc_RuntimeError,
+		"x_image and y_image are not the same shape");
+	    return 1;
+	}
+	geo_param[0] = (float)origin_x;
+	geo_param[1] = (float)origin_y;
+	geo_param[2] = (float)xbin;
+	geo_param[3] = (float)ybin;
+
+	return 0;
+}
+
+/* This is called by ccos_eventcorrection.  The arrays x, y, pha and
+   active begin at element k0 of the events table, which matters for
+   comparing with i0 and i1.
+*/
+
+static void eventCorrection(float x[], float y[], short pha[],
+	npy_bool active[], int n_events, int k0, double area[4],
+	int n_intervals, int i0[], int i1[], double param[], int mode[],
+	PyArrayObject *geo_x, PyArrayObject *geo_y,
+	int geo_interp, float geo_param[4],
+	PyArrayObject *dgeo_x, PyArrayObject *dgeo_y,
+	int dgeo_interp, float dgeo_param[4],
+	PyArrayObject *xwalk, PyArrayObject *ywalk) {
+
+	int k;			/* loop index for events */
+	int n = 0;		/* index of current tempcorr interval */
+	double *p;		/* x0, xslope, y0, yslope for interval n */
+	double xdelta, ydelta;	/* walk corrections */
+
+	for (k = 0;  k < n_events;  k++) {
+
+	    /* Thermal distortion correction; this must reproduce the
+	       precision used by numpy for x0 + x * xslope, so mode gives
+	       the data type of the product and of the sum.
+	    */
+	    while (n < n_intervals && k0 + k >= i1[n])
+		n++;
+	    if (n < n_intervals && k0 + k >= i0[n]) {
+		p = &param[4*n];
+		if (mode[2*n] == 0)
+		    x[k] = (float)p[0] + x[k] * (float)p[1];
+		else if (mode[2*n] == 1)
+		    x[k] = (float)(p[0] + (double)(x[k] * (float)p[1]));
+		else if (mode[2*n] == 2)
+		    x[k] = (float)(p[0] + (double)x[k] * p[1]);
+		if (mode[2*n+1] == 0)
+		    y[k] = (float)p[2] + y[k] * (float)p[3];
+		else if (mode[2*n+1] == 1)
+		    y[k] = (float)(p[2] + (double)(y[k] * (float)p[3]));
+		else if (mode[2*n+1] == 2)
+		    y[k] = (float)(p[2] + (double)y[k] * p[3]);
+	    }
+
+	    if (geo_x != NULL) {
+		geoCorrectEvent(&x[k], &y[k], geo_x, geo_y,
+			PyArray_DIM(geo_x, 1), PyArray_DIM(geo_x, 0),
+			geo_interp, geo_param[0], geo_param[1],
+			geo_param[2], geo_param[3]);
+	    }
+	    if (dgeo_x != NULL) {
+		geoCorrectEvent(&x[k], &y[k], dgeo_x, dgeo_y,
+			PyArray_DIM(dgeo_x, 1), PyArray_DIM(dgeo_x, 0),
+			dgeo_interp, dgeo_param[0], dgeo_param[1],
+			dgeo_param[2], dgeo_param[3]);
+	    }
+
+	    active[k] = !((double)x[k] > area[3] || (double)x[k] < area[2] ||
+			  (double)y[k] > area[1] || (double)y[k] < area[0]);
+
+	    /* The X and Y walk corrections are both computed from the
+	       coordinates before either of them is applied.
+	    */
+	    if (active[k] && (xwalk != NULL || ywalk != NULL)) {
+		if (xwalk != NULL)
+		    xdelta = walkDelta(x[k], (double)pha[k],
+			(double *)PyArray_DATA(xwalk),
+			PyArray_DIM(xwalk, 1), PyArray_DIM(xwalk, 0));
+		if (ywalk != NULL)
+		    ydelta = walkDelta(y[k], (double)pha[k],
+			(double *)PyArray_DATA(ywalk),
+			PyArray_DIM(ywalk, 1), PyArray_DIM(ywalk, 0));
+		if (xwalk != NULL)
+		    x[k] = (float)((double)x[k] - xdelta);
+		if (ywalk != NULL)
+		    y[k] = (float)((double)y[k] - ydelta);
+	    }
+	}
+}
+
+/* calling sequence for lookup:
+
+   n_outside = lookup(x, table, x_first, subsample, out)
+
+    x          i: array of coordinates (float32 or float64)
+    table      i: function values at x_first + i / subsample, for i = 0
+                  to len(table) - 1 (float64)
+    x_first    i: the coordinate of the first element of table (float)
+    subsample  i: the number of table elements per unit of x (float)
+    out        o: the function values at x, linearly interpolated in
+                  table (float64); NaN where x is outside the table
+    n_outside  o: the number of elements of x that are outside the table
+                  (or NaN), for which out was set to NaN (int)
+*/
+
+static PyObject *ccos_lookup(PyObject *self, PyObject *args) {
+
+	PyObject *ox, *otable, *oout;
+	PyArrayObject *x, *table, *out;
+	double x_first, subsample;
+	int n_events;		/* number of elements in x */
+	int n_table;		/* number of elements in table */
+	int n_outside = 0;	/* number of elements of x outside table */
+	int nt;			/* number of threads */
+
+	if (!PyArg_ParseTuple(args, "OOddO",
+			&ox, &otable, &x_first, &subsample, &oout)) {
+	    PyErr_SetString(PyExc_RuntimeError, "can't read arguments");
+	    return NULL;
+	}
+
+	if (PyArray_Check(ox) &&
+	    PyArray_TYPE((PyArrayObject*) ox) == NPY_FLOAT32) {
+	    x = (PyArrayObject *)PyArray_FROM_OTF(ox, NPY_FLOAT32,
+			NPY_ARRAY_IN_ARRAY);
+	} else {
+	    x = (PyArrayObject *)PyArray_FROM_OTF(ox, NPY_FLOAT64,
+			NPY_ARRAY_IN_ARRAY);
+	}
+	table = (PyArrayObject *)PyArray_FROM_OTF(otable, NPY_FLOAT64,
+			NPY_ARRAY_IN_ARRAY);
+	out = (PyArrayObject *)PyArray_FROM_OTF(oout, NPY_FLOAT64,
+			NPY_ARRAY_INOUT_ARRAY2);
+	if (x == NULL || table == NULL || out == NULL) {
+	    Py_XDECREF(x);
+	    Py_XDECREF(table);
+	    if (out != NULL) {
+		PyArray_DiscardWritebackIfCopy(out);
+		Py_DECREF(out);
+	    }
+	    return NULL;
+	}
+
+	n_events = PyArray_SIZE(x);
+	n_table = PyArray_SIZE(table);
+	if (PyArray_SIZE(out) != n_events || n_table < 2 || subsample <= 0.) {
+	    PyErr_SetString(PyExc_ValueError,
+		"out must be the same size as x, table must have at least "
+		"two elements, and subsample must be positive");
+	    Py_DECREF(x);
+	    Py_DECREF(table);
+	    PyArray_DiscardWritebackIfCopy(out);
+	    Py_DECREF(out);
+	    return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	/* Each thread handles a contiguous subset of the events. */
+	nt = threadsFor(n_events);
+# pragma omp parallel num_threads(nt) if (nt > 1) reduction(+:n_outside)
+	{
+	    int k_lo, k_hi;
+	    threadBand(n_events, &k_lo, &k_hi);
+	    n_outside += lookupEvents(x, (double *)PyArray_DATA(table), n_table,
+			x_first, subsample, (double *)PyArray_DATA(out),
+			k_lo, k_hi);
+	}
+	Py_END_ALLOW_THREADS
+
+	Py_DECREF(x);
+	Py_DECREF(table);
+	PyArray_ResolveWritebackIfCopy(out);
+	Py_DECREF(out);
+
+	return Py_BuildValue("i", n_outside);
+}
+
+/* This is called by ccos_lookup, for elements k_lo to k_hi-1 of x.
+   The function value returned is the number of those elements that
+   are outside the table.
+*/
+
+static int lookupEvents(PyArrayObject *x, double table[], int n_table,
+		double x_first, double subsample, double out[],
+		int k_lo, int k_hi) {
+
+	float *x_f = NULL;	/* x, if it is float32 */
+	double *x_d = NULL;	/* x, if it is float64 */
+	double u;		/* x in units of table elements */
+	int i;			/* index in table */
+	int k;			/* loop index for x */
+	int n_outside = 0;
+
+	if (PyArray_TYPE(x) == NPY_FLOAT32)
+	    x_f = (float *)PyArray_DATA(x);
+	else
+	    x_d = (double *)PyArray_DATA(x);
+
+	for (k = k_lo;  k < k_hi;  k++) {
+	    if (x_f != NULL)
+		u = ((double)x_f[k] - x_first) * subsample;
+	    else
+		u = (x_d[k] - x_first) * subsample;
+	    /* this is false if u is NaN */
+	    if (u >= 0. && u < (double)(n_table - 1)) {
+		i = (int)u;		/* u is not negative, so this is floor */
+		u -= (double)i;
+		out[k] = table[i] + u * (table[i+1] - table[i]);
+	    } else {
+		out[k] = NAN;
+		n_outside++;
+	    }
+	}
+
+	return n_outside;
+}
+
+/* This returns the walk correction for one event, interpolated in the
+   image of shape (ny,nx) at (fast, slow).  The arithmetic is the same
+   as in bilinear_interpolation in timetag.py:  coordinates are clipped
+   to the image, and the image is extended by one row and column of zeros.
+*/
+
+static double walkDelta(float fast, double slow, double image[],
+		int nx, int ny) {
+
+	int ix, iy;
+	double dx1, dx2, dy1, dy2;	/* weights */
+	double f11, f12, f21, f22;	/* image values at the four corners */
+
+	if (fast < 0.0F)
+	    fast = 0.0F;
+	else if (fast > nx - 1)
+	    fast = (float)(nx - 1);
+	ix = (int)fast;
+
+	if (slow < 0.)
+	    slow = 0.;
+	else if (slow > ny - 1)
+	    slow = (double)(ny - 1);
+	iy = (int)slow;
+
+	dx1 = (double)fast - (double)ix;
+	dx2 = 1.0 - dx1;
+	dy1 = slow - (double)iy;
+	dy2 = 1.0 - dy1;
+
+	f11 = image[iy*nx + ix];
+	f12 = (iy+1 < ny) ? image[(iy+1)*nx + ix] : 0.;
+	f21 = (ix+1 < nx) ? image[iy*nx + ix+1] : 0.;
+	f22 = (iy+1 < ny && ix+1 < nx) ? image[(iy+1)*nx + ix+1] : 0.;
+
+	return f11 * dx2 * dy2 + f12 * dx2 * dy1 +
+	       f21 * dx1 * dy2 + f22 * dx1 * dy1;
+}
+
 /* calling sequence for pha_check:
 
    counters = pha_check(x, y, pha, dq, im_low, im_high, pha_flag)
@@ -3573,9 +4558,17 @@ static PyObject *ccos_xy_extract(PyObject *self, PyObject *args) {
 		return NULL;
 	}
 
-	status = extrFromEvents(xi, eta, outdata,
+	if (PyArray_DIM(xi, 0) != PyArray_DIM(eta, 0)) {
+	    PyErr_SetString(PyExc_RuntimeError,
+			"xi and eta must both be the same length");
+	    status = 1;
+	} else {
+	    Py_BEGIN_ALLOW_THREADS
+	    status = extrFromEvents(xi, eta, outdata,
 			x_offset, slope, intercept,
 			dq, sdqflags, epsilon);
+	    Py_END_ALLOW_THREADS
+	}
 
 	Py_DECREF(xi);
 	Py_DECREF(eta);
@@ -3598,31 +4591,24 @@ static int extrFromEvents(PyArrayObject *xi, PyArrayObject *eta,
 		int x_offset, double slope, double intercept,
 		PyArrayObject *dq, short sdqflags, PyArrayObject *epsilon) {
 
-	int xi_type, eta_type;	/* data type code for xi and eta */
 	int half_height;	/* half of extr height, fraction truncated */
 	/* lower is the lower limit of the spectral extraction region for a
 	   given value of xi.
 	*/
 	double y0;		/* lower edge of spec extr region at xi=0 */
-	double y;		/* c_eta corrected for slope */
 	int n_events;		/* length of xi and eta arrays */
-	int k;			/* event index */
 	int nx, ny;		/* size of outdata */
-	double c_xi, c_eta;	/* xi and eta for one event */
-	short c_dq = 0;
-	double c_eps = 1.;	/* but the epsilon column is float32 */
-	int i, j;		/* nearest integers to c_xi, c_eta */
-	int i_z;		/* i + zero-point offset */
-
+	int i, j;
+	int nt;			/* number of threads */
+	int t, b;
+	npy_intp k, m;		/* event index, pixel index */
+	npy_intp *pixel = NULL;	/* pixel index for each event */
+	npy_intp *order = NULL, *band_start = NULL;	/* see bandOrder */
+	double *c_outdata;
+	float *c_epsilon;
+
+	/* The caller has checked that xi and eta are the same length. */
 	n_events = PyArray_DIM(xi, 0);
-	if (n_events != PyArray_DIM(eta, 0)) {
-	    PyErr_SetString(PyExc_RuntimeError,
-			"xi and eta must both be the same length");
-	    return 1;
-	}
-
-	xi_type = PyArray_DESCR(xi)->type_num;
-	eta_type = PyArray_DESCR(eta)->type_num;
 
 	/* shape is (ny,nx), nx is in the dispersion direction */
 	nx = PyArray_DIM(outdata, 1);
@@ -3638,40 +4624,98 @@ static int extrFromEvents(PyArrayObject *xi, PyArrayObject *eta,
 		*(double *)PyArray_GETPTR2(outdata, j, i) = 0.;
 
 	y0 = intercept - half_height;
-	for (k = 0;  k < n_events;  k++) {	/* for each event ... */
-	    if (dq != NULL)
-		c_dq = *(short *)PyArray_GETPTR1(dq, k);
-	    if ((c_dq & sdqflags) == 0) {
-		if (xi_type == NPY_INT16) {
-		    i = *(short *)PyArray_GETPTR1(xi, k);
-		    c_xi = (double)i;
-		} else {
-		    c_xi = *(float *)PyArray_GETPTR1(xi, k);
-		    i = NINT(c_xi);
-		}
-		i_z = i + x_offset;	/* note:  don't add x_offset to c_xi */
-		if (i_z < 0 || i_z > nx-1)
-		    continue;
-		if (eta_type == NPY_INT16) {
-		    j = *(short *)PyArray_GETPTR1(eta, k);
-		    c_eta = (double)j;
-		} else {
-		    c_eta = *(float *)PyArray_GETPTR1(eta, k);
-		}
-		y = c_eta - (y0 + slope * c_xi);
-		j = NINT(y);
-		/* include this event if it's within the extraction region */
-		if (j >= 0 && j < ny) {
-		    if (epsilon != NULL)
-			c_eps = *(float *)PyArray_GETPTR1(epsilon, k);
-		    *(double *)PyArray_GETPTR2(outdata, j, i_z) += c_eps;
+
+	c_outdata = (double *)PyArray_DATA(outdata);
+	c_epsilon = (epsilon == NULL) ? NULL : (float *)PyArray_DATA(epsilon);
+
+	/* Each thread adds the events in a band of rows of outdata
+	   (see bandOrder).
+	*/
+	nt = threadsFor(n_events);
+	if (nt > 1)
+	    pixel = PyMem_RawMalloc(n_events * sizeof(npy_intp));
+	if (pixel != NULL) {
+# pragma omp parallel for num_threads(nt) schedule(static)
+	    for (t = 0;  t < nt;  t++) {
+		npy_intp k, k_lo, k_hi;
+		partLimits(n_events, t, nt, &k_lo, &k_hi);
+		for (k = k_lo;  k < k_hi;  k++)
+		    pixel[k] = extrEventPixel(xi, eta, nx, ny, x_offset,
+				slope, y0, dq, sdqflags, k);
+	    }
+	    bandOrder(pixel, n_events, nx, ny, nt, &order, &band_start);
+	}
+	if (order != NULL) {
+# pragma omp parallel for num_threads(nt) schedule(static)
+	    for (b = 0;  b < nt;  b++) {
+		npy_intp n, k;
+		for (n = band_start[b];  n < band_start[b+1];  n++) {
+		    k = order[n];
+		    c_outdata[pixel[k]] +=
+			(c_epsilon == NULL) ? 1. : (double)c_epsilon[k];
 		}
 	    }
+	} else {
+	    for (k = 0;  k < n_events;  k++) {
+		m = extrEventPixel(xi, eta, nx, ny, x_offset,
+			slope, y0, dq, sdqflags, k);
+		if (m >= 0)
+		    c_outdata[m] +=
+			(c_epsilon == NULL) ? 1. : (double)c_epsilon[k];
+	    }
 	}
+	PyMem_RawFree(pixel);
+	PyMem_RawFree(order);
+	PyMem_RawFree(band_start);
 
 	return (0);
 }
 
+/* This is called by extrFromEvents.  The function value is the index in
+   outdata (shape (ny,nx)) of the pixel to which event k should be added,
+   or -1 if the event is flagged as bad or outside the extraction region.
+*/
+
+static npy_intp extrEventPixel(PyArrayObject *xi, PyArrayObject *eta,
+		int nx, int ny, int x_offset, double slope, double y0,
+		PyArrayObject *dq, short sdqflags, npy_intp k) {
+
+	double y;		/* c_eta corrected for slope */
+	double c_xi, c_eta;	/* xi and eta for one event */
+	short c_dq = 0;
+	int i, j;		/* nearest integers to c_xi, c_eta */
+	int i_z;		/* i + zero-point offset */
+
+	if (dq != NULL)
+	    c_dq = *(short *)PyArray_GETPTR1(dq, k);
+	if ((c_dq & sdqflags) != 0)
+	    return -1;
+
+	if (PyArray_DESCR(xi)->type_num == NPY_INT16) {
+	    i = *(short *)PyArray_GETPTR1(xi, k);
+	    c_xi = (double)i;
+	} else {
+	    c_xi = *(float *)PyArray_GETPTR1(xi, k);
+	    i = NINT(c_xi);
+	}
+	i_z = i + x_offset;	/* note:  don't add x_offset to c_xi */
+	if (i_z < 0 || i_z > nx-1)
+	    return -1;
+	if (PyArray_DESCR(eta)->type_num == NPY_INT16) {
+	    j = *(short *)PyArray_GETPTR1(eta, k);
+	    c_eta = (double)j;
+	} else {
+	    c_eta = *(float *)PyArray_GETPTR1(eta, k);
+	}
+	y = c_eta - (y0 + slope * c_xi);
+	j = NINT(y);
+	/* include this event if it's within the extraction region */
+	if (j < 0 || j >= ny)
+	    return -1;
+
+	return (npy_intp)j * nx + i_z;
+}
+
 /* calling sequence for xy_collapse:
 
    xy_collapse(xi, eta, dq, slope, xdisp)
@@ -3834,6 +4878,7 @@ static PyObject *ccos_csum_3d(PyObject *self, PyObject *args) {
 	PyArrayObject *array, *x, *y, *epsilon, *pha;
 	int binx=1, biny=1;
 	int n_events, nx, ny, nz;
+	int nt;			/* number of threads */
 
 	if (!PyArg_ParseTuple(args, "OOOOO|ii",
 			&oarray, &ox, &oy, &oepsilon, &opha, &binx, &biny)) {
@@ -3872,11 +4917,14 @@ static PyObject *ccos_csum_3d(PyObject *self, PyObject *args) {
 	    return NULL;
 	}
 
+	nt = threadsFor(n_events);
+	Py_BEGIN_ALLOW_THREADS
 	bin3DtoCsum((float *)PyArray_DATA(array), nx, ny, nz,
 		binx, biny,
 		(float *)PyArray_DATA(x), (float *)PyArray_DATA(y),
 		(float *)PyArray_DATA(epsilon),
-		(short *)PyArray_DATA(pha), n_events);
+		(short *)PyArray_DATA(pha), n_events, nt);
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(array);
 	Py_DECREF(x);
@@ -3888,22 +4936,34 @@ static PyObject *ccos_csum_3d(PyObject *self, PyObject *args) {
 	return Py_None;
 }
 
-/* This is called by ccos_csum_3d. */
+/* This is called by ccos_csum_3d.  If nt > 1, each of nt threads adds
+   the events in a band of rows (j) of the array (see bandOrder).
+*/
 
 static void bin3DtoCsum(float array[], int nx, int ny, int nz,
 		int binx, int biny,
 		float x[], float y[],
-		float epsilon[], short pha[], int n_events) {
+		float epsilon[], short pha[], int n_events, int nt) {
 
 	int n;		/* loop index for events */
 	int i, j, k;	/* pixel coordinates of event, indices in 3-D array */
 	int m;		/* 1-D index into array */
+	npy_intp *pixel = NULL;	/* m for each event, or -1 */
+	npy_intp *order = NULL, *band_start = NULL;	/* see bandOrder */
 
 	if (binx < 1)
 	    binx = 1;
 	if (biny < 1)
 	    biny = 1;
 
+	if (nt > 1)
+	    pixel = PyMem_RawMalloc(n_events * sizeof(npy_intp));
+
+	if (pixel == NULL) {
+	    nt = 1;
+	}
+
+# pragma omp parallel for num_threads(nt) schedule(static) if (nt > 1) private(i, j, k, m)
 	for (n = 0;  n < n_events;  n++) {
 
 	    /* the pixel coordinates of the current event */
@@ -3913,11 +4973,31 @@ static void bin3DtoCsum(float array[], int nx, int ny, int nz,
 
 	    /* truncate at borders of image */
 	    if (i < 0 || i >= nx || j < 0 || j >= ny || k < 0 || k >= nz)
-		continue;
+		m = -1;
+	    else
+		m = i + nx*j + nx*ny*k;
 
-	    m = i + nx*j + nx*ny*k;
-	    array[m] += epsilon[n];
+	    if (pixel != NULL)
+		pixel[n] = m;
+	    else if (m >= 0)
+		array[m] += epsilon[n];
 	}
+
+	if (pixel != NULL) {
+	    if (bandOrder(pixel, n_events, nx, ny, nt,
+			&order, &band_start) == 0) {
+		addEventsByBand(array, NULL, epsilon,
+			pixel, order, band_start, nt);
+	    } else {
+		for (n = 0;  n < n_events;  n++) {
+		    if (pixel[n] >= 0)
+			array[pixel[n]] += epsilon[n];
+		}
+	    }
+	}
+	PyMem_RawFree(pixel);
+	PyMem_RawFree(order);
+	PyMem_RawFree(band_start);
 }
 
 /* calling sequence for csum_2d:
@@ -3944,6 +5024,7 @@ static PyObject *ccos_csum_2d(PyObject *self, PyObject *args) {
 	PyArrayObject *array, *x, *y, *epsilon;
 	int binx=1, biny=1;
 	int n_events, nx, ny;
+	int nt;			/* number of threads */
 
 	if (!PyArg_ParseTuple(args, "OOOO|ii",
 			&oarray, &ox, &oy, &oepsilon, &binx, &biny)) {
@@ -3969,10 +5050,13 @@ static PyObject *ccos_csum_2d(PyObject *self, PyObject *args) {
 	nx = PyArray_DIM(array, 1);	/* shape (ny,nx) */
 	ny = PyArray_DIM(array, 0);
 
+	nt = threadsFor(n_events);
+	Py_BEGIN_ALLOW_THREADS
 	bin2DtoCsum((float *)PyArray_DATA(array), nx, ny,
 		binx, biny,
 		(float *)PyArray_DATA(x), (float *)PyArray_DATA(y),
-		(float *)PyArray_DATA(epsilon), n_events);
+		(float *)PyArray_DATA(epsilon), n_events, nt);
+	Py_END_ALLOW_THREADS
 
 	Py_DECREF(array);
 	Py_DECREF(x);
@@ -3983,21 +5067,34 @@ static PyObject *ccos_csum_2d(PyObject *self, PyObject *args) {
 	return Py_None;
 }
 
-/* This is called by ccos_csum_2d. */
+/* This is called by ccos_csum_2d.  If nt > 1, each of nt threads adds
+   the events in a band of rows of the array (see bandOrder).
+*/
 
 static void bin2DtoCsum(float array[], int nx, int ny,
 		int binx, int biny,
 		float x[], float y[],
-		float epsilon[], int n_events) {
+		float epsilon[], int n_events, int nt) {
 
 	int n;		/* loop index for events */
 	int i, j;	/* pixel coordinates of event, indices in 2-D array */
+	int m;		/* 1-D index into array */
+	npy_intp *pixel = NULL;	/* m for each event, or -1 */
+	npy_intp *order = NULL, *band_start = NULL;	/* see bandOrder */
 
 	if (binx < 1)
 	    binx = 1;
 	if (biny < 1)
 	    biny = 1;
 
+	if (nt > 1)
+	    pixel = PyMem_RawMalloc(n_events * sizeof(npy_intp));
+
+	if (pixel == NULL) {
+	    nt = 1;
+	}
+
+# pragma omp parallel for num_threads(nt) schedule(static) if (nt > 1) private(i, j, m)
 	for (n = 0;  n < n_events;  n++) {
 
 	    /* the pixel coordinates of the current event */
@@ -4006,10 +5103,31 @@ static void bin2DtoCsum(float array[], int nx, int ny,
 
 	    /* truncate at borders of image */
 	    if (i < 0 || i >= nx || j < 0 || j >= ny)
-		continue;
+		m = -1;
+	    else
+		m = i + nx*j;
 
-	    array[i+nx*j] += epsilon[n];
+	    if (pixel != NULL)
+		pixel[n] = m;
+	    else if (m >= 0)
+		array[m] += epsilon[n];
+	}
+
+	if (pixel != NULL) {
+	    if (bandOrder(pixel, n_events, nx, ny, nt,
+			&order, &band_start) == 0) {
+		addEventsByBand(array, NULL, epsilon,
+			pixel, order, band_start, nt);
+	    } else {
+		for (n = 0;  n < n_events;  n++) {
+		    if (pixel[n] >= 0)
+			array[pixel[n]] += epsilon[n];
+		}
+	    }
 	}
+	PyMem_RawFree(pixel);
+	PyMem_RawFree(order);
+	PyMem_RawFree(band_start);
 }
 
 /* calling sequence for bin2d:
@@ -4090,6 +5208,9 @@ static PyMethodDef ccos_methods[] = {
 	{"binevents", ccos_binevents, METH_VARARGS,
 	"bin events table x & y coordinates to an image array"},
 
+	{"binevents2", ccos_binevents2, METH_VARARGS,
+	"bin events to a counts array and a weighted array in one pass"},
+
 	{"bindq", ccos_bindq, METH_VARARGS,
 	"flag regions in a 2-D array according to a DQI table"},
 
@@ -4165,6 +5286,18 @@ static PyMethodDef ccos_methods[] = {
 	{"bin2d", ccos_bin2d, METH_VARARGS,
 	    "bin (block sum) a 2-D array to a smaller 2-D array"},
 
+	{"eventcorrection", ccos_eventcorrection, METH_VARARGS,
+	    "apply tempcorr, geocorr, dgeocorr and walk to events in one pass"},
+
+	{"lookup", ccos_lookup, METH_VARARGS,
+	    "linearly interpolate in a uniformly sampled table"},
+
+	{"set_threads", ccos_set_threads, METH_VARARGS,
+	    "set the number of threads to use for the event kernels"},
+
+	{"get_threads", ccos_get_threads, METH_NOARGS,
+	    "return the number of threads used for the event kernels"},
+
 	{NULL, NULL, 0, NULL}
 };
 
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from calcos import ccos
+
+
+def run_kernels(x, y, pha, epsilon, dq):
+    """Run each threaded ccos kernel, returning all of the results."""
+    results = []
+
+    image = np.zeros((1024, 16384), dtype=np.float32)
+    ccos.binevents(x, y, image, 0, dq, 4, epsilon)
+    results.append(image)
+
+    counts = np.zeros((1024, 16384), dtype=np.float32)
+    weighted = np.zeros((1024, 16384), dtype=np.float32)
+    ccos.binevents2(x, y, counts, weighted, 0, dq, 4, epsilon)
+    results.extend([counts, weighted])
+
+    dq_array = np.zeros((1024, 16384), dtype=np.int16)
+    rng = np.random.default_rng(2)
+    lx = rng.integers(-100, 16384, 200).astype(np.int32)
+    ly = rng.integers(-10, 1024, 200).astype(np.int32)
+    ux = (lx + rng.integers(0, 2000, 200)).astype(np.int32)
+    uy = (ly + rng.integers(0, 300, 200)).astype(np.int32)
+    flag = (2 ** rng.integers(0, 14, 200)).astype(np.int32)
+    ccos.bindq(lx, ly, ux, uy, flag, dq_array, 0)
+    results.append(dq_array)
+
+    eps = epsilon.copy()
+    flat = rng.uniform(0.5, 1.5, (1024, 16384)).astype(np.float32)
+    ccos.applyflat(x, y, eps, flat)
+    results.append(eps)
+
+    (xg, yg) = (x.copy(), y.copy())
+    geo_x = rng.normal(0., 2., (64, 1024)).astype(np.float32)
+    geo_y = rng.normal(0., 2., (64, 1024)).astype(np.float32)
+    ccos.geocorrection(xg, yg, geo_x, geo_y, 1, 0, 0, 16, 16)
+    results.extend([xg, yg])
+
+    delta = np.zeros(len(x), dtype=np.float32)
+    ccos.walkcorrection(x / 16., y / 16., geo_x, delta)
+    results.append(delta)
+
+    (xe, ye) = (x.copy(), y.copy())
+    active = np.ones(len(x), dtype=np.bool_)
+    n = len(x)
+    tempcorr = (np.array([0, n // 3], dtype=np.int32),
+                np.array([n // 3, n], dtype=np.int32),
+                np.array([[1.5, 1.0001, -0.5, 0.9999],
+                          [-1.5, 0.9998, 0.5, 1.0002]]),
+                np.array([[0, 2], [1, 0]], dtype=np.int32))
+    ccos.eventcorrection(xe, ye, pha, active, (100., 900., 1000., 15000.),
+                         tempcorr, (geo_x, geo_y, 1, 0, 0, 16, 16), None,
+                         rng.normal(0., 1., (32, 16384)), None)
+    results.extend([xe, ye, active])
+
+    table = np.cumsum(rng.uniform(0., 1., 16384 * 8 + 1))
+    interpolated = np.zeros(len(x), dtype=np.float64)
+    n_outside = ccos.lookup(x, table, 0., 8., interpolated)
+    results.extend([interpolated, n_outside])
+
+    spectrum = np.zeros((41, 16384), dtype=np.float64)
+    ccos.xy_extract(x, y, spectrum, 0.001, 500., 0, dq, 4, epsilon)
+    results.append(spectrum)
+
+    csum = np.zeros((1024, 16384), dtype=np.float32)
+    ccos.csum_2d(csum, x, y, epsilon)
+    results.append(csum)
+
+    csum3 = np.zeros((32, 256, 4096), dtype=np.float32)
+    ccos.csum_3d(csum3, x, y, epsilon, pha, 4, 4)
+    results.append(csum3)
+
+    return results
+
+
+def test_threads_give_same_results():
+    # Setup
+    rng = np.random.default_rng(1)
+    nevents = 300000
+    x = rng.uniform(-10., 16394., nevents).astype(np.float32)
+    y = rng.uniform(-10., 1034., nevents).astype(np.float32)
+    # concentrate some of the events, so pixels get many counts
+    y[::3] = rng.normal(500., 5., len(y[::3]))
+    pha = rng.integers(-1, 33, nevents).astype(np.int16)
+    epsilon = rng.uniform(0.8, 1.3, nevents).astype(np.float32)
+    dq = rng.choice(np.array([0, 0, 0, 4, 8], dtype=np.int16), nevents)
+    saved = ccos.get_threads()
+    try:
+        # Test
+        ccos.set_threads(1)
+        assert ccos.get_threads() == 1
+        serial = run_kernels(x, y, pha, epsilon, dq)
+        nthreads = ccos.set_threads(4)
+        assert nthreads in (1, 4)
+        parallel = run_kernels(x, y, pha, epsilon, dq)
+    finally:
+        ccos.set_threads(saved)
+
+    # Verify
+    for (a, b) in zip(serial, parallel):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_binevents2():
+    # Setup
+    rng = np.random.default_rng(21)
+    nevents = 200000
+    x = rng.uniform(-10., 16394., nevents).astype(np.float32)
+    y = rng.normal(500., 50., nevents).astype(np.float32)
+    epsilon = rng.uniform(0.8, 1.3, nevents).astype(np.float32)
+    dq = rng.choice(np.array([0, 0, 0, 4, 8], dtype=np.int16), nevents)
+    truth_counts = np.zeros((1024, 16384), dtype=np.float32)
+    truth_weighted = np.zeros((1024, 16384), dtype=np.float32)
+    ccos.binevents(x, y, truth_counts, 100, dq, 4)
+    ccos.binevents(x, y, truth_weighted, 100, dq, 4, epsilon)
+    # nonzero initial values, which binevents2 must clear
+    counts = np.ones((1024, 16384), dtype=np.float32)
+    weighted = np.ones((1024, 16384), dtype=np.float32)
+    # Test
+    ccos.binevents2(x, y, counts, weighted, 100, dq, 4, epsilon)
+    # Verify
+    np.testing.assert_array_equal(counts, truth_counts)
+    np.testing.assert_array_equal(weighted, truth_weighted)
+    with pytest.raises(ValueError):
+        ccos.binevents2(x, y, counts, weighted[:10], 100, dq, 4, epsilon)
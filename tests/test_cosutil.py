@@ -7,6 +7,7 @@ from pathlib import Path
 import numpy as np
 import pytest
 from astropy.io import fits
+from astropy.stats import poisson_conf_interval
 
 from calcos import cosutil
 from calcos.calcosparam import MissingRowError
@@ -49,6 +50,163 @@ def test_get_table_exceptions(tmp_path):
         cosutil.getTable(name, {'Time': t}, exactly_one=True)
 
 
+def test_table_cache(tmp_path):
+    # Setup
+    name = str(tmp_path / "tableCache.fits")
+    ofd = generate_fits_file(name)
+    cache = cosutil.TableCache()
+    # Test
+    first = cache.getData(name, 1)
+    second = cache.getData(name, "EVENTS")
+    third = cache.getData(name, 1)
+    # Verify
+    np.testing.assert_array_equal(ofd[1].data, first)
+    assert third is first
+    assert second is not first
+    assert cache.hits == 1
+    assert cache.misses == 2
+    assert cache.nbytes() == 2 * first.nbytes
+
+    # a modified file must be read again
+    ofd.close()
+    with fits.open(name, mode="update") as fd:
+        fd[1].data.field("TIME")[:] = 7.
+    os.utime(name, ns=(0, 0))
+    fourth = cache.getData(name, 1)
+    assert fourth is not first
+    np.testing.assert_array_equal(fourth.field("TIME"), 7.)
+    assert cache.nbytes() == 2 * first.nbytes
+
+    # least recently used entries are discarded to stay within the limit
+    cache.setMaxBytes(first.nbytes)
+    assert cache.nbytes() == first.nbytes
+    assert cache.getData(name, 1) is fourth
+    cache.clear()
+    assert cache.nbytes() == 0
+
+
+def test_image_store(tmp_path):
+    # Setup
+    name = str(tmp_path / "imageStore.fits")
+    refcache = str(tmp_path / "refcache")
+    rng = np.random.default_rng(18)
+    image = rng.normal(size=(20, 30)).astype(np.float32)
+    hdu = fits.ImageHDU(image, name="FUVA")
+    hdu.header["origin_x"] = 12
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(name)
+    store = cosutil.ImageStore()
+    # Test
+    (direct, direct_hdr) = store.getImage(name, ("FUVA", 1))
+    store.setDirectory(refcache)
+    (data, hdr) = store.getImage(name, ("FUVA", 1))
+    (data2, hdr2) = cosutil.ImageStore(refcache).getImage(name, 1)
+    # Verify
+    np.testing.assert_array_equal(direct, image)
+    assert direct_hdr["origin_x"] == 12
+    np.testing.assert_array_equal(data, image)
+    assert data.dtype.isnative
+    assert not data.flags.writeable
+    assert hdr["origin_x"] == 12
+    assert store.getImage(name, ("FUVA", 1))[0] is data
+    np.testing.assert_array_equal(data2, image)
+    # .npy and .hdr files for two extension keys, and no temporary files
+    assert len(os.listdir(refcache)) == 4
+    assert not [f for f in os.listdir(refcache) if f.endswith(".tmp")]
+
+    # a modified file gets new copies
+    with fits.open(name, mode="update") as fd:
+        fd[1].data[:] = 7.
+    os.utime(name, ns=(0, 0))
+    (data3, hdr3) = store.getImage(name, ("FUVA", 1))
+    assert np.all(data3 == 7.)
+    assert len(os.listdir(refcache)) == 6
+
+
+def test_file_key(tmp_path):
+    # Setup
+    name = tmp_path / "ref.txt"
+    name.write_text("first")
+    os.utime(str(name), ns=(0, 0))
+
+    # Test
+    key = cosutil.fileKey(str(name))
+
+    # Verify
+    assert key[0] == os.path.abspath(str(name))
+    assert cosutil.fileKey(str(name)) == key
+    # a file that is replaced gets a new key
+    name.write_text("second")
+    assert cosutil.fileKey(str(name)) != key
+    assert cosutil.fileKey(str(tmp_path / "missing.txt")) is None
+    assert cosutil.fileKey(None) is None
+
+
+def test_image_store_memory(tmp_path):
+    # Setup
+    names = [str(tmp_path / ("image%d.fits" % i)) for i in range(3)]
+    for (i, name) in enumerate(names):
+        fits.HDUList([fits.PrimaryHDU(),
+                      fits.ImageHDU(np.full((10, 10), i, dtype=">f8"))]
+                     ).writeto(name)
+    # room for two of the 800-byte images
+    store = cosutil.ImageStore(max_nbytes=2000)
+    # Test
+    (data0, hdr0) = store.getImage(names[0], 1)
+    (data1, hdr1) = store.getImage(names[1], 1)
+    # Verify
+    assert data0.dtype.isnative
+    assert not data0.flags.writeable
+    assert store.getImage(names[0], 1)[0] is data0
+    # image1 is the least recently used, so it is discarded
+    store.getImage(names[2], 1)
+    assert store.getImage(names[0], 1)[0] is data0
+    assert store.getImage(names[1], 1)[0] is not data1
+    # a modified file is read again
+    with fits.open(names[0], mode="update") as fd:
+        fd[1].data[:] = 7.
+    os.utime(names[0], ns=(0, 0))
+    assert np.all(store.getImage(names[0], 1)[0] == 7.)
+    assert len(store._memory) == 2
+    # 0 disables the cache
+    store = cosutil.ImageStore(max_nbytes=0)
+    assert store.getImage(names[2], 1)[0] is not \
+           store.getImage(names[2], 1)[0]
+
+
+def test_get_geo_images_refcache(tmp_path, monkeypatch):
+    # Setup
+    name = str(tmp_path / "geo.fits")
+    rng = np.random.default_rng(19)
+    hdus = [fits.PrimaryHDU()]
+    for ver in [1, 2]:
+        hdu = fits.ImageHDU(rng.normal(size=(16, 64)).astype(">f4"),
+                            name="FUVA", ver=ver)
+        hdu.header["origin_x"] = 3
+        hdu.header["xbin"] = 8
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(name)
+    truth = cosutil.getGeoImages(name, "FUVA")
+    monkeypatch.setattr(cosutil, "image_store",
+                        cosutil.ImageStore(str(tmp_path / "refcache")))
+    # Test
+    test = cosutil.getGeoImages(name, "FUVA")
+    # Verify
+    for (t, u) in zip(truth, test):
+        np.testing.assert_array_equal(t, u)
+    assert not test[0].flags.writeable
+
+
+def test_get_table_returns_copy(tmp_path):
+    # Setup
+    name = str(tmp_path / "getTableCopy.fits")
+    generate_fits_file(name)
+    # Test
+    dt = cosutil.getTable(name, {})
+    dt.field("TIME")[:] = -1.
+    # Verify
+    assert np.all(cosutil.getTable(name, {}).field("TIME") != -1.)
+
+
 def test_get_col_copy(tmp_path):
     # Setup
     # create a test fits file
@@ -101,6 +259,68 @@ def test_write_output_events(tmp_path):
     assert actual_lines == lines
 
 
+def test_write_output_events_blocks(tmp_path, monkeypatch):
+    # Setup
+    in_file = str(tmp_path / "test_rawtag.fits")
+    out_file = str(tmp_path / "test_corrtag.fits")
+    rng = np.random.default_rng(16)
+    nrows = 1001
+    cols = [fits.Column(name="TIME", format="1E", unit="s",
+                        array=np.sort(rng.uniform(0., 100., nrows))),
+            fits.Column(name="RAWX", format="1I", unit="pixel",
+                        array=rng.integers(0, 16384, nrows)),
+            fits.Column(name="RAWY", format="1I", unit="pixel",
+                        array=rng.integers(0, 1024, nrows)),
+            fits.Column(name="PHA", format="1B",
+                        array=rng.integers(0, 32, nrows))]
+    primary_hdu = fits.PrimaryHDU()
+    primary_hdu.header["detector"] = "FUV"
+    gti_hdu = fits.BinTableHDU.from_columns(
+                [fits.Column(name="START", format="1D", array=[0.]),
+                 fits.Column(name="STOP", format="1D", array=[100.])],
+                name="GTI")
+    fits.HDUList([primary_hdu,
+                  fits.BinTableHDU.from_columns(cols, name="EVENTS"),
+                  gti_hdu]).writeto(in_file)
+    monkeypatch.setattr(cosutil, "EVENTS_BLOCK_SIZE", 100)
+
+    # Test
+    lines = cosutil.writeOutputEvents(in_file, out_file)
+
+    # Verify
+    assert lines == nrows
+    with fits.open(in_file) as ifd, fits.open(out_file) as ofd:
+        assert ofd[0].header["filename"] == "test_corrtag.fits"
+        indata = ifd["EVENTS"].data
+        outdata = ofd["EVENTS"].data
+        assert len(outdata) == nrows
+        for (in_name, out_name) in [("TIME", "TIME"), ("RAWX", "RAWX"),
+                                    ("RAWY", "RAWY"), ("RAWX", "XCORR"),
+                                    ("RAWY", "YCORR"), ("PHA", "PHA")]:
+            np.testing.assert_array_equal(outdata.field(out_name),
+                                          indata.field(in_name))
+        for name in ["XDOPP", "XFULL", "YFULL", "WAVELENGTH", "DQ"]:
+            assert np.all(outdata.field(name) == 0)
+        assert np.all(outdata.field("EPSILON") == 1.)
+        np.testing.assert_array_equal(ofd["GTI"].data.field("STOP"), [100.])
+
+
+def test_event_chunks(monkeypatch):
+    monkeypatch.setattr(cosutil, "chunk_size", 4)
+    assert cosutil.eventChunks(10) == [slice(0, 4), slice(4, 8),
+                                       slice(8, 10)]
+    assert cosutil.eventChunks(9, start=3) == [slice(3, 7), slice(7, 9)]
+    assert cosutil.eventChunks(3, start=3) == []
+
+
+def test_set_chunk_size(monkeypatch):
+    monkeypatch.setattr(cosutil, "chunk_size", cosutil.chunk_size)
+    cosutil.setChunkSize(1000)
+    assert cosutil.chunk_size == 1000
+    with pytest.raises(ValueError):
+        cosutil.setChunkSize(0)
+
+
 def test_concat_arrays():
     # setup
     arr1 = np.ones(10, dtype=float)
@@ -276,6 +496,28 @@ def test_err_frequentist():
     np.testing.assert_array_equal(true_upper3, upper3)
 
 
+def test_err_frequentist_table():
+    # Setup
+    rng = np.random.default_rng(3)
+    counts = rng.poisson(4., (50, 40)).astype(np.float32)
+    # values that are not in the table
+    counts[0, :4] = [2.5, 0.25, 20000., 10001.]
+    counts[1, 0] = np.nan
+
+    # Test
+    lower, upper = cosutil.errFrequentist(counts)
+
+    # Verify
+    (true_lower, true_upper) = poisson_conf_interval(
+                counts, interval='frequentist-confidence')
+    np.testing.assert_array_equal(
+            lower, (counts - true_lower).astype(np.float32))
+    np.testing.assert_array_equal(
+            upper, (true_upper - counts).astype(np.float32))
+    assert lower.dtype == np.float32
+    assert upper.dtype == np.float32
+
+
 def test_precess():
     """
     unit test for precess(t, target)
@@ -587,6 +829,25 @@ def test_print_msg():
     assert test_message == captured_msg.getvalue()[:-1]  # to remove the newline at the end
 
 
+def test_capture_messages():
+    # Setup
+    captured_msg = io.StringIO()
+    sys.stdout = captured_msg  # redirect stdout
+    cosutil.setVerbosity(1)
+    # Test
+    cosutil.captureMessages()
+    cosutil.printMsg("first")
+    cosutil.printMsg("not printed", 2)
+    cosutil.printWarning("second")
+    messages = cosutil.releaseMessages()
+    cosutil.printMsg("third")
+    sys.stdout = sys.__stdout__  # reset the redirect
+    # Verify
+    assert messages == ["first", "Warning:  second"]
+    assert captured_msg.getvalue() == "third\n"
+    assert cosutil.releaseMessages() == []
+
+
 def test_return_time():
     t = time.strftime("%d-%b-%Y %H:%M:%S %Z", time.localtime(time.time()))
     get_time = cosutil.returnTime()
@@ -0,0 +1,100 @@
+import numpy as np
+from astropy.io import fits
+
+from calcos import dispersion
+
+
+def create_disptab(name):
+    """Write a disptab with a cubic dispersion relation for FUVA G160M."""
+    cols = [
+        fits.Column(name="SEGMENT", format="4A", array=np.array(["FUVA"])),
+        fits.Column(name="OPT_ELEM", format="5A", array=np.array(["G160M"])),
+        fits.Column(name="APERTURE", format="3A", array=np.array(["PSA"])),
+        fits.Column(name="CENWAVE", format="J", array=np.array([1600])),
+        fits.Column(name="FPOFFSET", format="J", array=np.array([0])),
+        fits.Column(name="NELEM", format="J", array=np.array([4])),
+        fits.Column(name="COEFF", format="4D",
+                    array=np.array([[1580., 1.2243e-2, -1.1e-7, 2.3e-12]])),
+        fits.Column(name="DELTA", format="D", array=np.array([-3.5])),
+    ]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(name)
+    return name
+
+
+def test_dispersion_table(tmp_path):
+    # Setup
+    disptab = create_disptab(str(tmp_path / "disptab.fits"))
+    filter = {"opt_elem": "G160M", "cenwave": 1600, "segment": "FUVA",
+              "aperture": "PSA", "fpoffset": 0}
+    disp_rel = dispersion.Dispersion(disptab, filter)
+    rng = np.random.default_rng(4)
+    x = rng.uniform(-1500., 18000., 100000).astype(np.float32)
+    x[:3] = [np.nan, -1024., 17408.]
+
+    # Test
+    disp_table = dispersion.getDispersionTable(disptab, filter, 16384,
+                                               x_shift=1.5)
+    wavelength = disp_table.evalDisp(x)
+    slope = disp_table.evalDerivDisp(x)
+    ratio = disp_table.evalDispRatio(x)
+
+    # Verify
+    assert disp_table.isAccurate()
+    assert dispersion.getDispersionTable(disptab, filter, 16384,
+                                         x_shift=1.5) is disp_table
+    exact_wavelength = disp_rel.evalDisp(np.float64(x) - 1.5)
+    exact_slope = disp_rel.evalDerivDisp(np.float64(x) - 1.5)
+    (wl_error, disp_error, ratio_error) = disp_table.maxError()
+    np.testing.assert_allclose(wavelength, exact_wavelength,
+                               rtol=0., atol=wl_error * 1.001)
+    np.testing.assert_allclose(slope, exact_slope,
+                               rtol=0., atol=disp_error * 1.001)
+    np.testing.assert_allclose(ratio, exact_wavelength / exact_slope,
+                               rtol=1.e-12, atol=ratio_error * 1.001)
+    assert wl_error < 1.e-9 * 1800.
+    # outside the table, the dispersion relation is evaluated directly
+    outside = np.logical_or(x < -1024., x >= 17408.)
+    assert outside.sum() > 0
+    np.testing.assert_array_equal(wavelength[outside],
+                                  exact_wavelength[outside])
+    assert np.isnan(wavelength[0])
+
+
+def test_dispersion_table_linear(tmp_path):
+    # Setup
+    disptab = str(tmp_path / "disptab.fits")
+    cols = [fits.Column(name="SEGMENT", format="4A", array=["FUVA"]),
+            fits.Column(name="OPT_ELEM", format="5A", array=["G130M"]),
+            fits.Column(name="APERTURE", format="3A", array=["PSA"]),
+            fits.Column(name="CENWAVE", format="J", array=[1291]),
+            fits.Column(name="NELEM", format="J", array=[2]),
+            fits.Column(name="COEFF", format="2D", array=[[1130., 0.01]])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(disptab)
+    filter = {"opt_elem": "G130M", "cenwave": 1291, "segment": "FUVA",
+              "aperture": "PSA"}
+    x = np.array([-2000., 0., 1234.5, 16383.], dtype=np.float32)
+
+    # Test
+    disp_table = dispersion.getDispersionTable(disptab, filter, 16384)
+
+    # Verify
+    assert disp_table.isAccurate()
+    np.testing.assert_allclose(disp_table.evalDisp(x),
+                               1130. + 0.01 * np.float64(x),
+                               rtol=1.e-12)
+    np.testing.assert_array_equal(disp_table.evalDerivDisp(x), 0.01)
+
+
+def test_dispersion_table_missing_row(tmp_path):
+    # Setup
+    disptab = create_disptab(str(tmp_path / "disptab.fits"))
+    filter = {"opt_elem": "G130M", "cenwave": 1600, "segment": "FUVA",
+              "aperture": "PSA", "fpoffset": 0}
+
+    # Test
+    disp_table = dispersion.getDispersionTable(disptab, filter, 16384)
+
+    # Verify
+    assert disp_table is None
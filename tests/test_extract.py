@@ -1,6 +1,7 @@
 import os
 
 from calcos.x1d import *
+from calcos import ccos
 import numpy as np
 from generate_tempfiles import generate_fits_file
 
@@ -80,3 +81,170 @@ def test_add_column_comment(tmp_path):
     # Verify
     assert comment == test_table[1].header.comments['TTYPE1']
 
+
+
+def test_get_percentile_vectors():
+    # Setup
+    rng = np.random.default_rng(15)
+    profile = rng.uniform(-0.01, 1., (31, 500))
+    profile[0] = 0.
+    profile[-1] = 0.
+    profile[:, :20] = 0.
+    cumulative_profile = np.cumsum(profile / profile.sum(axis=0)
+                                   .clip(1.e-6), axis=0)
+    (p1, p2, p3, p4) = (0.01, 0.2, 0.8, 0.99)
+
+    # Test
+    (lower_outer_index, lower_inner_index, upper_inner_index,
+     upper_outer_index, enclosed_fraction, lower_outer_value,
+     lower_inner_value, upper_inner_value, upper_outer_value) = \
+        extract.getPercentileVectors(cumulative_profile, p1, p2, p3, p4)
+
+    # Verify
+    assert np.all(upper_outer_index[:20] == 0)
+    for column in range(20, 500):
+        cp = cumulative_profile[:, column]
+        assert lower_outer_index[column] == np.where(cp < p1)[0][-1]
+        assert lower_inner_index[column] == np.where(cp < p2)[0][-1]
+        assert upper_inner_index[column] == np.where(cp > p3)[0][0]
+        assert upper_outer_index[column] == np.where(cp > p4)[0][0]
+        assert upper_outer_value[column] == cp[int(upper_outer_index[column])]
+        assert enclosed_fraction[column] == \
+            upper_outer_value[column] - lower_outer_value[column]
+
+
+def test_zone_sums():
+    # Setup
+    rng = np.random.default_rng(16)
+    data = rng.normal(10., 3., (50, 300)).astype(np.float32)
+    dq = rng.choice(np.array([0, 0, 0, 4, 8, 16], dtype=np.int16), (50, 300))
+    start = rng.integers(-60, 50, 300)
+    stop = start + rng.integers(-5, 40, 300)
+
+    # Test
+    (start_n, stop_n) = extract.sliceLimits(start, stop, 50)
+    sums = extract.zoneSums(extract.columnCumsum(data), start_n, stop_n)
+    dq_or = extract.zoneBitwiseOr(dq, start_n, stop_n)
+
+    # Verify
+    for column in range(300):
+        np.testing.assert_allclose(
+            sums[column],
+            data[start[column]:stop[column], column].sum(dtype=np.float64),
+            atol=1.e-9)
+        assert dq_or[column] == \
+            np.bitwise_or.reduce(dq[start[column]:stop[column], column])
+
+
+def create_tdstab(name, nt=4, nwl=6, ref_time=52000.):
+    rng = np.random.default_rng(7)
+    maxt, maxwl = nt + 2, nwl + 3
+    segments = ["FUVA", "FUVB"]
+    cols = [fits.Column(name="SEGMENT", format="4A", array=segments),
+            fits.Column(name="OPT_ELEM", format="8A", array=["G130M"] * 2),
+            fits.Column(name="CENWAVE", format="J", array=[1291] * 2),
+            fits.Column(name="APERTURE", format="4A", array=["PSA"] * 2),
+            fits.Column(name="NWL", format="J", array=[nwl] * 2),
+            fits.Column(name="NT", format="J", array=[nt] * 2),
+            fits.Column(name="WAVELENGTH", format="%dD" % maxwl,
+                        array=np.tile(np.linspace(1100., 1450., maxwl),
+                                      (2, 1))),
+            fits.Column(name="TIME", format="%dD" % maxt,
+                        array=np.tile(np.linspace(53000., 58000., maxt),
+                                      (2, 1))),
+            fits.Column(name="SLOPE", format="%dE" % (maxt * maxwl),
+                        array=rng.uniform(-5., 0., (2, maxt * maxwl))),
+            fits.Column(name="INTERCEPT", format="%dE" % (maxt * maxwl),
+                        array=rng.uniform(0.8, 1., (2, maxt * maxwl)))]
+    hdu = fits.BinTableHDU.from_columns(cols)
+    hdu.header["REF_TIME"] = ref_time
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(name)
+    return hdu.data
+
+
+def test_get_tds_factors(tmp_path):
+    # Setup
+    tdstab = str(tmp_path / "tds.fits")
+    data = create_tdstab(tdstab)
+    row = data[1]
+    slope = row["SLOPE"].reshape(6, 9)
+    intercept = row["INTERCEPT"].reshape(6, 9)
+    filter = {"opt_elem": "G130M", "cenwave": 1291, "aperture": "PSA",
+              "segment": "FUVB"}
+
+    for t_obs in [50000., 53000., 54000., 55500., 56249., 57000., 60000.]:
+        # Test
+        (wl, factor, extrapolate) = extract.getTdsFactors(tdstab, filter,
+                                                          t_obs)
+
+        # Verify
+        # the interval that contains t_obs, using the first or last one
+        # if t_obs is outside the range of times
+        time = row["TIME"][:4]
+        i = min(max(np.count_nonzero(time <= t_obs) - 1, 0), 3)
+        delta_t = (t_obs - 52000.) / 365.25
+        np.testing.assert_array_equal(wl, row["WAVELENGTH"][:6])
+        np.testing.assert_array_equal(
+            factor, delta_t * (slope[i, :6] / 100.) + intercept[i, :6])
+        assert extrapolate == (t_obs < time[0] or t_obs >= time[-1])
+
+
+def test_do_flux_corr(tmp_path):
+    # Setup
+    tdstab = str(tmp_path / "tds.fits")
+    create_tdstab(tdstab)
+    fluxtab = str(tmp_path / "flux.fits")
+    cols = [fits.Column(name="SEGMENT", format="4A", array=["FUVA", "FUVB"]),
+            fits.Column(name="OPT_ELEM", format="8A", array=["G130M"] * 2),
+            fits.Column(name="CENWAVE", format="J", array=[1291] * 2),
+            fits.Column(name="APERTURE", format="4A", array=["PSA"] * 2),
+            fits.Column(name="WAVELENGTH", format="3D",
+                        array=[[1100., 1300., 1450.]] * 2),
+            fits.Column(name="SENSITIVITY", format="3E",
+                        array=[[1.e13, 3.e13, 2.e13], [2.e13, 0., 1.e13]])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(fluxtab)
+    rng = np.random.default_rng(8)
+    segment = ["FUVA", "FUVB", "FUVA", "FUVB", "FUVB"]
+    wavelength = np.linspace(1150., 1400., 20) + \
+                 rng.uniform(-5., 5., (5, 1))
+    net = rng.uniform(0., 10., (5, 20)).astype(np.float32)
+    error = rng.uniform(0., 1., (5, 20)).astype(np.float32)
+    cols = [fits.Column(name="SEGMENT", format="4A", array=segment),
+            fits.Column(name="WAVELENGTH", format="20D", array=wavelength),
+            fits.Column(name="NET", format="20E", array=net),
+            fits.Column(name="FLUX", format="20E",
+                        array=np.zeros((5, 20), dtype=np.float32)),
+            fits.Column(name="ERROR", format="20E", array=error),
+            fits.Column(name="ERROR_LOWER", format="20E", array=error)]
+    hdu = fits.BinTableHDU.from_columns(cols)
+    hdu.header["EXPSTART"] = 55000.
+    hdu.header["EXPEND"] = 55000.1
+    ofd = fits.HDUList([fits.PrimaryHDU(), hdu])
+    info = {"opt_elem": "G130M", "cenwave": 1291, "aperture": "PSA",
+            "fpoffset": 0}
+    reffiles = {"fluxtab": fluxtab, "tdstab": tdstab}
+
+    # Test
+    extract.doFluxCorr(ofd, info, reffiles, "PERFORM")
+
+    # Verify
+    # Compare with correcting one row at a time.
+    filter = dict(info)
+    del filter["fpoffset"]
+    for row in range(5):
+        filter["segment"] = segment[row]
+        (wl_phot, sens_phot) = extract.getFluxCurve(fluxtab, filter)
+        sens = np.zeros(20, dtype=np.float32)
+        ccos.interp1d(wl_phot, sens_phot, wavelength[row], sens)
+        sens = np.where(sens <= 0., 1., sens)
+        (wl_tds, factor_tds, extrapolate) = \
+            extract.getTdsFactors(tdstab, filter, 55000.05)
+        tds = np.zeros(20, dtype=np.float32)
+        ccos.interp1d(wl_tds, factor_tds, wavelength[row], tds)
+        np.testing.assert_array_equal(ofd[1].data["FLUX"][row],
+                                      net[row] / sens / tds)
+        np.testing.assert_array_equal(ofd[1].data["ERROR"][row],
+                                      error[row] / sens / tds)
+    assert ofd[0].header["FLUXCORR"] == "COMPLETE"
+    assert ofd[0].header["TDSCORR"] == "COMPLETE"
@@ -0,0 +1,63 @@
+import numpy as np
+
+from calcos import findshift1
+
+
+def create_shift1(xc_range, initial_offset):
+    fs1 = object.__new__(findshift1.Shift1)
+    fs1.lenxc = 2 * xc_range + 1
+    fs1.initial_offset = initial_offset
+    fs1.current_key = "FUVA"
+    fs1.spec_found = {"FUVA": True}
+    return fs1
+
+
+def create_spectra(rng, nelem, shift):
+    x = np.arange(nelem, dtype=np.float64)
+    template = np.full(nelem, 0.5)
+    for center in rng.uniform(0., nelem, 40):
+        template += rng.uniform(50., 2000.) * \
+                    np.exp(-0.5 * ((x - center) / rng.uniform(1., 3.))**2)
+    template[:7] = 0.
+    spectrum = rng.poisson(2. * np.interp(x - shift, x, template) + 1.)
+    spectrum = spectrum.astype(np.float64)
+    spectrum[:12] = 0.
+    spectrum[-20:] = 0.
+    return (spectrum, template)
+
+
+def test_scan_lags():
+    # Setup
+    rng = np.random.default_rng(14)
+    (spectrum, template) = create_spectra(rng, 4096, 13.3)
+    for (xc_range, initial_offset) in [(20, 0.), (100, 2.5), (4090, 0.)]:
+        fs1 = create_shift1(xc_range, initial_offset)
+
+        # Test
+        (rms, good) = fs1.scanLags(spectrum, template)
+
+        # Verify
+        maxlag = xc_range
+        for (i, shift) in enumerate(range(-maxlag, maxlag + 1)):
+            fs1.computeNormalization(spectrum, template,
+                                     shift + initial_offset)
+            assert good[i] == (fs1.factor is not None)
+            if good[i]:
+                np.testing.assert_allclose(rms[i], fs1.rms, rtol=1.e-6)
+
+
+def test_find_shift():
+    # Setup
+    rng = np.random.default_rng(15)
+    (spectrum, template) = create_spectra(rng, 16384, -31.6)
+    fs1 = create_shift1(100, 0.)
+
+    # Test
+    (shift, orig_shift1, scatter, foundit) = fs1.findShift(spectrum,
+                                                           template)
+
+    # Verify
+    assert foundit
+    assert shift == orig_shift1
+    assert abs(shift - (-31.6)) < 0.1
+    assert scatter < 0.5
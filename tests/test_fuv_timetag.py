@@ -1,6 +1,9 @@
 """Tests for COS/FUV timetag."""
 
+import os
+
 import pytest
+from astropy.io.fits import FITSDiff
 
 import calcos
 from helpers import BaseCOS
@@ -44,3 +47,32 @@ class TestFUVTimetag(BaseCOS):
                 comparison_name = 'ref_' + fname
                 outputs.append((fname, comparison_name))
         self.compare_outputs(outputs, rtol=3e-7)
+
+    def test_fuv_timetag_jobs(self):
+        """
+        FUV tagflash exposures give the same output with --jobs 2
+        """
+        files_to_download = ['lckg01070_asn.fits', 'lckg01czq_spt.fits',
+                             'lckg01d4q_spt.fits', 'lckg01d9q_spt.fits',
+                             'lckg01dcq_spt.fits']
+
+        # Prepare input files.
+        self.get_input_files(files_to_download)
+
+        # Run CALCOS serially and with two jobs.
+        input_file = 'lckg01070_asn.fits'
+        calcos.calcos(input_file, outdir='serial')
+        calcos.calcos(input_file, outdir='parallel', jobs=2)
+
+        # Compare results.
+        outroots = ['lckg01czq', 'lckg01d4q', 'lckg01d9q', 'lckg01dcq']
+        diffs = []
+        for outroot in outroots:
+            for sfx in ('corrtag_a', 'corrtag_b', 'lampflash', 'x1d'):
+                fname = '{}_{}.fits'.format(outroot, sfx)
+                diff = FITSDiff(os.path.join('parallel', fname),
+                                os.path.join('serial', fname),
+                                ignore_keywords=self.ignore_keywords)
+                if not diff.identical:
+                    diffs.append(diff.report())
+        assert not diffs, '\n'.join(diffs)
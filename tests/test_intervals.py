@@ -0,0 +1,133 @@
+import numpy as np
+
+from calcos import ccos
+from calcos import cosutil
+from calcos import intervals
+
+
+def test_range_indices():
+    # Setup
+    rng = np.random.default_rng(11)
+    time = np.sort(rng.uniform(0., 100., 2000)).astype(np.float32)
+    t0 = rng.uniform(-10., 110., 300)
+    t1 = t0 + rng.uniform(0., 20., 300)
+
+    # Test
+    (i0, i1, no_overlap) = intervals.rangeIndices(time, t0, t1)
+
+    # Verify
+    for i in range(len(t0)):
+        try:
+            indices = ccos.range(time, t0[i], t1[i])
+        except RuntimeError:
+            assert no_overlap[i]
+            continue
+        assert not no_overlap[i]
+        assert (i0[i], i1[i]) == indices
+
+
+def test_merged():
+    # Setup
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("badt", [[50., 60.], [10., 20.], [15., 30.]])
+    bad_intervals.add("burst", [[30., 35.], [70., 70.]])
+
+    # Test
+    (start, stop) = bad_intervals.merged(["badt", "burst"])
+
+    # Verify
+    np.testing.assert_array_equal(start, [10., 50., 70.])
+    np.testing.assert_array_equal(stop, [35., 60., 70.])
+
+
+def test_flag_events():
+    # Setup
+    rng = np.random.default_rng(12)
+    time = np.sort(rng.uniform(0., 1000., 50000)).astype(np.float32)
+    badt = [[s, s + rng.uniform(0., 50.)]
+            for s in rng.uniform(-100., 1100., 40)]
+    badt.append([time[100], time[100]])
+    dq = rng.choice(np.array([0, 4, 2048], dtype=np.int16), len(time))
+    expected = dq.copy()
+    for (start, stop) in badt:
+        expected |= np.where(np.logical_and(time >= start, time <= stop),
+                             2048, 0).astype(np.int16)
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("badt", badt)
+
+    # Test
+    bad_intervals.flagEvents(time, dq, 2048, "badt")
+
+    # Verify
+    np.testing.assert_array_equal(dq, expected)
+
+
+def test_count_events():
+    # Setup
+    time = np.arange(0., 100., 0.5, dtype=np.float32)
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("badt", [[-10., 5.], [20., 30.], [25., 30.],
+                               [98., 150.], [200., 300.]])
+
+    # Test
+    (n_events, exptime) = bad_intervals.countEvents(time, "badt",
+                                                    t_min=time[0],
+                                                    t_max=time[-1])
+
+    # Verify
+    assert n_events == 10 + 20 + 10 + 4
+    assert exptime == 5. + 10. + 5. + 1.5
+
+
+def test_subtract_from():
+    # Setup
+    gti = [[0., 100.], [200., 300.], [400., 500.]]
+    bad_intervals = intervals.TimeIntervals()
+    bad_intervals.add("burst", [[10., 20.], [190., 210.]])
+    bad_intervals.add("badt", [[15., 30.], [50., 60.], [390., 510.]])
+
+    # Test
+    (modified, new_gti) = bad_intervals.subtractFrom(gti, ["burst", "badt"])
+    (unmodified, same_gti) = bad_intervals.subtractFrom(gti, "gti")
+
+    # Verify
+    assert modified
+    assert new_gti == [[0., 10.], [30., 50.], [60., 100.], [210., 300.]]
+    assert not unmodified
+    assert same_gti == gti
+
+
+def test_subtract_from_dropped_gti():
+    # Setup
+    gti = [[0., 100.], [200., 300.]]
+    bad_intervals = intervals.TimeIntervals()
+    # The first bad interval covers the second GTI, so the later one that
+    # only overlaps part of it has no effect.
+    bad_intervals.add("badt", [[150., 350.], [250., 260.]])
+    bad_intervals.add("burst", [[50., 60.]])
+
+    # Test
+    (dropped, dropped_gti) = bad_intervals.subtractFrom(gti, "badt")
+    (modified, new_gti) = bad_intervals.subtractFrom(gti, ["badt", "burst"])
+
+    # Verify
+    # Dropping a whole GTI does not count as a change, as in recomputeGTI.
+    assert not dropped
+    assert dropped_gti == [[0., 100.]]
+    assert modified
+    assert new_gti == [[0., 50.], [60., 100.]]
+
+
+def test_search_sorted(monkeypatch):
+    # Setup
+    rng = np.random.default_rng(17)
+    time = np.sort(rng.uniform(0., 100., 1000)).astype(">f4")
+    time[500:520] = time[500]           # repeated times
+    values = np.concatenate([rng.uniform(-10., 110., 200), time[495:525]])
+    monkeypatch.setattr(cosutil, "chunk_size", 37)
+
+    # Test and verify
+    for side in ["left", "right"]:
+        truth = np.searchsorted(time.astype(np.float64), values, side=side)
+        test = intervals.searchSorted(time, values, side=side)
+        np.testing.assert_array_equal(truth, test)
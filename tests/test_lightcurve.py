@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from calcos import cosutil
+from calcos import lightcurve
+from calcos.calcosparam import DQ_BURST, DQ_BAD_TIME
+
+SEGMENT = "FUVA"
+
+
+def create_disptab(name):
+    cols = [fits.Column(name="SEGMENT", format="4A", array=[SEGMENT]),
+            fits.Column(name="OPT_ELEM", format="8A", array=["G130M"]),
+            fits.Column(name="APERTURE", format="4A", array=["PSA"]),
+            fits.Column(name="CENWAVE", format="J", array=[1291]),
+            fits.Column(name="FPOFFSET", format="J", array=[0]),
+            fits.Column(name="NELEM", format="J", array=[2]),
+            fits.Column(name="COEFF", format="2D", array=[[1130., 0.01]])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(name)
+
+
+def create_xtractab(name, b_spec_wca):
+    cols = [fits.Column(name="SEGMENT", format="4A", array=[SEGMENT] * 2),
+            fits.Column(name="OPT_ELEM", format="8A", array=["G130M"] * 2),
+            fits.Column(name="CENWAVE", format="J", array=[1291] * 2),
+            fits.Column(name="APERTURE", format="4A", array=["PSA", "WCA"]),
+            fits.Column(name="SLOPE", format="E", array=[0.001, 0.]),
+            fits.Column(name="B_SPEC", format="E",
+                        array=[500., b_spec_wca]),
+            fits.Column(name="HEIGHT", format="J", array=[25, 25]),
+            fits.Column(name="B_BKG1", format="E", array=[440., 640.]),
+            fits.Column(name="B_BKG2", format="E", array=[530., 560.]),
+            fits.Column(name="BHEIGHT", format="J", array=[20, 20]),
+            fits.Column(name="BWIDTH", format="J", array=[101, 101])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(name)
+
+
+def create_corrtag(name, xtractab, disptab, boundary, nevents=50000,
+                   seed=4):
+    rng = np.random.default_rng(seed)
+    time = np.sort(rng.uniform(0., 1000., nevents))
+    xfull = rng.uniform(1000., 15000., nevents)
+    yfull = rng.uniform(420., 620., nevents)
+    dq = np.where(rng.uniform(size=nevents) < 0.02, DQ_BURST, 0)
+    dq[(time > 850.) & (time < 870.)] |= DQ_BAD_TIME
+    phdr = fits.Header()
+    for (key, value) in [("INSTRUME", "COS"), ("DETECTOR", "FUV"),
+                         ("SEGMENT", SEGMENT), ("OBSTYPE", "SPECTROSCOPIC"),
+                         ("OBSMODE", "TIME-TAG"), ("EXPTYPE", "EXTERNAL/SCI"),
+                         ("OPT_ELEM", "G130M"), ("CENWAVE", 1291),
+                         ("APERTURE", "PSA"), ("FPPOS", 3),
+                         ("WAVECORR", "COMPLETE"), ("XTRCTALG", "BOXCAR"),
+                         ("XTRACTAB", xtractab), ("DISPTAB", disptab)]:
+        phdr[key] = value
+    events = fits.BinTableHDU.from_columns(
+        [fits.Column(name="TIME", format="E", unit="s", array=time),
+         fits.Column(name="XFULL", format="E", array=xfull),
+         fits.Column(name="YFULL", format="E", array=yfull),
+         fits.Column(name="DQ", format="I", array=dq),
+         fits.Column(name="EPSILON", format="E",
+                     array=rng.uniform(0.9, 1.2, nevents)),
+         fits.Column(name="WAVELENGTH", format="E",
+                     array=np.where(yfull < boundary, 1130. + 0.01 * xfull,
+                                    0.))],
+        name="EVENTS")
+    for (key, value) in [("EXPSTART", 55000.), ("EXPEND", 55000.01157),
+                         ("EXPTIME", 780.)]:
+        events.header[key] = value
+    gti = fits.BinTableHDU.from_columns(
+        [fits.Column(name="START", format="D", array=[0., 600.]),
+         fits.Column(name="STOP", format="D", array=[400., 980.])],
+        name="GTI")
+    fits.HDUList([fits.PrimaryHDU(header=phdr), events, gti]).writeto(name)
+
+
+# With the WCA at 540, the upper background box (530 +/- 10) extends
+# beyond the midpoint between the PSA and WCA, where timetag assigns no
+# wavelengths.
+@pytest.mark.parametrize("b_spec_wca", [600., 540.])
+def test_light_curve(tmp_path, b_spec_wca):
+    # Setup
+    cosutil.setVerbosity(0)
+    xtractab = str(tmp_path / "xtractab.fits")
+    create_xtractab(xtractab, b_spec_wca)
+    disptab = str(tmp_path / "disptab.fits")
+    create_disptab(disptab)
+    corrtag = str(tmp_path / "abc_corrtag_a.fits")
+    create_corrtag(corrtag, xtractab, disptab, (500. + b_spec_wca) / 2.)
+    bands = [(1150., 1200.), (1180., 1250.), (1130., 1300.)]
+    output = str(tmp_path / "abc_lc.fits")
+
+    # Test
+    ofd = lightcurve.lightCurve(corrtag, 75., bands=bands, output=output,
+                                verbosity=0)
+
+    # Verify
+    # Compare with selecting the events for each bin and band separately.
+    with fits.open(corrtag) as fd:
+        events = fd["EVENTS"].data
+        time = events["TIME"]
+        xfull = events["XFULL"].astype(np.float64)
+        yfull = events["YFULL"].astype(np.float64)
+        wavelength = events["WAVELENGTH"]
+        epsilon = events["EPSILON"]
+        ok = (events["DQ"] & (DQ_BURST | DQ_BAD_TIME)) == 0
+    ok &= (time < 400.) | ((time >= 600.) & (time < 980.))
+
+    def in_box(center, height):
+        j = np.floor(yfull - (center - height // 2 + 0.001 * xfull) + 0.5)
+        return (j >= 0) & (j < height)
+
+    source = in_box(500., 25)
+    background = (in_box(440., 20) | in_box(530., 20)) & ~source
+    bkg_norm = 25. / 40.
+    # Background wavelengths come from the dispersion relation.
+    wavelength = np.where(background,
+                          (1130. + 0.01 * xfull).astype(np.float32),
+                          wavelength)
+    if b_spec_wca == 540.:
+        assert np.any(background & (events["WAVELENGTH"] == 0.))
+
+    data = ofd["LIGHTCURVE"].data
+    assert len(data) == 14                      # 0 to 980 s
+    assert data["STOP"][-1] == 980.
+    np.testing.assert_allclose(
+        data["EXPTIME"], [75.] * 5 + [25., 0., 0.] + [75.] * 5 + [5.])
+    for (k, (t0, t1)) in enumerate(zip(data["START"], data["STOP"])):
+        for (b, (w0, w1)) in enumerate(bands):
+            select = ok & (time >= t0) & (time < t1) & \
+                     (wavelength >= w0) & (wavelength < w1)
+            assert data["COUNTS"][k, b] == np.count_nonzero(select & source)
+            assert data["BKG_COUNTS"][k, b] == \
+                   np.count_nonzero(select & background)
+            if data["EXPTIME"][k] > 0.:
+                exptime = data["EXPTIME"][k]
+                gross = epsilon[select & source].sum() / exptime
+                bkg = epsilon[select & background].sum() * bkg_norm / exptime
+            else:
+                (gross, bkg) = (0., 0.)
+            assert data["GROSS"][k, b] == pytest.approx(gross, rel=1.e-6)
+            assert data["BACKGROUND"][k, b] == pytest.approx(bkg, rel=1.e-6)
+    np.testing.assert_allclose(data["NET"], data["GROSS"] - data["BACKGROUND"],
+                               atol=1.e-6)
+    assert data["COUNTS"][6:8].sum() == 0
+    assert ofd["BANDS"].data["WAVE_MIN"].tolist() == [1150., 1180., 1130.]
+    with fits.open(output) as fd:
+        assert fd["LIGHTCURVE"].header["NBANDS"] == 3
+
+
+def test_bin_exptime():
+    bin_start = np.array([0., 10., 20., 30.])
+    bin_stop = bin_start + 10.
+
+    exptime = lightcurve.binExptime(bin_start, bin_stop,
+                                    np.array([5., 18., 32.]),
+                                    np.array([12., 22., 35.]))
+
+    np.testing.assert_allclose(exptime, [5., 4., 2., 3.])
@@ -0,0 +1,214 @@
+"""Tests for calibrating exposures in parallel (the --jobs option)."""
+
+import os
+import time
+import types
+
+import pytest
+from astropy.io import fits
+
+from calcos.calcos import Calibration
+from calcos import ccos
+from calcos import cosutil
+
+
+class FakeObservation:
+    """Just enough of calcos.Observation for Calibration.calibrateAll."""
+
+    def __init__(self, root, segment, outdir, lamptab):
+        self.info = {"root": root, "segment": segment, "tagflash": True,
+                     "opt_elem": "G140L", "cenwave": 1105}
+        self.switches = {"wavecorr": "PERFORM"}
+        self.reffiles = {"lamptab": lamptab}
+        self.filenames = {"trl": os.path.join(outdir, root + ".tra"),
+                          "out": os.path.join(outdir, "%s_%s.txt"
+                                              % (root, segment))}
+
+    def openTrailer(self):
+        cosutil.openTrailer(self.filenames["trl"])
+
+    def closeTrailer(self):
+        cosutil.closeTrailer()
+
+
+class FakeCalibration(Calibration):
+    """Calibration methods that write small files and print messages."""
+
+    def __init__(self, obs_list, jobs, delays=None, fail=None, threads=None):
+        self.delays = delays or {}
+        self.fail = fail
+        self.assoc = types.SimpleNamespace(
+            obs=obs_list,
+            cl_args={"jobs": jobs, "threads": threads, "stimfile": None,
+                     "livetimefile": None, "burstfile": None,
+                     "refcache": None})
+
+    def prepareFake(self, obs):
+        cosutil.printMsg("prepare %s %s" % (obs.info["root"],
+                                            obs.info["segment"]))
+
+    def calibrateFake(self, obs):
+        root = obs.info["root"]
+        segment = obs.info["segment"]
+        cosutil.printMsg("calibrate %s %s" % (root, segment))
+        time.sleep(self.delays.get(root, 0.))
+        if root == self.fail:
+            raise RuntimeError("can't calibrate %s" % root)
+        other = [o for o in self.assoc.obs
+                 if o.info["root"] == root and o is not obs][0]
+        if segment == "FUVA":
+            if not self.segmentBNeedsA(other):
+                # Segment B is calibrated at the same time.
+                t0 = time.time()
+                while not os.path.exists(other.filenames["out"]):
+                    if time.time() - t0 > 10.:
+                        raise RuntimeError("%s FUVB was not started" % root)
+                    time.sleep(0.01)
+            # Segment A writes its output slowly.
+            time.sleep(0.3)
+            with open(obs.filenames["out"], "w") as fd:
+                fd.write("output for %s\n" % root)
+        elif self.segmentBNeedsA(obs):
+            # Segment B copies the output for segment A, as
+            # concurrent.copySegAtoSegB does for a tagflash exposure
+            # with no wavecal signal for segment B.
+            with open(other.filenames["out"]) as fd:
+                text = fd.read()
+            with open(obs.filenames["out"], "w") as fd:
+                fd.write(text)
+        else:
+            with open(obs.filenames["out"], "w") as fd:
+                fd.write("segment B output for %s\n" % root)
+        obs.info["done"] = True
+        return (root, segment)
+
+    def calibrateThreads(self, obs):
+        return ccos.get_threads()
+
+
+def create_lamptab(name, has_lines_b):
+    cols = [fits.Column(name="OPT_ELEM", format="8A", array=["G140L"] * 2),
+            fits.Column(name="CENWAVE", format="J", array=[1105] * 2),
+            fits.Column(name="SEGMENT", format="4A", array=["FUVA", "FUVB"]),
+            fits.Column(name="HAS_LINES", format="L",
+                        array=[True, has_lines_b])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(name)
+
+
+def make_observations(tmp_path, roots, has_lines_b=False):
+    lamptab = str(tmp_path / "lamptab.fits")
+    if not os.path.exists(lamptab):
+        create_lamptab(lamptab, has_lines_b)
+    return [FakeObservation(root, segment, str(tmp_path), lamptab)
+            for root in roots for segment in ["FUVA", "FUVB"]]
+
+
+def test_job_groups(tmp_path):
+    obs_list = make_observations(tmp_path, ["abc", "def"])
+    obs_list[3].info["tagflash"] = False
+    cal = FakeCalibration(obs_list, jobs=4)
+
+    assert cal.jobGroups(obs_list) == [[0, 1], [2], [3]]
+
+
+def test_segments_in_parallel(tmp_path):
+    # Setup
+    cosutil.setVerbosity(1)
+    obs_list = make_observations(tmp_path, ["abc"], has_lines_b=True)
+    cal = FakeCalibration(obs_list, jobs=2)
+
+    # Test
+    results = cal.calibrateAll(obs_list, "prepareFake", "calibrateFake")
+
+    # Verify
+    # Segment A waited for segment B to write its output.
+    assert results == [("abc", "FUVA"), ("abc", "FUVB")]
+    with open(str(tmp_path / "abc_FUVB.txt")) as fd:
+        assert fd.read() == "segment B output for abc\n"
+
+
+def test_segment_b_after_segment_a(tmp_path):
+    # Setup
+    cosutil.setVerbosity(1)
+    obs_list = make_observations(tmp_path, ["abc", "def"])
+    cal = FakeCalibration(obs_list, jobs=4)
+
+    # Test
+    results = cal.calibrateAll(obs_list, "prepareFake", "calibrateFake")
+
+    # Verify
+    # With no wavecal signal for segment B, segment B always found the
+    # complete output for segment A.
+    assert results == [("abc", "FUVA"), ("abc", "FUVB"),
+                       ("def", "FUVA"), ("def", "FUVB")]
+    for root in ["abc", "def"]:
+        with open(str(tmp_path / ("%s_FUVB.txt" % root))) as fd:
+            assert fd.read() == "output for %s\n" % root
+    # info was updated from the worker processes
+    assert all(obs.info["done"] for obs in obs_list)
+
+
+def test_messages_in_order(tmp_path, capsys):
+    # Setup
+    cosutil.setVerbosity(1)
+    cosutil.setWriteToTrailer(True)
+    obs_list = make_observations(tmp_path, ["abc", "def", "ghi"])
+    # The first exposure finishes last.
+    cal = FakeCalibration(obs_list, jobs=3, delays={"abc": 1.})
+
+    # Test
+    cal.calibrateAll(obs_list, "prepareFake", "calibrateFake")
+
+    # Verify
+    expected = []
+    for obs in obs_list:
+        expected += ["prepare %s %s" % (obs.info["root"], obs.info["segment"]),
+                     "calibrate %s %s" % (obs.info["root"],
+                                          obs.info["segment"])]
+    assert capsys.readouterr().out.splitlines() == expected
+    for (k, root) in enumerate(["abc", "def", "ghi"]):
+        with open(str(tmp_path / (root + ".tra"))) as fd:
+            assert fd.read().splitlines() == expected[4 * k:4 * k + 4]
+
+
+def test_error_in_job(tmp_path, capsys):
+    # Setup
+    cosutil.setVerbosity(1)
+    cosutil.setWriteToTrailer(True)
+    obs_list = make_observations(tmp_path, ["abc", "def", "ghi"])
+    cal = FakeCalibration(obs_list, jobs=2, fail="def")
+
+    # Test
+    with pytest.raises(RuntimeError, match="can't calibrate def"):
+        cal.calibrateAll(obs_list, "prepareFake", "calibrateFake")
+
+    # Verify
+    # The messages up to the failure were copied, and the second segment
+    # of the failed exposure was not calibrated.
+    assert capsys.readouterr().out.splitlines() == [
+        "prepare abc FUVA", "calibrate abc FUVA",
+        "prepare abc FUVB", "calibrate abc FUVB",
+        "prepare def FUVA", "calibrate def FUVA"]
+    with open(str(tmp_path / "def.tra")) as fd:
+        assert fd.read().splitlines() == ["prepare def FUVA",
+                                          "calibrate def FUVA"]
+    assert not os.path.exists(str(tmp_path / "def_FUVB.txt"))
+
+
+def test_threads_in_job(tmp_path):
+    # Setup
+    cosutil.setVerbosity(1)
+    obs_list = make_observations(tmp_path, ["abc", "def"])
+    cal = FakeCalibration(obs_list, jobs=2, threads=2)
+    # 1 if ccos was not compiled with OpenMP
+    n_threads = ccos.set_threads(2)
+    ccos.set_threads(1)
+
+    # Test
+    results = cal.calibrateAll(obs_list, "prepareFake", "calibrateThreads")
+
+    # Verify
+    # The worker processes use the number of threads that was specified.
+    assert results == [n_threads] * 4
+    assert ccos.get_threads() == 1
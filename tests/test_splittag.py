@@ -0,0 +1,143 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from calcos import splittag
+
+
+def create_corrtag(name, nevents=2000, seed=1):
+    rng = np.random.default_rng(seed)
+    # a gap with no events from 400 to 600 s
+    time = np.sort(np.concatenate(
+        [rng.uniform(0., 400., nevents // 2),
+         rng.uniform(600., 1000., nevents - nevents // 2)]))
+    phdr = fits.Header()
+    phdr["DETECTOR"] = "FUV"
+    phdr["SEGMENT"] = "FUVA"
+    phdr["WAVECORR"] = "COMPLETE"
+    events = fits.BinTableHDU.from_columns(
+        [fits.Column(name="TIME", format="E", unit="s", array=time),
+         fits.Column(name="XFULL", format="E",
+                     array=rng.uniform(0., 16384., nevents)),
+         fits.Column(name="DQ", format="I",
+                     array=rng.integers(0, 4, nevents))],
+        name="EVENTS")
+    events.header["EXPSTART"] = 55000.
+    events.header["EXPEND"] = 55000. + 1000. / splittag.SEC_PER_DAY
+    events.header["EXPTIME"] = 1000.
+    gti = fits.BinTableHDU.from_columns(
+        [fits.Column(name="START", format="D", array=[0., 600.]),
+         fits.Column(name="STOP", format="D", array=[400., 1000.])],
+        name="GTI")
+    timeline_time = np.arange(0., 1001., dtype=np.float32)
+    timeline = fits.BinTableHDU.from_columns(
+        [fits.Column(name="TIME", format="E", array=timeline_time),
+         fits.Column(name="SUN_ALT", format="E",
+                     array=np.cos(timeline_time / 100.))],
+        name="TIMELINE")
+    fits.HDUList([fits.PrimaryHDU(header=phdr), events, gti,
+                  timeline]).writeto(name)
+    return time
+
+
+def test_slice_indices():
+    time = np.sort(np.random.default_rng(3).uniform(0., 100., 500))
+    time[100:110] = time[100]           # repeated times
+    time_list = [(0., 10.), (10., 10.5), (time[100], 50.), (50., 150.),
+                 (20., 15.), (time[-1], 200.)]
+
+    (first, last) = splittag.sliceIndices(time, time_list)
+
+    for (k, (t0, t1)) in enumerate(time_list):
+        assert (first[k], last[k]) == splittag.determineSlice(time, t0, t1)
+
+
+def test_split_one_tag(tmp_path):
+    # Setup
+    input = str(tmp_path / "abc_corrtag_a.fits")
+    time = create_corrtag(input)
+    outroot = str(tmp_path / "out")
+
+    # Test
+    plan = splittag.splitOneTag(input, outroot, increment=100., verbosity=0,
+                                max_writers=2, max_open_files=3)
+
+    # Verify
+    # 10 intervals, but none of the events are in 400 to 500 or 500 to 600
+    assert len(plan) == 8
+    with fits.open(input) as ifd:
+        in_events = ifd["EVENTS"].data
+        in_time = in_events["TIME"]
+        for (k, (filename, t0, t1, i, j)) in enumerate(plan):
+            assert filename == "%s_%d_corrtag_a.fits" % (outroot, k + 1)
+            # the last interval ends at (and includes) the last event
+            assert np.all(in_time[i:j] >= t0)
+            assert np.all((in_time[i:j] < t1) | (j == len(time)))
+            with fits.open(filename) as ofd:
+                events = ofd["EVENTS"]
+                np.testing.assert_array_equal(events.data, in_events[i:j])
+                assert events.header["NEVENTS"] == j - i
+                assert events.header["NEVENTSA"] == j - i
+                assert events.header["EXPTIME"] == pytest.approx(t1 - t0)
+                timeline = ofd["TIMELINE"].data
+                assert timeline["TIME"][0] == t0
+                assert timeline["TIME"][-1] == np.ceil(t1)
+                assert len(ofd[0].header["HISTORY"]) == 2
+    assert sum(j - i for (filename, t0, t1, i, j) in plan) == len(time)
+
+
+def test_split_one_tag_messages(tmp_path, monkeypatch, capsys):
+    # Setup
+    input = str(tmp_path / "abc_corrtag_a.fits")
+    create_corrtag(input)
+    outroot = str(tmp_path / "out")
+    write_one_slice = splittag.writeOneSlice
+
+    def slow_write(filename, blocks):
+        # The first files take the longest to write.
+        k = int(filename[len(outroot) + 1:].split("_")[0])
+        time.sleep(0.05 * (8 - k))
+        return write_one_slice(filename, blocks)
+
+    monkeypatch.setattr(splittag, "writeOneSlice", slow_write)
+
+    # Test
+    plan = splittag.splitOneTag(input, outroot, increment=100., verbosity=1,
+                                max_writers=4, max_open_files=5)
+
+    # Verify
+    # The files are reported in the order of the slices.
+    written = [line for line in capsys.readouterr().out.splitlines()
+               if line.endswith(" written")]
+    assert written == ["%s written" % filename
+                       for (filename, t0, t1, i, j) in plan]
+
+
+def test_split_one_tag_dry_run(tmp_path):
+    input = str(tmp_path / "abc_corrtag_a.fits")
+    create_corrtag(input)
+    outroot = str(tmp_path / "out")
+
+    plan = splittag.splitOneTag(input, outroot, time_list="start 450 stop",
+                                verbosity=0, dry_run=True)
+
+    assert [(t0, i) for (filename, t0, t1, i, j) in plan] == \
+           [(0., 0), (450., 1000)]
+    assert plan[1][4] == 2000
+    assert sorted(os.listdir(str(tmp_path))) == ["abc_corrtag_a.fits"]
+
+
+def test_new_gti():
+    gti = splittag.TableSlicer(fits.BinTableHDU.from_columns(
+        [fits.Column(name="START", format="D", array=[0., 600.]),
+         fits.Column(name="STOP", format="D", array=[400., 1000.])]))
+    no_gti = splittag.TableSlicer(None, splittag.defaultGTI())
+
+    assert splittag.newGTI(gti, 300., 700.).tolist() == \
+           [(300., 400.), (600., 700.)]
+    assert splittag.newGTI(gti, 450., 550.).tolist() == [(0., 0.)]
+    assert splittag.newGTI(no_gti, 450., 550.).tolist() == [(450., 550.)]
+    assert no_gti.header(1)["EXTNAME"] == "GTI"
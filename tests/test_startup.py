@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import calcos
+
+# Modules that are slow to import and that calcos only needs for some
+# calibration steps; importing calcos must not import them.
+LAZY_MODULES = ("scipy", "astropy.stats", "concurrent.futures",
+                "calcos.accum", "calcos.average", "calcos.extract",
+                "calcos.fpavg", "calcos.spwcs", "calcos.timeline",
+                "calcos.timetag", "calcos.wavecal")
+
+# Importing calcos may take at most this much longer (seconds) than
+# importing numpy and astropy.io.fits, which calcos always needs.  Before
+# the slow modules were imported lazily, the difference was about 1.3 s.
+MAX_STARTUP_OVERHEAD = 0.5
+
+
+def run_python(statement):
+    """Run a statement in a new Python process; return the elapsed time."""
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.dirname(calcos.__file__))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [package_dir] + [p for p in [env.get("PYTHONPATH")] if p])
+    t0 = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", statement], env=env,
+                            capture_output=True, text=True, check=True)
+    return (time.perf_counter() - t0, result.stdout)
+
+
+def test_import_is_lazy():
+    (elapsed, stdout) = run_python(
+        "import sys, calcos; "
+        "print(' '.join(m for m in sys.modules if m.startswith(%r)))"
+        % (LAZY_MODULES,))
+    assert stdout.split() == []
+
+
+# The elapsed time depends on the machine and on its load, so this is
+# only run with --slow; test_import_is_lazy is the regression check.
+@pytest.mark.slow
+def test_startup_time():
+    # best of several runs, to reduce the effect of other processes
+    baseline = min(run_python("import numpy; from astropy.io import fits")[0]
+                   for i in range(3))
+    startup = min(run_python("import calcos")[0] for i in range(3))
+    assert startup - baseline < MAX_STARTUP_OVERHEAD
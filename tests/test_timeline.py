@@ -0,0 +1,95 @@
+import numpy as np
+
+from calcos import ccos
+from calcos import orbit
+from calcos import timeline
+
+
+def create_orbit():
+    # Approximate HST orbital elements; these are normally read from the
+    # primary header of the spt file.
+    orb = object.__new__(orbit.HSTOrbit)
+    eccentry = 3.e-4
+    orb.argperig = 0.3
+    orb.cirveloc = 7590.
+    orb.cosincli = 0.877
+    orb.ecbdx3 = 3. * eccentry**3
+    orb.eccentry = eccentry
+    orb.eccentx2 = 2. * eccentry
+    orb.ecbdx4d3 = 4. / 3. * eccentry**3
+    orb.epchtime = 7.9e8
+    orb.esqdx5d2 = 2.5 * eccentry**2
+    orb.fdmeanan = 1.75e-4
+    orb.hsthorb = 2850.
+    orb.meananom = 1.2
+    orb.rascascn = 0.45
+    orb.rcargper = -1.e-8
+    orb.rcascnrv = -9.e-8
+    orb.sdmeanan = 1.e-17
+    orb.semilrec = 6.92e6
+    orb.sineincl = 0.4799
+    return orb
+
+
+def test_get_pos_array():
+    # Setup
+    orb = create_orbit()
+    mjd = 55500.123 + np.arange(0., 6000., 37.) / timeline.SEC_PER_DAY
+    rect_targ = timeline.sphToRect((1., 2.6, -0.5))
+
+    # Test
+    (rect_hst, vel_hst) = orb.getPos(mjd)
+    rect_sun = timeline.eqSun(mjd)
+    sph = timeline.rectToSph(rect_hst)
+    sun_alt = timeline.computeAlt(rect_sun, rect_hst, parallax=True)
+    sun_zd = timeline.computeZD(rect_sun, rect_hst)
+    radial_vel = timeline.dotProduct(rect_targ, vel_hst)
+    target_alt = timeline.computeAlt(rect_targ, rect_hst, parallax=False)
+
+    # Verify
+    assert rect_hst.shape == (3, len(mjd))
+    assert vel_hst.shape == (3, len(mjd))
+    for i in range(len(mjd)):
+        (rect_i, vel_i) = orb.getPos(mjd[i])
+        rect_sun_i = timeline.eqSun(mjd[i])
+        np.testing.assert_allclose(rect_hst[:, i], rect_i, rtol=1.e-12)
+        np.testing.assert_allclose(vel_hst[:, i], vel_i, rtol=1.e-12)
+        np.testing.assert_allclose(rect_sun[:, i], rect_sun_i, rtol=1.e-12)
+        np.testing.assert_allclose(sph[:, i], timeline.rectToSph(rect_i),
+                                   rtol=1.e-12)
+        np.testing.assert_allclose(
+            sun_alt[i], timeline.computeAlt(rect_sun_i, rect_i,
+                                            parallax=True), rtol=1.e-12)
+        np.testing.assert_allclose(
+            sun_zd[i], timeline.computeZD(rect_sun_i, rect_i), rtol=1.e-12)
+        np.testing.assert_allclose(
+            radial_vel[i], timeline.dotProduct(rect_targ, vel_i),
+            rtol=1.e-12)
+        np.testing.assert_allclose(
+            target_alt[i], timeline.computeAlt(rect_targ, rect_i,
+                                               parallax=False), rtol=1.e-12)
+    # Radius of the orbit should be roughly 6900 km.
+    assert np.all(np.abs(sph[0] - 6920.) < 10.)
+
+
+def test_timeline_bin_indices():
+    # Setup
+    rng = np.random.default_rng(7)
+    time = np.sort(rng.uniform(-2., 500., 20000)).astype(np.float32)
+    time[100:200] = time[100]           # repeated times
+    tl_time = np.arange(0., 510., 1., dtype=np.float32)
+    dt = tl_time[1] - tl_time[0]
+
+    # Test
+    (jt0, jt1, no_overlap) = timeline.timelineBinIndices(time, tl_time, dt)
+
+    # Verify
+    assert no_overlap.sum() > 0
+    for i in range(len(tl_time)):
+        try:
+            indices = ccos.range(time, tl_time[i], tl_time[i] + dt)
+        except RuntimeError:
+            assert no_overlap[i]
+            continue
+        assert not no_overlap[i]
+        assert (jt0[i], jt1[i]) == indices
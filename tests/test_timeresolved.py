@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from calcos import cosutil
+from calcos import extract
+from calcos import splittag
+from calcos import timeresolved
+
+SEGMENT = "FUVA"
+MODE = {"OPT_ELEM": "G130M", "CENWAVE": 1291, "APERTURE": "PSA"}
+
+
+def mode_columns(extra):
+    cols = [fits.Column(name="SEGMENT", format="4A", array=[SEGMENT]),
+            fits.Column(name="OPT_ELEM", format="8A",
+                        array=[MODE["OPT_ELEM"]]),
+            fits.Column(name="CENWAVE", format="J", array=[MODE["CENWAVE"]]),
+            fits.Column(name="APERTURE", format="4A",
+                        array=[MODE["APERTURE"]])]
+    return fits.BinTableHDU.from_columns(cols + extra)
+
+
+def create_reffiles(tmp_path):
+    tables = {
+        "xtractab": [fits.Column(name="SLOPE", format="E", array=[0.]),
+                     fits.Column(name="B_SPEC", format="E", array=[500.]),
+                     fits.Column(name="HEIGHT", format="J", array=[25]),
+                     fits.Column(name="B_BKG1", format="E", array=[400.]),
+                     fits.Column(name="B_BKG2", format="E", array=[600.]),
+                     fits.Column(name="BHEIGHT", format="J", array=[30]),
+                     fits.Column(name="BWIDTH", format="J", array=[101])],
+        "disptab": [fits.Column(name="FPOFFSET", format="J", array=[0]),
+                    fits.Column(name="NELEM", format="J", array=[2]),
+                    fits.Column(name="COEFF", format="4D",
+                                array=[[1130., 0.00997, 0., 0.]])],
+        "fluxtab": [fits.Column(name="WAVELENGTH", format="2D",
+                                array=[[1100., 1300.]]),
+                    fits.Column(name="SENSITIVITY", format="2E",
+                                array=[[1.e13, 3.e13]])],
+    }
+    phdr = {}
+    for (key, extra) in tables.items():
+        name = str(tmp_path / (key + ".fits"))
+        fits.HDUList([fits.PrimaryHDU(), mode_columns(extra)]).writeto(name)
+        phdr[key] = name
+    bpixtab = str(tmp_path / "bpixtab.fits")
+    cols = [fits.Column(name="SEGMENT", format="4A", array=[SEGMENT])]
+    cols += [fits.Column(name=name, format="I", array=[value])
+             for (name, value) in [("LX", 5000), ("LY", 490), ("DX", 20),
+                                   ("DY", 20), ("DQ", 4)]]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(bpixtab)
+    phdr["bpixtab"] = bpixtab
+    return phdr
+
+
+def create_corrtag(name, reffiles, nevents=20000, seed=2):
+    rng = np.random.default_rng(seed)
+    # a gap with no good time from 400 to 600 s
+    time = np.sort(np.concatenate(
+        [rng.uniform(0., 400., nevents // 2),
+         rng.uniform(600., 1000., nevents - nevents // 2)]))
+    phdr = fits.Header()
+    for (key, value) in [("INSTRUME", "COS"), ("DETECTOR", "FUV"),
+                         ("SEGMENT", SEGMENT), ("OBSTYPE", "SPECTROSCOPIC"),
+                         ("OBSMODE", "TIME-TAG"), ("EXPTYPE", "EXTERNAL/SCI"),
+                         ("OPT_ELEM", MODE["OPT_ELEM"]),
+                         ("CENWAVE", MODE["CENWAVE"]),
+                         ("APERTURE", MODE["APERTURE"]), ("FPPOS", 3),
+                         ("WAVECORR", "COMPLETE"), ("BACKCORR", "PERFORM"),
+                         ("FLUXCORR", "PERFORM"), ("TDSCORR", "OMIT"),
+                         ("HELCORR", "OMIT"), ("STATFLAG", False),
+                         ("XTRCTALG", "BOXCAR")]:
+        phdr[key] = value
+    for (key, value) in reffiles.items():
+        phdr[key] = value
+    events = fits.BinTableHDU.from_columns(
+        [fits.Column(name="TIME", format="E", unit="s", array=time),
+         fits.Column(name="XFULL", format="E",
+                     array=rng.uniform(1000., 15000., nevents)),
+         fits.Column(name="YFULL", format="E",
+                     array=np.where(rng.uniform(size=nevents) < 0.8,
+                                    rng.normal(500., 3., nevents),
+                                    rng.uniform(350., 650., nevents))),
+         fits.Column(name="DQ", format="I",
+                     array=np.where(rng.uniform(size=nevents) < 0.01, 512,
+                                    0)),
+         fits.Column(name="EPSILON", format="E",
+                     array=rng.uniform(0.9, 1.2, nevents))],
+        name="EVENTS")
+    for (key, value) in [("EXPSTART", 55000.), ("EXPEND", 55000.01157),
+                         ("EXPTIME", 800.), ("EXPTIMEA", 800.),
+                         ("SDQFLAGS", 8346), ("X_OFFSET", 0)]:
+        events.header[key] = value
+    gti = fits.BinTableHDU.from_columns(
+        [fits.Column(name="START", format="D", array=[0., 600.]),
+         fits.Column(name="STOP", format="D", array=[400., 1000.])],
+        name="GTI")
+    fits.HDUList([fits.PrimaryHDU(header=phdr), events, gti]).writeto(name)
+
+
+def test_extract_time_resolved(tmp_path):
+    # Setup
+    cosutil.setVerbosity(0)
+    reffiles = create_reffiles(tmp_path)
+    corrtag = str(tmp_path / "abc_corrtag_a.fits")
+    create_corrtag(corrtag, reffiles)
+    time_list = "start 150 300 500 700 stop"
+
+    # Test
+    ofd = timeresolved.extractTimeResolved(corrtag, time_list=time_list,
+                                           verbosity=0)
+
+    # Verify
+    # Compare with extracting each interval from a file written by splittag.
+    plan = splittag.splitOneTag(corrtag, str(tmp_path / "split"),
+                                time_list=time_list, verbosity=0)
+    data = ofd[1].data
+    assert len(data) == len(plan) == 5
+    for (row, (filename, t0, t1, i, j)) in enumerate(plan):
+        x1d = str(tmp_path / ("x1d_%d.fits" % row))
+        extract.extract1D(filename, output=x1d, update_input=False)
+        with fits.open(x1d) as fd:
+            expected = fd[1].data
+            assert data["START"][row] == t0
+            assert data["STOP"][row] == t1
+            assert data["EXPTIME"][row] == expected["EXPTIME"][0]
+            for name in ["WAVELENGTH", "NET", "GCOUNTS", "BACKGROUND",
+                         "FLUX", "ERROR", "DQ", "DQ_WGT"]:
+                np.testing.assert_array_equal(data[name][row],
+                                              expected[name][0], err_msg=name)
+    assert ofd[0].header["FLUXCORR"] == "COMPLETE"
+    assert ofd[1].header["SP_LOC_A"] == pytest.approx(500.)
+
+
+def test_get_cube():
+    segment = np.array(["NUVA", "NUVB", "NUVC"] * 4)
+    flux = np.arange(12 * 5, dtype=np.float32).reshape(12, 5)
+    cols = [fits.Column(name="SEGMENT", format="4A", array=segment),
+            fits.Column(name="START", format="D",
+                        array=np.repeat([0., 10., 20., 30.], 3)),
+            fits.Column(name="STOP", format="D",
+                        array=np.repeat([10., 20., 30., 40.], 3)),
+            fits.Column(name="FLUX", format="5E", array=flux)]
+    ofd = fits.HDUList([fits.PrimaryHDU(),
+                        fits.BinTableHDU.from_columns(cols)])
+
+    (start, stop, segments, cube) = timeresolved.getCube(ofd)
+
+    assert start.tolist() == [0., 10., 20., 30.]
+    assert stop.tolist() == [10., 20., 30., 40.]
+    assert segments == ["NUVA", "NUVB", "NUVC"]
+    assert cube.shape == (4, 3, 5)
+    np.testing.assert_array_equal(cube[2, 1], flux[7])
@@ -0,0 +1,418 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from calcos import ccos
+from calcos import cosutil
+from calcos import timetag
+
+
+def create_deadtab(name, timestep):
+    obs_rate = np.array([0., 5000., 10000., 20000., 50000.], dtype=np.float32)
+    livetime = np.array([1., 0.98, 0.95, 0.9, 0.8], dtype=np.float32)
+    cols = [fits.Column(name="SEGMENT", format="4A",
+                        array=np.array(["FUVA"] * len(obs_rate))),
+            fits.Column(name="OBS_RATE", format="E", array=obs_rate),
+            fits.Column(name="LIVETIME", format="E", array=livetime)]
+    hdu = fits.BinTableHDU.from_columns(cols)
+    hdu.header["TIMESTEP"] = timestep
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(name)
+    return (obs_rate, livetime)
+
+
+def create_events(nevents, seed=1):
+    rng = np.random.default_rng(seed)
+    # bursts of events with gaps, so some intervals are empty
+    time = np.sort(np.concatenate(
+        [rng.uniform(0., 400., nevents // 2),
+         rng.uniform(600., 1003.3, nevents - nevents // 2)]))
+    cols = [fits.Column(name="TIME", format="E", array=time),
+            fits.Column(name="EPSILON", format="E",
+                        array=rng.uniform(0.9, 1.1, nevents))]
+    return fits.BinTableHDU.from_columns(cols).data
+
+
+def reference_epsilon(time, epsilon, dt_deadtime, obs_rate, live_factor):
+    """The per-interval loop that deadtimeCorrection used to do."""
+    epsilon = epsilon.copy()
+    nevents = len(time)
+    t0 = time[0]
+    t1 = t0 + dt_deadtime
+    last_time = time[nevents-1]
+    last_livetime = 1.
+    sum_livetime = 0.
+    wgt_livetime = 0.
+    first = True
+    while t0 < last_time:
+        (i, j) = ccos.range(time, t0, t1)
+        if i >= j:
+            t0 = t1
+            t1 = t0 + dt_deadtime
+            continue
+        if t1 < last_time:
+            countrate = (j - i) / dt_deadtime
+            livetime = cosutil.determineLivetime(countrate,
+                                                 obs_rate, live_factor)
+            sum_livetime += livetime * (t1 - t0)
+            wgt_livetime += (t1 - t0)
+        else:
+            if (last_time - t0) < 0.5 * dt_deadtime and not first:
+                livetime = last_livetime
+            else:
+                countrate = (j - i) / (last_time - t0)
+                livetime = cosutil.determineLivetime(countrate,
+                                                     obs_rate, live_factor)
+            sum_livetime += livetime * (last_time - t0)
+            wgt_livetime += (last_time - t0)
+        if livetime > 0.:
+            epsilon[i:j] = epsilon[i:j] / livetime
+            last_livetime = livetime
+        first = False
+        t0 = t1
+        t1 = t0 + dt_deadtime
+    return (epsilon, sum_livetime / wgt_livetime)
+
+
+def test_determine_livetime_array():
+    obs_rate = np.array([100., 5000., 10000., 20000.], dtype=np.float32)
+    live_factor = np.array([1., 0.98, 0.95, 0.9], dtype=np.float32)
+    countrate = np.array([-1., 0., 50., 100., 2345.6, 5000., 12345.678,
+                          19999.99, 20000., 1.e6])
+    truth = [cosutil.determineLivetime(float(c), obs_rate, live_factor)
+             for c in countrate]
+    test = cosutil.determineLivetimeArray(countrate, obs_rate, live_factor)
+    np.testing.assert_array_equal(truth, test)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 9999])
+def test_deadtime_correction(tmp_path, monkeypatch, chunk_size):
+    # Setup
+    if chunk_size is not None:
+        monkeypatch.setattr(cosutil, "chunk_size", chunk_size)
+    deadtab = str(tmp_path / "deadtab.fits")
+    dt_deadtime = 10.
+    (obs_rate, live_factor) = create_deadtab(deadtab, dt_deadtime)
+    events = create_events(200000)
+    time = events.field("TIME").astype(np.float64)
+    (truth, truth_avg) = reference_epsilon(time, events.field("EPSILON"),
+                                           dt_deadtime, obs_rate, live_factor)
+    info = {"segment": "FUVA", "countrate": 250., "detector": "FUV",
+            "subarray": False, "nsubarry": 0}
+    livetimefile = str(tmp_path / "livetime.txt")
+    # Test
+    (dead_rate, dead_method, avg_livetime) = timetag.deadtimeCorrection(
+        events, deadtab, info, None, None, "raw.fits", livetimefile)
+    # Verify
+    assert dead_method == "DATA"
+    np.testing.assert_array_equal(truth, events.field("EPSILON"))
+    assert avg_livetime == truth_avg
+    with open(livetimefile) as fd:
+        lines = [line.split() for line in fd if not line.startswith("#")]
+    intervals = [words for words in lines if len(words) == 4]
+    # there are no events between 400 and 600 s
+    assert not [words for words in intervals
+                if 400. < float(words[0]) < 590.]
+    # the last interval ends at the last event, and it's short
+    assert intervals[-1][1] == "1003"
+    assert intervals[-1][2:] == intervals[-2][2:]
+
+
+def test_find_stims():
+    # Setup
+    rng = np.random.default_rng(3)
+    nevents = 20000
+    x = rng.uniform(0., 16384., nevents).astype(np.float32)
+    y = rng.uniform(0., 1024., nevents).astype(np.float32)
+    x[::10] = rng.normal(372., 2., nevents // 10)
+    y[::10] = rng.normal(941., 2., nevents // 10)
+    stim_ref = (np.float32(940.), np.float32(370.))
+    # the last interval has no stim events
+    indices = np.array([0, 5000, 5001, 5001, 12000, 19999, 20000])
+    x[-1] = 0.
+    # Test
+    (sy, sx, sumysq, sumxsq, n) = timetag.findStims(x, y, indices,
+                                                    stim_ref, 15, 15)
+    # Verify
+    for k in range(len(indices) - 1):
+        (i, j) = (indices[k], indices[k+1])
+        ((sy_k, sx_k), (sumysq_k, sumxsq_k), n_k, found) = \
+                timetag.findStim(x[i:j], y[i:j], stim_ref, 15, 15)
+        ((sy_s, sx_s), (sumysq_s, sumxsq_s), n_s, found_s) = \
+                timetag.stimInInterval((sy, sx, sumysq, sumxsq, n), k)
+        # the same values (to single precision), and the same data type
+        assert (n_s, found_s) == (n_k, found)
+        assert type(n_s) is type(n_k)
+        if found:
+            assert sx_s == pytest.approx(sx_k, abs=1.e-4)
+            assert sy_s == pytest.approx(sy_k, abs=1.e-4)
+            assert sumxsq_s == pytest.approx(sumxsq_k, rel=1.e-5)
+            assert sumysq_s == pytest.approx(sumysq_k, rel=1.e-5)
+            assert type(sx_s) is type(sx_k) is np.float32
+            assert type(sumysq_s) is type(sumysq_k) is np.float32
+        else:
+            assert (sy_s, sx_s, sumysq_s, sumxsq_s) == (None,) * 4
+    assert n[-1] == 0
+
+
+def create_coordinate_reffiles(tmp_path, segment="FUVA"):
+    rng = np.random.default_rng(5)
+    brftab = str(tmp_path / "brftab.fits")
+    cols = [fits.Column(name="SEGMENT", format="4A", array=[segment]),
+            fits.Column(name="A_LOW", format="J", array=[100]),
+            fits.Column(name="A_HIGH", format="J", array=[900]),
+            fits.Column(name="A_LEFT", format="J", array=[1000]),
+            fits.Column(name="A_RIGHT", format="J", array=[15000])]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(cols)]).writeto(brftab)
+    reffiles = {"brftab": brftab}
+    for (key, shape, origin, binning) in [("geofile", (64, 1024), 0, 16),
+                                          ("dgeofile", (128, 512), 8, 32)]:
+        name = str(tmp_path / (key + ".fits"))
+        hdul = [fits.PrimaryHDU()]
+        for extver in [1, 2]:
+            hdu = fits.ImageHDU(rng.normal(0., 2., shape).astype(np.float32))
+            hdu.header["extname"] = segment
+            hdu.header["extver"] = extver
+            hdu.header["origin_x"] = origin
+            hdu.header["origin_y"] = origin
+            hdu.header["xbin"] = binning
+            hdu.header["ybin"] = binning // 16
+            hdul.append(hdu)
+        fits.HDUList(hdul).writeto(name)
+        reffiles[key] = name
+    for (key, shape) in [("xwlkfile", (32, 16384)), ("ywlkfile", (32, 1024))]:
+        name = str(tmp_path / (key + ".fits"))
+        hdu = fits.ImageHDU(rng.normal(0., 1., shape).astype(np.float32))
+        hdu.header["segment"] = segment
+        fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(name)
+        reffiles[key] = name
+    for key in list(reffiles):
+        reffiles[key + "_hdr"] = reffiles[key]
+    return reffiles
+
+
+@pytest.mark.parametrize("chunk_size", [None, 7001])
+def test_event_corrections(tmp_path, monkeypatch, chunk_size):
+    # Setup
+    reffiles = create_coordinate_reffiles(tmp_path)
+    rng = np.random.default_rng(11)
+    nevents = 50000
+    cols = [fits.Column(name="XCORR", format="E",
+                        array=rng.uniform(-50., 16434., nevents)),
+            fits.Column(name="YCORR", format="E",
+                        array=rng.uniform(-5., 1030., nevents)),
+            fits.Column(name="PHA", format="I",
+                        array=rng.integers(-2, 35, nevents))]
+    # The parameters are a mix of Python and numpy floats, which affects
+    # the precision of the arithmetic in thermalDistortion.
+    stim_param = {"i0": [0, 10000, 25000, 40000],
+                  "i1": [10000, 25000, 40000, nevents],
+                  "x0": [1.2345678, np.float64(-2.3456789), 0.,
+                         np.float32(0.75)],
+                  "xslope": [1.0001234, 0.9998765, 1., np.float32(1.0002)],
+                  "y0": [np.float64(0.5), 0.1234567, 0., 0.3],
+                  "yslope": [0.99876, np.float64(1.00123), 1., 1.001]}
+    info = {"detector": "FUV", "segment": "FUVA"}
+    switches = {"tempcorr": "PERFORM", "geocorr": "PERFORM",
+                "dgeocorr": "PERFORM", "igeocorr": "PERFORM",
+                "xwlkcorr": "PERFORM", "ywlkcorr": "PERFORM"}
+    timetag.setCorrColNames("FUV")
+    for igeocorr in ["PERFORM", "OMIT"]:
+        switches["igeocorr"] = igeocorr
+        events = fits.BinTableHDU.from_columns(cols).data
+        truth = fits.BinTableHDU.from_columns(cols).data
+        phdr = fits.Header()
+        truth_phdr = fits.Header()
+        # Test
+        if chunk_size is not None:
+            monkeypatch.setattr(cosutil, "chunk_size", chunk_size)
+        timetag.doEventCorrections(stim_param, events, info, switches,
+                                   reffiles, phdr)
+        monkeypatch.undo()
+        active_area = timetag.active_area.copy()
+        timetag.doTempcorr(stim_param, truth, info, switches, reffiles,
+                           truth_phdr)
+        timetag.doGeocorr(truth, info, switches, reffiles, truth_phdr)
+        timetag.doDgeocorr(truth, info, switches, reffiles, truth_phdr)
+        timetag.setActiveArea(truth, info, reffiles["brftab"])
+        xcorrection = timetag.doXWalkcorr(truth, info, switches, reffiles,
+                                          truth_phdr)
+        ycorrection = timetag.doYWalkcorr(truth, info, switches, reffiles,
+                                          truth_phdr)
+        timetag.applyWalkCorrection(truth, xcorrection, ycorrection)
+        # Verify
+        assert active_area.sum() > 0 and not active_area.all()
+        np.testing.assert_array_equal(active_area, timetag.active_area)
+        np.testing.assert_array_equal(events.field("XCORR"),
+                                      truth.field("XCORR"))
+        np.testing.assert_array_equal(events.field("YCORR"),
+                                      truth.field("YCORR"))
+        assert dict(phdr) == dict(truth_phdr)
+
+
+def test_get_walk_image(tmp_path):
+    # Setup
+    reffiles = create_coordinate_reffiles(tmp_path)
+
+    # Test
+    xwalk = timetag.getWalkImage(reffiles["xwlkfile"], "FUVA")
+
+    # Verify
+    assert xwalk.shape == (32, 16384)
+    with pytest.raises(RuntimeError, match="FUVB.*xwlkfile.fits"):
+        timetag.getWalkImage(reffiles["xwlkfile"], "FUVB")
+
+
+def create_wavecal_reffiles(tmp_path):
+    wcptab = str(tmp_path / "wcptab.fits")
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns(
+        [fits.Column(name="OPT_ELEM", format="8A",
+                     array=["G130M", "G185M"])])]).writeto(wcptab)
+    xtractab = str(tmp_path / "xtractab.fits")
+    segments = ["NUVA", "NUVB", "NUVC"] * 2
+    apertures = ["PSA"] * 3 + ["WCA"] * 3
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns(
+        [fits.Column(name="SEGMENT", format="4A", array=segments),
+         fits.Column(name="OPT_ELEM", format="8A", array=["G185M"] * 6),
+         fits.Column(name="CENWAVE", format="J", array=[1850] * 6),
+         fits.Column(name="APERTURE", format="4A", array=apertures),
+         fits.Column(name="SLOPE", format="E", array=[0.] * 6),
+         fits.Column(name="B_SPEC", format="E",
+                     array=[180., 280., 380., 580., 680., 780.])])
+                  ]).writeto(xtractab)
+    return {"wcptab": wcptab, "xtractab": xtractab}
+
+
+@pytest.mark.parametrize("detector", ["FUV", "NUV"])
+def test_update_from_wavecal(tmp_path, monkeypatch, detector):
+    # Setup
+    reffiles = create_wavecal_reffiles(tmp_path)
+    rng = np.random.default_rng(12)
+    nevents = 30000
+    cols = [fits.Column(name="TIME", format="E",
+                        array=np.sort(rng.uniform(0., 1500., nevents))),
+            fits.Column(name="XCORR", format="E",
+                        array=rng.uniform(0., 16384., nevents)),
+            fits.Column(name="YCORR", format="E",
+                        array=rng.uniform(0., 1024., nevents))]
+    for name in ["XDOPP", "XFULL", "YFULL"]:
+        cols.append(fits.Column(name=name, format="E",
+                                array=np.zeros(nevents)))
+    if detector == "FUV":
+        info = {"detector": "FUV", "segment": "FUVA", "opt_elem": "G130M",
+                "cenwave": 1291}
+    else:
+        info = {"detector": "NUV", "segment": "NUVA", "opt_elem": "G185M",
+                "cenwave": 1850}
+    info.update({"obsmode": "TIME-TAG", "exptype": "EXTERNAL/SCI",
+                 "fpoffset": 0, "expstart": 55000.,
+                 "addsimulatedwavecal": False})
+    shift_dict = {"shift1a": 12.5, "shift1b": -3.25, "shift1c": 7.,
+                  "shift2a": 1.5, "shift2b": -0.75, "shift2c": 0.}
+    slope_dict = {"shift1a": 0.001, "shift1b": -0.002, "shift1c": 0.,
+                  "shift2a": 0.0005, "shift2b": 0.0003, "shift2c": 0.}
+    active_area = rng.uniform(size=nevents) < 0.9
+    timetag.setCorrColNames(detector)
+    results = []
+    for chunk_size in [None, 7001]:
+        events = fits.BinTableHDU.from_columns(cols).data
+        # XDOPP differs from XCORR, as after the Doppler correction.
+        events.field("XDOPP")[:] = events.field("XCORR") + 0.5
+        phdr = fits.Header()
+        hdr = fits.Header()
+        # Test
+        if chunk_size is not None:
+            monkeypatch.setattr(cosutil, "chunk_size", chunk_size)
+        monkeypatch.setattr(timetag, "active_area", active_area)
+        monkeypatch.setattr(timetag.wavecal, "returnWavecalShift",
+                            lambda *args: (shift_dict, slope_dict, "abc"))
+        timetag.copyColumns(events)
+        np.testing.assert_array_equal(events.field("YFULL"),
+                                      events.field("YCORR"))
+        (tl_time, shift1_vs_time) = timetag.updateFromWavecal(
+                events, [{}], "COMPLETE", None, info, {}, reffiles, "",
+                phdr, hdr)
+        monkeypatch.undo()
+        results.append((events, dict(hdr)))
+
+    # Verify
+    (events, hdr) = results[0]
+    (chunked_events, chunked_hdr) = results[1]
+    np.testing.assert_array_equal(chunked_events.field("XFULL"),
+                                  events.field("XFULL"))
+    np.testing.assert_array_equal(chunked_events.field("YFULL"),
+                                  events.field("YFULL"))
+    for key in hdr:
+        assert chunked_hdr[key] == pytest.approx(hdr[key], abs=1.e-4)
+    time = events.field("TIME")
+    xdopp = events.field("XDOPP")
+    ycorr = events.field("YCORR")
+    if detector == "FUV":
+        expected = np.where(active_area,
+                            xdopp - ((time - time[0]) * 0.001 + 12.5), xdopp)
+        np.testing.assert_array_equal(events.field("XFULL"), expected)
+        expected = np.where(active_area,
+                            ycorr - ((time - time[0]) * 0.0005 + 1.5), ycorr)
+        np.testing.assert_array_equal(events.field("YFULL"), expected)
+        assert set(hdr) == {"SHIFT1A", "SHIFT2A", "DPIXEL1A"}
+    else:
+        # The same shift2 (stripe B) for every stripe.
+        expected = ycorr - ((time - time[0]) * 0.0003 - 0.75)
+        np.testing.assert_array_equal(events.field("YFULL"), expected)
+        # stripe C, for the PSA and the WCA
+        in_c = ((ycorr >= 330.) & (ycorr < 480.)) | (ycorr >= 730.)
+        np.testing.assert_array_equal(events.field("XFULL")[in_c],
+                                      xdopp[in_c] - 7.)
+        assert set(hdr) == {"SHIFT1A", "SHIFT1B", "SHIFT1C", "SHIFT2A",
+                            "SHIFT2B", "SHIFT2C", "DPIXEL1A", "DPIXEL1B",
+                            "DPIXEL1C"}
+    # For NUV, shift1 vs time is for stripe B.
+    key = {"FUV": "shift1a", "NUV": "shift1b"}[detector]
+    np.testing.assert_allclose(shift1_vs_time,
+                               slope_dict[key] * tl_time + shift_dict[key])
+
+
+def test_orbital_phase():
+    # Setup
+    rng = np.random.default_rng(6)
+    time = np.sort(rng.uniform(-0.5, 3000., 100000)).astype(np.float32)
+    (expstart, doppzero, orbitper) = (55000.3, 55000.25, 5760.)
+    t = (expstart - doppzero) * timetag.SEC_PER_DAY + time.astype(np.float64)
+
+    # Test
+    phase = timetag.orbitalPhase(time, expstart, doppzero, orbitper)
+    xd = timetag.orbitalDoppler(time, np.full(len(time), 8000.),
+                                np.full(len(time), 1.3e5),
+                                expstart, 7.5, doppzero, orbitper)
+
+    # Verify
+    exact_phase = np.sin(2. * np.pi * t / orbitper)
+    step = timetag.DOPPLER_TABLE_STEP
+    np.testing.assert_allclose(phase, exact_phase,
+                               rtol=0., atol=1.5e-7 * step**2)
+    np.testing.assert_allclose(
+        xd, 8000. - 7.5 / timetag.SPEED_OF_LIGHT * 1.3e5 * exact_phase,
+        rtol=0., atol=1.e-8)
+    assert len(timetag.orbitalPhase(time[:0], expstart, doppzero,
+                                    orbitper)) == 0
+
+
+def test_flag_gti():
+    # Setup
+    time = np.arange(0., 1000., 0.032, dtype=np.float32)
+    dq = np.where(np.arange(len(time)) % 7 == 0,
+                  timetag.DQ_BAD_TIME, 0).astype(np.int16)
+    gti = [[10., 300.], [300.5, 600.], [700., 1100.]]
+    expected = dq | timetag.DQ_BAD_TIME
+    for (t_start, t_stop) in gti:
+        (i0, i1) = ccos.range(time, t_start, t_stop + 0.02)
+        expected[i0:i1] &= ~timetag.DQ_BAD_TIME
+
+    # Test
+    timetag.flag_gti(time, dq, gti)
+
+    # Verify
+    np.testing.assert_array_equal(dq, expected)
+    # A GTI with no events is an error, as it is for ccos.range.
+    with pytest.raises(RuntimeError, match="does not overlap"):
+        timetag.flag_gti(time, dq, gti + [[1200., 1300.]])
@@ -0,0 +1,150 @@
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from calcos import cosutil
+from calcos import worker
+
+
+class FakeCalcos(object):
+    """Record the calls, instead of calibrating anything."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, name, **kwargs):
+        self.calls.append((name, kwargs))
+        if name == "bad_asn.fits":
+            raise RuntimeError("can't open bad_asn.fits")
+        return 5 if name.endswith("_rawacq.fits") else 0
+
+
+class ImageCalcos(object):
+    """Read a reference image, as calcos does for each exposure."""
+
+    def __init__(self, flatfile):
+        self.flatfile = flatfile
+        self.images = []
+
+    def __call__(self, name, **kwargs):
+        cosutil.setRefcache(kwargs.get("refcache"))
+        self.images.append(cosutil.image_store.getImage(self.flatfile, 1))
+        return 0
+
+
+def write_job(queue_dir, name, request, mtime):
+    temp = os.path.join(queue_dir, name + ".tmp")
+    with open(temp, "w") as fd:
+        fd.write(request)
+    os.utime(temp, ns=(mtime, mtime))
+    os.rename(temp, os.path.join(queue_dir, name + ".job"))
+
+
+def test_serve_queue(tmp_path, monkeypatch):
+    # Setup
+    fake = FakeCalcos()
+    monkeypatch.setattr(worker, "calcos", fake)
+    queue_dir = str(tmp_path)
+    write_job(queue_dir, "second", "a_asn.fits, b_rawacq.fits\n", 2000)
+    write_job(queue_dir, "first", "c_asn.fits", 1000)
+    write_job(queue_dir, "third", "bad_asn.fits", 3000)
+    cl_args = {"outdir": "out", "verbosity": None}
+
+    # Test
+    njobs = worker.serveQueue(queue_dir, cl_args, wait=False)
+
+    # Verify
+    assert njobs == 3
+    assert [name for (name, kwargs) in fake.calls] == \
+           ["c_asn.fits", "a_asn.fits", "b_rawacq.fits", "bad_asn.fits"]
+    assert fake.calls[0][1] == cl_args
+    assert sorted(os.listdir(queue_dir)) == \
+           ["first.done", "second.done", "third.done"]
+    replies = {}
+    for name in ["first", "second", "third"]:
+        with open(os.path.join(queue_dir, name + ".done")) as fd:
+            replies[name] = fd.read()
+    assert replies["first"] == "0\n"
+    assert replies["second"] == "5\n"
+    assert replies["third"] == "1 can't open bad_asn.fits\n"
+    assert cosutil.fd_trl is None
+
+
+def test_serve_queue_stop(tmp_path, monkeypatch):
+    fake = FakeCalcos()
+    monkeypatch.setattr(worker, "calcos", fake)
+    queue_dir = str(tmp_path)
+    write_job(queue_dir, "first", "c_asn.fits", 1000)
+    open(os.path.join(queue_dir, worker.STOP_REQUEST), "w").close()
+    assert worker.serveQueue(queue_dir, {}) == 0
+    assert fake.calls == []
+
+
+def test_serve_socket(tmp_path, monkeypatch):
+    # Setup
+    fake = FakeCalcos()
+    monkeypatch.setattr(worker, "calcos", fake)
+    socket_path = str(tmp_path / "calcos.sock")
+    result = []
+    server = threading.Thread(
+        target=lambda: result.append(worker.serveSocket(socket_path, {})))
+    server.start()
+    for i in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.05)
+
+    def send(request):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        with client, client.makefile("rw") as fd:
+            fd.write(request + "\n")
+            fd.flush()
+            return fd.readline()
+
+    # Test
+    replies = [send("a_asn.fits"), send("b_rawacq.fits"),
+               send(worker.STOP_REQUEST)]
+    server.join(timeout=10.)
+
+    # Verify
+    assert replies == ["0\n", "5\n", "0\n"]
+    assert result == [2]
+    assert not os.path.exists(socket_path)
+
+
+def test_reference_image_reused(tmp_path, monkeypatch):
+    # Setup
+    flatfile = str(tmp_path / "flat.fits")
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.ImageHDU(np.ones((8, 16), dtype=">f4"))]
+                 ).writeto(flatfile)
+    fake = ImageCalcos(flatfile)
+    monkeypatch.setattr(worker, "calcos", fake)
+    monkeypatch.setattr(cosutil, "image_store", cosutil.ImageStore())
+    opened = []
+    fits_open = fits.open
+
+    def counting_open(name, *args, **kwargs):
+        opened.append(name)
+        return fits_open(name, *args, **kwargs)
+
+    monkeypatch.setattr(cosutil.fits, "open", counting_open)
+    queue_dir = str(tmp_path / "queue")
+    os.mkdir(queue_dir)
+    write_job(queue_dir, "first", "a_asn.fits", 1000)
+    write_job(queue_dir, "second", "b_asn.fits", 2000)
+
+    # Test
+    njobs = worker.serveQueue(queue_dir, {"refcache": None}, wait=False)
+
+    # Verify
+    # The second job uses the image read by the first one.
+    assert njobs == 2
+    assert opened == [flatfile]
+    assert fake.images[1][0] is fake.images[0][0]
+    assert not fake.images[1][0].flags.writeable